@@ -49,9 +49,18 @@ SMARTQUOTE_EXTENSION = True  # Turn on temporary smartQuote (apos) feature.  Won
 WHATS_NEW_EXPIRES_DAYS = 0
 WHATS_NEW_EXPIRES_HOURS = 8
 WHATS_NEW_EXPIRES_MINUTES = 0
+WHATS_NEW_CACHE_SIZE = 50                # What's New lists kept, per days_back/limit/offset, see opasWhatsNewCache
+WHATS_NEW_MAX_STALE = 60 * 60            # seconds past expiry an old list is still returned while it's reloaded in the background
 
 JOURNALNEWFLAG = "*New* "
 NO_OFFSITE_DOCUMENT_ACCESS_CHECKS = True # set to false if the server should check with PaDS for offsite documents
+PADS_PERMISSION_CHECK_MAX_WORKERS = 8    # max concurrent PaDS permit checks when resolving a page of documents
+PADS_PERMIT_CACHE_SIZE = 20000           # max (session, document, reason) PaDS permit answers kept in memory
+PADS_PERMIT_CACHE_TTL = 600              # seconds a PaDS permit answer is reused for the same session and document
+PADS_PERMIT_CACHE_DENIED_TTL = 15        # seconds a 401 (session not authenticated) answer is reused; short, since a login through another server process or PaDS itself doesn't clear it here
+PADS_PERMIT_CACHE_FULLTEXT = False       # if False, full-text (DocumentView) checks always go to PaDS, so it sees every view
+SESSION_INFO_CACHE_SIZE = 5000           # max api_sessions records kept in memory by get_session_info
+SESSION_INFO_CACHE_TTL = 30              # seconds a session record is reused without rereading api_sessions (per server process)
 
 # Cache controls
 CACHEURL = "Caching"
@@ -60,6 +69,42 @@ CACHE_EXPIRES_HOURS = 8
 CACHE_EXPIRES_MINUTES = 0
 DEFAULT_LIMIT_FOR_CACHE = 15
 DEFAULT_LIMIT_FOR_MOST_VIEWED = 7
+MOST_CITED_CACHE_SIZE = 100              # Most Cited lists kept, per period/publication period/source type/limit/offset, see opasCacheMostCited
+MOST_VIEWED_CACHE_SIZE = 100             # Most Viewed lists kept, per period/publication period/source type/limit/offset, see opasCacheMostViewed
+MOST_CACHE_MAX_STALE = 60 * 60           # seconds past expiry an old Most Cited/Viewed list is still returned while it's reloaded in the background
+MOST_CITED_PRELOAD_PERIODS = ('5', '10', '20', 'all') # cited_in_period lists (default limit) loaded in the background at server startup
+MOST_VIEWED_PRELOAD_PERIODS = (0, 1, 2, 3, 4)          # viewperiod lists (default limit) loaded in the background at server startup
+STAT_SUMMARY_BATCH_SIZE = 1000           # rows per statement when refreshing the api_stat_*_summary tables
+RENDER_CACHE_SIZE = 100                  # rendered (XSLT) document and abstract HTML kept in memory, see opasRenderCache
+RENDER_CACHE_TTL = 24 * 60 * 60          # seconds; entries are keyed on file_last_modified, so this only bounds memory use by rarely read documents
+RENDER_CACHE_DIR = None                  # optional folder for a second, on-disk tier of rendered HTML (shared by the server processes)
+QUERY_CACHE_SIZE = 500                   # raw Solr search responses kept in memory, see opasQueryCache
+QUERY_CACHE_TTL = 10 * 60                # seconds a search response is reused
+QUERY_CACHE_VERSION_CHECK = 15           # seconds between checks of a core's index version; a new version (a commit) empties the cache
+ARTIFACT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "opas_artifacts") # generated PDF/EPUB download renderings, see opasArtifactCache; None to disable
+ARTIFACT_CACHE_MAX_BYTES = 2 * 1024**3   # total size of the artifact cache folder; least recently used files are removed above this
+ARTIFACT_CACHE_VERSION = "1"             # change to discard all cached renderings (e.g., after a change to the PDF/EPUB code)
+DOWNLOAD_TEMPFILE_MAX_AGE = 60 * 60      # seconds; download files left in the temp folder (e.g., per user stamped PDFs) are removed after this
+DOWNLOAD_TEMPFILE_CLEANUP_INTERVAL = 10 * 60 # seconds between checks of the temp folder for old download files
+RENDER_QUEUE_WORKERS = 2                 # processes rendering large PDF/EPUB downloads, see opasRenderQueue; 0 renders every download in the request's thread
+RENDER_QUEUE_MAX_PENDING = 20            # renderings queued or running at once (per server process); beyond this downloads get 503
+RENDER_QUEUE_SYNC_MAX_BYTES = 100 * 1024 # documents (XML) smaller than this are rendered in the request's thread, as before
+RENDER_QUEUE_WAIT_TIMEOUT = 25           # seconds a download request waits for its rendering before answering 202 (retry later)
+RENDER_QUEUE_RETRY_AFTER = 10            # seconds, sent as Retry-After with the 202 and 503 answers
+RENDER_QUEUE_RESULT_TTL = 120            # seconds a finished rendering is kept for the retry of a request which got 202 (for those the artifact cache can't keep); less than DOWNLOAD_TEMPFILE_MAX_AGE
+FILE_STREAM_CHUNK_SIZE = 1024 * 1024     # bytes read at a time when streaming originals and images from FlexFileSystem (S3 or local), see opasFileStream
+PDF_STAMP_CACHE_SIZE = 500               # copyright stamps (PDF incremental updates) kept in memory, per original file and user, so HTTP Range requests don't reread the original
+PDF_STAMP_CACHE_TTL = 60 * 60            # seconds a copyright stamp is kept
+PDF_STAMP_STRUCTURE_CACHE_SIZE = 200     # per original file, the part of the copyright stamp which is the same for every user, so another user's stamp doesn't reread the original
+PDF_STAMP_STRUCTURE_CACHE_TTL = 60 * 60  # seconds it's kept
+HTTP_VALIDATOR_CACHE_SIZE = 20000        # ETag/Last-Modified values kept in memory per request (and session), so a matching If-None-Match gets a 304 without Solr or XSLT, see opasHTTPCache
+HTTP_VALIDATOR_CACHE_TTL = 10 * 60       # seconds the validators are trusted; they're also dropped when the Solr index version changes
+HTTP_CACHE_PUBLIC_MAX_AGE = 24 * 60 * 60 # seconds, Cache-Control max-age for public resources (images); permissioned responses are private and revalidated each time
+SITEMAP_EXPORT_ROWS = 10000              # art_ids per cursorMark page when streaming the sitemap export, see opasSiteMap
+SITEMAP_WRITE_WORKERS = 4                # sitemap files written (to local disk or S3) at once
+SITEMAP_COMPRESS = True                  # write gzip compressed sitemap files (sitemapN.xml.gz); the index itself isn't compressed
+METRICS_ENABLED = True                   # time requests and Solr/MySQL/PaDS/XSLT calls for /v2/Admin/Metrics, see opasMetrics
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # histogram bucket bounds, in seconds
 
 EXPERT_PICKS_DEFAULT_IMAGE = "IJP.100.1465A.F0002"
 
@@ -218,6 +263,40 @@ DEFAULT_PUBLICATION_PERIOD = "ALL"
 
 DB_ITEM_OF_INTEREST_WIDTH = 255 # database col for logging query/item of interest
 
+# Size of the thread pool that runs the (def) endpoints; they block on Solr, MySQL and PaDS
+API_ENDPOINT_THREAD_LIMIT = 40
+
+# Outbound HTTP (PaDS, Solr schema/admin calls) via opasHTTPClient
+HTTP_CONNECT_TIMEOUT = 5         # seconds to establish a connection
+HTTP_READ_TIMEOUT = 30           # seconds to wait for the server to send data
+HTTP_POOL_CONNECTIONS = 10       # number of hosts to keep connection pools for
+HTTP_POOL_MAXSIZE = 20           # max keep-alive connections kept per host
+HTTP_RETRIES = 2                 # retries for idempotent requests on connection errors or 502/503/504
+                                 # (PaDS GETs are on the request path: a read timeout or 50x answer each time means up to
+                                 #  (HTTP_RETRIES + 1) * HTTP_READ_TIMEOUT plus the backoff sleeps before the request goes on)
+HTTP_RETRY_BACKOFF = 0.3         # backoff factor, sleeps 0.3, 0.6, 1.2... secs between retries
+
+# MySQL connection pool (per process, see opasCentralDBLib.opasConnectionPool)
+# Every endpoint thread may hold a connection, so the pool must be at least API_ENDPOINT_THREAD_LIMIT, plus room for
+#   the background users (usage log writer, cache refreshes).  A borrower waiting longer than DB_POOL_TIMEOUT gets
+#   opasCentralDBLib.PoolTimeout (the endpoint answers 503), rather than carrying on without a connection.
+DB_POOL_BACKGROUND_CONNECTIONS = 5                                   # connections beyond the endpoint threads
+DB_POOL_SIZE = API_ENDPOINT_THREAD_LIMIT + DB_POOL_BACKGROUND_CONNECTIONS # max connections held open (in use + idle) per process
+DB_POOL_TIMEOUT = 10             # seconds to wait for a free connection before giving up
+DB_POOL_RECYCLE = 3600           # seconds; connections older than this are closed and replaced
+DB_POOL_PING_AFTER_IDLE = 30     # seconds; idle connections are pinged before being reused
+
+# Usage log writer (endpoint calls and document views, see opasCentralDBLib.opasUsageLogWriter)
+USAGE_LOG_ASYNC = True           # if False, each record is inserted (and committed) on the request path, as before
+USAGE_LOG_BATCH_SIZE = 200       # rows per multi-row INSERT (and commit)
+USAGE_LOG_FLUSH_MS = 500         # milliseconds a queued row waits at most for a batch to fill
+USAGE_LOG_QUEUE_SIZE = 20000     # rows held waiting to be written; when full, new rows are dropped (and counted)
+USAGE_LOG_PUT_TIMEOUT = 0.05     # seconds a request waits for room in a full queue before its row is dropped
+USAGE_LOG_SHUTDOWN_TIMEOUT = 10  # seconds allowed at shutdown to write the rows still queued
+
+# Admin report downloads are streamed from the database, this many rows at a time
+REPORT_DOWNLOAD_CHUNK_ROWS = 2000
+
 SOLR_KWIC_MAX_ANALYZED_CHARS = 25200000 # kwic (and highlighting) wont show any hits past this.
 SOLR_FULL_TEXT_MAX_ANALYZED_CHARS = 25200000 # full-text markup won't show matches beyond this.
 SOLR_HIGHLIGHT_RETURN_FRAGMENT_SIZE = 25200000 # to get a complete document from SOLR, with highlights, needs to be large.  SummaryFields do not have highlighting.
@@ -367,6 +446,7 @@ DESCRIPTION_CLIENT_ID = "Numeric ID assigned to a client app by Opas Administrat
 DESCRIPTION_CLIENT_SESSION = "Client session GUID"
 DESCRIPTION_CORE = "The preset name for the specif core to use (e.g., docs, authors, etc.)"
 DESCRIPTION_DOWNLOAD = "Download a CSV with the current return set of the statistical table" 
+DESCRIPTION_DOWNLOADFORMAT = "The format of a report download: CSV (default), or NDJSON (one JSON object per line)"
 DESCRIPTION_DAYSBACK = "Number of days to look back to assess what's new"
 DESCRIPTION_DOCDOWNLOADFORMAT = f"The format of the downloaded document data.  One of: {list_values(VALS_DOWNLOADFORMAT)}"
 DESCRIPTION_DOCIDORPARTIAL = "The document ID (e.g., IJP.077.0217A) or a partial ID (e.g., IJP.077,  no wildcard) for which to return data (only one ID for full-text documents)"
@@ -472,6 +552,7 @@ TITLE_CORE = "Core to use"
 TITLE_DAYSBACK = "Days Back"
 TITLE_DEF_TYPE = "edisMax, disMax, lucene (standard) or None (lucene)"
 TITLE_DOWNLOAD = "Download response as CSV"
+TITLE_DOWNLOADFORMAT = "Report download format"
 TITLE_DOCUMENT_CONCORDANCE_ID = "Paragraph language ID"
 TITLE_DOCUMENT_CONCORDANCE_RX = "Paragraph language IDs"
 TITLE_DOCUMENT_ID = "Document ID (e.g., IJP.077.0217A)"
@@ -578,6 +659,7 @@ ENDPOINT_SUMMARY_LOGLEVEL = "Admin function to change logging level"
 ENDPOINT_SUMMARY_LOGIN_BASIC = "Login a user more securely"
 ENDPOINT_SUMMARY_LOGOUT = "Logout the user who is logged in"
 ENDPOINT_SUMMARY_METADATA_ARTICLEID = "Check if articleID (document ID) is a valid articleID and break down the subinformation from it"
+ENDPOINT_SUMMARY_METRICS = "Admin function to return server metrics (latency histograms, pool and cache gauges) in Prometheus text format"
 ENDPOINT_SUMMARY_MOST_CITED = "Return the most cited journal articles published in this time period (5, 10, 20, or ALL years)"
 ENDPOINT_SUMMARY_WHO_CITED = "Return the documents which cited the document specified during this time period (5, 10, 20, or ALL years)"
 ENDPOINT_SUMMARY_MORELIKETHIS = "Finds related documents based on the contents of the document."
@@ -1026,6 +1108,16 @@ PDF_OTHER_STYLE = r"""
 # MAXSRATIO is the highest sRatio, since 1 is reserved.
 MAXSRATIO = 0.9999999
 
+# parallel load (opasDataLoader --workers)
+LOADER_SOLR_ADD_BATCH_SIZE = 50     # documents sent to a Solr core per add request by the loader's writer
+LOADER_WORKER_QUEUE_FACTOR = 2      # files read ahead per worker process, bounds the parsed documents held in memory
+LOADER_BIBLIO_BATCH_SIZE = 500     # api_biblioxml rows per multi-row REPLACE (and commit) by the loader
+
+# loader skip check (files already loaded and unchanged)
+LOADER_SKIP_CHECK_BULK_MIN_FILES = 50    # from this many candidate files up, fetch all the loaded file dates in one export rather than a query per file
+LOADER_SKIP_CHECK_MAX_SRC_CODES = 25     # export only the candidates' source codes, unless there are more than this many (then the whole core)
+LOADER_SKIP_CHECK_EXPORT_ROWS = 10000    # rows per cursorMark page in that export
+
 gBookCodes = ["CBK", "ZBK", "IPL", "NLP", "WMK", "SE", "GW"]
 gAnnualsThatAreTranslations = ["ANIJP-FR", "ANIJP-IT", "ANIJP-EL", "ANIJP-TR", "ANIJP-DE", "ANRP"]
 # Series Classic books with their own code, to add CBK as well.
@@ -18,6 +18,7 @@ from collections import UserDict
 import opasCentralDBLib
 import lxml
 import opasXMLHelper as opasxmllib
+import opasTermAutomaton
 
 default_ancestor_list = "abbr|artinfo|be|h[1-9]|cgrp|figx|frac|impx|ln|pgx|url|a|bx|bxe|webx"
 ocd = opasCentralDBLib.opasCentralDB()
@@ -109,6 +110,7 @@ class GlossaryRecognitionEngine(UserDict):
 
     biblioDB = None
     matchList = None
+    prefilter = None # opasTermAutomaton.RegexPrefilter over matchList, built on first use
     impxList = None
     recognitionMethod = 1 # original method, for now works better than "new" mothod
     leftMarker = u"⩥"   # used only in new code version, recognitionMethod=2
@@ -118,15 +120,19 @@ class GlossaryRecognitionEngine(UserDict):
     rightTag = '</impx>'
     
     #--------------------------------------------------------------------------------
-    def __init__(self, gather=True):
+    def __init__(self, gather=True, use_automaton=True):
         """
         Initialize the instance.  Load the glossary terms.
         If gather is true, search regex's are combined for faster recognition.  However,
         	this means that you cannot track what matches at what does.
+        If use_automaton is true, the document is first scanned once with an Aho-Corasick automaton
+            of the literal text each term requires, and only the term regexes which can match are run.
+            The markup is the same either way.
         """
 
         UserDict.__init__(self)
         self.gather = gather
+        self.use_automaton = use_automaton
         #if gather != True:
             #print ("Gathering regex patterns is off.")
         self.data = {}
@@ -135,6 +141,10 @@ class GlossaryRecognitionEngine(UserDict):
         else:
             self.matchList = self.__class__.matchList
 
+        if self.use_automaton and self.__class__.prefilter is None:
+            self.__class__.prefilter = opasTermAutomaton.RegexPrefilter([rcrow[0] for rcrow in self.matchList],
+                                                                        exclude_chars=self.leftMarker + self.midSeparator + self.rightMarker)
+
         #if self.__class__.impxList == None:
             #self.__class__.impxList = self.loadImpxMatchList()
         #else:
@@ -415,12 +425,21 @@ class GlossaryRecognitionEngine(UserDict):
         
         changes = False # reset
         sep2 = 'u22E1'
+        if self.use_automaton:
+            # the regexes which can match anywhere in the document; the markers added below can't create new matches
+            candidates = self.__class__.prefilter.candidates(node_text)
+        else:
+            candidates = None
+
         idx = -1
         for rcrow in self.matchList: # mark terms
             idx += 1
             if rcrow[1][1] <= 3: # skip single letter markup like '(M)'. rcrow[1][0]='(m)', [1][1] = 3, [1][2] = 'M', [1][3] = 'YP0008007699320'
                 continue
 
+            if candidates is not None and idx not in candidates:
+                continue
+
             subStrCxt = f"{self.leftMarker}\g<0>{self.midSeparator}{idx}{self.rightMarker}"
             # Match at the start, at the end, the whole, and in the middle, delineated
             rc = rcrow[0]
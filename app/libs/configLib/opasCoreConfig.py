@@ -13,6 +13,7 @@ import solrpy as solr
 import pysolr
 from localsecrets import SOLRUSER, SOLRPW, SOLRURL
 import opasConfig
+import opasMetrics
 
 # These are the solr database names used
 SOLR_DOCS = "pepwebdocs"
@@ -25,23 +26,33 @@ SOLR_DEFAULT_CORE = SOLR_DOCS
 # constants
 COMMITLIMIT = 1000  # commit the load to Solr every X articles
 
+class TimedSolr(pysolr.Solr):
+    """
+    pysolr.Solr whose requests are timed for /v2/Admin/Metrics (operation core/handler, e.g., pepwebdocs/select)
+    """
+    def _send_request(self, method, path="", *args, **kwargs):
+        core = str(self.url).rstrip("/").rsplit("/", 1)[-1]
+        handler = path.split("?", 1)[0].strip("/")
+        with opasMetrics.timer("solr", f"{core}/{handler}"):
+            return super()._send_request(method, path, *args, **kwargs)
+
 # for pysolr! (solrpy is now limited to a variant of term search and used only in opasSolrPyLib.py)
 if SOLRUSER is not None and SOLRPW is not None:
-    solr_call = pysolr.Solr(SOLRURL, auth=(SOLRUSER, SOLRPW))
-    solr_docs2 = pysolr.Solr(SOLRURL + SOLR_DOCS, auth=(SOLRUSER, SOLRPW))
+    solr_call = TimedSolr(SOLRURL, auth=(SOLRUSER, SOLRPW))
+    solr_docs2 = TimedSolr(SOLRURL + SOLR_DOCS, auth=(SOLRUSER, SOLRPW))
     #solr_docs_term_search = pysolr.Solr(SOLRURL + SOLR_DOCS, "/terms", auth=(SOLRUSER, SOLRPW))
-    solr_gloss2 = pysolr.Solr(SOLRURL + SOLR_GLOSSARY, auth=(SOLRUSER, SOLRPW))
-    solr_authors2 = pysolr.Solr(SOLRURL + SOLR_AUTHORS, auth=(SOLRUSER, SOLRPW))
+    solr_gloss2 = TimedSolr(SOLRURL + SOLR_GLOSSARY, auth=(SOLRUSER, SOLRPW))
+    solr_authors2 = TimedSolr(SOLRURL + SOLR_AUTHORS, auth=(SOLRUSER, SOLRPW))
     #solr_authors_term_search2 = pysolr.Solr(solr_authors, "/terms", auth=(SOLRUSER, SOLRPW))
-    solr_like_this2 = pysolr.Solr(solr_authors2, "/mlt", auth=(SOLRUSER, SOLRPW))
+    solr_like_this2 = TimedSolr(solr_authors2, "/mlt", auth=(SOLRUSER, SOLRPW))
 else: #  no user and password needed
-    solr_call = pysolr.Solr(SOLRURL)
-    solr_docs2 = pysolr.Solr(SOLRURL + SOLR_DOCS)
+    solr_call = TimedSolr(SOLRURL)
+    solr_docs2 = TimedSolr(SOLRURL + SOLR_DOCS)
     #solr_docs_term_search = solr_docs2  # term_index = solr_docs2.suggest_terms(term_field, term_partial.lower())
-    solr_gloss2 = pysolr.Solr(SOLRURL + SOLR_GLOSSARY)
-    solr_authors2 = pysolr.Solr(SOLRURL + SOLR_AUTHORS)
+    solr_gloss2 = TimedSolr(SOLRURL + SOLR_GLOSSARY)
+    solr_authors2 = TimedSolr(SOLRURL + SOLR_AUTHORS)
     #solr_authors_term_search2 = pysolr.Solr(solr_authors2, "/terms")
-    solr_like_this2 = pysolr.Solr(solr_authors2, "/mlt")
+    solr_like_this2 = TimedSolr(solr_authors2, "/mlt")
 
 # define cores for ExtendedSearch
 EXTENDED_CORES = {
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasArtifactCache
+
+Persistent cache of generated download files, for prep_document_download.
+
+Generating a PDF (XSLT, then weasyprint) for a long article takes seconds, and an EPUB needs
+  the same XSLT pass, yet the result only differs by user in the copyright information.  So the
+  part that doesn't depend on the user is kept here, in a folder shared by the server processes
+  (opasConfig.ARTIFACT_CACHE_DIR):
+    - for PDF, the rendered article without the copyright page
+    - for EPUB, the transformed article HTML
+  and the user's copyright page and stamp are added to a copy for each request.
+
+Files are content addressed: the name is a hash of the document ID, its file_last_modified (so a
+  reloaded document is never served stale), the kind of artifact, and the stylesheet version (a hash
+  of the XSLT and CSS files and the PDF styles in opasConfig, plus opasConfig.ARTIFACT_CACHE_VERSION),
+  so a changed stylesheet simply stops matching the old files.
+
+The folder is kept under opasConfig.ARTIFACT_CACHE_MAX_BYTES by removing the least recently used
+  files (a hit touches the file's modification time).
+
+clean_temp_files removes download files left in the temp folder by earlier requests (the
+  per-user stamped copies, header/footer stamps), once they're older than
+  opasConfig.DOWNLOAD_TEMPFILE_MAX_AGE.
+
+>>> import tempfile
+>>> cache = ArtifactCache(tempfile.mkdtemp(), max_bytes=10)
+>>> key = artifact_key("IJP.001.0001A", "2022-01-01T00:00:00Z", "html")
+>>> cache.get(key) is None
+True
+>>> path = cache.put_data(key, b"<html/>")
+>>> cache.get(key) == path, cache.get_text(key)
+(True, '<html/>')
+>>> cache.put_data(artifact_key("IJP.001.0002A", "2022-01-01T00:00:00Z", "html"), b"<html/>") is not None
+True
+>>> cache.get(key) is None # over max_bytes, the older file went
+True
+>>> artifact_key("IJP.001.0001A", None, "pdf") is None
+True
+"""
+import os
+import re
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+import opasConfig
+
+import logging
+logger = logging.getLogger(__name__)
+
+# names of the download files written to the temp folder (see prep_document_download and
+#   opasPDFStampCpyrght.stampcopyright): DOCID.PDF, DOCID.epub, DOCID-pepweb.pdf, DOCID-original.pdf,
+#   DOCID-render-XXXXXXXX.pdf, DOCID-copyright-XXXXXXXX.pdf, and the 8 character random names of the header/footer stamps
+rcx_download_tempfile = re.compile(r"""^(?:[a-z0-9_]{8}\.pdf
+                                       |[A-Z][A-Z0-9\-]*\.[A-Z0-9]+\.[A-Z0-9]+(?:-pepweb|-original|-(?:render|copyright)-[a-z0-9_]{8})?\.(?:PDF|pdf|epub)
+                                       )$""", re.VERBOSE)
+
+_stylesheet_version = None
+
+def stylesheet_version():
+    """
+    Return a short hash of everything besides the document which determines a rendering:
+      the XSLT, the CSS stylesheet, the PDF styles, and opasConfig.ARTIFACT_CACHE_VERSION
+    """
+    global _stylesheet_version
+    if _stylesheet_version is None:
+        hasher = hashlib.sha256(str(opasConfig.ARTIFACT_CACHE_VERSION).encode("utf8"))
+        file_specs = [os.path.join(style_path, opasConfig.XSLT_XMLTOHTML) for style_path in opasConfig.XSLT_PATH.split(";")]
+        file_specs.append(opasConfig.CSS_STYLESHEET)
+        for file_spec in file_specs:
+            try:
+                with open(file_spec, "rb") as f:
+                    hasher.update(f.read())
+            except OSError:
+                pass # not in this folder of the path
+        hasher.update(opasConfig.PDF_OTHER_STYLE.encode("utf8"))
+        hasher.update(opasConfig.PDF_CHINESE_STYLE.encode("utf8"))
+        _stylesheet_version = hasher.hexdigest()[:16]
+
+    return _stylesheet_version
+
+def artifact_key(document_id, file_last_modified, kind):
+    """
+    Return the cache file name for an artifact (kind is also the extension), or None if it
+      shouldn't be cached (no version information)
+    """
+    if document_id is None or file_last_modified is None:
+        return None
+
+    digest = hashlib.sha256(f"{document_id}|{file_last_modified}|{kind}|{stylesheet_version()}".encode("utf8")).hexdigest()
+    return f"{digest}.{kind}"
+
+def clean_temp_files(temp_dir=None, max_age=opasConfig.DOWNLOAD_TEMPFILE_MAX_AGE):
+    """
+    Remove download files older than max_age seconds from temp_dir.  Returns the number removed.
+    """
+    if temp_dir is None:
+        temp_dir = tempfile.gettempdir()
+
+    ret_val = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(temp_dir))
+    except OSError as e:
+        logger.warning(f"Can't list temp folder {temp_dir}: {e}")
+        entries = []
+
+    for entry in entries:
+        if rcx_download_tempfile.match(entry.name):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    ret_val += 1
+            except OSError:
+                pass # in use or already gone
+
+    if ret_val:
+        logger.info(f"Removed {ret_val} old download files from {temp_dir}")
+
+    return ret_val
+
+class ArtifactCache(object):
+    def __init__(self, cache_dir, max_bytes=opasConfig.ARTIFACT_CACHE_MAX_BYTES, cleanup_interval=opasConfig.DOWNLOAD_TEMPFILE_CLEANUP_INTERVAL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        if self.cache_dir is not None:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except Exception as e:
+                logger.error(f"Artifact cache folder {self.cache_dir} can't be created ({e}).  Downloads won't be cached.")
+                self.cache_dir = None
+
+    def enabled(self):
+        return self.cache_dir is not None
+
+    def get(self, key):
+        """
+        Return the path of the cached file for key, or None
+        """
+        ret_val = None
+        if key is not None and self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, key)
+            try:
+                os.utime(path) # recently used; the last to be evicted
+            except FileNotFoundError:
+                self.misses += 1
+            except OSError as e:
+                self.errors += 1
+                logger.warning(f"Artifact cache read error: {e}")
+            else:
+                self.hits += 1
+                ret_val = path
+
+        return ret_val
+
+    def get_text(self, key):
+        ret_val = None
+        path = self.get(key)
+        if path is not None:
+            try:
+                with open(path, "r", encoding="utf8") as f:
+                    ret_val = f.read()
+            except OSError as e:
+                self.errors += 1
+                logger.warning(f"Artifact cache read error: {e}")
+
+        return ret_val
+
+    def _store(self, key, write):
+        ret_val = None
+        if key is not None and self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, key)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                write(temp_path)
+                os.replace(temp_path, path)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Artifact cache write error: {e}")
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            else:
+                ret_val = path
+                self.evict(keep=path)
+
+        return ret_val
+
+    def put_file(self, key, source_file):
+        """
+        Move source_file into the cache as key; returns the cached path, or None if it couldn't be stored
+          (source_file is then left where it was)
+        """
+        ret_val = self._store(key, lambda temp_path: shutil.copyfile(source_file, temp_path))
+        if ret_val is not None:
+            try:
+                os.remove(source_file)
+            except OSError:
+                pass
+
+        return ret_val
+
+    def put_data(self, key, data):
+        def write(temp_path):
+            with open(temp_path, "wb") as fo:
+                fo.write(data)
+
+        return self._store(key, write)
+
+    def put_text(self, key, text):
+        return self.put_data(key, text.encode("utf8"))
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used files (other than keep) until the folder is under max_bytes.
+          Returns the number removed.
+        """
+        ret_val = 0
+        stale = time.time() - opasConfig.DOWNLOAD_TEMPFILE_MAX_AGE
+        with self._lock:
+            files = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith(".tmp"):
+                        if stat.st_mtime < stale: # an interrupted write
+                            os.remove(entry.path)
+                        continue
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            files.sort()
+            for mtime, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                ret_val += 1
+
+        self.evictions += ret_val
+        return ret_val
+
+    def clean_temp_files(self, temp_dir=None, max_age=opasConfig.DOWNLOAD_TEMPFILE_MAX_AGE):
+        """
+        Run clean_temp_files, at most every cleanup_interval seconds
+        """
+        ret_val = 0
+        now = time.time()
+        if now - self._last_cleanup >= self.cleanup_interval:
+            self._last_cleanup = now
+            ret_val = clean_temp_files(temp_dir=temp_dir, max_age=max_age)
+
+        return ret_val
+
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "errors": self.errors
+                }
+
+# the process wide cache used by prep_document_download
+artifact_cache = ArtifactCache(opasConfig.ARTIFACT_CACHE_DIR)
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasArtifactCache Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
@@ -8,11 +8,15 @@ from datetime import datetime, timedelta
 #import starlette.status as httpCodes
 from opasConfig import normalize_val, VALS_YEAROPTIONS, CACHEURL, \
                        DEFAULT_LIMIT_FOR_CACHE, DEBUG_TRACE, CACHE_EXPIRES_DAYS, \
-                       CACHE_EXPIRES_HOURS, CACHE_EXPIRES_MINUTES
+                       CACHE_EXPIRES_HOURS, CACHE_EXPIRES_MINUTES, MOST_CITED_CACHE_SIZE, \
+                       MOST_CACHE_MAX_STALE, MOST_CITED_PRELOAD_PERIODS
 #import models
 #import opasPySolrLib
 from opasPySolrSearch import search_text_qs
 import opasQueryHelper
+import opasQueryCache
+import opasMemoryCache
+from configLib.opasCoreConfig import solr_docs2
 
 def nested_dict(n, type):
     from collections import defaultdict
@@ -24,29 +28,28 @@ def nested_dict(n, type):
 def load_most_cited(cited_in_period: str='5',
                     cite_count: int=0,
                     publication_period: int=None,
+                    source_type: str=None,
                     limit=DEFAULT_LIMIT_FOR_CACHE, 
+                    offset=0,
                     req_url=CACHEURL
                    ):
     ret_val = None
-    fname = "load_whats_cited"
+    fname = "load_most_cited"
     try:
         ret_status = (200, "OK") # default is like HTTP_200_OK
         cited_in_period = normalize_val(cited_in_period, VALS_YEAROPTIONS, default='5')
         sort = f"art_cited_{cited_in_period} desc"
-        currentDateTime = datetime.now()
-        date = currentDateTime.date()
-        start_year = date.strftime("%Y")
         if publication_period is None:
             start_year = None
         else:
-            start_year -= publication_period
-            start_year = f">{start_year}"
+            start_year = f">{datetime.now().year - publication_period}"
         
         cite_count_predicate = f"{cite_count} in {cited_in_period}"
         field_set = None
         
         solr_query_spec = \
             opasQueryHelper.parse_search_query_parameters(citecount=cite_count_predicate, 
+                                                          source_type=source_type,
                                                           startyear=start_year,
                                                           highlightlimit=0, 
                                                           return_field_set=field_set, 
@@ -58,7 +61,7 @@ def load_most_cited(cited_in_period: str='5',
         
         ret_val, ret_status = search_text_qs(solr_query_spec, 
                                              limit=limit,
-                                             offset=0,
+                                             offset=offset,
                                              req_url = req_url,
                                              caller_name=fname
                                             )
@@ -68,73 +71,91 @@ def load_most_cited(cited_in_period: str='5',
     return ret_val
 
 class mostCitedCache(object):
+    """
+    Most Cited lists (without abstracts, so the same for every session), cached per
+      (cited_in_period, publication_period, source_type, limit, offset) and Solr index version,
+      so a stat update (opasDataUpdateStat) or reload shows at once.  A list is reloaded in the
+      background once it's older than CACHE_EXPIRES_DAYS/HOURS/MINUTES (the old one is returned
+      meanwhile, for up to opasConfig.MOST_CACHE_MAX_STALE seconds), and simultaneous requests
+      for a list that isn't cached wait for the same Solr query.  The lists for
+      opasConfig.MOST_CITED_PRELOAD_PERIODS are loaded in the background when the server starts
+      (preload_lists, called by main.py's startup hook).
+    """
     def __init__(self,
                  cited_in_period: str='5',
                  publication_period: int=None,
                  limit=DEFAULT_LIMIT_FOR_CACHE,
-                 offset=0, 
+                 offset=0,
                  cite_count: int=0,
-                 session_info=None, 
-                 req_url=CACHEURL): 
-                 
-        # load message database
-        self.limit = limit
-        self.offset = offset
-        self.cited_in_period = cited_in_period
-        self.publication_period = publication_period
+                 session_info=None,
+                 req_url=CACHEURL):
 
-        self.expires = datetime.now() + timedelta(days=CACHE_EXPIRES_DAYS,
-                                                  hours=CACHE_EXPIRES_HOURS,
-                                                  minutes=CACHE_EXPIRES_MINUTES)
-
-        self.most_cited = load_most_cited(cited_in_period,
-                                           cite_count,
-                                           publication_period,
-                                           limit=limit, 
-                                           req_url=req_url
-                                         )
-        
-        
-        # response.status_message = "Success"
-        self.most_cited.documentList.responseInfo.request = req_url
-        self.most_cited.documentList.responseInfo.limit = limit
-        self.most_cited.documentList.responseInfo.offset = offset       
+        expires = timedelta(days=CACHE_EXPIRES_DAYS,
+                            hours=CACHE_EXPIRES_HOURS,
+                            minutes=CACHE_EXPIRES_MINUTES)
+        self.cache = opasMemoryCache.RefreshingCache(name="most_cited",
+                                                     maxsize=MOST_CITED_CACHE_SIZE,
+                                                     ttl=expires.total_seconds(),
+                                                     max_stale=MOST_CACHE_MAX_STALE)
 
     def __del__(self):
         pass
-    
+
+    def _key_and_load(self, cited_in_period, publication_period, source_type, limit, offset, req_url):
+        cited_in_period = normalize_val(cited_in_period, VALS_YEAROPTIONS, default='5')
+        key = (cited_in_period, publication_period, source_type, limit, offset, opasQueryCache.query_cache.index_version(solr_docs2))
+        load = lambda: load_most_cited(cited_in_period=cited_in_period,
+                                       publication_period=publication_period,
+                                       source_type=source_type,
+                                       limit=limit,
+                                       offset=offset,
+                                       req_url=req_url)
+        return key, load
+
+    def preload(self,
+                cited_in_period: str='5',
+                publication_period: int=None,
+                source_type: str=None,
+                limit=DEFAULT_LIMIT_FOR_CACHE,
+                offset=0,
+                req_url=CACHEURL):
+        """
+        Load a list in the background, if it's not cached
+        """
+        self.cache.prefetch(*self._key_and_load(cited_in_period, publication_period, source_type, limit, offset, req_url))
+
+    def preload_lists(self, publication_period: int=None, limit=DEFAULT_LIMIT_FOR_CACHE, offset=0, req_url=CACHEURL):
+        """
+        Load the lists for MOST_CITED_PRELOAD_PERIODS in the background (at server startup)
+        """
+        for period in MOST_CITED_PRELOAD_PERIODS:
+            self.preload(cited_in_period=period, publication_period=publication_period, limit=limit, offset=offset, req_url=req_url)
+
     def get_most_cited(self,
                        cited_in_period: str='5',
                        publication_period: int=None,
+                       source_type: str=None,
                        limit=DEFAULT_LIMIT_FOR_CACHE,
-                       offset=0, 
+                       offset=0,
                        cite_count: int=0,
-                       session_info=None, 
+                       session_info=None,
                        req_url=CACHEURL,
                        forced_update=False                ):
         ret_val = {}
         try:
-            # reload when needed later
-            if self.expires < datetime.now() or forced_update or self.limit != limit or self.cited_in_period != cited_in_period or self.publication_period != publication_period:
-                self.most_cited = load_most_cited(cited_in_period=cited_in_period, publication_period=publication_period, limit=limit, offset=offset, req_url=req_url)            
-                self.expires = datetime.now() + timedelta(days=CACHE_EXPIRES_DAYS,
-                                                          hours=CACHE_EXPIRES_HOURS,
-                                                          minutes=CACHE_EXPIRES_MINUTES)
-                self.limit = limit
-                self.offset = offset
-                self.cited_in_period = cited_in_period
-                self.publication_period = publication_period
-
-                if DEBUG_TRACE:
-                    ts = time.time()
-                    print(f"{ts}: [WhatsNew] Cache updated. Exp: {self.expires} DaysBack: {days_back} Limit: {limit} Offset: {offset} Forced:{forced_update}")
+            key, load = self._key_and_load(cited_in_period, publication_period, source_type, limit, offset, req_url)
+            most_cited = self.cache.get(key, load, force=forced_update)
+            if DEBUG_TRACE:
+                ts = time.time()
+                print(f"{ts}: [MostCited] Period: {cited_in_period} Limit: {limit} Offset: {offset} Forced:{forced_update} Cache: {self.cache.stats()}")
 
-            ret_val = self.most_cited
+            # a copy, since the caller may change it
+            ret_val = most_cited.copy(deep=True)
             ret_val.documentList.responseInfo.limit = limit
             ret_val.documentList.responseInfo.offset = offset
 
         except Exception as e:
-            pass
+            logger.error(f"MostCitedCacheError: {e}")
 
         return ret_val
 
@@ -149,7 +170,7 @@ if __name__ == "__main__":
     logger.addHandler(ch)
     
     mvdb = mostCitedCache()
-    print ("%s: %s" % (mvdb.expires, mvdb.get_most_cited()))
+    print ("%s: %s" % (mvdb.cache.stats(), mvdb.get_most_cited()))
 
     print ("Fini. Tests complete.")
     
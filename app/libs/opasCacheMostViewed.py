@@ -7,9 +7,13 @@ import time
 from datetime import datetime, timedelta
 from fastapi import HTTPException
 import starlette.status as httpCodes
-from opasConfig import CACHEURL, DEBUG_TRACE, CACHE_EXPIRES_DAYS, CACHE_EXPIRES_HOURS, CACHE_EXPIRES_MINUTES, DEFAULT_LIMIT_FOR_MOST_VIEWED, DEFAULT_LIMIT_FOR_CACHE
+from opasConfig import CACHEURL, DEBUG_TRACE, CACHE_EXPIRES_DAYS, CACHE_EXPIRES_HOURS, CACHE_EXPIRES_MINUTES, DEFAULT_LIMIT_FOR_MOST_VIEWED, DEFAULT_LIMIT_FOR_CACHE, \
+                      MOST_VIEWED_CACHE_SIZE, MOST_CACHE_MAX_STALE, MOST_VIEWED_PRELOAD_PERIODS
 import models
+import opasQueryCache
+import opasMemoryCache
 from opasCacheSupport import document_get_most_viewed
+from configLib.opasCoreConfig import solr_docs2
 
 def nested_dict(n, type):
     from collections import defaultdict
@@ -19,6 +23,8 @@ def nested_dict(n, type):
         return defaultdict(lambda: nested_dict(n-1, type))
 
 def load_most_viewed(viewperiod = 2, 
+                     publication_period: int=None,
+                     source_type: str="journal",
                      limit=DEFAULT_LIMIT_FOR_MOST_VIEWED,
                      offset=0,
                      session_info=None,
@@ -28,6 +34,8 @@ def load_most_viewed(viewperiod = 2,
     fname = "load_most_viewed"
     try:
         ret_val, ret_status = document_get_most_viewed( view_period=viewperiod,   # 0:lastcalendaryear 1:lastweek 2:lastmonth, 3:last6months, 4:last12months
+                                                        publication_period=publication_period,
+                                                        source_type=source_type,
                                                         limit=limit, 
                                                         offset=offset,
                                                         session_info=session_info, 
@@ -62,6 +70,15 @@ def load_most_viewed(viewperiod = 2,
     return ret_val
 
 class mostViewedCache(object):
+    """
+    Most Viewed lists (without abstracts, so the same for every session), cached per
+      (viewperiod, publication_period, source_type, limit, offset) and Solr index version, so a
+      stat update (opasDataUpdateStat) shows at once.  Lists are reloaded in the background
+      once they expire (see mostCitedCache), and the lists for
+      opasConfig.MOST_VIEWED_PRELOAD_PERIODS are loaded in the background when the server starts
+      (preload_lists, called by main.py's startup hook, not here, so that the processes which
+      only import config, e.g., the loader and render workers, don't query Solr and MySQL).
+    """
     def __init__(self,
                  viewperiod = 2, 
                  limit=DEFAULT_LIMIT_FOR_CACHE,
@@ -69,29 +86,50 @@ class mostViewedCache(object):
                  session_info=None,
                  req_url=CACHEURL
                 ):
-        # load message database
-        self.limit = limit
-        self.offset = offset
-        self.viewperiod = viewperiod
-        self.expires = datetime.now() + timedelta(days=CACHE_EXPIRES_DAYS,
-                                                  hours=CACHE_EXPIRES_HOURS,
-                                                  minutes=CACHE_EXPIRES_MINUTES)
-
-        self.most_viewed = load_most_viewed(viewperiod=viewperiod,
-                                            limit=limit,
-                                            session_info=session_info,
-                                            req_url=req_url)
-        # response.status_message = "Success"
-        self.most_viewed.documentList.responseInfo.request = req_url
-        self.most_viewed.documentList.responseInfo.limit = limit
-        self.most_viewed.documentList.responseInfo.offset = offset       
-        
+        expires = timedelta(days=CACHE_EXPIRES_DAYS,
+                            hours=CACHE_EXPIRES_HOURS,
+                            minutes=CACHE_EXPIRES_MINUTES)
+        self.cache = opasMemoryCache.RefreshingCache(name="most_viewed",
+                                                     maxsize=MOST_VIEWED_CACHE_SIZE,
+                                                     ttl=expires.total_seconds(),
+                                                     max_stale=MOST_CACHE_MAX_STALE)
 
     def __del__(self):
         pass
-    
+
+    def _key_and_load(self, viewperiod, publication_period, source_type, limit, offset, req_url):
+        key = (viewperiod, publication_period, source_type, limit, offset, opasQueryCache.query_cache.index_version(solr_docs2))
+        load = lambda: load_most_viewed(viewperiod=viewperiod,
+                                        publication_period=publication_period,
+                                        source_type=source_type,
+                                        limit=limit,
+                                        offset=offset,
+                                        req_url=req_url)
+        return key, load
+
+    def preload(self,
+                viewperiod = 2, 
+                publication_period: int=None,
+                source_type: str="journal",
+                limit=DEFAULT_LIMIT_FOR_CACHE,
+                offset=0, 
+                req_url=CACHEURL):
+        """
+        Load a list in the background, if it's not cached
+        """
+        self.cache.prefetch(*self._key_and_load(viewperiod, publication_period, source_type, limit, offset, req_url))
+
+    def preload_lists(self, limit=DEFAULT_LIMIT_FOR_CACHE, offset=0, req_url=CACHEURL):
+        """
+        Load the lists for MOST_VIEWED_PRELOAD_PERIODS in the background (at server startup)
+        """
+        for period in MOST_VIEWED_PRELOAD_PERIODS:
+            self.preload(viewperiod=period, limit=limit, offset=offset, req_url=req_url)
+
     def get_most_viewed(self,
                         viewperiod = 2, 
+                        publication_period: int=None,
+                        source_type: str="journal",
                         limit=DEFAULT_LIMIT_FOR_MOST_VIEWED,
                         offset=0, 
                         session_info=None,
@@ -99,30 +137,21 @@ class mostViewedCache(object):
                         forced_update=False                ):
         ret_val = {}
         try:
-            # reload when needed later
-            if self.expires < datetime.now() or forced_update or self.limit != limit or self.viewperiod != viewperiod:
-                self.most_viewed = load_most_viewed(viewperiod=viewperiod, limit=limit, session_info=session_info, req_url=req_url)
-                self.expires = datetime.now() + timedelta(days=CACHE_EXPIRES_DAYS,
-                                                          hours=CACHE_EXPIRES_HOURS,
-                                                          minutes=CACHE_EXPIRES_MINUTES)
-                self.limit = limit
-                self.offset = offset
-                self.viewperiod = viewperiod
-                if DEBUG_TRACE:
-                    ts = time.time()
-                    print(f"{ts}: [MostViewed] Cache updated. Exp: {self.expires} Limit: {limit} Forced:{forced_update}")
+            key, load = self._key_and_load(viewperiod, publication_period, source_type, limit, offset, req_url)
+            most_viewed = self.cache.get(key, load, force=forced_update)
+            if DEBUG_TRACE:
+                ts = time.time()
+                print(f"{ts}: [MostViewed] Period: {viewperiod} Limit: {limit} Offset: {offset} Forced:{forced_update} Cache: {self.cache.stats()}")
 
-            ret_val = self.most_viewed 
+            # a copy, since the caller may change it
+            ret_val = most_viewed.copy(deep=True)
             ret_val.documentList.responseInfo.limit = limit
             ret_val.documentList.responseInfo.offset = offset
 
         except Exception as e:
-            pass
+            logger.error(f"MostViewedCacheError: {e}")
 
         return ret_val
-            
-    def __del__(self):
-        pass
 
 if __name__ == "__main__":
     print (40*"*", "MostViewedCache Tests", 40*"*")
@@ -142,7 +171,7 @@ if __name__ == "__main__":
     logger.addHandler(ch)
     
     mvdb = mostViewedCache()
-    print ("%s: %s" % (mvdb.expires, mvdb.get_most_viewed()))
+    print ("%s: %s" % (mvdb.cache.stats(), mvdb.get_most_viewed()))
 
     print ("Fini. Tests complete.")
     
@@ -9,9 +9,11 @@ This library is supports the main functionality of the OPAS Central Database
 The database has use and usage information.
 
 OPASCENTRAL TABLES (and Views) CURRENTLY USED:
-   vw_stat_most_viewed (depends on vw_stat_docviews_crosstab,
+   vw_stat_most_viewed (depends on api_stat_docviews_summary,
                                    table articles)
 
+   api_stat_docviews_summary (vw_stat_docviews_crosstab, materialized by opasDataUpdateStat)
+
    vw_stat_docviews_crosstab (depends on api_docviews,
                                          vw_stat_docviews_lastmonth,
                                          vw_stat_docviews_lastsixmonths,
@@ -30,7 +32,8 @@ OPASCENTRAL TABLES (and Views) CURRENTLY USED:
     
     Used in generators:
     
-      vw_stat_cited_crosstab_with_details (depeds on vw_stat_cited_crosstab + articles)
+      vw_stat_cited_crosstab_with_details (depends on api_stat_cited_summary, which is vw_stat_cited_crosstab
+                                           materialized by opasDataUpdateStat and opasDataLoader, + articles)
       vw_stat_most_viewed
 
 """
@@ -47,7 +50,11 @@ __version__     = "2021.0602.1"
 __status__      = "Development"
 
 import sys
+import os
 import re
+import threading
+import queue
+import atexit
 # import fnmatch
 
 # import os.path
@@ -60,6 +67,8 @@ from fastapi import Depends
 
 import opasConfig
 from opasConfig import normalize_val # use short form everywhere
+import opasMemoryCache
+import opasMetrics
 
 import localsecrets
 # from localsecrets import DBHOST, DBUSER, DBPW, DBNAME
@@ -199,6 +208,23 @@ def get_password_hash(password):
     """
     return pwd_context.hash(password)
 
+# api_sessions records, keyed by session_id, for get_session_from_db(use_cache=True).  Hits are
+#  database lookups avoided.  Each server process has its own, so entries are short lived;
+#  every write to a session's record here drops it from this process's cache.
+session_cache = opasMemoryCache.TTLCache(name="session_info",
+                                         maxsize=opasConfig.SESSION_INFO_CACHE_SIZE,
+                                         ttl=opasConfig.SESSION_INFO_CACHE_TTL)
+
+def invalidate_session_cache(session_id):
+    """
+    Forget the cached api_sessions record for session_id (e.g., after login, logout, or an update)
+    """
+    ret_val = False
+    if session_id is not None:
+        ret_val = session_cache.invalidate(session_id)
+
+    return ret_val
+
 class ErrorMessageDB(object):
     def __init__(self):
         self.message_data = {}
@@ -220,12 +246,438 @@ class ErrorMessageDB(object):
         return retVal
     
 
+class PoolTimeout(mysql.connector.PoolError):
+    """
+    No pooled connection became free within the pool timeout (the server is overloaded)
+    """
+
+class opasConnectionPool(object):
+    """
+    Process-wide pool of MySQL connections, shared by all opasCentralDB instances
+      which connect with the same host/port/user/database.
+
+    Connections are borrowed by opasCentralDB.open_connection and returned by
+      opasCentralDB.close_connection, so the many short-lived opasCentralDB objects
+      created per endpoint no longer pay for a connect (TCP + auth) every call.
+
+    - At most size connections exist at once (in use + idle); borrowers wait up to
+      timeout seconds for one to be returned.
+    - Idle connections older than recycle seconds are closed and replaced.
+    - Connections idle longer than ping_after_idle seconds are pinged before reuse,
+      and replaced if the ping fails.
+
+    Use get_pool (not the constructor) so a single pool per process is shared.
+
+    >>> pool = get_pool()
+    >>> conn = pool.get_connection()
+    >>> pool.stats()["in_use"] >= 1
+    True
+    >>> pool.release(conn)
+    """
+    def __init__(self,
+                 host, port, user, password, database,
+                 size=opasConfig.DB_POOL_SIZE,
+                 timeout=opasConfig.DB_POOL_TIMEOUT,
+                 recycle=opasConfig.DB_POOL_RECYCLE,
+                 ping_after_idle=opasConfig.DB_POOL_PING_AFTER_IDLE):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after_idle = ping_after_idle
+        self.pid = os.getpid()
+        self._idle = [] # (connection, created_time, last_used_time)
+        self._created_at = {}  # id(connection) -> created time, for connections in use
+        self._cond = threading.Condition()
+        # metrics
+        self.in_use = 0
+        self.waiting = 0
+        self.created = 0
+        self.recycled = 0
+        self.failed_health_checks = 0
+        self.timeouts = 0
+        self.borrowed = 0
+
+    def _connect(self):
+        with opasMetrics.timer("mysql", "connect"):
+            conn = mysql.connector.connect(user=self.user, password=self.password, database=self.database, host=self.host)
+        self.created += 1
+        # statements run on it are timed for /v2/Admin/Metrics
+        return opasMetrics.TimedConnection(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled connection ({e})")
+
+    def _healthy(self, conn, created, last_used):
+        """
+        Return True if an idle connection can be handed out again
+        """
+        now = time.time()
+        if self.recycle and now - created > self.recycle:
+            self.recycled += 1
+            return False
+
+        if now - last_used > self.ping_after_idle:
+            try:
+                conn.ping(reconnect=False)
+            except Exception as e:
+                logger.info(f"Pooled DB connection failed health check ({e}); replacing it.")
+                self.failed_health_checks += 1
+                return False
+
+        return True
+    
+    def get_connection(self):
+        """
+        Borrow a connection from the pool, waiting up to self.timeout seconds if all are in use.
+        
+        Raises PoolTimeout on timeout, or the connect error if a new
+          connection can't be opened.
+        """
+        deadline = time.time() + self.timeout
+        with self._cond:
+            while True:
+                while self._idle:
+                    conn, created, last_used = self._idle.pop()
+                    if self._healthy(conn, created, last_used):
+                        self.in_use += 1
+                        self.borrowed += 1
+                        self._created_at[id(conn)] = created
+                        return conn
+                    else:
+                        self._discard(conn)
+
+                if self.in_use < self.size:
+                    # reserve the slot, connect outside the lock
+                    self.in_use += 1
+                    break
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No DB connection available within {self.timeout} secs (pool size {self.size})")
+
+                self.waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self.in_use -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self.borrowed += 1
+            self._created_at[id(conn)] = time.time()
+
+        return conn
+
+    def release(self, conn):
+        """
+        Return a borrowed connection.  Any open transaction is rolled back (as close() did
+          before pooling) so the next borrower doesn't see a stale snapshot.
+        """
+        reusable = True
+        try:
+            conn.rollback()
+        except Exception as e:
+            logger.debug(f"Pooled DB connection could not be reset ({e}); discarding it.")
+            reusable = False
+
+        with self._cond:
+            self.in_use -= 1
+            created = self._created_at.pop(id(conn), time.time())
+            if reusable and os.getpid() == self.pid:
+                self._idle.append((conn, created, time.time()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        """
+        Close idle connections (e.g., at shutdown).  Connections in use are closed when returned.
+        """
+        with self._cond:
+            while self._idle:
+                conn, created, last_used = self._idle.pop()
+                self._discard(conn)
+
+    def stats(self):
+        """
+        Return a dict of pool metrics
+        """
+        with self._cond:
+            ret_val = {"size": self.size,
+                       "in_use": self.in_use,
+                       "idle": len(self._idle),
+                       "waiting": self.waiting,
+                       "created": self.created,
+                       "borrowed": self.borrowed,
+                       "recycled": self.recycled,
+                       "failed_health_checks": self.failed_health_checks,
+                       "timeouts": self.timeouts,
+                       }
+        return ret_val
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(host=localsecrets.DBHOST,
+             port=localsecrets.DBPORT,
+             user=localsecrets.DBUSER,
+             password=localsecrets.DBPW,
+             database=localsecrets.DBNAME):
+    """
+    Return the process-wide connection pool for these connection parameters, creating it if needed.
+    
+    A pool inherited across a fork is never reused; the child process gets its own.
+    """
+    key = (host, port, user, database, os.getpid())
+    with _pools_lock:
+        ret_val = _pools.get(key)
+        if ret_val is None:
+            ret_val = opasConnectionPool(host=host, port=port, user=user, password=password, database=database)
+            _pools[key] = ret_val
+
+    return ret_val
+
+def get_pool_stats():
+    """
+    Return the metrics for all connection pools in this process, keyed by "user@host/database"
+
+    >>> stats = get_pool_stats()
+    >>> isinstance(stats, dict)
+    True
+    """
+    ret_val = {}
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [(key, pool) for key, pool in _pools.items() if key[-1] == pid]
+        
+    for key, pool in pools:
+        host, port, user, database, pid = key
+        ret_val[f"{user}@{host}/{database}"] = pool.stats()
+
+    return ret_val
+
+USAGE_LOG_COLUMNS = {"api_session_endpoints": ("session_id", "api_endpoint_id", "params", "item_of_interest",
+                                               "return_status_code", "api_method", "return_added_status_message"),
+                     "api_session_endpoints_not_logged_in": ("session_id", "api_endpoint_id", "params", "item_of_interest",
+                                                             "return_status_code", "api_method", "return_added_status_message"),
+                     "api_docviews": ("user_id", "document_id", "session_id", "type", "datetimechar"),
+                     }
+
+class opasUsageLogWriter(object):
+    """
+    Background writer for the usage log tables (USAGE_LOG_COLUMNS), so recording an endpoint
+      call or document view doesn't add a database round trip to the response.
+
+    Rows are queued by add (opasCentralDB.record_session_endpoint and record_document_view)
+      and written by a daemon thread, as multi-row INSERTs with one commit, once
+      batch_size rows are waiting or the oldest has waited flush_ms.
+
+    - The queue holds at most queue_size rows.  When MySQL is slow and it fills, add waits
+      up to put_timeout seconds for room, then drops the row (counted in stats()["dropped"]).
+    - flush waits for the queued rows to be written (main.py calls it at shutdown, and
+      it's registered with atexit for scripts).
+    - Rows of a batch which fails are retried one at a time, so one bad row loses only itself.
+
+    Use get_usage_log_writer (not the constructor) so a single writer per process is shared.
+    """
+    def __init__(self,
+                 batch_size=opasConfig.USAGE_LOG_BATCH_SIZE,
+                 flush_ms=opasConfig.USAGE_LOG_FLUSH_MS,
+                 queue_size=opasConfig.USAGE_LOG_QUEUE_SIZE,
+                 put_timeout=opasConfig.USAGE_LOG_PUT_TIMEOUT):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.pid = os.getpid()
+        self._thread = None
+        self._lock = threading.Lock()
+        # metrics
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.batches = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="opasUsageLogWriter", daemon=True)
+                self._thread.start()
+
+    def add(self, table, row):
+        """
+        Queue a row (tuple of USAGE_LOG_COLUMNS[table] values) to be written.  Returns False if it was dropped.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._start()
+        try:
+            self.queue.put((table, row), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.warning(f"Usage log queue full (MySQL slow or unavailable).  {dropped} rows dropped so far.")
+            return False
+
+        with self._lock:
+            self.queued += 1
+        return True
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Usage log writer error: {e}")
+            finally:
+                for item in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        rows_by_table = {}
+        for table, row in batch:
+            rows_by_table.setdefault(table, []).append(row)
+
+        caller_name = "opasUsageLogWriter"
+        written = 0
+        errors = 0
+        ocd = opasCentralDB()
+        try:
+            opened = ocd.open_connection(caller_name=caller_name)
+        except PoolTimeout:
+            opened = False
+
+        if not opened:
+            errors = len(batch)
+            logger.error(f"Usage log writer could not open database.  {errors} rows lost.")
+        else:
+            try:
+                with closing(ocd.db.cursor()) as cursor:
+                    for table, rows in rows_by_table.items():
+                        columns = USAGE_LOG_COLUMNS[table]
+                        row_sql = "(%s)" % ", ".join(["%s"] * len(columns))
+                        insert_sql = "INSERT INTO %s (%s) VALUES " % (table, ", ".join(columns))
+                        try:
+                            cursor.execute(insert_sql + ", ".join([row_sql] * len(rows)), [value for row in rows for value in row])
+                            ocd.db.commit()
+                            written += len(rows)
+                        except mysql.connector.Error as e:
+                            logger.warning(f"Usage log batch of {len(rows)} rows for {table} failed ({e}).  Retrying by row.")
+                            ocd.db.rollback()
+                            for row in rows:
+                                try:
+                                    cursor.execute(insert_sql + row_sql, row)
+                                    ocd.db.commit()
+                                    written += 1
+                                except mysql.connector.Error as e:
+                                    errors += 1
+                                    logger.error(f"Error logging {table} row {row}: {e}")
+            except Exception as e:
+                errors = len(batch) - written
+                logger.error(f"Usage log writer error: {e}.  {errors} rows lost.")
+            finally:
+                ocd.close_connection(caller_name=caller_name)
+
+        with self._lock:
+            self.written += written
+            self.errors += errors
+            self.batches += 1
+
+    def flush(self, timeout=opasConfig.USAGE_LOG_SHUTDOWN_TIMEOUT):
+        """
+        Wait up to timeout seconds for the queued rows to be written.  Returns True if they all were.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return self.queue.unfinished_tasks == 0
+
+        deadline = time.time() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logger.warning(f"Usage log flush timed out with {self.queue.unfinished_tasks} rows not written.")
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+
+        return True
+
+    def stats(self):
+        """
+        Return a dict of writer metrics
+        """
+        with self._lock:
+            ret_val = {"queue_size": self.queue.qsize(),
+                       "queued": self.queued,
+                       "written": self.written,
+                       "dropped": self.dropped,
+                       "errors": self.errors,
+                       "batches": self.batches,
+                       }
+        return ret_val
+
+_usage_log_writer = None
+_usage_log_writer_lock = threading.Lock()
+
+def get_usage_log_writer():
+    """
+    Return this process's usage log writer, creating it if needed (a forked child gets its own)
+    """
+    global _usage_log_writer
+    with _usage_log_writer_lock:
+        if _usage_log_writer is None or _usage_log_writer.pid != os.getpid():
+            _usage_log_writer = opasUsageLogWriter()
+            atexit.register(_usage_log_writer.flush)
+
+    return _usage_log_writer
+
+def flush_usage_log(timeout=opasConfig.USAGE_LOG_SHUTDOWN_TIMEOUT):
+    """
+    Write the queued usage log rows, if any (e.g., at shutdown).  Returns True if they all were.
+    """
+    ret_val = True
+    if _usage_log_writer is not None and _usage_log_writer.pid == os.getpid():
+        ret_val = _usage_log_writer.flush(timeout=timeout)
+
+    return ret_val
+
 class opasCentralDB(object):
     """
     This object should be used and then discarded on an endpoint by endpoint basis in any
       multiuser mode.
       
     Therefore, keeping session info in the object is ok,
+
+    Some instances are shared at module level by endpoints running in the thread pool, so the
+      connection (db, open_depth, connected) is kept per thread: each thread borrows its own
+      pooled connection, and nested opens share it only within that thread.
     
     >> random_session_id = secrets.token_urlsafe(16)
     >>> import opasDocPermissions
@@ -255,30 +707,79 @@ class opasCentralDB(object):
         self.user = user
         self.password = password
         self.database = database
+        self._local = threading.local() # db, open_depth and connected, per thread
         self.connected = False
         self.db = None
+        self.open_depth = 0 # nested open_connection calls (in this thread) sharing self.db
+        self.pool = get_pool(host=host, port=port, user=user, password=password, database=database)
         self.library_version = self.get_mysql_version()
         self.session_id = session_id # deprecate?
 
+    @property
+    def db(self):
+        return getattr(self._local, "db", None)
+
+    @db.setter
+    def db(self, value):
+        self._local.db = value
+
+    @property
+    def open_depth(self):
+        return getattr(self._local, "open_depth", 0)
+
+    @open_depth.setter
+    def open_depth(self, value):
+        self._local.open_depth = value
+
+    @property
+    def connected(self):
+        return getattr(self._local, "connected", False)
+
+    @connected.setter
+    def connected(self, value):
+        self._local.connected = value
+
     def __del__(self):
-        pass
+        # return a connection left open (by this thread) by an unpaired open_connection
+        if getattr(self, "_local", None) is not None and self.db is not None:
+            self.open_depth = 0
+            self.close_connection(caller_name="__del__")
         
     def open_connection(self, caller_name=""):
         """
         Opens a connection - Try Always!
         
-        If already open, no changes.
+        The connection is borrowed from the process-wide pool, one per thread.
+        If already open in this thread, no changes (the connection is shared with the
+          caller that opened it, and only returned to the pool by the outermost close).
+
+        Returns False if the database can't be reached, but raises PoolTimeout if
+          the pool stays exhausted (all connections in use) for DB_POOL_TIMEOUT secs,
+          so an overloaded server fails the request instead of running it without a DB.
         >>> ocd = opasCentralDB()
         >>> ocd.open_connection("my name")
         True
         >>> ocd.close_connection("my name")
+        False
         """
+        if self.db is not None:
+            self.open_depth += 1
+            return self.connected
+            
         try:
             opasCentralDB.connection_count += 1
-            self.db = mysql.connector.connect(user=self.user, password=self.password, database=self.database, host=self.host)
+            self.db = self.pool.get_connection()
             self.connected = True
+            self.open_depth = 1
             # logger.debug(f"Opened connection #{opasCentralDB.connection_count}")
 
+        except PoolTimeout as e:
+            self.connected = False
+            opasCentralDB.connection_count -= 1
+            logger.error(f"Database connection pool exhausted ({caller_name}) ({e}) {self.pool.stats()}")
+            self.db = None
+            raise
+
         except Exception as e:
             self.connected = False
             opasCentralDB.connection_count -= 1
@@ -288,16 +789,28 @@ class opasCentralDB(object):
         return self.connected
 
     def close_connection(self, caller_name=""):
+        if self.db is None:
+            logger.info(f"caller: {caller_name} the db is not open.")
+            self.open_depth = 0
+            self.connected = False
+            return self.connected
+
+        self.open_depth -= 1
+        if self.open_depth > 0:
+            # still in use by an outer caller
+            return self.connected
+
         try:
             opasCentralDB.connection_count -= 1
-            self.db.close()
-            self.db = None
+            self.pool.release(self.db)
             # logger.debug(f"Database closed by ({caller_name})")
                 
         except Exception as e:
             opasCentralDB.connection_count = 0
-            logger.info(f"caller: {caller_name} the db is not open ({e}).")
+            logger.info(f"caller: {caller_name} the db could not be returned to the pool ({e}).")
 
+        self.db = None
+        self.open_depth = 0
         self.connected = False
         return self.connected
 
@@ -309,6 +822,7 @@ class opasCentralDB(object):
         """
         fname = "end_session"
         ret_val = False
+        invalidate_session_cache(session_id)
         session_info = self.get_session_from_db(session_id)
         if session_info is not None:
             self.open_connection(caller_name=fname) # make sure connection is open
@@ -1161,14 +1675,74 @@ class opasCentralDB(object):
         # return session model object
         return ret_val # None or Session Object
 
-    def get_session_from_db(self, session_id):
+    def get_select_as_row_chunks(self, sqlSelect: str, chunk_size=opasConfig.REPORT_DOWNLOAD_CHUNK_ROWS):
+        """
+        Generic retrieval from database, returning a generator of (column_names, rows) tuples,
+          where rows is a list of up to chunk_size tuples.
+        
+        The connection is borrowed and the query executed before returning, so pool exhaustion
+          (PoolTimeout) and SQL errors are raised to the caller, e.g., before a streamed response
+          has sent its status.  The rows are then read from an unbuffered cursor, so MySQL streams
+          them and only one chunk is held in memory, however large the result.
+        
+        The generator holds its own pooled connection (not this thread's) until it is exhausted
+          or closed, since a streamed response may read each chunk on a different thread.
+        
+        >>> ocd = opasCentralDB()
+        >>> chunks = ocd.get_select_as_row_chunks(sqlSelect="SELECT * from vw_reports_session_activity LIMIT 5;", chunk_size=2)
+        >>> [len(rows) for column_names, rows in chunks]
+        [2, 2, 1]
+        """
+        fname = "get_select_as_row_chunks"
+        conn = self.pool.get_connection() # raises PoolTimeout, or the connect error
+        cursor = None
+        try:
+            cursor = conn.cursor(buffered=False, dictionary=False)
+            cursor.execute(sqlSelect)
+        except Exception as e:
+            logger.error(f"{fname}: query failed ({e})")
+            self._release_row_chunks_connection(conn, cursor, fname)
+            raise
+
+        def row_chunks():
+            try:
+                column_names = cursor.column_names
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield column_names, rows
+            finally:
+                self._release_row_chunks_connection(conn, cursor, fname)
+
+        return row_chunks()
+
+    def _release_row_chunks_connection(self, conn, cursor, caller_name=""):
+        # if the reader stopped early (e.g., the client disconnected), the rest of the result
+        #  is unread; the connection is then discarded by the pool rather than reused
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Exception as e:
+                logger.debug(f"{caller_name}: cursor closed with unread rows ({e})")
+        self.pool.release(conn)
+
+    def get_session_from_db(self, session_id, use_cache=False):
         """
         Get the session record info for session sessionID
         
+        With use_cache, a copy of the record read within the last opasConfig.SESSION_INFO_CACHE_TTL
+          seconds (by this process) is returned without querying the database.
+        
         Tested in main instance docstring
         """
         fname = "get_session_from_db"
         from models import SessionInfo # do this here to avoid circularity
+        if use_cache:
+            ret_val = session_cache.get(session_id)
+            if ret_val is not None:
+                return ret_val.copy() # callers modify the record they get
+            
         self.open_connection(caller_name=fname) # make sure connection is open
         ret_val = None
         if self.db is not None:
@@ -1189,6 +1763,7 @@ class opasCentralDB(object):
         
                         # sessionRecord
                         ret_val = SessionInfo(**session)
+                        session_cache.put(session_id, ret_val.copy())
                     else:
                         ret_val = None
                         logger.debug(f"{fname} - Session info not found in db {session_id}")
@@ -1302,6 +1877,7 @@ class opasCentralDB(object):
         """
         fname = "update_session"
         ret_val = False
+        invalidate_session_cache(session_id)
         self.open_connection(caller_name=fname) # make sure connection is open
         setClause = "SET "
         added = 0
@@ -1414,6 +1990,7 @@ class opasCentralDB(object):
             err_msg = "Parameter error: No session ID specified"
             logger.error(err_msg)
         else:
+            invalidate_session_cache(session_id)
             if not self.open_connection(caller_name="delete_session"): # make sure connection opens
                 logger.error("Delete session could not open database")
             else: # its open
@@ -1454,6 +2031,7 @@ class opasCentralDB(object):
         elif session_info is None: # for now, required
             logger.error(f"No session_info specified")
         else:
+            invalidate_session_cache(session_id)
             if session_info.session_start is None:
                 session_info.session_start = datetime.utcfromtimestamp(time.time()).strftime(opasConfig.TIME_FORMAT_STR_DB)
                 if opasConfig.DEBUG_TRACE: print (f"{fname} set session Start: {session_info.session_start}")
@@ -1597,64 +2175,51 @@ class opasCentralDB(object):
         """
         fname = "record_session_endpoint"
         ret_val = None
-        if not self.open_connection(caller_name=fname): # make sure connection is open
+        try:
+            session_id = session_info.session_id
+            client_id = session_info.api_client_id
+        except:
+            if self.session_id is None:
+                # no session open!
+                logger.error("OCD: No session is open")
+                return ret_val
+            else:
+                session_id = self.session_id
+                client_id = opasConfig.NO_CLIENT_ID
+                
+        # Workaround for None in session id
+        if session_id is None:
+            session_id = opasConfig.NO_SESSION_ID # just to record it
+
+        # TODO: I removed returnStatusCode from here. Remove it from the DB
+        if getattr(session_info, "authenticated", False):
+            table = "api_session_endpoints"
+        else:
+            # TODO: Record in a separate table.
+            table = "api_session_endpoints_not_logged_in"
+
+        row = (session_id, 
+               api_endpoint_id, 
+               params,
+               item_of_interest,
+               return_status_code,
+               api_endpoint_method, 
+               status_message
+              )
+
+        logger.debug(f"Session ID: {session_id} (client {client_id}) accessed Session Endpoint {api_endpoint_id}")
+        if opasConfig.USAGE_LOG_ASYNC:
+            if get_usage_log_writer().add(table, row):
+                ret_val = 1
+        elif not self.open_connection(caller_name=fname): # make sure connection is open
             logger.error("record_session_endpoint could not open database")
         else:
-            try:
-                session_id = session_info.session_id
-                client_id = session_info.api_client_id
-            except:
-                if self.session_id is None:
-                    # no session open!
-                    logger.error("OCD: No session is open")
-                    return ret_val
-                else:
-                    session_id = self.session_id
-                    client_id = opasConfig.NO_CLIENT_ID
-                    
-            # Workaround for None in session id
-            if session_id is None:
-                session_id = opasConfig.NO_SESSION_ID # just to record it
-                
             if self.db is not None:  # shouldn't need this test
                 with closing(self.db.cursor()) as cursor:
-                    # TODO: I removed returnStatusCode from here. Remove it from the DB
-                    if session_info.authenticated:
-                        sql = """INSERT INTO 
-                                    api_session_endpoints(session_id, 
-                                                          api_endpoint_id,
-                                                          params, 
-                                                          item_of_interest, 
-                                                          return_status_code,
-                                                          api_method,
-                                                          return_added_status_message
-                                                         )
-                                                         VALUES 
-                                                         (%s, %s, %s, %s, %s, %s, %s)"""
-                    else:
-                        # TODO: Record in a separate table.
-                        sql = """INSERT INTO 
-                                    api_session_endpoints_not_logged_in(session_id, 
-                                                                        api_endpoint_id,
-                                                                        params, 
-                                                                        item_of_interest, 
-                                                                        return_status_code,
-                                                                        api_method,
-                                                                        return_added_status_message
-                                                                       )
-                                                                       VALUES 
-                                                                       (%s, %s, %s, %s, %s, %s, %s)"""
-    
-                    logger.debug(f"Session ID: {session_id} (client {client_id}) accessed Session Endpoint {api_endpoint_id}")
+                    columns = USAGE_LOG_COLUMNS[table]
+                    sql = "INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(columns), ", ".join(["%s"] * len(columns)))
                     try:
-                        ret_val = cursor.execute(sql, (session_id, 
-                                                       api_endpoint_id, 
-                                                       params,
-                                                       item_of_interest,
-                                                       return_status_code,
-                                                       api_endpoint_method, 
-                                                       status_message
-                                                      ))
+                        ret_val = cursor.execute(sql, row)
                         ret_val = cursor.rowcount
                         self.db.commit()
                     except mysql.connector.IntegrityError as e:
@@ -2125,7 +2690,6 @@ class opasCentralDB(object):
         """
         fname = "record_document_view"
         ret_val = None
-        self.open_connection(caller_name=fname) # make sure connection is open
         try:
             session_id = session_info.session_id
             user_id =  session_info.user_id
@@ -2135,39 +2699,42 @@ class opasCentralDB(object):
             return ret_val
         try:
             if view_type.lower() != "abstract" and view_type.lower() != "image/jpeg":
-                if self.db is not None:
-                    with closing(self.db.cursor()) as cursor:
-                        try:
-                            sql = """INSERT INTO 
-                                        api_docviews(user_id, 
-                                                      document_id, 
-                                                      session_id, 
-                                                      type, 
-                                                      datetimechar
-                                                     )
-                                                     VALUES 
-                                                      (%s, %s, %s, %s, %s)"""
-                            
-                            cursor.execute(sql,
-                                           (user_id,
-                                            document_id,
-                                            session_id, 
-                                            view_type, 
-                                            datetime.utcfromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S')
-                                            )
-                                           )
-                            self.db.commit()
-                            cursor.close()
-                            ret_val = True
-                
-                        except Exception as e:
-                            logger.error(f"Error saving document {document_id} view {view_type} for session {session_id} and user_id {user_id}: {e}")
+                row = (user_id,
+                       document_id,
+                       session_id, 
+                       view_type, 
+                       datetime.utcfromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S')
+                       )
+                if opasConfig.USAGE_LOG_ASYNC:
+                    if get_usage_log_writer().add("api_docviews", row):
+                        ret_val = True
+                else:
+                    self.open_connection(caller_name=fname) # make sure connection is open
+                    if self.db is not None:
+                        with closing(self.db.cursor()) as cursor:
+                            try:
+                                sql = """INSERT INTO 
+                                            api_docviews(user_id, 
+                                                          document_id, 
+                                                          session_id, 
+                                                          type, 
+                                                          datetimechar
+                                                         )
+                                                         VALUES 
+                                                          (%s, %s, %s, %s, %s)"""
+                                
+                                cursor.execute(sql, row)
+                                self.db.commit()
+                                ret_val = True
+                    
+                            except Exception as e:
+                                logger.error(f"Error saving document {document_id} view {view_type} for session {session_id} and user_id {user_id}: {e}")
+
+                    self.close_connection(caller_name=fname) # make sure connection is closed
                     
         except Exception as e:
             logger.error(f"Error checking document view type {view_type}: {e}")
 
-        self.close_connection(caller_name=fname) # make sure connection is closed
-
         return ret_val
    
     def verify_admin(self, session_info):
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasCompileManifest
+
+Records, for each input file compiled by the loader (--smartload), the hash of its content and
+  the versions of the lookup data the compile used (see opasXMLProcessor.get_compile_dependency_versions),
+  so the next run can tell whether the saved output build is still current without relying on
+  file modification times.
+
+  A file needs compiling if it has no entry, if its content hash differs from the recorded one,
+  or if it was compiled against different lookup data (e.g., the glossary terms changed).
+
+The manifest is a json file, written with a temp file and rename so an interrupted run can't
+  leave a partial one.
+
+>>> import tempfile
+>>> path = os.path.join(tempfile.mkdtemp(), "manifest.json")
+>>> manifest = CompileManifest(path, dependency_versions={"glossary": "a1"})
+>>> content_hash("<pepkbd3/>") == content_hash(b"<pepkbd3/>")
+True
+>>> manifest.record("IJP.001.0001A(bKBD3).xml", content_hash("<pepkbd3/>"))
+>>> manifest.save()
+>>> manifest = CompileManifest(path, dependency_versions={"glossary": "a1"})
+>>> manifest.needs_compile("IJP.001.0001A(bKBD3).xml", content_hash("<pepkbd3/>"))
+False
+>>> manifest.needs_compile("IJP.001.0001A(bKBD3).xml", content_hash("<pepkbd3>changed</pepkbd3>"))
+True
+>>> CompileManifest(path, dependency_versions={"glossary": "b2"}).dependencies_changed("IJP.001.0001A(bKBD3).xml")
+True
+"""
+import os
+import json
+import hashlib
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+MANIFEST_FORMAT = 1
+
+def content_hash(contents):
+    """
+    Return the hash recorded for file contents (str or bytes)
+    """
+    if isinstance(contents, str):
+        contents = contents.encode("utf8")
+    return hashlib.sha256(contents).hexdigest()
+
+def dependency_key(dependency_versions):
+    """
+    Reduce a dict of dependency versions to one short key
+    """
+    return hashlib.sha256(json.dumps(dependency_versions, sort_keys=True).encode("utf8")).hexdigest()[:16]
+
+class CompileManifest(object):
+    def __init__(self, path, dependency_versions=None):
+        self.path = path
+        self.dependency_versions = dependency_versions or {}
+        self.dependency_key = dependency_key(self.dependency_versions)
+        self.entries = {} # input file name -> {"hash": content hash, "deps": dependency key}
+        self.changed = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            logger.info(f"No compile manifest at {self.path}.  Starting a new one.")
+        except Exception as e:
+            logger.error(f"Compile manifest {self.path} could not be read ({e}).  Starting a new one.")
+        else:
+            if data.get("format") == MANIFEST_FORMAT:
+                self.entries = data.get("files", {})
+            else:
+                logger.warning(f"Compile manifest {self.path} has an unknown format.  Starting a new one.")
+
+    def save(self):
+        """
+        Write the manifest if anything was recorded since it was loaded (or last saved)
+        """
+        with self._lock:
+            if not self.changed:
+                return
+            data = {"format": MANIFEST_FORMAT,
+                    "dependencies": self.dependency_versions,
+                    "dependency_key": self.dependency_key,
+                    "files": self.entries}
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf8") as f:
+                json.dump(data, f, indent=0, sort_keys=True)
+            os.replace(temp_path, self.path)
+            self.changed = False
+
+    def get(self, filename):
+        return self.entries.get(filename, None)
+
+    def dependencies_changed(self, filename):
+        """
+        True if filename was compiled against lookup data that has since changed
+        """
+        entry = self.get(filename)
+        return entry is not None and entry.get("deps") != self.dependency_key
+
+    def needs_compile(self, filename, file_hash):
+        entry = self.get(filename)
+        return entry is None or entry.get("hash") != file_hash or entry.get("deps") != self.dependency_key
+
+    def record(self, filename, file_hash):
+        """
+        Record that filename, with content file_hash, was compiled with the current lookup data
+        """
+        with self._lock:
+            self.entries[filename] = {"hash": file_hash, "deps": self.dependency_key}
+            self.changed = True
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasCompileManifest Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
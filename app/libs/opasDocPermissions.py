@@ -12,7 +12,7 @@
 import sys
 sys.path.append("..") # Adds higher directory to python modules path.
 
-import requests
+import concurrent.futures
 import datetime
 from datetime import datetime as dt # to avoid python's confusion with datetime.timedelta
 import datetime as dtime 
@@ -53,9 +53,27 @@ from localsecrets import PADS_BASE_URL, PADS_TEST_ID, PADS_TEST_PW # , PADS_BASE
 base = PADS_BASE_URL
 # base = "http://development.org:9300"
 import opasCentralDBLib
+import opasMemoryCache
+import opasHTTPClient
+import opasMetrics
 from config import msgdb
 ocd = opasCentralDBLib.opasCentralDB()
 
+# PaDS permit answers, keyed by (session_id, doc_id, reason_for_check); cleared per session on login/logout
+permit_cache = opasMemoryCache.TTLCache(name="pads_permits",
+                                        maxsize=opasConfig.PADS_PERMIT_CACHE_SIZE,
+                                        ttl=opasConfig.PADS_PERMIT_CACHE_TTL)
+
+def invalidate_session_permits(session_id):
+    """
+    Forget the cached PaDS permit answers for session_id (e.g., after the user logs in or out)
+    """
+    ret_val = 0
+    if session_id is not None:
+        ret_val = permit_cache.invalidate_where(lambda key: key[0] == session_id)
+        
+    return ret_val
+
 def user_logged_in_per_header(request, session_id=None, caller_name="unknown") -> bool:
     """
     Return logged in per header, or None if no info found, unless there's no request
@@ -367,7 +385,7 @@ def get_session_info(request: Request,
            
     # should now have a session id
     if session_id is not None and session_id != opasConfig.NO_SESSION_ID:
-        session_info_from_db = ocd.get_session_from_db(session_id)
+        session_info_from_db = ocd.get_session_from_db(session_id, use_cache=True)
         if session_info_from_db is None: # not in DB
             in_db = False
             update_db = True
@@ -541,7 +559,8 @@ def get_authserver_session_userinfo(session_id, client_id, addl_log_info=""):
     if session_id is not None:
         full_URL = base + f"/v1/Users" + f"?SessionID={session_id}"
         try:
-            response = requests.get(full_URL, headers={"Content-Type":"application/json"}) # Call PaDS
+            with opasMetrics.timer("pads", "users"):
+                response = opasHTTPClient.get(full_URL, headers={"Content-Type":"application/json"}) # Call PaDS
             ocd.log_pads_calls(caller=caller_name, reason=caller_name + addl_log_info, session_id=session_id, pads_call=full_URL, return_status_code=response.status_code) # Log Call PaDS
             
         except Exception as e:
@@ -604,13 +623,16 @@ def authserver_login(username=PADS_TEST_ID,
     caller_name = "authserver_login"
     
     logger.info(f"Logging in user {username} with session_id {session_id}")
+    invalidate_session_permits(session_id)
+    opasCentralDBLib.invalidate_session_cache(session_id)
     if session_id is not None:
         full_URL = base + f"/v1/Authenticate/?SessionId={session_id}"
     else:
         full_URL = base + f"/v1/Authenticate/"
 
     try:
-        pads_response = requests.post(full_URL, headers={"Content-Type":"application/json"}, json={"UserName":f"{username}", "Password":f"{password}"})
+        with opasMetrics.timer("pads", "authenticate"):
+            pads_response = opasHTTPClient.post(full_URL, headers={"Content-Type":"application/json"}, json={"UserName":f"{username}", "Password":f"{password}"})
         ocd.log_pads_calls(caller=caller_name, reason=caller_name, session_id=session_id, pads_call=full_URL, return_status_code=pads_response.status_code, params=username) # Log Call PaDS
         
     except Exception as e:
@@ -668,6 +690,10 @@ def authserver_login(username=PADS_TEST_ID,
                 pads_session_info.pads_status_response = status_code
                 pads_session_info.pads_disposition = msg 
                 
+    if pads_session_info.SessionId != session_id:
+        invalidate_session_permits(pads_session_info.SessionId)
+        opasCentralDBLib.invalidate_session_cache(pads_session_info.SessionId)
+
     return pads_session_info
 
 def authserver_logout(session_id, request: Request=None, response: Response=None):
@@ -675,12 +701,15 @@ def authserver_logout(session_id, request: Request=None, response: Response=None
     caller_name = "authserver_logout"
     
     if session_id is not None:
+        invalidate_session_permits(session_id)
+        opasCentralDBLib.invalidate_session_cache(session_id)
         if response is not None:
             response.delete_cookie(key=opasConfig.OPASSESSIONID,path="/",
                                    domain=localsecrets.COOKIE_DOMAIN)
         # call PaDS
         full_URL = base + f"/v1/Users/Logout/?SessionId={session_id}"
-        response = requests.post(full_URL, headers={"Content-Type":"application/json"})
+        with opasMetrics.timer("pads", "logout"):
+            response = opasHTTPClient.post(full_URL, headers={"Content-Type":"application/json"})
         ocd.log_pads_calls(caller=caller_name, reason=caller_name, session_id=session_id, pads_call=full_URL, return_status_code=response.status_code) # Log Call PaDS
         if response.ok:
             ret_val = True
@@ -702,6 +731,12 @@ def authserver_permission_check(session_id,
     ret_resp = None
     if reason_for_check is None:
         logger.warning(f"{caller_name}: fulltext_request info not supplied")
+
+    cache_key = (session_id, doc_id, reason_for_check)
+    if reason_for_check != opasConfig.AUTH_DOCUMENT_VIEW_REQUEST or opasConfig.PADS_PERMIT_CACHE_FULLTEXT:
+        ret_resp = permit_cache.get(cache_key)
+        if ret_resp is not None:
+            return ret_resp.Permit, ret_resp.copy()
         
     full_URL = base + f"/v1/Permits?SessionId={session_id}&DocId={doc_id}&DocYear={doc_year}&ReasonForCheck={reason_for_check}"
 
@@ -712,7 +747,8 @@ def authserver_permission_check(session_id,
         headers = None
 
     try: # permit request to PaDS
-        response = requests.get(full_URL, headers=headers) # Call PaDS
+        with opasMetrics.timer("pads", "permits"):
+            response = opasHTTPClient.get(full_URL, headers=headers) # Call PaDS
         ocd.log_pads_calls(caller=caller_name, reason=reason_for_check, session_id=session_id, pads_call=full_URL, return_status_code=response.status_code, params=doc_id) # Log Call PaDS
         
     except Exception as e:
@@ -784,6 +820,14 @@ def authserver_permission_check(session_id,
             ret_resp = models.PadsPermitInfo(SessionId=session_id,
                                              DocId=doc_id,
                                              ReasonStr=msg)
+        else:
+            # only remember real answers from PaDS, not the stand-ins used when it's down
+            if ret_resp.ReasonStr != "PaDS not responding":
+                if ret_resp.StatusCode == httpCodes.HTTP_200_OK:
+                    permit_cache.put(cache_key, ret_resp.copy())
+                elif ret_resp.StatusCode == httpCodes.HTTP_401_UNAUTHORIZED:
+                    # only briefly: the user may log in through another process (or PaDS), which won't clear it here
+                    permit_cache.put(cache_key, ret_resp.copy(), ttl=opasConfig.PADS_PERMIT_CACHE_DENIED_TTL)
 
     return ret_val, ret_resp      
         
@@ -794,7 +838,8 @@ def get_access_limitations(doc_id,
                            doi=None,
                            documentListItem: models.DocumentListItem=None,  # deprecated, not used
                            fulltext_request:bool=None,
-                           request=None):
+                           request=None,
+                           collect_userinfo:bool=True):
     """
     Based on the classification of the document (archive, current [embargoed],
        free, offsite), and the users permissions in session_info, determine whether
@@ -803,6 +848,9 @@ def get_access_limitations(doc_id,
        
     20210428 - removed documentListItem and update side effects, caller should copy access
                There are still side effects on session_info
+
+    With collect_userinfo False, a full-text permit doesn't fetch the PaDS user info of a
+      session not yet identified (see collect_session_userinfo); the caller does it once.
        
     """
     caller_name = "get_access_limitations"
@@ -1043,29 +1091,9 @@ def get_access_limitations(doc_id,
                                         ret_val.accessLimited = False
                                         ret_val.accessChecked = True
     
-                                if fulltext_request and pads_authorized:
+                                if fulltext_request and pads_authorized and collect_userinfo:
                                     # let's make sure we know about this user.
-                                    if session_info.user_id == opasConfig.USER_NOT_LOGGED_IN_NAME:
-                                        # We got this far, We need to find out who this is
-                                        pads_user_info, status_code = get_authserver_session_userinfo(session_info.session_id, session_info.api_client_id, addl_log_info=" (user info not yet collected)")
-                                        ret_val.accessChecked = True
-                                        if pads_user_info is not None:
-                                            session_info.user_id = pads_user_info.UserId
-                                            session_info.username = pads_user_info.UserName
-                                            session_info.user_type = pads_user_info.UserType # TODO - Add this to session table
-                                            # session_info.session_expires_time = ?
-                                            # ocd = opasCentralDBLib.opasCentralDB()
-                                            ocd.update_session(session_info.session_id,
-                                                               userID=session_info.user_id,
-                                                               username=session_info.username,
-                                                               usertype=session_info.user_type,
-                                                               authenticated=1,
-                                                               authorized_peparchive=1 if session_info.authorized_peparchive == True else 0,
-                                                               authorized_pepcurrent=1 if session_info.authorized_pepcurrent == True else 0,
-                                                               session_end=session_info.session_expires_time,
-                                                               api_client_id=session_info.api_client_id
-                                                               )
-                                                
+                                    collect_session_userinfo(session_info)
                                             
                                 if pads_authorized:
                                     # "This content is available for you to access"
@@ -1135,6 +1163,114 @@ def get_access_limitations(doc_id,
 
     return ret_val
 
+def collect_session_userinfo(session_info):
+    """
+    For a session PaDS has authorized, but whose user isn't known yet, get the user
+      info from PaDS and save it in session_info and the api_sessions table.
+    """
+    if session_info.user_id == opasConfig.USER_NOT_LOGGED_IN_NAME:
+        # We got this far, We need to find out who this is
+        pads_user_info, status_code = get_authserver_session_userinfo(session_info.session_id, session_info.api_client_id, addl_log_info=" (user info not yet collected)")
+        if pads_user_info is not None:
+            session_info.user_id = pads_user_info.UserId
+            session_info.username = pads_user_info.UserName
+            session_info.user_type = pads_user_info.UserType # TODO - Add this to session table
+            # session_info.session_expires_time = ?
+            # ocd = opasCentralDBLib.opasCentralDB()
+            ocd.update_session(session_info.session_id,
+                               userID=session_info.user_id,
+                               username=session_info.username,
+                               usertype=session_info.user_type,
+                               authenticated=1,
+                               authorized_peparchive=1 if session_info.authorized_peparchive == True else 0,
+                               authorized_pepcurrent=1 if session_info.authorized_pepcurrent == True else 0,
+                               session_end=session_info.session_expires_time,
+                               api_client_id=session_info.api_client_id
+                               )
+
+# the session_info fields get_access_limitations changes from a PaDS answer
+SESSION_ACCESS_FIELDS = ("authenticated", "authorized_peparchive", "authorized_pepcurrent")
+
+def get_access_limitations_for_list(document_list_items,
+                                    session_info,
+                                    fulltext_request:bool=None,
+                                    request=None,
+                                    max_workers=opasConfig.PADS_PERMISSION_CHECK_MAX_WORKERS):
+    """
+    Resolve access limitations for a whole page of documents (e.g., a search result page),
+      returning a dict of documentID -> AccessLimitations (as returned by get_access_limitations).
+
+    PaDS has no bulk permits call, so the checks which need PaDS are made concurrently, with
+      at most max_workers requests in flight, rather than serially one per document.
+
+    The first document is checked alone: a PaDS answer that authorizes PEPArchive or PEPCurrent
+      is saved in session_info, which lets get_access_limitations skip PaDS for the rest of the
+      page, as it did when called serially; for full-text, the PaDS user info of a session not yet
+      identified is collected then (collect_session_userinfo).  The concurrent checks don't collect
+      it, so PaDS is asked for it, and api_sessions updated, at most once, from this thread.
+
+    Each concurrent check works on its own copy of session_info, so one document's PaDS answer
+      (e.g., an error, which clears the authorizations) doesn't change the checks of the others
+      while they run.  The changes each one made to the session's access fields
+      (SESSION_ACCESS_FIELDS) are applied to session_info afterwards, in document order, as a
+      serial run would have left them.
+    """
+    ret_val = {}
+    items = [item for item in document_list_items if item is not None and item.documentID is not None]
+
+    def check(item, collect_userinfo=True, item_session_info=session_info):
+        return get_access_limitations(doc_id=item.documentID,
+                                      classification=item.accessClassification, # based on file_classification (where it is)
+                                      year=item.year,
+                                      doi=item.doi,
+                                      session_info=item_session_info,
+                                      documentListItem=item,
+                                      fulltext_request=fulltext_request,
+                                      request=request,
+                                      collect_userinfo=collect_userinfo)
+
+    def check_copy(item):
+        # returns the access limitations, and the session access fields the check changed
+        if session_info is None:
+            return check(item, False), {}
+        item_session_info = session_info.copy()
+        access = check(item, False, item_session_info)
+        changes = {field: getattr(item_session_info, field) for field in SESSION_ACCESS_FIELDS
+                   if getattr(item_session_info, field) != getattr(session_info, field)}
+        return access, changes
+
+    if items:
+        first = items.pop(0)
+        ret_val[first.documentID] = check(first)
+
+    if len(items) == 1 or max_workers is None or max_workers <= 1:
+        for item in items:
+            ret_val[item.documentID] = check(item)
+    elif items:
+        session_changes = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+            futures = {executor.submit(check_copy, item): item.documentID for item in items}
+            for future in concurrent.futures.as_completed(futures):
+                doc_id = futures[future]
+                try:
+                    ret_val[doc_id], session_changes[doc_id] = future.result()
+                except Exception as e:
+                    logger.error(f"get_access_limitations_for_list: Permission check for {doc_id} failed: {e}")
+                    ret_val[doc_id] = None
+
+        # merge what the checks learned about the session, in document order
+        for item in items:
+            for field, value in session_changes.get(item.documentID, {}).items():
+                setattr(session_info, field, value)
+
+        if fulltext_request and session_info is not None:
+            # a later document was the first one PaDS permitted
+            permitted = [access for access in ret_val.values() if access is not None and access.accessLimitedAuthResponse is not None and not access.accessLimited]
+            if permitted:
+                collect_session_userinfo(session_info)
+
+    return ret_val
+
 # ##################################################################################################################################################
 #
 #  LOCAL ROUTUNES
@@ -1173,19 +1309,22 @@ def get_pads_session_info(session_id=None,
         logger.debug(f"{caller_name}: calling PaDS")
         if user_ip is not None and user_ip is not '':
             headers = { opasConfig.X_FORWARDED_FOR:user_ip }
-            pads_session_info = requests.get(full_URL, headers) # Call PaDS
+            with opasMetrics.timer("pads", "authenticate_ip"):
+                pads_session_info = opasHTTPClient.get(full_URL, headers) # Call PaDS
             status_code = pads_session_info.status_code # save it for a bit (we replace pads_session_info below); this is only in PaDS return of pads_session_info, not in the model.
             msg = f"{caller_name}: Session ID:{session_id}. X_FORWARDED_FOR from authenticateIP: {user_ip}. URL: {req_url} PaDS Session Info: {pads_session_info}"
             logger.debug(msg)
             if opasConfig.PADS_INFO_TRACE: print (f"PADS Monitor: {msg}")
         else:
             if session_id is not None:
-                pads_session_info = requests.get(full_URL) # Call PaDS
+                with opasMetrics.timer("pads", "authenticate_ip"):
+                    pads_session_info = opasHTTPClient.get(full_URL) # Call PaDS
                 status_code = pads_session_info.status_code # save it for a bit (we replace pads_session_info below)
                 if opasConfig.PADS_INFO_TRACE: print (f"PADS Monitor: {full_URL} / {pads_session_info}")
                 
             else: # we need a session id, go ahead and ask Pads (separate for tracking)
-                pads_session_info = requests.get(full_URL) # Call PaDS
+                with opasMetrics.timer("pads", "authenticate_ip"):
+                    pads_session_info = opasHTTPClient.get(full_URL) # Call PaDS
                 status_code = pads_session_info.status_code # save it for a bit (we replace pads_session_info below)
                 if opasConfig.PADS_INFO_TRACE: print (f"PADS Monitor: {full_URL} / {pads_session_info}")
             
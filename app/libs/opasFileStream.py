@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasFileStream
+
+Streaming responses for files read through opasFileSupport.FlexFileSystem (S3 or local), with
+  HTTP Range support.  The file is sent on as it's read, in opasConfig.FILE_STREAM_CHUNK_SIZE
+  chunks, rather than downloaded to local disk first.
+
+  - file_response: a file as it is (e.g., an image)
+  - stamped_pdf_response: an original PDF with the user's copyright footer on every page.  The
+    footer is added as a PDF incremental update appended to the original bytes
+    (opasPDFStampCpyrght.copyright_stamp_update), so the original can be streamed unchanged.
+
+The stamp is made in two parts.  The page objects it adds, with their offsets, are the same for
+  every user, and can only be made once the whole original has been read (into memory, not to
+  disk); they're kept per original file (opasConfig.PDF_STAMP_STRUCTURE_CACHE_SIZE/TTL).  From
+  them and the username alone, each user's stamp is then made without the original.
+
+So only the first request for an original, before its structure is kept, reads it whole: a plain
+  request is then sent without a Content-Length (the original streams as it's read and the stamp
+  follows it), and a Range request reads the original first.  Otherwise the stamp is made before
+  the response, so its length is known, and ranges are served by reading only the bytes asked
+  for.  Each user's stamp is also kept (opasConfig.PDF_STAMP_CACHE_SIZE/TTL), for the byte ranges
+  a PDF viewer asks for.
+
+>>> parse_range("bytes=0-99", 1000), parse_range("bytes=900-", 1000), parse_range("bytes=-100", 1000)
+((0, 100), (900, 1000), (900, 1000))
+>>> parse_range(None, 1000) is None, parse_range("bytes=0-9,20-29", 1000) is None
+(True, True)
+>>> parse_range("bytes=1000-", 1000)
+Traceback (most recent call last):
+...
+opasFileStream.RangeNotSatisfiable: bytes=1000-
+"""
+import re
+from urllib.parse import quote
+
+from starlette.responses import Response, StreamingResponse
+import starlette.status as httpCodes
+
+import opasConfig
+import opasMemoryCache
+import opasPDFStampCpyrght
+
+import logging
+logger = logging.getLogger(__name__)
+
+rcx_range = re.compile(r"^\s*bytes\s*=\s*(?P<start>\d*)\s*-\s*(?P<end>\d*)\s*$", re.IGNORECASE)
+
+# (filename, size, username) -> the bytes appended to stamp the original (b"" if it couldn't be stamped)
+stamp_cache = opasMemoryCache.TTLCache(name="pdf_stamps", maxsize=opasConfig.PDF_STAMP_CACHE_SIZE, ttl=opasConfig.PDF_STAMP_CACHE_TTL)
+# (filename, size) -> opasPDFStampCpyrght.copyright_stamp_structure of the original ({} if it can't be stamped)
+structure_cache = opasMemoryCache.TTLCache(name="pdf_stamp_structures", maxsize=opasConfig.PDF_STAMP_STRUCTURE_CACHE_SIZE, ttl=opasConfig.PDF_STAMP_STRUCTURE_CACHE_TTL)
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+def parse_range(range_header, size):
+    """
+    Return (start, end) (end exclusive) for a single range Range header, or None to send the whole
+      file (no header, or one this doesn't handle, such as multiple ranges).  Raises
+      RangeNotSatisfiable if the range is outside the file.
+    """
+    ret_val = None
+    if range_header:
+        m = rcx_range.match(range_header)
+        if m is not None and (m.group("start") or m.group("end")):
+            if m.group("start"):
+                start = int(m.group("start"))
+                end = int(m.group("end")) + 1 if m.group("end") else size
+            else: # suffix: the last n bytes
+                start = max(size - int(m.group("end")), 0)
+                end = size
+            end = min(end, size)
+            if start >= end:
+                raise RangeNotSatisfiable(range_header)
+            ret_val = (start, end)
+
+    return ret_val
+
+def content_disposition(download_name):
+    quoted_name = quote(download_name)
+    if quoted_name != download_name:
+        ret_val = f"attachment; filename*=utf-8''{quoted_name}"
+    else:
+        ret_val = f'attachment; filename="{download_name}"'
+
+    return ret_val
+
+def _response(content, size, byte_range, media_type, download_name):
+    """
+    Return the StreamingResponse (206 for a range) for content, an iterator of the bytes of the requested range of a file of size bytes
+    """
+    headers = {"Accept-Ranges": "bytes",
+               "Content-Disposition": content_disposition(download_name)}
+    if byte_range is not None:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        headers["Content-Length"] = str(end - start)
+        status_code = httpCodes.HTTP_206_PARTIAL_CONTENT
+    else:
+        if size is not None:
+            headers["Content-Length"] = str(size)
+        status_code = httpCodes.HTTP_200_OK
+
+    return StreamingResponse(content, status_code=status_code, media_type=media_type, headers=headers)
+
+def _not_satisfiable(size):
+    return Response(status_code=httpCodes.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers={"Content-Range": f"bytes */{size}"})
+
+def file_response(flex_fs, filename, media_type, download_name, range_header=None):
+    """
+    Return a streaming response for filename (a full name on flex_fs), or the requested range of it
+    """
+    size = flex_fs.get_file_size(filename)
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return _not_satisfiable(size)
+
+    start, end = byte_range if byte_range is not None else (0, size)
+    return _response(flex_fs.read_chunks(filename, start=start, end=end), size, byte_range, media_type, download_name)
+
+def make_structure(pdf_data, structure_key):
+    """
+    Return (and keep) the stamp structure of the original pdf_data; {} if it can't be stamped
+    """
+    try:
+        ret_val = opasPDFStampCpyrght.copyright_stamp_structure(pdf_data)
+    except Exception as e:
+        # as with stampcopyright, the original is still sent
+        logger.error(f"Could not stamp copyright on {structure_key[0]}; sending without marks (error:{e})")
+        ret_val = {}
+
+    structure_cache.put(structure_key, ret_val)
+    return ret_val
+
+def make_stamp(username, structure, key):
+    """
+    Return (and keep) the bytes to append to the original to stamp it for username, from its structure; b"" if it can't be stamped
+    """
+    ret_val = b""
+    if structure:
+        try:
+            ret_val = opasPDFStampCpyrght.copyright_stamp_from_structure(username, structure)
+        except Exception as e:
+            logger.error(f"Could not stamp copyright for user {username} on {key[0]}; sending without marks (error:{e})")
+
+    stamp_cache.put(key, ret_val)
+    return ret_val
+
+def stamped_pdf_response(flex_fs, filename, username, download_name, media_type="application/pdf", range_header=None):
+    """
+    Return a streaming response for the original PDF filename (a full name on flex_fs), stamped for username, or the requested range of it
+    """
+    original_size = flex_fs.get_file_size(filename)
+    structure_key = (filename, original_size)
+    key = (filename, original_size, username)
+    stamp = stamp_cache.get(key)
+    if stamp is None:
+        structure = structure_cache.get(structure_key)
+        if structure is None and range_header:
+            # the full length is needed for a range
+            structure = make_structure(b"".join(flex_fs.read_chunks(filename)), structure_key)
+        if structure is not None:
+            stamp = make_stamp(username, structure, key)
+
+    if stamp is None:
+        # the first request for this original: its structure is made as it's read
+        def content():
+            chunks = []
+            for chunk in flex_fs.read_chunks(filename):
+                chunks.append(chunk)
+                yield chunk
+            yield make_stamp(username, make_structure(b"".join(chunks), structure_key), key)
+
+        ret_val = _response(content(), None, None, media_type, download_name)
+    else:
+        size = original_size + len(stamp)
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return _not_satisfiable(size)
+
+        start, end = byte_range if byte_range is not None else (0, size)
+        def content():
+            if start < original_size:
+                yield from flex_fs.read_chunks(filename, start=start, end=min(end, original_size))
+            if end > original_size:
+                yield stamp[max(start - original_size, 0):end - original_size]
+
+        ret_val = _response(content(), size, byte_range, media_type, download_name)
+
+    return ret_val
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasFileStream Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
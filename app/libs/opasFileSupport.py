@@ -518,6 +518,46 @@ class FlexFileSystem(object):
       
         return ret_val
     #-----------------------------------------------------------------------------
+    def get_file_size(self, filename):
+        """
+        Return the size in bytes of filename (a full name, e.g., from get_download_filename)
+        """
+        if self.fs is not None:
+            ret_val = self.fs.size(filename)
+        else:
+            ret_val = os.path.getsize(filename)
+
+        return ret_val
+    #-----------------------------------------------------------------------------
+    def read_chunks(self, filename, start=0, end=None, chunk_size=None):
+        """
+        Yield the bytes of filename (a full name, e.g., from get_download_filename) from start up to
+          end (exclusive; the end of the file if None), chunk_size (default
+          opasConfig.FILE_STREAM_CHUNK_SIZE) at a time, so a large file can be sent on as it's read
+          (on S3, as ranged reads) rather than copied locally first.
+        """
+        if chunk_size is None: # (not a default argument: opasConfig imports this module)
+            chunk_size = opasConfig.FILE_STREAM_CHUNK_SIZE
+
+        if self.fs is not None:
+            f = self.fs.open(filename, "rb")
+        else:
+            f = open(filename, "rb")
+
+        try:
+            if start:
+                f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+    #-----------------------------------------------------------------------------
     def get_file_contents(self, filespec, path=None):
         """
         Return the contents of a non-binary file
@@ -28,6 +28,9 @@ from datetime import datetime
 from dateutil import parser
 import calendar
 import email.utils
+import csv
+import io
+import json
 import opasConfig
 # import roman
 import difflib
@@ -402,6 +405,44 @@ def format_http_timestamp(ts: Union[int, float, tuple, time.struct_time, datetim
         raise TypeError(f'unknown timestamp type: {repr(ts)}')
     return email.utils.formatdate(time_num, usegmt=True)
 
+def csv_chunks(row_chunks, header=None):
+    """
+    Encode (column_names, rows) chunks (e.g., from opasCentralDB.get_select_as_row_chunks)
+      as CSV text, one string per chunk, starting with the header (default, the column names).
+    None is written as an empty field, as pandas to_csv does.
+
+    >>> list(csv_chunks([(("id", "name"), [(1, "Freud, S."), (2, None)])], header=["user id", "user name"]))
+    ['user id,user name\\n1,"Freud, S."\\n2,\\n']
+    """
+    stream = io.StringIO()
+    writer = csv.writer(stream, lineterminator="\n")
+    for column_names, rows in row_chunks:
+        if header is None:
+            header = column_names
+        if header is not False:
+            writer.writerow(header)
+            header = False
+        writer.writerows(rows)
+        yield stream.getvalue()
+        stream.seek(0)
+        stream.truncate()
+
+    if header: # no rows, header only
+        writer.writerow(header)
+        yield stream.getvalue()
+
+def ndjson_chunks(row_chunks):
+    """
+    Encode (column_names, rows) chunks as newline delimited JSON (one object per row,
+      keyed by column name), one string per chunk.  Dates and other non-JSON types are
+      written as strings.
+
+    >>> list(ndjson_chunks([(("id", "last_update"), [(1, datetime(2022, 1, 2, 3, 4, 5))])]))
+    ['{"id": 1, "last_update": "2022-01-02 03:04:05"}\\n']
+    """
+    for column_names, rows in row_chunks:
+        yield "".join(json.dumps(dict(zip(column_names, row)), default=str) + "\n" for row in rows)
+
 def derive_author_mast(authorIDList):
     """
     """
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasHTTPCache
+
+Conditional GET (ETag/Last-Modified, If-None-Match/If-Modified-Since) and Cache-Control for
+  documents, abstracts, glossary entries and images, which only change when the loader reloads
+  them.
+
+  - The ETag of a documents response is derived from each document's file_last_modified (or a hash
+    of its content where there's none, e.g., glossary entries), its access (accessChecked,
+    accessLimited), the request (path and query), so it changes with the user's access level, and
+    the stylesheet version (opasArtifactCache.stylesheet_version), so a changed XSLT or CSS isn't
+    answered with a 304.  An image's ETag is a hash of its bytes.
+  - The validators sent are kept (opasConfig.HTTP_VALIDATOR_CACHE_SIZE/TTL) per request, and, for
+    permissioned resources, per session, user and access (authentication and authorization).  A repeat request whose
+    If-None-Match (or If-Modified-Since) matches gets a 304 before any Solr or XSLT work.  They're
+    kept with the Solr index version (read through opasQueryCache, at most every
+    opasConfig.QUERY_CACHE_VERSION_CHECK seconds), so a reload stops them matching, and with the
+    document view recorded for the response, if any, so the endpoint can record the view again for
+    the 304 (kept_view_type).
+  - Without kept validators (a new server process, or another one), the response is generated, and
+    if its ETag matches the request's, a 304 is still returned instead of the body.
+  - Permissioned responses are "private, no-cache" (the browser may keep them, but must revalidate);
+    public ones (images) are "public, max-age=opasConfig.HTTP_CACHE_PUBLIC_MAX_AGE", so a CDN can
+    serve them too.
+
+>>> from starlette.requests import Request
+>>> def request(headers=()):
+...     return Request({"type": "http", "method": "GET", "path": "/v2/Documents/Image/AIM.036.0275A.FIG001/",
+...                     "query_string": b"download=0&client-session=abc", "headers": list(headers)})
+>>> cache = ValidatorCache(name="http_validators_doctest", get_index_version=lambda solr_core: 1)
+>>> key = request_key(request())
+>>> key
+('/v2/Documents/Image/AIM.036.0275A.FIG001/', (('download', '0'),))
+>>> cache.check(request(), key) is None # nothing sent yet
+True
+>>> etag = make_etag(b"image bytes")
+>>> response = Response(b"image bytes")
+>>> cache.respond(request(), response, key, etag, public=True) is None
+True
+>>> response.headers["etag"] == etag, response.headers["cache-control"]
+(True, 'public, max-age=86400')
+>>> cache.check(request([(b"if-none-match", etag.encode())]), key).status_code
+304
+>>> cache.check(request([(b"if-none-match", b'"other"')]), key) is None
+True
+>>> cache.kept_view_type(key) is None # images aren't recorded as views here
+True
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from starlette.responses import Response
+import starlette.status as httpCodes
+
+import opasConfig
+import opasMemoryCache
+import opasQueryCache
+import opasArtifactCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+# query parameters which identify the caller rather than what's asked for
+CALLER_PARAMS = ("client-id", "client-session", "client_id", "client_session")
+
+def make_etag(*parts):
+    """
+    Return a (weak) ETag for the parts, which may be str, bytes or other values with a stable str()
+    """
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(part if isinstance(part, bytes) else str(part).encode("utf8"))
+        hasher.update(b"\x00")
+
+    return f'W/"{hasher.hexdigest()[:32]}"'
+
+def to_datetime(value):
+    """
+    Return value (a datetime or a Solr date string) as an aware UTC datetime, or None
+    """
+    ret_val = None
+    if isinstance(value, str):
+        try:
+            value = datetime.strptime(value, opasConfig.TIME_FORMAT_STR)
+        except ValueError:
+            value = None
+
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        ret_val = value.astimezone(timezone.utc).replace(microsecond=0)
+
+    return ret_val
+
+def documents_validators(documents, variant=""):
+    """
+    Return (etag, last_modified) for a models.Documents response.  last_modified is None unless
+      every document has its file_last_modified (updated).
+    """
+    parts = [variant, opasArtifactCache.stylesheet_version()]
+    dates = []
+    for item in documents.documents.responseSet:
+        updated = to_datetime(item.updated)
+        dates.append(updated)
+        parts.extend((item.documentID, getattr(item, "termID", None), item.accessChecked, item.accessLimited))
+        if updated is not None:
+            parts.append(updated.isoformat())
+        else:
+            parts.append(make_etag(item.document or "", item.abstract or ""))
+
+    last_modified = max(dates) if dates and None not in dates else None
+    return make_etag(*parts), last_modified
+
+def request_key(request, session_info=None):
+    """
+    Return the key for the validators of a request: the path and query (without the caller's ids),
+      plus, for permissioned resources (session_info given), the session, its user and their access
+      (authentication and archive/current authorization), so a 304 is only sent before the access
+      check when the access is the same as when the validators were sent
+    """
+    params = tuple(sorted((name, value) for name, value in request.query_params.multi_items() if name not in CALLER_PARAMS))
+    ret_val = (request.url.path, params)
+    if session_info is not None:
+        ret_val += (session_info.session_id,
+                    session_info.user_id,
+                    session_info.authenticated,
+                    session_info.authorized_peparchive,
+                    session_info.authorized_pepcurrent)
+
+    return ret_val
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match header with etag
+    """
+    opaque_tag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or (candidate[2:] if candidate.startswith("W/") else candidate) == opaque_tag:
+            return True
+
+    return False
+
+def is_not_modified(request, etag, last_modified=None):
+    """
+    Return True if the request's validators match; If-None-Match takes precedence over If-Modified-Since
+    """
+    ret_val = False
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        ret_val = etag_matches(if_none_match, etag)
+    elif last_modified is not None:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                ret_val = last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                ret_val = False
+
+    return ret_val
+
+def cache_headers(etag, last_modified=None, public=False):
+    ret_val = {"ETag": etag}
+    if last_modified is not None:
+        ret_val["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    if public:
+        ret_val["Cache-Control"] = f"public, max-age={opasConfig.HTTP_CACHE_PUBLIC_MAX_AGE}"
+    else:
+        ret_val["Cache-Control"] = "private, no-cache"
+
+    return ret_val
+
+def not_modified_response(etag, last_modified=None, public=False):
+    return Response(status_code=httpCodes.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag, last_modified, public))
+
+def solr_index_version(solr_core):
+    return opasQueryCache.query_cache.index_version(solr_core)
+
+class ValidatorCache(object):
+    def __init__(self,
+                 name="http_validators",
+                 maxsize=opasConfig.HTTP_VALIDATOR_CACHE_SIZE,
+                 ttl=opasConfig.HTTP_VALIDATOR_CACHE_TTL,
+                 get_index_version=solr_index_version):
+        self.memory = opasMemoryCache.TTLCache(name=name, maxsize=maxsize, ttl=ttl)
+        self.get_index_version = get_index_version
+        self.not_modified = 0         # 304s before any work
+        self.not_modified_late = 0    # 304s after generating the response
+
+    def _version(self, solr_core):
+        return None if solr_core is None else self.get_index_version(solr_core)
+
+    def check(self, request, key, solr_core=None):
+        """
+        Return a 304 response if the request's validators match those last sent for key (and
+          solr_core's index hasn't changed since), otherwise None
+        """
+        ret_val = None
+        if request.headers.get("if-none-match") is not None or request.headers.get("if-modified-since") is not None:
+            entry = self.memory.get(key)
+            if entry is not None:
+                etag, last_modified, public, version, view_type = entry
+                if version != self._version(solr_core):
+                    self.memory.invalidate(key)
+                elif is_not_modified(request, etag, last_modified):
+                    self.not_modified += 1
+                    ret_val = not_modified_response(etag, last_modified, public)
+
+        return ret_val
+
+    def respond(self, request, response, key, etag, last_modified=None, public=False, solr_core=None, view_type=None):
+        """
+        Set the validator and Cache-Control headers on response, and keep them for key, along
+          with view_type (the document view recorded for the response, if any).
+          Returns a 304 response if the request's validators already match, otherwise None.
+        """
+        self.memory.put(key, (etag, last_modified, public, self._version(solr_core), view_type))
+        for name, value in cache_headers(etag, last_modified, public).items():
+            response.headers[name] = value
+
+        ret_val = None
+        if is_not_modified(request, etag, last_modified):
+            self.not_modified_late += 1
+            ret_val = not_modified_response(etag, last_modified, public)
+
+        return ret_val
+
+    def kept_view_type(self, key):
+        """
+        Return the view_type kept with the validators for key, i.e., the document view to record for a 304 from check
+        """
+        entry = self.memory.get(key)
+        return entry[4] if entry is not None else None
+
+    def stats(self):
+        ret_val = self.memory.stats()
+        ret_val["not_modified"] = self.not_modified
+        ret_val["not_modified_late"] = self.not_modified_late
+        return ret_val
+
+# the process wide cache used by the document and image endpoints
+validator_cache = ValidatorCache()
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasHTTPCache Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasHTTPClient
+
+Shared, pooled HTTP client for the server's outbound calls (PaDS, Solr schema and admin API).
+
+Module level requests.get/post open a new TCP (and TLS) connection on every call and,
+  without a timeout, can wait forever on a server that stops answering.  The functions
+  here go through one requests.Session per process instead, which:
+
+  - keeps connections alive and reuses them (at most opasConfig.HTTP_POOL_MAXSIZE per host),
+  - applies connect/read timeouts (opasConfig.HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    unless the caller supplies one,
+  - retries idempotent requests (GET, HEAD...) on connection errors and on 502/503/504,
+    with exponential backoff (opasConfig.HTTP_RETRIES, HTTP_RETRY_BACKOFF).  After the
+    last retry the final response is returned, so callers still see the status code.
+  - never stores or sends cookies: the session is shared by the calls made for every
+    user, so a cookie PaDS sets for one (e.g., on /v1/Authenticate) mustn't go out with
+    the next user's calls, just as with the per call requests.get used before.
+
+get, post and request take the same arguments as the requests functions of the same name.
+
+>>> session = get_session()
+>>> session is get_session()
+True
+"""
+import os
+import threading
+import http.cookiejar
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import opasConfig
+
+import logging
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def _new_session():
+    retry = Retry(total=opasConfig.HTTP_RETRIES,
+                  connect=opasConfig.HTTP_RETRIES,
+                  read=opasConfig.HTTP_RETRIES,
+                  status=opasConfig.HTTP_RETRIES,
+                  backoff_factor=opasConfig.HTTP_RETRY_BACKOFF,
+                  status_forcelist=(502, 503, 504),
+                  raise_on_status=False)
+
+    adapter = HTTPAdapter(pool_connections=opasConfig.HTTP_POOL_CONNECTIONS,
+                          pool_maxsize=opasConfig.HTTP_POOL_MAXSIZE,
+                          max_retries=retry)
+    ret_val = requests.Session()
+    # shared by all users' calls, so keep no cookies
+    ret_val.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    ret_val.mount("http://", adapter)
+    ret_val.mount("https://", adapter)
+    return ret_val
+
+def get_session():
+    """
+    Return the process-wide pooled requests.Session (a new one after a fork)
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _new_session()
+            _session_pid = os.getpid()
+
+    return _session
+
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", (opasConfig.HTTP_CONNECT_TIMEOUT, opasConfig.HTTP_READ_TIMEOUT))
+    return get_session().request(method, url, **kwargs)
+
+def get(url, params=None, **kwargs):
+    return request("GET", url, params=params, **kwargs)
+
+def post(url, data=None, json=None, **kwargs):
+    return request("POST", url, data=data, json=json, **kwargs)
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasHTTPClient Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasMemoryCache
+
+Small in-process caches for the OPAS server.
+
+TTLCache is a thread-safe, size-bounded (least recently used entries are evicted first)
+  dictionary whose entries expire ttl seconds after they are stored.  Each cache keeps
+  hit/miss/eviction counters, and registers itself by name so all the caches in a
+  process can be reported together (get_cache_stats).
+
+>>> cache = TTLCache(name="doctest", maxsize=2, ttl=60)
+>>> cache.put(("session1", "IJP.001.0001A"), "permit")
+>>> cache.get(("session1", "IJP.001.0001A"))
+'permit'
+>>> cache.get(("session1", "IJP.001.0002A")) is None
+True
+>>> cache.put(("session1", "IJP.001.0002A"), "permit2")
+>>> cache.put(("session2", "IJP.001.0003A"), "permit3") # evicts the least recently used
+>>> len(cache)
+2
+>>> cache.invalidate_where(lambda key: key[0] == "session2")
+1
+>>> stats = cache.stats()
+>>> stats["hits"], stats["misses"], stats["evictions"], stats["invalidations"]
+(1, 1, 1, 1)
+
+RefreshingCache holds values which are expensive to build but may be a little out of date
+  (e.g., the What's New list), keyed by the parameters they're built for.  After ttl seconds a
+  value is stale: it's still returned, while it's reloaded in the background (stale while
+  revalidate).  Only after max_stale more seconds is it dropped, so the next request waits for
+  the load.  Concurrent loads of the same key are coalesced into one.  prefetch starts a load
+  in the background (e.g., for the common lists at startup) without waiting for it.
+
+>>> loads = []
+>>> cache = RefreshingCache(name="refreshing_doctest", maxsize=10, ttl=60)
+>>> cache.get(("days_back", 30), lambda: loads.append(1) or "list 1")
+'list 1'
+>>> cache.get(("days_back", 30), lambda: loads.append(1) or "list 2"), len(loads)
+('list 1', 1)
+>>> cache.get(("days_back", 30), lambda: "list 3", force=True)
+'list 3'
+"""
+import threading
+import time
+import concurrent.futures
+from collections import OrderedDict
+
+import logging
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_registry = {}
+_registry_lock = threading.Lock()
+
+class TTLCache(object):
+    def __init__(self, name, maxsize=1000, ttl=300):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict() # key -> (expires_time, value)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        with _registry_lock:
+            _registry[name] = self
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, default=_MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        """
+        Return the unexpired value for key, or default.
+        """
+        with self._lock:
+            entry = self._data.get(key, None)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.time():
+                    self._data.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return value
+                else:
+                    del self._data[key]
+                    self.expirations += 1
+
+            if count:
+                self.misses += 1
+            return default
+
+    def put(self, key, value, ttl=None):
+        """
+        Store value for key, expiring in ttl seconds (defaults to the cache ttl).
+        """
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Remove key if present.  Returns True if it was.
+        """
+        with self._lock:
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self.invalidations += 1
+                return True
+            return False
+
+    def invalidate_where(self, predicate):
+        """
+        Remove all entries whose key satisfies predicate(key).  Returns the number removed.
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        """
+        Return a dict of the cache counters
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._data),
+                    "maxsize": self.maxsize,
+                    "ttl": self.ttl,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                    "evictions": self.evictions,
+                    "expirations": self.expirations,
+                    "invalidations": self.invalidations,
+                    }
+
+class RefreshingCache(object):
+    def __init__(self, name, maxsize=100, ttl=300, max_stale=None, refresh_workers=2):
+        self.name = name
+        self.ttl = ttl
+        self.max_stale = ttl if max_stale is None else max_stale
+        # entries: (time loaded, value); kept until they're too stale to return
+        self.memory = TTLCache(name=name, maxsize=maxsize, ttl=ttl + self.max_stale)
+        self._loading = {} # key -> Future of the load running for it
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix=name)
+        self.loads = 0
+        self.refreshes = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.load_errors = 0
+
+    def _start_load(self, key):
+        """
+        Return (future, True) to run a load for key, or (the future of the one running, False)
+        """
+        with self._lock:
+            future = self._loading.get(key)
+            if future is not None:
+                return future, False
+            future = concurrent.futures.Future()
+            self._loading[key] = future
+            return future, True
+
+    def _run_load(self, key, load, future):
+        try:
+            value = load()
+        except Exception as e:
+            self.load_errors += 1
+            logger.error(f"{self.name}: load of {key} failed: {e}")
+            future.set_exception(e)
+        else:
+            if value is not None: # (a failed load some callers report as None)
+                self.memory.put(key, (time.time(), value))
+            future.set_result(value)
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def get(self, key, load, force=False):
+        """
+        Return the value for key, calling load() to build it when there's none (or force).
+          A stale value is returned as is, and reloaded in the background.
+        """
+        entry = None if force else self.memory.get(key)
+        if entry is not None:
+            loaded, value = entry
+            if time.time() - loaded >= self.ttl:
+                self.stale_hits += 1
+                future, run = self._start_load(key)
+                if run:
+                    self.refreshes += 1
+                    self._executor.submit(self._run_load, key, load, future)
+            return value
+
+        future, run = self._start_load(key)
+        if run:
+            self.loads += 1
+            self._run_load(key, load, future)
+        else:
+            self.coalesced += 1
+
+        return future.result()
+
+    def prefetch(self, key, load):
+        """
+        Start loading key in the background, unless it's cached (or already loading).  Returns at once.
+        """
+        if self.memory.get(key) is None:
+            future, run = self._start_load(key)
+            if run:
+                self.loads += 1
+                self._executor.submit(self._run_load, key, load, future)
+
+    def invalidate(self, key):
+        return self.memory.invalidate(key)
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self):
+        ret_val = self.memory.stats()
+        ret_val.update({"loads": self.loads,
+                        "refreshes": self.refreshes,
+                        "coalesced": self.coalesced,
+                        "stale_hits": self.stale_hits,
+                        "load_errors": self.load_errors
+                        })
+        return ret_val
+
+def get_cache_stats():
+    """
+    Return the stats of every TTLCache in this process, keyed by cache name
+    """
+    with _registry_lock:
+        caches = list(_registry.values())
+
+    return {cache.name: cache.stats() for cache in caches}
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasMemoryCache Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
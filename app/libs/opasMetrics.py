@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasMetrics
+
+Request and dependency timing for the OPAS server, exported in the Prometheus text
+  exposition format (version 0.0.4) by /v2/Admin/Metrics.
+
+- opas_http_request_duration_seconds{method, route, status}: histogram of endpoint
+  response times (to the end of the body, so streamed downloads count in full), recorded
+  by MetricsMiddleware.  route is the route's path template (e.g.,
+  /v2/Documents/Document/{documentID}/), so the series don't grow with the document ids
+  requested.
+- opas_dependency_duration_seconds{dependency, operation}: histogram of the time spent
+  in calls to Solr (operation core/handler), MySQL (statement type), PaDS and the XSLT
+  transforms (transformer name), recorded by timer.
+- opas_dependency_errors_total, opas_http_requests_in_flight and
+  opas_dependency_calls_in_flight count the failures and the calls running.
+- Gauges from the stats() of the connection pools, caches, usage log writer and
+  render queue, added by register_stats.
+
+Values are per server process (as are the stats they include), so with several
+  workers each one is scraped, or its numbers are partial.
+
+>>> hist = Histogram("doctest_duration_seconds", "Doctest timings", ("operation", ), buckets=(0.1, 1))
+>>> hist.observe(0.05, operation="select")
+>>> hist.observe(0.5, operation="select")
+>>> print ("\\n".join(hist.collect()))
+# HELP doctest_duration_seconds Doctest timings
+# TYPE doctest_duration_seconds histogram
+doctest_duration_seconds_bucket{operation="select",le="0.1"} 1
+doctest_duration_seconds_bucket{operation="select",le="1"} 2
+doctest_duration_seconds_bucket{operation="select",le="+Inf"} 2
+doctest_duration_seconds_sum{operation="select"} 0.55
+doctest_duration_seconds_count{operation="select"} 2
+
+>>> with timer("doctest", "transform"):
+...     pass
+>>> 'opas_dependency_duration_seconds_count{dependency="doctest",operation="transform"} 1' in render()
+True
+"""
+import re
+import time
+import threading
+from contextlib import ContextDecorator
+
+import opasConfig
+
+import logging
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4" # (Starlette adds the charset)
+
+# the statement types reported for MySQL (others are counted as "other")
+SQL_OPERATIONS = ("select", "insert", "replace", "update", "delete", "call", "show", "set", "create", "drop", "truncate")
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=""):
+    labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    if extra:
+        labels = f"{labels},{extra}" if labels else extra
+    return "{" + labels + "}" if labels else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    ret_val = repr(round(value, 6)) if isinstance(value, float) else str(value)
+    return ret_val[:-2] if ret_val.endswith(".0") else ret_val
+
+class Counter(object):
+    """
+    A count per label values, only ever increased
+    """
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {} # label values -> count
+        self._lock = threading.Lock()
+        _register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        ret_val = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0)]
+        for key, value in values:
+            ret_val.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return ret_val
+
+class Gauge(Counter):
+    """
+    A value per label values which goes up and down (e.g., calls in flight)
+    """
+    metric_type = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(object):
+    """
+    Observations per label values, counted in cumulative buckets (upper bounds in seconds)
+    """
+    def __init__(self, name, documentation, labelnames=(), buckets=opasConfig.METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"), )
+        self._values = {} # label values -> [bucket counts, sum]
+        self._lock = threading.Lock()
+        _register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            return sum(entry[0]) if entry is not None else 0
+
+    def collect(self):
+        ret_val = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, key, extra='le="%s"' % _format_value(bound))
+                ret_val.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            ret_val.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            ret_val.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return ret_val
+
+_metrics = []
+_stats_sources = {}
+_registry_lock = threading.Lock()
+
+def _register(metric):
+    with _registry_lock:
+        _metrics.append(metric)
+
+def register_stats(name, stats, label=None):
+    """
+    Export the numbers returned by stats() as gauges opas_<name>_<key>, read at each render.
+
+    stats returns {key: number}, or with label, {label value: {key: number}} (e.g., one
+      entry per cache or connection pool), which adds the label to each gauge.
+    """
+    with _registry_lock:
+        _stats_sources[name] = (stats, label)
+
+def _collect_stats(name, stats, label):
+    gauges = {} # gauge name -> lines
+    for label_value, values in (stats().items() if label else [(None, stats())]):
+        labels = _format_labels((label, ), (label_value, )) if label else ""
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            gauge = re.sub("[^a-zA-Z0-9_]", "_", f"opas_{name}_{key}")
+            gauges.setdefault(gauge, []).append(f"{gauge}{labels} {_format_value(value)}")
+
+    ret_val = []
+    for gauge, lines in gauges.items():
+        ret_val.append(f"# TYPE {gauge} gauge")
+        ret_val.extend(lines)
+    return ret_val
+
+HTTP_REQUEST_DURATION = Histogram("opas_http_request_duration_seconds", "Endpoint response time", ("method", "route", "status"))
+HTTP_REQUESTS_IN_FLIGHT = Gauge("opas_http_requests_in_flight", "Requests being handled")
+DEPENDENCY_DURATION = Histogram("opas_dependency_duration_seconds", "Time spent in calls to Solr, MySQL, PaDS and XSLT transforms", ("dependency", "operation"))
+DEPENDENCY_ERRORS = Counter("opas_dependency_errors_total", "Calls to Solr, MySQL, PaDS and XSLT transforms which raised an exception", ("dependency", "operation"))
+DEPENDENCY_IN_FLIGHT = Gauge("opas_dependency_calls_in_flight", "Calls to Solr, MySQL, PaDS and XSLT transforms running", ("dependency", ))
+
+class timer(ContextDecorator):
+    """
+    Time a call to a dependency, as a context manager or decorator:
+
+        with opasMetrics.timer("pads", "permits"):
+            response = opasHTTPClient.get(full_URL)
+    """
+    def __init__(self, dependency, operation):
+        self.dependency = dependency
+        self.operation = operation
+
+    def __enter__(self):
+        if opasConfig.METRICS_ENABLED:
+            DEPENDENCY_IN_FLIGHT.inc(dependency=self.dependency)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if opasConfig.METRICS_ENABLED:
+            DEPENDENCY_IN_FLIGHT.dec(dependency=self.dependency)
+            DEPENDENCY_DURATION.observe(time.perf_counter() - self.start, dependency=self.dependency, operation=self.operation)
+            if exc_type is not None:
+                DEPENDENCY_ERRORS.inc(dependency=self.dependency, operation=self.operation)
+        return False
+
+def sql_operation(sql):
+    """
+    Return the statement type of sql, for the operation label
+
+    >>> sql_operation("  SELECT * from api_sessions")
+    'select'
+    >>> sql_operation("LOCK TABLES api_docviews WRITE")
+    'other'
+    """
+    words = str(sql).split(None, 1)
+    ret_val = words[0].lower() if words else ""
+    return ret_val if ret_val in SQL_OPERATIONS else "other"
+
+class TimedCursor(object):
+    """
+    DB-API cursor wrapper timing execute, executemany and callproc as dependency calls
+    """
+    def __init__(self, cursor, dependency="mysql"):
+        self._cursor = cursor
+        self._dependency = dependency
+
+    def execute(self, operation, *args, **kwargs):
+        with timer(self._dependency, sql_operation(operation)):
+            return self._cursor.execute(operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        with timer(self._dependency, sql_operation(operation)):
+            return self._cursor.executemany(operation, *args, **kwargs)
+
+    def callproc(self, procname, *args, **kwargs):
+        with timer(self._dependency, "call"):
+            return self._cursor.callproc(procname, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._cursor.close()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class TimedConnection(object):
+    """
+    DB-API connection wrapper whose cursors (and commits) are timed as dependency calls
+    """
+    def __init__(self, connection, dependency="mysql"):
+        self._connection = connection
+        self._dependency = dependency
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._connection.cursor(*args, **kwargs), dependency=self._dependency)
+
+    def commit(self):
+        with timer(self._dependency, "commit"):
+            return self._connection.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+class MetricsMiddleware(object):
+    """
+    ASGI middleware recording each HTTP request in HTTP_REQUEST_DURATION and HTTP_REQUESTS_IN_FLIGHT
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not opasConfig.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500 # unless a response is started
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # the router leaves the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, method=scope.get("method", ""), route=route, status=status)
+
+def render():
+    """
+    Return all the metrics, in the text exposition format
+    """
+    with _registry_lock:
+        metrics = list(_metrics)
+        stats_sources = list(_stats_sources.items())
+
+    ret_val = []
+    for metric in metrics:
+        ret_val.extend(metric.collect())
+
+    for name, (stats, label) in stats_sources:
+        try:
+            ret_val.extend(_collect_stats(name, stats, label))
+        except Exception as e:
+            logger.warning(f"Metrics: stats for {name} not available ({e})")
+
+    return "\n".join(ret_val) + "\n"
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasMetrics Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
@@ -2,11 +2,14 @@
 # Adding a watermark to a multi-page PDF
 import sys
 import os
+import re
 
 import logging
 logger = logging.getLogger(__name__)
 
-from pdfrw import PdfReader, PdfWriter, PageMerge
+from pdfrw import PdfReader, PdfWriter, PageMerge, PdfDict, PdfName
+from pdfrw.objects.pdfindirect import PdfIndirect
+from pdfrw.buildxobj import pagexobj
 from fpdf import FPDF, HTMLMixin
 #from xhtml2pdf import pisa             # for HTML 2 PDF conversion
 import opasXMLHelper as opasxmllib
@@ -89,6 +92,229 @@ def write_copyright_page(username="PEP"):
     
     return copyright_file
 
+def append_pdf(input_file, append_file, output_file):
+    """
+    Write the pages of input_file, followed by those of append_file, to output_file.  Returns output_file.
+    """
+    writer_output = PdfWriter()
+    writer_output.addpages(PdfReader(input_file).pages)
+    writer_output.addpages(PdfReader(append_file).pages)
+    writer_output.write(output_file)
+    return output_file
+
+def headerfooter_pdf_data(username):
+    """
+    Return the one page PDF (bytes) with the user's copyright footer, as merged onto each page by stampcopyright
+    """
+    pdf = PDF()
+    pdf.username_to_set = username
+    pdf.alias_nb_pages("{nb}")
+    pdf.add_page()
+    return bytes(pdf.output())
+
+def _pdf_serialize(obj, new_object, original=True):
+    """
+    Return the PDF syntax for obj (a pdfrw object).  If original, obj is from the file being
+      updated, and its indirect objects are written as references; otherwise everything is written
+      in place, other than streams, which are passed to new_object, which returns the reference to use.
+    """
+    if isinstance(obj, PdfIndirect):
+        if original:
+            ret_val = f"{obj[0]} {obj[1]} R"
+        else:
+            ret_val = _pdf_serialize(obj.real_value(), new_object, original)
+    elif original and isinstance(getattr(obj, "indirect", None), tuple):
+        ret_val = f"{obj.indirect[0]} {obj.indirect[1]} R"
+    elif isinstance(obj, PdfDict):
+        if obj.stream is not None:
+            ret_val = new_object(obj)
+        else:
+            ret_val = "<<" + " ".join(f"{key} {_pdf_serialize(value, new_object, original)}" for key, value in dict.items(obj)) + ">>"
+    elif isinstance(obj, list):
+        ret_val = "[" + " ".join(_pdf_serialize(value, new_object, original) for value in list.__iter__(obj)) + "]"
+    elif obj is None:
+        ret_val = "null"
+    else:
+        ret_val = str(obj)
+
+    return ret_val
+
+class _NewObjects(object):
+    """
+    The objects added by an incremental update, numbered from next_objnum: objnum -> PDF syntax (str) of the body
+    """
+    def __init__(self, next_objnum):
+        self.next_objnum = next_objnum
+        self.objects = {}
+
+    def reserve(self):
+        objnum = self.next_objnum
+        self.next_objnum += 1
+        return objnum
+
+    def add(self, stream_dict, objnum=None):
+        """
+        Add stream_dict (a pdfrw stream), as objnum if given (reserved), and return the reference to it
+        """
+        if objnum is None:
+            objnum = self.reserve()
+        entries = " ".join(f"{key} {_pdf_serialize(value, self.add, original=False)}" for key, value in dict.items(stream_dict) if key != "/Length")
+        self.objects[objnum] = f"<<{entries} /Length {len(stream_dict.stream)}>>\nstream\n{stream_dict.stream}\nendstream"
+        return f"{objnum} 0 R"
+
+def copyright_stamp_structure(pdf_data):
+    """
+    Return the part of the copyright stamp update for the PDF file pdf_data which is the same for
+      every user (a dict): the new versions of the page objects, which draw the stamp XObject (the
+      footer) over each page, with their offsets, and the trailer entries.  copyright_stamp_from_structure
+      then only needs this and the username, not the original, to make a user's stamp.
+
+    The stamp XObject is given the object number stamp_objnum, so the pages can refer to it
+      before it's made.  Encrypted files raise ValueError.
+
+    >>> structure = copyright_stamp_structure(headerfooter_pdf_data("Test User"))
+    >>> structure["stamp_objnum"] < structure["next_objnum"], len(structure["xref"]) > 1
+    (True, True)
+    """
+    reader = PdfReader(fdata=pdf_data)
+    if reader.Encrypt is not None:
+        raise ValueError("Encrypted PDF")
+
+    startxref = re.findall(rb"startxref\s+(\d+)", pdf_data[-2048:])
+    if not startxref:
+        raise ValueError("No startxref in PDF")
+    prev_xref = int(startxref[-1])
+
+    # (some writers leave the cross reference stream itself out of /Size)
+    next_objnum = max([int(reader.Size)] + [int(objnum) + 1 for objnum in re.findall(rb"(\d+)\s+\d+\s+obj\b", pdf_data)])
+    new_objects = _NewObjects(next_objnum)
+    new_object = new_objects.add
+    stamp_objnum = new_objects.reserve()
+    stamp_ref = f"{stamp_objnum} 0 R"
+    pre_ref = new_object(PdfDict(stream="q\n"))
+    post_refs = {} # page origin -> content stream drawing the footer there
+
+    page_objects = {} # (objnum, gen) -> PDF syntax
+    for page in reader.pages:
+        if not isinstance(page.indirect, tuple):
+            raise ValueError("Page is not an indirect object")
+        inheritable = page.inheritable
+        resources = inheritable.Resources
+        if resources is None:
+            resources = PdfDict()
+        xobjects = resources.XObject
+        if xobjects is None:
+            xobjects = PdfDict()
+        if "/PEPStamp" in xobjects:
+            raise ValueError("Already stamped")
+        xobject_entries = [f"{key} {_pdf_serialize(value, new_object)}" for key, value in dict.items(xobjects)]
+        xobject_entries.append(f"/PEPStamp {stamp_ref}")
+        resource_entries = [f"{key} {_pdf_serialize(value, new_object)}" for key, value in dict.items(resources) if key != "/XObject"]
+        resource_entries.append("/XObject <<" + " ".join(xobject_entries) + ">>")
+
+        contents = dict.get(page, PdfName.Contents)
+        if contents is None:
+            content_refs = []
+        elif isinstance(contents, list):
+            content_refs = [_pdf_serialize(value, new_object) for value in list.__iter__(contents)]
+        else:
+            content_refs = [_pdf_serialize(contents, new_object)]
+        media_box = inheritable.MediaBox
+        origin = (media_box[0], media_box[1]) if media_box is not None else ("0", "0")
+        if origin not in post_refs:
+            post_refs[origin] = new_object(PdfDict(stream=f"Q\nq 1 0 0 1 {origin[0]} {origin[1]} cm /PEPStamp Do Q\n"))
+        content_refs = [pre_ref] + content_refs + [post_refs[origin]]
+
+        entries = [f"{key} {_pdf_serialize(value, new_object)}" for key, value in dict.items(page) if key not in ("/Contents", "/Resources")]
+        if PdfName.MediaBox not in page:
+            entries.append(f"/MediaBox {_pdf_serialize(inheritable.MediaBox, new_object)}")
+        if PdfName.Rotate not in page and inheritable.Rotate is not None:
+            entries.append(f"/Rotate {inheritable.Rotate}")
+        entries.append("/Resources <<" + " ".join(resource_entries) + ">>")
+        entries.append("/Contents [" + " ".join(content_refs) + "]")
+        page_objects[page.indirect] = "<<" + " ".join(entries) + ">>"
+
+    # write the objects, noting their offsets for the cross reference section
+    offset = len(pdf_data) + 1
+    out = ["\n"]
+    xref = {}
+    for (objnum, gen), body in list(page_objects.items()) + [((objnum, 0), body) for objnum, body in new_objects.objects.items()]:
+        text = f"{objnum} {gen} obj\n{body}\nendobj\n"
+        xref[objnum] = (offset, gen)
+        out.append(text)
+        offset += len(text.encode("latin-1"))
+
+    trailer = [f"/Root {_pdf_serialize(reader.Root, new_object)}", f"/Prev {prev_xref}"]
+    if reader.Info is not None:
+        trailer.append(f"/Info {_pdf_serialize(reader.Info, new_object)}")
+    if reader.ID is not None:
+        trailer.append(f"/ID {_pdf_serialize(reader.ID, new_object)}")
+
+    ret_val = {"body": "".join(out).encode("latin-1"), # the page objects (and the streams they use), following the original
+               "end_offset": offset,                  # the offset after body
+               "xref": xref,                          # objnum -> (offset, gen), for the objects in body
+               "stamp_objnum": stamp_objnum,
+               "next_objnum": new_objects.next_objnum,
+               "trailer": trailer
+              }
+    return ret_val
+
+def copyright_stamp_from_structure(username, structure):
+    """
+    Return the bytes to append to a PDF file to stamp the user's copyright footer on every page,
+      from the file's copyright_stamp_structure.
+    """
+    new_objects = _NewObjects(structure["next_objnum"])
+    stamp_page = PdfReader(fdata=headerfooter_pdf_data(username)).pages[0]
+    new_objects.add(pagexobj(stamp_page), objnum=structure["stamp_objnum"])
+
+    # the stamp's objects follow the page objects, then the cross reference section for them all
+    offset = structure["end_offset"]
+    out = []
+    xref = dict(structure["xref"])
+    for objnum, body in new_objects.objects.items():
+        text = f"{objnum} 0 obj\n{body}\nendobj\n"
+        xref[objnum] = (offset, 0)
+        out.append(text)
+        offset += len(text.encode("latin-1"))
+
+    xref_offset = offset
+    out.append("xref\n0 1\n0000000000 65535 f \n") # the head of the free list, as usual
+    objnums = sorted(xref)
+    start = 0
+    while start < len(objnums):
+        end = start
+        while end + 1 < len(objnums) and objnums[end + 1] == objnums[end] + 1:
+            end += 1
+        out.append(f"{objnums[start]} {end - start + 1}\n")
+        for objnum in objnums[start:end + 1]:
+            out.append("%010d %05d n \n" % xref[objnum])
+        start = end + 1
+
+    trailer = [f"/Size {new_objects.next_objnum}"] + structure["trailer"]
+    out.append("trailer\n<<" + " ".join(trailer) + f">>\nstartxref\n{xref_offset}\n%%EOF\n")
+
+    return structure["body"] + "".join(out).encode("latin-1")
+
+def copyright_stamp_update(username, pdf_data):
+    """
+    Return the bytes to append to the PDF file pdf_data to stamp the user's copyright footer on every page.
+
+    This is a PDF incremental update: the original bytes are left as they are, and followed by new
+      versions of the page objects (their content wrapped, then the footer drawn over it) and a
+      cross reference section for them.  So a stamped original can be sent as it's read (see
+      opasFileStream), rather than rewritten to a file first.  The update is made in two parts,
+      copyright_stamp_structure (the same for every user, so it can be kept per file) and
+      copyright_stamp_from_structure.  Encrypted files raise ValueError.
+
+    >>> original = headerfooter_pdf_data("Test User")
+    >>> stamped = original + copyright_stamp_update("Another User", original)
+    >>> page = PdfReader(fdata=stamped).pages[0]
+    >>> len(page.Contents), sorted(page.Resources.XObject.keys())
+    (3, ['/PEPStamp'])
+    """
+    return copyright_stamp_from_structure(username, copyright_stamp_structure(pdf_data))
+
 def stampcopyright(username, input_file, top=True, bottom=True, suffix=""):
     def new_page():
         fpdf = FPDF()
@@ -176,6 +402,11 @@ def stampcopyright(username, input_file, top=True, bottom=True, suffix=""):
         output_file = input_file
     else:
         logger.debug(f"Copyright info added for user {username} to Original PDF")
+
+    try:
+        os.remove(headerfooterfile)
+    except Exception:
+        pass # wasn't written
         
     return output_file
     
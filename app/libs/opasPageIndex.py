@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasPageIndex
+
+Page break index of a document's XML, so page ranges (page, pageoffset, pagelimit on
+  /v2/Documents/Document/) can be cut from the stored text without parsing it.
+
+The loader builds the index (page_index_json) from the exact XML it stores in Solr's text_xml,
+  and stores it in art_pgindex.  It records the character offsets of:
+
+  - every element which is a child of the (single) body element, and the pb elements among them,
+    with their page numbers
+  - the elements before the body which are children of its ancestors (e.g., artinfo), which
+    the first page includes
+
+Each element's span includes its tail text, as lxml's tostring does.  With this, get_pages
+  returns the same selection of elements as opasXMLHelper.xml_get_pages, wrapped in the same
+  envelope, by slicing the text.  The XML is equivalent, not byte for byte identical:
+  the slices keep the characters as stored, where xml_get_pages serializes non-ASCII
+  characters as character references.
+
+The text may be the highlighted copy of the stored text, with Solr's hit markers
+  (opasConfig.HITMARKERSTART/HITMARKEREND) added; the offsets are adjusted for them.
+
+Documents the index can't describe exactly (more than one body, entities other than
+  the predefined ones) get no index, and xml_get_pages parses them as before.
+
+>>> xml = '<pepkbd3><artinfo>info</artinfo><body><p>page 1</p><pb><n>1</n></pb><p>page 2</p>\\n<pb><n>2</n></pb><p>page 3</p></body></pepkbd3>'
+>>> index = page_index(xml)
+>>> get_pages(xml, index, offset=0, limit=1)[0]
+'<body>\\n<artinfo>info</artinfo>\\n<p>page 1</p>\\n<pb><n>1</n></pb>\\n</body>\\n'
+>>> get_pages(xml, index, offset=1, limit=1)[0]
+'<body>\\n<p>page 2</p>\\n\\n<pb><n>2</n></pb>\\n</body>\\n'
+>>> marked = xml.replace("page 2", "#@@@page@@@# 2")
+>>> get_pages(marked, index, offset=1, limit=1)[0]
+'<body>\\n<p>#@@@page@@@# 2</p>\\n\\n<pb><n>2</n></pb>\\n</body>\\n'
+"""
+import re
+import json
+import bisect
+from xml.sax.saxutils import unescape
+
+import opasConfig
+
+import logging
+logger = logging.getLogger(__name__)
+
+PAGE_INDEX_FORMAT = 1
+NO_PAGE_NBR = "npn" # as returned by opasXMLHelper.xml_get_pages
+
+rcx_markup = re.compile(r"""<!--.*?-->                                 # comment
+                            |<\?.*?\?>                                 # processing instruction
+                            |<!\[CDATA\[.*?\]\]>                       # cdata
+                            |<!DOCTYPE(?:[^\[>]|\[.*?\])*>             # doctype, with or without internal subset
+                            |<(?P<close>/?)(?P<name>[^\s/>!?]+)(?:[^>"']|"[^"]*"|'[^']*')*?(?P<empty>/?)>  # tag
+                        """, re.DOTALL | re.VERBOSE)
+rcx_entity_ref = re.compile(r"&(?!(?:amp|lt|gt|quot|apos|#[0-9]+|#x[0-9a-fA-F]+);)")
+rcx_hit_markers = re.compile(f"{re.escape(opasConfig.HITMARKERSTART)}|{re.escape(opasConfig.HITMARKEREND)}")
+
+class _Element(object):
+    __slots__ = ("name", "start", "end", "text_start", "tail_end", "parent", "children")
+    def __init__(self, name, start, parent):
+        self.name = name
+        self.start = start
+        self.end = None
+        self.text_start = None # None for an empty element tag
+        self.tail_end = None
+        self.parent = parent
+        self.children = []
+
+def _scan(xmlstr):
+    """
+    Return the root _Element of xmlstr, with start/end/tail offsets for all elements
+    """
+    root = None
+    stack = []
+    tail_pending = [] # elements whose tail ends at the next (non cdata) markup
+    for m in rcx_markup.finditer(xmlstr):
+        token = m.group(0)
+        if token.startswith("<![CDATA["):
+            continue
+        for elem in tail_pending:
+            elem.tail_end = m.start()
+        tail_pending = []
+        name = m.group("name")
+        if name is None: # comment, pi, doctype
+            continue
+        if m.group("close"):
+            elem = stack.pop()
+            if elem.name != name:
+                raise ValueError(f"Mismatched end tag {name} at {m.start()}")
+            elem.end = m.end()
+            tail_pending.append(elem)
+        else:
+            parent = stack[-1] if stack else None
+            elem = _Element(name, m.start(), parent)
+            if parent is not None:
+                parent.children.append(elem)
+            elif root is None:
+                root = elem
+            if m.group("empty"):
+                elem.end = m.end()
+                tail_pending.append(elem)
+            else:
+                stack.append(elem)
+                elem.text_start = m.end()
+    for elem in tail_pending:
+        elem.tail_end = len(xmlstr)
+    if stack or root is None:
+        raise ValueError("Unbalanced XML")
+
+    return root
+
+def _text(xmlstr, elem):
+    """
+    Return the text of elem before its first child (lxml's elem.text), or None
+    """
+    if elem.text_start is None:
+        return None
+    # text ends at the first markup of any kind
+    text = xmlstr[elem.text_start:xmlstr.find("<", elem.text_start)]
+    return unescape(text, {"&quot;": '"', "&apos;": "'"}) if text else None
+
+def page_index(xmlstr, inside="body", pagebrk="pb", pagenbr="n"):
+    """
+    Return the page index (a dict) of xmlstr, or None if it can't be indexed
+    """
+    ret_val = None
+    try:
+        if rcx_entity_ref.search(xmlstr):
+            raise ValueError("Entity references")
+
+        root = _scan(xmlstr)
+        bodies = []
+        pb_total = 0
+        all_elements = [root]
+        pos = 0
+        while pos < len(all_elements):
+            elem = all_elements[pos]
+            pos += 1
+            all_elements.extend(elem.children)
+            if elem.name == inside:
+                bodies.append(elem)
+            elif elem.name == pagebrk:
+                pb_total += 1
+
+        if len(bodies) != 1:
+            raise ValueError(f"{len(bodies)} {inside} elements")
+
+        body = bodies[0]
+        # the ancestors' children before the body, in document order
+        front = []
+        ancestor = body
+        while ancestor.parent is not None:
+            front = [[child.start, child.tail_end] for child in ancestor.parent.children if child.start < ancestor.start] + front
+            ancestor = ancestor.parent
+
+        kids = []
+        pbs = []
+        for kid_idx, child in enumerate(body.children):
+            kids.append([child.start, child.tail_end])
+            if child.name == pagebrk:
+                page_nbr = NO_PAGE_NBR
+                for pb_child in child.children:
+                    if pb_child.name == pagenbr:
+                        page_nbr = _text(xmlstr, pb_child)
+                        break
+                pbs.append([kid_idx, page_nbr])
+
+        ret_val = {"format": PAGE_INDEX_FORMAT,
+                   "length": len(xmlstr),
+                   "inside": inside,
+                   "pagebrk": pagebrk,
+                   "pagenbr": pagenbr,
+                   "pb_total": pb_total,
+                   "front": front,
+                   "kids": kids,
+                   "pbs": pbs}
+    except Exception as e:
+        logger.info(f"No page index: {e}")
+
+    return ret_val
+
+def page_index_json(xmlstr, inside="body", pagebrk="pb", pagenbr="n"):
+    """
+    Return the page index of xmlstr as stored by the loader (json string), or None
+    """
+    ret_val = page_index(xmlstr, inside=inside, pagebrk=pagebrk, pagenbr=pagenbr)
+    if ret_val is not None:
+        ret_val = json.dumps(ret_val, separators=(",", ":"))
+
+    return ret_val
+
+def _offset_mapper(xmlstr, index_length):
+    """
+    Return a function mapping offsets in the indexed (unmarked) text to offsets in xmlstr, which may
+      have hit markers inserted, or None if xmlstr isn't the indexed text
+    """
+    if len(xmlstr) == index_length:
+        return lambda offset: offset
+
+    plain_positions = []
+    shifts = []
+    removed = 0
+    for m in rcx_hit_markers.finditer(xmlstr):
+        removed += m.end() - m.start()
+        plain_positions.append(m.start() - (removed - (m.end() - m.start())))
+        shifts.append(removed)
+
+    if len(xmlstr) - removed != index_length:
+        return None
+
+    def mapper(offset):
+        # markers at the offset belong before it (a marker never precedes a tag)
+        idx = bisect.bisect_right(plain_positions, offset)
+        return offset + (shifts[idx - 1] if idx else 0)
+
+    return mapper
+
+def get_pages(xmlstr, index, offset=0, limit=1, inside="body", env="body", pagebrk="pb", pagenbr="n"):
+    """
+    Return the same tuple as opasXMLHelper.xml_get_pages, except the second entry is the list of xml
+      fragments rather than elements, or None if index doesn't apply (then use xml_get_pages).
+    """
+    if isinstance(index, str):
+        try:
+            index = json.loads(index)
+        except Exception as e:
+            logger.warning(f"Bad page index: {e}")
+            return None
+
+    if index is None or limit is None or index.get("format") != PAGE_INDEX_FORMAT:
+        return None
+
+    if (index["inside"], index["pagebrk"], index["pagenbr"]) != (inside, pagebrk, pagenbr):
+        return None
+
+    mapper = _offset_mapper(xmlstr, index["length"])
+    if mapper is None:
+        return None
+
+    if offset == 0:
+        offset1 = 0
+    else:
+        offset1 = offset
+    offset2 = offset1 + limit
+    if offset2 > index["pb_total"]:
+        offset2 = index["pb_total"] - 2
+
+    kids = index["kids"]
+    pbs = index["pbs"]
+    fragment = lambda span: xmlstr[mapper(span[0]):mapper(span[1])]
+
+    first_pn = pbs[offset1][1] if 0 <= offset1 < len(pbs) else NO_PAGE_NBR
+    if 1 <= offset2 <= len(pbs):
+        end_pb_kid = pbs[offset2 - 1][0]
+        last_pn = pbs[offset2 - 1][1]
+    else:
+        end_pb_kid = None
+        last_pn = NO_PAGE_NBR
+
+    if offset1 == 0: # everything before the ending pb, then the pb
+        if end_pb_kid is None:
+            spans = []
+            secondpbfrag = ""
+        else:
+            spans = index["front"] + kids[:end_pb_kid]
+            secondpbfrag = fragment(kids[end_pb_kid]) + "\n"
+    else: # the children after the offset1 pb through the offset2 pb
+        spans = []
+        secondpbfrag = ""
+        if offset1 >= 1:
+            pb_kids = [pb[0] for pb in pbs]
+            start_kid = pb_kids[offset1 - 1] + 1 if offset1 <= len(pb_kids) else len(kids)
+            if offset2 >= 1:
+                end_kid = pb_kids[offset2 - 1] + 1 if offset2 <= len(pb_kids) else len(kids)
+            else:
+                end_kid = len(kids)
+            spans = kids[start_kid:end_kid]
+
+    elem_list = [fragment(span) for span in spans]
+    new_xml = f"<{env}>\n" + "".join(frag + "\n" for frag in elem_list) + secondpbfrag + f"</{env}>\n"
+
+    return (new_xml, elem_list, first_pn, last_pn)
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasPageIndex Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
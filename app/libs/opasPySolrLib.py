@@ -57,6 +57,11 @@ import schemaMap
 import opasGenSupportLib as opasgenlib
 import opasXMLHelper as opasxmllib
 import opasDocPermissions as opasDocPerm
+import opasRenderCache
+import opasQueryCache
+import opasArtifactCache
+import opasRenderQueue
+import opasPDFStampCpyrght
 # import smartsearch
 import opasQueryHelper
 from weasyprint import HTML, CSS
@@ -1389,7 +1394,7 @@ def search_text_qs(solr_query_spec: models.SolrQuerySpec,
         if solr_query_spec.fullReturn: #and session_info.XXXauthenticated:
             # NOTE: we add this here, but in return data, access by document will be checked.
             if "text_xml" not in solr_query_spec.returnFields:
-                return_fields = return_fields + ", text_xml, para" #, art_excerpt, art_excerpt_xml
+                return_fields = return_fields + ", text_xml, para, art_pgindex" #, art_excerpt, art_excerpt_xml
         
         if solr_query_spec.abstractReturn:
             if "abstract_xml" not in solr_query_spec.returnFields:
@@ -1489,7 +1494,10 @@ def search_text_qs(solr_query_spec: models.SolrQuerySpec,
                        
         # ####################################################################################
         # THE SEARCH!
-        results = solr_docs2.search(query, **solr_param_dict)
+        if solr_query_spec.fullReturn: # full-text responses are too large to keep
+            results = solr_docs2.search(query, **solr_param_dict)
+        else: # the response is the same for every user (access is checked below), so it can be reused
+            results = opasQueryCache.query_cache.search(solr_docs2, query, **solr_param_dict)
         # ####################################################################################
        
     except SAXParseException as e:
@@ -1582,12 +1590,25 @@ def search_text_qs(solr_query_spec: models.SolrQuerySpec,
                     logger.debug(f"No session info to perform optimizations {e}")
                     
                 record_count = len(results.docs)
+                page_items = []
                 for result in results.docs:
-                    # reset anchor counts for full-text markup re.sub
-                    # count_anchors = 0
                     # authorIDs = result.get("art_authors", None)
                     documentListItem = models.DocumentListItem()
                     documentListItem = opasQueryHelper.get_base_article_info_from_search_result(result, documentListItem, session_info=session_info)
+                    page_items.append((result, documentListItem))
+
+                # sometimes, we don't need to check permissions (see below); when we do, resolve
+                #  the whole page at once so the PaDS calls aren't made serially, one per document
+                check_access = get_full_text or (solr_query_spec.abstractReturn and record_count == 1)
+                if check_access:
+                    page_access = opasDocPerm.get_access_limitations_for_list([item for result, item in page_items],
+                                                                              session_info=session_info,
+                                                                              fulltext_request=solr_query_spec.fullReturn,
+                                                                              request=request)
+                
+                for result, documentListItem in page_items:
+                    # reset anchor counts for full-text markup re.sub
+                    # count_anchors = 0
                     documentID = documentListItem.documentID
                     if documentID is None:
                         # there's a problem with this records
@@ -1599,16 +1620,8 @@ def search_text_qs(solr_query_spec: models.SolrQuerySpec,
                     # NEW 20211008 - If logged in, check permissions for full-text, or an abstract request with one return
                     documentListItem.accessChecked = False # default anyway, but to make sure it always exists
                     documentListItem.accessLimited = True  # default is True anyway, but to make sure it always exists
-                    if get_full_text or (solr_query_spec.abstractReturn and record_count == 1): 
-                        access = opasDocPerm.get_access_limitations( doc_id=documentListItem.documentID, 
-                                                                     classification=documentListItem.accessClassification, # based on file_classification (where it is)
-                                                                     year=documentListItem.year,
-                                                                     doi=documentListItem.doi, 
-                                                                     session_info=session_info, 
-                                                                     documentListItem=documentListItem,
-                                                                     fulltext_request=solr_query_spec.fullReturn,
-                                                                     request=request
-                                                                    ) # will updated accessLimited fields in documentListItem
+                    if check_access: 
+                        access = page_access.get(documentID) # resolved above by get_access_limitations_for_list
                         
                         if access is not None: # copy all the access info returned
                             documentListItem.accessChecked = True
@@ -2785,6 +2798,168 @@ def metadata_get_volumes(source_code=None,
         
     return ret_val
 #-----------------------------------------------------------------------------
+def html_to_pdf_file(html_string, output_filename):
+    """
+    Render html_string as a PDF file, output_filename.  Returns output_filename, or None if it couldn't be rendered.
+    """
+    ret_val = None
+    # due to problems with pisa and referenced graphics and banners, weasyprint used now rather than Pisa 2022-04-20
+    try:
+        stylesheets = []
+        #stylesheet_paths = [opasConfig.CSS_STYLESHEET, ]
+        #try:
+            #for stylesheet_path in stylesheet_paths:
+                #with open(stylesheet_path) as f:
+                    #style_data = f.read()
+                #stylesheets.append(CSS(string=style_data))
+        #except Exception as e:
+            #print (f"Error reading file: {stylesheet_path}")
+        font_config = FontConfiguration()
+        html = HTML(string = html_string)
+        html.write_pdf(target=output_filename, stylesheets=stylesheets, font_config=font_config)
+
+    except Exception as e:
+        logging.error(f"Weasyprint error: {e}")
+        #status = models.ErrorReturn( httpcode=httpCodes.HTTP_500_INTERNAL_SERVER_ERROR,
+                                     #error_description="Sorry, due to a conversion error, this article cannot be converted to PDF. Try ePUB format instead."
+                                     #)
+        if 1:
+            # Since Weasyprint returns nothing useful in this case, use the xml2html Pisa library to generate the PDF
+            # It usually works when Weasyprint fails, but doesn't seem to be able to include graphics anymore
+            # that was working at least partly at one point.
+            pisa_css = r"""
+                <link rel="stylesheet" type="text/css" href="%s"/>
+                @page {
+                    size: letter portrait;
+                    @frame content_frame {
+                        left: 50pt;
+                        width: 512pt;
+                        top: 50pt;
+                        height: 692pt;
+                    }
+                }
+                @font-face {font-family: Roboto; src: url('%s');}
+                @font-face {font-family: Roboto; font-style: italic; src: url('%s');}
+                @font-face {font-family: Roboto; font-weight: bold; src: url('%s');}
+                @font-face {font-family: Roboto; font-weight: bold; font-style: italic; src: url('%s');}
+                body, p, p2 {   
+                            font-family: 'Noto Sans' }
+
+            """ % (opasConfig.CSS_STYLESHEET,
+                   opasConfig.fetch_resources('Roboto-Regular.ttf', None),
+                   opasConfig.fetch_resources('Roboto-Italic.ttf', None),
+                   opasConfig.fetch_resources('Roboto-Bold.ttf', None),
+                   opasConfig.fetch_resources('Roboto-BoldItalic.ttf', None),
+                   )
+            #pisa_css = pisa_css + style_data 
+
+            #pisa.showLogging() # debug only
+            #print (f"In Print Module.  Folder {os.getcwd()}")
+            #print (f"{opasConfig.PDF_EXTENDED_FONT}")
+            # doc = opasxmllib.remove_encoding_string(doc)
+            # open output file for writing (truncated binary)
+            try:
+                result_file = open(output_filename, "w+b")
+                # Need to fix links for graphics, e.g., see https://xhtml2pdf.readthedocs.io/en/latest/usage.html#using-xhtml2pdf-in-django
+                pisaStatus = pisa.CreatePDF(src=html_string,            # the HTML to convert
+                                            dest=result_file,
+                                            css_default=pisa_css, 
+                                            encoding="UTF-8") #,
+                                            # link_callback=opasConfig.fetch_resources)           # file handle to receive result
+                # close output file
+                result_file.close()
+            except Exception as e:
+                ret_val = None
+            else:
+                ret_val = output_filename                                    
+    else:
+        ret_val = output_filename
+
+    return ret_val
+
+def download_tempfile(document_id, purpose):
+    """
+    Return the name of a new (empty) file in the temp folder, for an intermediate PDF of document_id
+    """
+    fd, ret_val = tempfile.mkstemp(prefix=f"{document_id}-{purpose}-", suffix=".pdf")
+    os.close(fd)
+    return ret_val
+
+def render_pdf_artifact(doc, document_id, heading, art_lang, body_key, head_key):
+    """
+    Render the article XML doc (without the copyright page) as a PDF, and keep it in the artifact
+      cache.  Returns the PDF's filename (None if it couldn't be rendered) and the HTML head, to
+      render the user's copyright page to match.
+
+    Large documents are rendered by the render queue's worker processes, so this must only use its arguments.
+    """
+    artifact_cache = opasArtifactCache.artifact_cache
+    html_string = opasxmllib.xml_str_to_html(doc, transformer_name=opasConfig.TRANSFORMER_XMLTOHTML, document_id=document_id) # transformer_name default used explicitly for code readability
+    html_string = re.sub("\[\[RunningHead\]\]", f"{heading}", html_string, count=1)
+    html_string = re.sub("\(\)", f"", html_string, count=1) # in running head, missing issue
+    html_string = re.sub("href=\"#/Document",\
+                         "href=\"https://pep-web.org/browse/document",html_string)
+    html_string = re.sub('class="fas fa-arrow-circle-right"',\
+                         'class="fa fa-external-link"', html_string)
+    html_string = re.sub(r"#/Search/\?author", f"https://pep-web.org/search/?q", html_string)
+
+    if art_lang == "zh":
+        # add some spaces in the chinese text to permit wrapping:
+        html_string = re.sub('\。', '。 ', html_string)
+        html_string = re.sub('\，', '， ', html_string)
+        html_string = re.sub('\“', ' “', html_string)
+        html_string = html_string.replace("</head>", opasConfig.PDF_CHINESE_STYLE + "</head>")
+    else:
+        # PDF Font to support Turkish and English (Extended Character Font)
+        html_string = html_string.replace("</head>", opasConfig.PDF_OTHER_STYLE + "</head>")
+
+    try:
+        # temp debugging change to write out intermediate HTML file
+        if localsecrets.DEVELOPMENT_DEBUGGING:
+            html_filename = document_id + ".html" 
+            html_out_filename  = os.path.join(tempfile.gettempdir(), html_filename)
+            with open(html_out_filename, 'w', encoding="utf8") as fo:
+                fo.write(html_string)
+    except:
+        pass
+
+    # the copyright page is rendered with the same head (styles, fonts) as the article
+    body_start = html_string.find("<body")
+    html_head = html_string[:body_start] if body_start != -1 else f"<html><head>{opasConfig.PDF_OTHER_STYLE}</head>"
+    ret_val = html_to_pdf_file(html_string, download_tempfile(document_id, "render"))
+    if ret_val is not None and not any(marker in html_string for marker in opasRenderCache.RENDER_ERROR_MARKERS):
+        # if it can't be cached, the render file is left for artifact_cache.clean_temp_files
+        cached_filename = artifact_cache.put_file(body_key, ret_val)
+        if cached_filename is not None:
+            ret_val = cached_filename
+            artifact_cache.put_text(head_key, html_head)
+
+    return ret_val, html_head
+
+def add_epub_elements(str):
+    # for now, just return
+    return str
+
+def render_epub_html_artifact(doc, document_id, heading, html_key):
+    """
+    Transform the article XML doc to the HTML for an EPUB, and keep it in the artifact cache.  Returns the HTML.
+
+    Large documents are transformed by the render queue's worker processes, so this must only use its arguments.
+    """
+    doc = opasxmllib.remove_encoding_string(doc)
+    html_string = opasxmllib.xml_str_to_html(doc, transformer_name=opasConfig.TRANSFORMER_XMLTOHTML, document_id=document_id) # transformer_name default used explicitly for code readability
+    html_string = re.sub("\[\[RunningHead\]\]", f"{heading}", html_string, count=1)
+    html_string = re.sub("href=\"#/Document",\
+                         "href=\"https://pep-web.org/browse/document", html_string)
+    html_string = re.sub('class="fas fa-arrow-circle-right"',\
+                         'class="fa fa-external-link"', html_string)
+    html_string = re.sub(r"#/Search/\?author", f"https://pep-web.org/search/?q", html_string)
+    html_string = add_epub_elements(html_string)
+    if not any(marker in html_string for marker in opasRenderCache.RENDER_ERROR_MARKERS):
+        opasArtifactCache.artifact_cache.put_text(html_key, html_string)
+
+    return html_string
+
 def prep_document_download(document_id,
                            session_info=None, 
                            ret_format="HTML",
@@ -2803,10 +2978,6 @@ def prep_document_download(document_id,
 
 
     """
-    def add_epub_elements(str):
-        # for now, just return
-        return str
-
     ret_val = None
     status = models.ErrorReturn(httpcode=httpCodes.HTTP_200_OK) # no error
 
@@ -2916,124 +3087,43 @@ def prep_document_download(document_id,
                         elif ret_format.upper() == "PDF":
                             """
                             Generated PDF, no page breaks, but page numbering, for reading and printing without wasting pages.
-                            """
-                            html_string = opasxmllib.xml_str_to_html(doc, transformer_name=opasConfig.TRANSFORMER_XMLTOHTML, document_id=document_id) # transformer_name default used explicitly for code readability
-                            html_string = re.sub("\[\[RunningHead\]\]", f"{heading}", html_string, count=1)
-                            html_string = re.sub("\(\)", f"", html_string, count=1) # in running head, missing issue
-                            copyright_page = COPYRIGHT_PAGE_HTML.replace("[[username]]", session_info.username)
-                            html_string = re.sub("</html>", f"{copyright_page}</html>", html_string, count=1)
-                            html_string = re.sub("href=\"#/Document",\
-                                                 "href=\"https://pep-web.org/browse/document",html_string)
-                            html_string = re.sub('class="fas fa-arrow-circle-right"',\
-                                                 'class="fa fa-external-link"', html_string)
-                            html_string = re.sub(r"#/Search/\?author", f"https://pep-web.org/search/?q", html_string)
-                            
-                            if art_lang == "zh":
-                                # add some spaces in the chinese text to permit wrapping:
-                                html_string = re.sub('\。', '。 ', html_string)
-                                html_string = re.sub('\，', '， ', html_string)
-                                html_string = re.sub('\“', ' “', html_string)
-                                html_string = html_string.replace("</head>", opasConfig.PDF_CHINESE_STYLE + "</head>")
-                            else:
-                                # PDF Font to support Turkish and English (Extended Character Font)
-                                html_string = html_string.replace("</head>", opasConfig.PDF_OTHER_STYLE + "</head>")
-                                
-                            # html_string.encode("UTF-8")
-                            filename = document_id + ".PDF" 
-                            output_filename = os.path.join(tempfile.gettempdir(), filename)
-                            try:
-                                # temp debugging change to write out intermediate HTML file
-                                if localsecrets.DEVELOPMENT_DEBUGGING:
-                                    html_filename = document_id + ".html" 
-                                    html_out_filename  = os.path.join(tempfile.gettempdir(), html_filename)
-                                    with open(html_out_filename, 'w', encoding="utf8") as fo:
-                                        fo.write(html_string)
-                            except:
-                                pass
 
-                            # due to problems with pisa and referenced graphics and banners, weasyprint used now rather than Pisa 2022-04-20
-                            try:
-                                stylesheets = []
-                                #stylesheet_paths = [opasConfig.CSS_STYLESHEET, ]
-                                #try:
-                                    #for stylesheet_path in stylesheet_paths:
-                                        #with open(stylesheet_path) as f:
-                                            #style_data = f.read()
-                                        #stylesheets.append(CSS(string=style_data))
-                                #except Exception as e:
-                                    #print (f"Error reading file: {stylesheet_path}")
-                                font_config = FontConfiguration()
-                                html = HTML(string = html_string)
-                                html.write_pdf(target=output_filename, stylesheets=stylesheets, font_config=font_config)
-
-                            except Exception as e:
-                                logging.error(f"Weasyprint error: {e}")
-                                #status = models.ErrorReturn( httpcode=httpCodes.HTTP_500_INTERNAL_SERVER_ERROR,
-                                                             #error_description="Sorry, due to a conversion error, this article cannot be converted to PDF. Try ePUB format instead."
-                                                             #)
-                                if 1:
-                                    # Since Weasyprint returns nothing useful in this case, use the xml2html Pisa library to generate the PDF
-                                    # It usually works when Weasyprint fails, but doesn't seem to be able to include graphics anymore
-                                    # that was working at least partly at one point.
-                                    pisa_css = r"""
-                                        <link rel="stylesheet" type="text/css" href="%s"/>
-                                        @page {
-                                            size: letter portrait;
-                                            @frame content_frame {
-                                                left: 50pt;
-                                                width: 512pt;
-                                                top: 50pt;
-                                                height: 692pt;
-                                            }
-                                        }
-                                        @font-face {font-family: Roboto; src: url('%s');}
-                                        @font-face {font-family: Roboto; font-style: italic; src: url('%s');}
-                                        @font-face {font-family: Roboto; font-weight: bold; src: url('%s');}
-                                        @font-face {font-family: Roboto; font-weight: bold; font-style: italic; src: url('%s');}
-                                        body, p, p2 {   
-                                                    font-family: 'Noto Sans' }
-                                                
-                                    """ % (opasConfig.CSS_STYLESHEET,
-                                           opasConfig.fetch_resources('Roboto-Regular.ttf', None),
-                                           opasConfig.fetch_resources('Roboto-Italic.ttf', None),
-                                           opasConfig.fetch_resources('Roboto-Bold.ttf', None),
-                                           opasConfig.fetch_resources('Roboto-BoldItalic.ttf', None),
-                                           )
-                                    #pisa_css = pisa_css + style_data 
-
-                                    #pisa.showLogging() # debug only
-                                    #print (f"In Print Module.  Folder {os.getcwd()}")
-                                    #print (f"{opasConfig.PDF_EXTENDED_FONT}")
-                                    # doc = opasxmllib.remove_encoding_string(doc)
-                                    # open output file for writing (truncated binary)
-                                    try:
-                                        result_file = open(output_filename, "w+b")
-                                        # Need to fix links for graphics, e.g., see https://xhtml2pdf.readthedocs.io/en/latest/usage.html#using-xhtml2pdf-in-django
-                                        pisaStatus = pisa.CreatePDF(src=html_string,            # the HTML to convert
-                                                                    dest=result_file,
-                                                                    css_default=pisa_css, 
-                                                                    encoding="UTF-8") #,
-                                                                    # link_callback=opasConfig.fetch_resources)           # file handle to receive result
-                                        # close output file
-                                        result_file.close()
-                                    except Exception as e:
-                                        ret_val = None
-                                    else:
-                                        ret_val = output_filename                                    
-
-                            else:
-                                ret_val = output_filename                               
+                            The rendering of the article is kept in the artifact cache, by document and stylesheet version;
+                              for each request only the user's copyright page is rendered, and appended to a copy.
+                            """
+                            artifact_cache = opasArtifactCache.artifact_cache
+                            artifact_cache.clean_temp_files()
+                            file_last_modified = art_info.get("file_last_modified", None)
+                            body_key = opasArtifactCache.artifact_key(document_id, file_last_modified, "pdf")
+                            head_key = opasArtifactCache.artifact_key(document_id, file_last_modified, "pdfhead.html")
+                            body_filename = artifact_cache.get(body_key)
+                            html_head = artifact_cache.get_text(head_key)
+                            if body_filename is None or html_head is None:
+                                # large documents are rendered in the render queue's processes; concurrent requests share one rendering
+                                body_filename, html_head = opasRenderQueue.render_queue.render(body_key or f"{document_id}.pdf",
+                                                                                               render_pdf_artifact,
+                                                                                               doc, document_id, heading, art_lang, body_key, head_key,
+                                                                                               size=len(doc))
+
+                            if body_filename is not None:
+                                copyright_page = COPYRIGHT_PAGE_HTML.replace("[[username]]", session_info.username)
+                                copyright_filename = html_to_pdf_file(f"{html_head}{copyright_page}</html>", download_tempfile(document_id, "copyright"))
+                                if copyright_filename is not None:
+                                    output_filename = os.path.join(tempfile.gettempdir(), document_id + ".PDF")
+                                    ret_val = opasPDFStampCpyrght.append_pdf(body_filename, copyright_filename, output_filename)
+                                    os.remove(copyright_filename)
                                 
                         elif ret_format.upper() == "EPUB":
-                            doc = opasxmllib.remove_encoding_string(doc)
-                            html_string = opasxmllib.xml_str_to_html(doc, transformer_name=opasConfig.TRANSFORMER_XMLTOHTML, document_id=document_id) # transformer_name default used explicitly for code readability
-                            html_string = re.sub("\[\[RunningHead\]\]", f"{heading}", html_string, count=1)
-                            html_string = re.sub("href=\"#/Document",\
-                                                 "href=\"https://pep-web.org/browse/document", html_string)
-                            html_string = re.sub('class="fas fa-arrow-circle-right"',\
-                                                 'class="fa fa-external-link"', html_string)
-                            html_string = re.sub(r"#/Search/\?author", f"https://pep-web.org/search/?q", html_string)
-                            html_string = add_epub_elements(html_string)
+                            # the transformed article is kept in the artifact cache; the book, with the user's copyright page, is built for each request
+                            artifact_cache = opasArtifactCache.artifact_cache
+                            artifact_cache.clean_temp_files()
+                            html_key = opasArtifactCache.artifact_key(document_id, art_info.get("file_last_modified", None), "epub.html")
+                            html_string = artifact_cache.get_text(html_key)
+                            if html_string is None:
+                                html_string = opasRenderQueue.render_queue.render(html_key or f"{document_id}.epub.html",
+                                                                                  render_epub_html_artifact,
+                                                                                  doc, document_id, heading, html_key,
+                                                                                  size=len(doc))
                             filename = opasxmllib.html_to_epub(htmlstr=html_string,
                                                                output_filename_base=document_id,
                                                                art_id=document_id,
@@ -3051,6 +3141,17 @@ def prep_document_download(document_id,
                                                          error_description=err_msg
                                                        )
         
+                    except opasRenderQueue.RenderPending as e:
+                        # still rendering; it carries on, and a retry picks up the result
+                        ret_val = None
+                        status = models.ErrorReturn( httpcode=httpCodes.HTTP_202_ACCEPTED,
+                                                     error_description=f"{document_id} is being prepared for download.  Please try again in {opasConfig.RENDER_QUEUE_RETRY_AFTER} seconds."
+                                                   )
+                    except opasRenderQueue.RenderQueueFull as e:
+                        ret_val = None
+                        status = models.ErrorReturn( httpcode=httpCodes.HTTP_503_SERVICE_UNAVAILABLE,
+                                                     error_description=f"Too many downloads are being prepared.  Please try again in {opasConfig.RENDER_QUEUE_RETRY_AFTER} seconds."
+                                                   )
                     except Exception as e:
                         err_msg = f"Can't convert: {e}"
                         ret_val = None
@@ -3112,6 +3213,10 @@ def get_fulltext_from_search_results(result,
             logger.warning("Warning: text with highlighting is smaller than full-text area.  Returning without hit highlighting.")
             text_xml = fullText
 
+    # the HTML rendering can be cached (opasRenderCache) only if this is the document's stored text (and then only without hit markers)
+    render_cacheable = opasRenderCache.is_marked_copy(text_xml, fullText)
+    glossary_markup = True
+
     if text_xml is not None:
         reduce = False
         # see if an excerpt was requested.
@@ -3133,7 +3238,9 @@ def get_fulltext_from_search_results(result,
                                                     limit=page_limit,
                                                     pagebrk="pb",
                                                     inside="body",
-                                                    env="body")
+                                                    env="body",
+                                                    # the loader's page index is for the stored text (hit markers are allowed for)
+                                                    page_index=result.get("art_pgindex", None) if render_cacheable else None)
                 temp_xml = temp_xml[0]
                 
             except Exception as e:
@@ -3145,6 +3252,7 @@ def get_fulltext_from_search_results(result,
             if return_options.get("Glossary", None) == False:
                 # remove glossary markup
                 text_xml = opasxmllib.remove_glossary_impx(text_xml)   
+                glossary_markup = False
     
     try:
         format_requested_ci = format_requested.lower() # just in case someone passes in a wrong type
@@ -3189,8 +3297,21 @@ def get_fulltext_from_search_results(result,
                                                pgrg=documentListItem.pgRg,
                                                ret_format="HTML"
                                                )
+        if render_cacheable:
+            render_key = opasRenderCache.render_key(documentListItem.documentID,
+                                                    result.get("file_last_modified", None),
+                                                    opasConfig.TRANSFORMER_XMLTOHTML,
+                                                    glossary=glossary_markup,
+                                                    offset=offset,
+                                                    limit=page_limit)
+        else:
+            render_key = None
+
         try:
-            text_xml = opasxmllib.xml_str_to_html(text_xml, transformer_name=opasConfig.TRANSFORMER_XMLTOHTML, document_id=documentListItem.documentID) # transformer_name default used explicitly for code readability
+            # renderings with hit markers aren't cached, so the markers stay where Solr put them
+            text_xml = opasRenderCache.render_cache.get_html(render_key,
+                                                             text_xml,
+                                                             lambda xml_text: opasxmllib.xml_str_to_html(xml_text, transformer_name=opasConfig.TRANSFORMER_XMLTOHTML, document_id=documentListItem.documentID)) # transformer_name default used explicitly for code readability
             
         except Exception as e:
             logger.error(f"GetFulltextError: Could not convert to HTML {e}; returning native format")
@@ -27,6 +27,8 @@ from xml.sax import SAXParseException
 import models
 import opasXMLHelper as opasxmllib
 import opasDocPermissions as opasDocPerm
+import opasRenderCache
+import opasQueryCache
 import opasQueryHelper
 import pysolr
 # still using a function in solpy
@@ -168,6 +170,10 @@ def get_fulltext_from_search_results(result,
             logger.warning("Warning: text with highlighting is smaller than full-text area.  Returning without hit highlighting.")
             text_xml = fullText
 
+    # the HTML rendering can be cached (opasRenderCache) only if this is the document's stored text (and then only without hit markers)
+    render_cacheable = opasRenderCache.is_marked_copy(text_xml, fullText)
+    glossary_markup = True
+
     if text_xml is not None:
         reduce = False
         # see if an excerpt was requested.
@@ -189,7 +195,9 @@ def get_fulltext_from_search_results(result,
                                                     limit=page_limit,
                                                     pagebrk="pb",
                                                     inside="body",
-                                                    env="body")
+                                                    env="body",
+                                                    # the loader's page index is for the stored text (hit markers are allowed for)
+                                                    page_index=result.get("art_pgindex", None) if render_cacheable else None)
                 temp_xml = temp_xml[0]
                 
             except Exception as e:
@@ -201,6 +209,7 @@ def get_fulltext_from_search_results(result,
             if return_options.get("Glossary", None) == False:
                 # remove glossary markup
                 text_xml = opasxmllib.remove_glossary_impx(text_xml)   
+                glossary_markup = False
     
     try:
         format_requested_ci = format_requested.lower() # just in case someone passes in a wrong type
@@ -245,8 +254,21 @@ def get_fulltext_from_search_results(result,
                                                pgrg=documentListItem.pgRg,
                                                ret_format="HTML"
                                                )
+        if render_cacheable:
+            render_key = opasRenderCache.render_key(documentListItem.documentID,
+                                                    result.get("file_last_modified", None),
+                                                    opasConfig.TRANSFORMER_XMLTOHTML,
+                                                    glossary=glossary_markup,
+                                                    offset=offset,
+                                                    limit=page_limit)
+        else:
+            render_key = None
+
         try:
-            text_xml = opasxmllib.xml_str_to_html(text_xml, transformer_name=opasConfig.TRANSFORMER_XMLTOHTML, document_id=documentListItem.documentID) # transformer_name default used explicitly for code readability
+            # renderings with hit markers aren't cached, so the markers stay where Solr put them
+            text_xml = opasRenderCache.render_cache.get_html(render_key,
+                                                             text_xml,
+                                                             lambda xml_text: opasxmllib.xml_str_to_html(xml_text, transformer_name=opasConfig.TRANSFORMER_XMLTOHTML, document_id=documentListItem.documentID)) # transformer_name default used explicitly for code readability
             
         except Exception as e:
             logger.error(f"GetFulltextError: Could not convert to HTML {e}; returning native format")
@@ -594,7 +616,7 @@ def search_text_qs(solr_query_spec: models.SolrQuerySpec,
         if solr_query_spec.fullReturn: #and session_info.XXXauthenticated:
             # NOTE: we add this here, but in return data, access by document will be checked.
             if "text_xml" not in solr_query_spec.returnFields:
-                return_fields = return_fields + ", text_xml, para" #, art_excerpt, art_excerpt_xml
+                return_fields = return_fields + ", text_xml, para, art_pgindex" #, art_excerpt, art_excerpt_xml
         
         if solr_query_spec.abstractReturn:
             if "abstract_xml" not in solr_query_spec.returnFields:
@@ -694,7 +716,10 @@ def search_text_qs(solr_query_spec: models.SolrQuerySpec,
                        
         # ####################################################################################
         # THE SEARCH!
-        results = solr_docs2.search(query, **solr_param_dict)
+        if solr_query_spec.fullReturn: # full-text responses are too large to keep
+            results = solr_docs2.search(query, **solr_param_dict)
+        else: # the response is the same for every user (access is checked below), so it can be reused
+            results = opasQueryCache.query_cache.search(solr_docs2, query, **solr_param_dict)
         # ####################################################################################
        
     except SAXParseException as e:
@@ -784,12 +809,25 @@ def search_text_qs(solr_query_spec: models.SolrQuerySpec,
                     logger.debug(f"No session info to perform optimizations {e}")
                     
                 record_count = len(results.docs)
+                page_items = []
                 for result in results.docs:
-                    # reset anchor counts for full-text markup re.sub
-                    # count_anchors = 0
                     # authorIDs = result.get("art_authors", None)
                     documentListItem = models.DocumentListItem()
                     documentListItem = opasQueryHelper.get_base_article_info_from_search_result(result, documentListItem, session_info=session_info)
+                    page_items.append((result, documentListItem))
+
+                # sometimes, we don't need to check permissions (see below); when we do, resolve
+                #  the whole page at once so the PaDS calls aren't made serially, one per document
+                check_access = get_full_text or (solr_query_spec.abstractReturn and record_count == 1)
+                if check_access:
+                    page_access = opasDocPerm.get_access_limitations_for_list([item for result, item in page_items],
+                                                                              session_info=session_info,
+                                                                              fulltext_request=solr_query_spec.fullReturn,
+                                                                              request=request)
+                
+                for result, documentListItem in page_items:
+                    # reset anchor counts for full-text markup re.sub
+                    # count_anchors = 0
                     documentID = documentListItem.documentID
                     if documentID is None:
                         # there's a problem with this records
@@ -801,16 +839,8 @@ def search_text_qs(solr_query_spec: models.SolrQuerySpec,
                     # NEW 20211008 - If logged in, check permissions for full-text, or an abstract request with one return
                     documentListItem.accessChecked = False # default anyway, but to make sure it always exists
                     documentListItem.accessLimited = True  # default is True anyway, but to make sure it always exists
-                    if get_full_text or (solr_query_spec.abstractReturn and record_count == 1): 
-                        access = opasDocPerm.get_access_limitations( doc_id=documentListItem.documentID, 
-                                                                     classification=documentListItem.accessClassification, # based on file_classification (where it is)
-                                                                     year=documentListItem.year,
-                                                                     doi=documentListItem.doi, 
-                                                                     session_info=session_info, 
-                                                                     documentListItem=documentListItem,
-                                                                     fulltext_request=solr_query_spec.fullReturn,
-                                                                     request=request
-                                                                    ) # will updated accessLimited fields in documentListItem
+                    if check_access: 
+                        access = page_access.get(documentID) # resolved above by get_access_limitations_for_list
                         
                         if access is not None: # copy all the access info returned
                             documentListItem.accessChecked = True
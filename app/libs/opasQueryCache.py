@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasQueryCache
+
+Cache of raw Solr search responses for search_text_qs.
+
+Many searches are repeated exactly (saved searches from client configurations, links from
+  the What's New list, facet clicks).  The Solr response for a search doesn't depend on
+  who asks (access is checked per user on the documents afterwards, in search_text_qs), so
+  it's kept here, keyed on the canonical form of the search as sent to Solr: the core, q,
+  and the parameters built from the SolrQuerySpec (filters, sort, facets, highlighting
+  options, paging), in sorted order.
+
+Entries are dropped:
+  - ttl seconds after they're stored (opasConfig.QUERY_CACHE_TTL)
+  - least recently used first, when there are more than maxsize (opasConfig.QUERY_CACHE_SIZE)
+  - all of a core's, when the core's index version changes, i.e., after any commit (by
+    the loader, or opasDataUpdateStat).  The version is read from Solr at most every
+    opasConfig.QUERY_CACHE_VERSION_CHECK seconds; if it can't be read, searches go to Solr
+    uncached.
+
+Each caller gets its own copy of the document dicts, since search_text_qs changes them.
+
+>>> class FakeCore(object):
+...     url = "http://localhost:8983/solr/pepwebdocs"
+...     calls = 0
+...     def search(self, q, **kwargs):
+...         self.calls += 1
+...         return pysolr.Results({"response": {"numFound": 1, "docs": [{"art_id": "IJP.001.0001A"}]}})
+>>> core = FakeCore()
+>>> cache = QueryResultCache(name="solr_query_results_doctest", get_index_version=lambda solr_core: 1)
+>>> results = cache.search(core, "text:ego", fq="art_year:1920", **{"facet.field": ["art_lang"]})
+>>> results.docs[0]["art_id"] = None
+>>> cache.search(core, "text:ego", **{"facet.field": ["art_lang"], "fq": "art_year:1920"}).docs
+[{'art_id': 'IJP.001.0001A'}]
+>>> core.calls, cache.stats()["hits"]
+(1, 1)
+"""
+import time
+import threading
+
+import pysolr
+
+import opasConfig
+import opasMemoryCache
+import opasHTTPClient
+
+import logging
+logger = logging.getLogger(__name__)
+
+def canonical_value(value):
+    """
+    Return a hashable, normalized form of a Solr parameter value
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(canonical_value(item) for item in value)
+    elif isinstance(value, str):
+        return value.strip()
+    else:
+        return value
+
+def query_key(solr_core, query, params):
+    """
+    Return the cache key for a search of solr_core
+    """
+    return (getattr(solr_core, "url", repr(solr_core)),
+            canonical_value(query),
+            tuple(sorted((name, canonical_value(value)) for name, value in params.items() if value is not None)))
+
+def copy_response(raw_response):
+    """
+    Copy a decoded Solr response deeply enough that changes to its documents aren't shared
+    """
+    ret_val = dict(raw_response)
+    response_part = raw_response.get("response")
+    if response_part is not None:
+        ret_val["response"] = dict(response_part, docs=[dict(doc) for doc in response_part.get("docs", ())])
+
+    return ret_val
+
+def solr_index_version(solr_core):
+    """
+    Return the version of solr_core's index (changes with every commit), or None if it can't be read
+    """
+    ret_val = None
+    try:
+        response = opasHTTPClient.get(solr_core.url.rstrip("/") + "/admin/luke",
+                                      params={"numTerms": 0, "show": "index", "wt": "json"},
+                                      auth=getattr(solr_core, "auth", None))
+        if response.ok:
+            ret_val = response.json()["index"]["version"]
+        else:
+            logger.warning(f"Index version check for {solr_core.url} returned {response.status_code}")
+    except Exception as e:
+        logger.warning(f"Index version check for {getattr(solr_core, 'url', solr_core)} failed: {e}")
+
+    return ret_val
+
+class QueryResultCache(object):
+    def __init__(self,
+                 name="solr_query_results",
+                 maxsize=opasConfig.QUERY_CACHE_SIZE,
+                 ttl=opasConfig.QUERY_CACHE_TTL,
+                 version_check=opasConfig.QUERY_CACHE_VERSION_CHECK,
+                 get_index_version=solr_index_version):
+        self.memory = opasMemoryCache.TTLCache(name=name, maxsize=maxsize, ttl=ttl)
+        self.version_check = version_check
+        self.get_index_version = get_index_version
+        self._versions = {} # core url -> (time checked, index version)
+        self._lock = threading.Lock()
+        self.version_changes = 0
+
+    def index_version(self, solr_core):
+        """
+        Return the (recently checked) index version of solr_core, emptying the core's entries if it changed
+        """
+        url = getattr(solr_core, "url", repr(solr_core))
+        with self._lock:
+            checked, version = self._versions.get(url, (0, None))
+        if time.time() - checked < self.version_check:
+            return version
+
+        new_version = self.get_index_version(solr_core)
+        with self._lock:
+            self._versions[url] = (time.time(), new_version)
+        if new_version != version and version is not None:
+            self.version_changes += 1
+            removed = self.memory.invalidate_where(lambda key: key[0] == url)
+            logger.info(f"Index version of {url} changed ({version} to {new_version}).  {removed} cached search responses dropped.")
+
+        return new_version
+
+    def search(self, solr_core, query, **params):
+        """
+        Return solr_core.search(query, **params), from the cache if the same search was run on
+          the same index version within the ttl.
+        """
+        if self.index_version(solr_core) is None:
+            return solr_core.search(query, **params)
+
+        key = query_key(solr_core, query, params)
+        raw_response = self.memory.get(key)
+        if raw_response is not None:
+            results_cls = getattr(solr_core, "results_cls", pysolr.Results)
+            ret_val = results_cls(copy_response(raw_response))
+        else:
+            ret_val = solr_core.search(query, **params)
+            if isinstance(getattr(ret_val, "raw_response", None), dict):
+                self.memory.put(key, copy_response(ret_val.raw_response))
+
+        return ret_val
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self):
+        ret_val = self.memory.stats()
+        ret_val["version_changes"] = self.version_changes
+        return ret_val
+
+# the process wide cache used by search_text_qs
+query_cache = QueryResultCache()
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasQueryCache Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
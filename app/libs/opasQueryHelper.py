@@ -47,6 +47,7 @@ import schemaMap
 import opasGenSupportLib as opasgenlib
 
 import opasXMLHelper as opasxmllib
+import opasRenderCache
 from opasArticleIDSupport import parse_issue_code, parse_volume_code
    
 # import opasDocPermissions as opasDocPerm
@@ -1987,9 +1988,11 @@ def get_excerpt_from_search_result(result: dict, documentListItem: models.Docume
     if documentListItem.sourceTitle is None:
         documentListItem = get_base_article_info_from_search_result(result, documentListItem)
 
+    excerpt_found = True
     try:
         art_excerpt = result["art_excerpt"]
     except KeyError as e:
+        excerpt_found = False
         art_excerpt  = "No abstract found for this title, or no abstract requested in search options."
         logger.info("No excerpt for document ID: %s", documentListItem.documentID)
 
@@ -2032,7 +2035,20 @@ def get_excerpt_from_search_result(result: dict, documentListItem: models.Docume
             abstract = abs_xml
             
         else: # ret_format == "HTML":
-            abstract = opasxmllib.xml_str_to_html(abs_xml, transformer_name=opasConfig.TRANSFORMER_XMLTOHTML, document_id=documentListItem.documentID) # transformer_name default used explicitly for code readability
+            # abs_xml depends on the fields the caller fetched (art_excerpt_xml or art_excerpt, documentInfoXML),
+            #  so it's part of the key; the fallback when there's no excerpt field isn't cached
+            if excerpt_found:
+                render_key = opasRenderCache.render_key(documentListItem.documentID,
+                                                        documentListItem.updated,
+                                                        opasConfig.TRANSFORMER_XMLTOHTML,
+                                                        abstract=True,
+                                                        omit_abstract=omit_abstract,
+                                                        xml_hash=opasRenderCache.content_hash(abs_xml))
+            else:
+                render_key = None
+            abstract = opasRenderCache.render_cache.get_html(render_key,
+                                                             abs_xml,
+                                                             lambda xml_text: opasxmllib.xml_str_to_html(xml_text, transformer_name=opasConfig.TRANSFORMER_XMLTOHTML, document_id=documentListItem.documentID)) # transformer_name default used explicitly for code readability
 
     # return it in the abstract field for display
     documentListItem.abstract = abstract
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasRenderCache
+
+Cache of rendered (XSLT transformed) document and abstract HTML.
+
+The same article is served many times, unchanged, but every request parses its XML and runs
+  the XSLT again.  Here the rendered HTML is kept, keyed on the document ID, its
+  file_last_modified (so a reloaded document is never served stale), the transformer name, and
+  the render options which change the output (e.g., glossary markup on/off, page range).
+
+There are two tiers:
+  - in memory, least recently used entries evicted first (opasMemoryCache.TTLCache, "rendered_html",
+    sized by opasConfig.RENDER_CACHE_SIZE)
+  - optionally on disk (opasConfig.RENDER_CACHE_DIR), gzipped, shared by all the server processes.
+
+Only renderings without hit highlighting are cached.  The hit markers Solr puts in the XML
+  (opasConfig.HITMARKERSTART/HITMARKEREND) depend on the search: on phrase and proximity matches,
+  on which occurrences are positional hits, and on highlightlimit.  They can't be put back
+  reliably once the XML has been rendered, so text with hit markers is rendered as before, through
+  the XSLT, and the result isn't cached.
+
+>>> cache = RenderCache(name="rendered_html_doctest", maxsize=10)
+>>> render = lambda xml: xml.replace("<p>", "<div>").replace("</p>", "</div>")
+>>> key = render_key("IJP.001.0001A", "2022-01-01T00:00:00Z", "XML2HTML", glossary=True)
+>>> cache.get_html(key, "<p>The ego and the id</p>", render)
+'<div>The ego and the id</div>'
+>>> cache.get_html(key, "<p>The ego and the id</p>", lambda xml: "not called")
+'<div>The ego and the id</div>'
+>>> cache.get_html(key, "<p>The #@@@ego@@@# and the id</p>", render)
+'<div>The #@@@ego@@@# and the id</div>'
+>>> cache.stats()["hits"]
+1
+>>> render_key("IJP.001.0001A", None, "XML2HTML") is None
+True
+"""
+import os
+import re
+import gzip
+import hashlib
+
+import opasConfig
+import opasMemoryCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+rcx_hit_markers = re.compile(f"{re.escape(opasConfig.HITMARKERSTART)}|{re.escape(opasConfig.HITMARKEREND)}")
+
+# rendering failures come back as a message rather than an exception; they aren't cached
+RENDER_ERROR_MARKERS = ("XSLT Transform Error", "Sorry, due to")
+
+def render_key(document_id, file_last_modified, transformer_name, **options):
+    """
+    Return the cache key for a rendering, or None if it shouldn't be cached (no version information)
+    """
+    if document_id is None or file_last_modified is None:
+        return None
+
+    return (document_id, str(file_last_modified), transformer_name) + tuple(sorted(options.items()))
+
+def content_hash(text):
+    """
+    Return a short hash of text, for keying renderings whose source isn't fixed by the document version alone
+
+    >>> content_hash("<abs><p>The ego</p></abs>") == content_hash("<abs><p>The ego</p></abs>"), content_hash("<abs/>") == content_hash("<abs><p/></abs>")
+    (True, False)
+    """
+    return hashlib.sha256(text.encode("utf8")).hexdigest()[:16]
+
+def is_marked_copy(xml_text, plain_xml_text):
+    """
+    True if xml_text is plain_xml_text, other than hit markers (i.e., it's the stored text of the
+      document, not a fragment or a different field), so its rendering can be cached under the document's key
+
+    >>> is_marked_copy("<p>The #@@@ego@@@#</p>", "<p>The ego</p>"), is_marked_copy("<p>The #@@@ego@@@#</p>", "<p>The ego and the id</p>")
+    (True, False)
+    """
+    if xml_text is None or plain_xml_text is None:
+        return False
+
+    return xml_text is plain_xml_text or rcx_hit_markers.sub("", xml_text) == plain_xml_text
+
+class RenderCache(object):
+    def __init__(self, name="rendered_html", maxsize=opasConfig.RENDER_CACHE_SIZE, ttl=opasConfig.RENDER_CACHE_TTL, disk_dir=None):
+        self.memory = opasMemoryCache.TTLCache(name=name, maxsize=maxsize, ttl=ttl)
+        self.disk_dir = disk_dir
+        self.disk_hits = 0
+        self.disk_errors = 0
+        if self.disk_dir is not None:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+            except Exception as e:
+                logger.error(f"Render cache folder {self.disk_dir} can't be created ({e}).  Disk tier disabled.")
+                self.disk_dir = None
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha256(repr(key).encode("utf8")).hexdigest() + ".html.gz")
+
+    def get(self, key):
+        ret_val = self.memory.get(key)
+        if ret_val is None and self.disk_dir is not None:
+            try:
+                with gzip.open(self._disk_path(key), "rt", encoding="utf8") as f:
+                    ret_val = f.read()
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                self.disk_errors += 1
+                logger.warning(f"Render cache read error: {e}")
+            else:
+                self.disk_hits += 1
+                self.memory.put(key, ret_val)
+
+        return ret_val
+
+    def put(self, key, html):
+        self.memory.put(key, html)
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with gzip.open(temp_path, "wt", encoding="utf8") as f:
+                    f.write(html)
+                os.replace(temp_path, path)
+            except Exception as e:
+                self.disk_errors += 1
+                logger.warning(f"Render cache write error: {e}")
+
+    def get_html(self, key, xml_text, render):
+        """
+        Return render(xml_text), using the cached rendering for key if there is one.
+
+        xml_text with hit markers is always rendered, so the markers come through the XSLT
+          exactly where Solr put them, and the result isn't cached.
+        """
+        if key is None or not isinstance(xml_text, str) or opasConfig.HITMARKERSTART in xml_text:
+            return render(xml_text)
+
+        ret_val = self.get(key)
+        if ret_val is None:
+            ret_val = render(xml_text)
+            if isinstance(ret_val, str) and not any(marker in ret_val for marker in RENDER_ERROR_MARKERS):
+                self.put(key, ret_val)
+
+        return ret_val
+
+    def stats(self):
+        ret_val = self.memory.stats()
+        ret_val["disk_hits"] = self.disk_hits
+        ret_val["disk_errors"] = self.disk_errors
+        return ret_val
+
+# the process wide cache used by the document and abstract endpoints
+render_cache = RenderCache(disk_dir=opasConfig.RENDER_CACHE_DIR)
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasRenderCache Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
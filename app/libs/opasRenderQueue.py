@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasRenderQueue
+
+Runs the expensive download renderings (weasyprint PDFs, the XSLT pass for EPUBs) in a separate,
+  bounded pool of processes (opasConfig.RENDER_QUEUE_WORKERS), so a long book doesn't hold a
+  server worker, and the GIL, for many seconds while searches wait.
+
+  - render(key, func, *args, size=...) returns func(*args).  Documents smaller than
+    opasConfig.RENDER_QUEUE_SYNC_MAX_BYTES are rendered in the calling thread, as before.  Others
+    are submitted to the pool and waited for, up to opasConfig.RENDER_QUEUE_WAIT_TIMEOUT seconds;
+    then RenderPending is raised.  The job carries on, so the client can simply retry.  The
+    renderings store their result in the artifact cache, but some can't be cached there (no
+    file_last_modified, or a rendering error), so a finished job's result is also kept here, under
+    its key, for opasConfig.RENDER_QUEUE_RESULT_TTL seconds; the retry picks it up rather than
+    submitting the job again.
+  - submit(key, func, *args), poll(key) and wait(key, timeout) are the same steps, separately.
+  - Requests for a key which is already queued or running share that job rather than rendering
+    it again.
+  - At most opasConfig.RENDER_QUEUE_MAX_PENDING jobs are queued or running; beyond that,
+    RenderQueueFull is raised.
+
+func and its arguments are pickled to the worker process, so func must be a module level function.
+
+>>> queue = RenderQueue(max_workers=0)
+>>> queue.render("IJP.001.0001A.pdf", max, 3, 4, size=10**6)
+4
+>>> queue.stats()["sync"]
+1
+>>> queue = RenderQueue(max_workers=1, sync_max_bytes=0)
+>>> queue.render("IJP.001.0001A.pdf", max, 3, 4, size=10**6)
+4
+>>> queue.poll("IJP.001.0001A.pdf") is None, queue.stats()["submitted"]
+(True, 1)
+>>> queue.shutdown()
+"""
+import os
+import time
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+import opasConfig
+
+import logging
+logger = logging.getLogger(__name__)
+
+class RenderPending(Exception):
+    """
+    The rendering is still running (in the pool); it can be picked up later with the same key
+    """
+    def __init__(self, key):
+        self.key = key
+        super().__init__(f"Rendering {key} is still running")
+
+class RenderQueueFull(Exception):
+    pass
+
+class RenderQueue(object):
+    def __init__(self,
+                 max_workers=opasConfig.RENDER_QUEUE_WORKERS,
+                 max_pending=opasConfig.RENDER_QUEUE_MAX_PENDING,
+                 sync_max_bytes=opasConfig.RENDER_QUEUE_SYNC_MAX_BYTES,
+                 wait_timeout=opasConfig.RENDER_QUEUE_WAIT_TIMEOUT,
+                 result_ttl=opasConfig.RENDER_QUEUE_RESULT_TTL):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.sync_max_bytes = sync_max_bytes
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._executor_pid = None
+        self._jobs = {} # key -> future, while queued or running
+        self._finished = {} # key -> (future, time finished), completed jobs for result_ttl seconds
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.reused = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.sync = 0
+
+    def _get_executor(self):
+        # the pool belongs to the process which started it (not inherited by forked server workers).
+        #  Workers are spawned rather than forked, so they don't inherit this process's threads and locks
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers,
+                                                                    mp_context=multiprocessing.get_context("spawn"))
+            self._executor_pid = os.getpid()
+
+        return self._executor
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._jobs.get(key) is future:
+                del self._jobs[key]
+            exception = None if future.cancelled() else future.exception()
+            if future.cancelled() or exception is not None:
+                self.failed += 1
+                if isinstance(exception, BrokenProcessPool):
+                    # a worker died (e.g., out of memory); start a new pool for the next job
+                    logger.error(f"Render worker process failed rendering {key}.  Restarting the pool.")
+                    self._executor = None
+            else:
+                self.completed += 1
+                if self.result_ttl > 0:
+                    self._finished[key] = (future, time.time())
+
+    def _finished_job(self, key):
+        # the completed job for key, if it finished less than result_ttl seconds ago (call with the lock held)
+        now = time.time()
+        for finished_key in [finished_key for finished_key, (future, finished) in self._finished.items() if now - finished >= self.result_ttl]:
+            del self._finished[finished_key]
+
+        ret_val = self._finished.get(key)
+        return ret_val[0] if ret_val is not None else None
+
+    def submit(self, key, func, *args):
+        """
+        Queue func(*args) in the pool, or return the future of the job already queued or running
+          for key, or finished within result_ttl seconds
+        """
+        with self._lock:
+            ret_val = self._jobs.get(key)
+            if ret_val is not None:
+                self.coalesced += 1
+                return ret_val
+
+            ret_val = self._finished_job(key)
+            if ret_val is not None:
+                self.reused += 1
+                return ret_val
+
+            if len(self._jobs) >= self.max_pending:
+                self.rejected += 1
+                raise RenderQueueFull(f"{len(self._jobs)} renderings are queued or running")
+
+            try:
+                ret_val = self._get_executor().submit(func, *args)
+            except BrokenProcessPool:
+                self._executor = None
+                ret_val = self._get_executor().submit(func, *args)
+            self._jobs[key] = ret_val
+            self.submitted += 1
+
+        ret_val.add_done_callback(lambda future: self._done(key, future))
+        return ret_val
+
+    def poll(self, key):
+        """
+        Return "queued" or "running" for a job in the pool, or None if there's none for key
+        """
+        with self._lock:
+            future = self._jobs.get(key)
+
+        if future is None or future.done():
+            ret_val = None
+        elif future.running():
+            ret_val = "running"
+        else:
+            ret_val = "queued"
+
+        return ret_val
+
+    def wait(self, key, future, timeout=None):
+        """
+        Return the result of a submitted job, raising RenderPending if it's not finished in timeout seconds
+        """
+        try:
+            ret_val = future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            self.timeouts += 1
+            raise RenderPending(key)
+
+        return ret_val
+
+    def render(self, key, func, *args, size=0):
+        """
+        Return func(*args): in this thread for small renderings (size in bytes), otherwise in the pool, waiting up to wait_timeout seconds
+        """
+        if self.max_workers <= 0 or size < self.sync_max_bytes:
+            self.sync += 1
+            return func(*args)
+
+        future = self.submit(key, func, *args)
+        return self.wait(key, future, timeout=self.wait_timeout)
+
+    def stats(self):
+        with self._lock:
+            futures = list(self._jobs.values())
+
+        running = sum(1 for future in futures if future.running())
+        return {"workers": self.max_workers,
+                "queued": len(futures) - running,
+                "running": running,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "completed": self.completed,
+                "reused": self.reused,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "sync": self.sync
+                }
+
+    def shutdown(self):
+        with self._lock:
+            executor = self._executor if self._executor_pid == os.getpid() else None
+            self._executor = None
+
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+# the process wide queue used by prep_document_download
+render_queue = RenderQueue()
+
+def get_render_queue_stats():
+    return render_queue.stats()
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasRenderQueue Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
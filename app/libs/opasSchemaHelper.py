@@ -15,7 +15,7 @@ __version__     = "2020.0821.1"
 __status__      = "Development"
 
 # import re
-import requests
+import opasHTTPClient
 from requests.auth import HTTPBasicAuth 
 from localsecrets import SOLRUSER, SOLRPW, SOLRURL
 
@@ -54,9 +54,9 @@ def solr_field_check(core, field_name):
         
         apicall = direct_endpoint_call(endpoint, SOLRURL)
         if SOLRUSER is not None:
-            response = requests.get(apicall, auth=HTTPBasicAuth(SOLRUSER, SOLRPW))
+            response = opasHTTPClient.get(apicall, auth=HTTPBasicAuth(SOLRUSER, SOLRPW))
         else:
-            response = requests.get(apicall)
+            response = opasHTTPClient.get(apicall)
 
         if response.status_code == 200:
             r = response.json()
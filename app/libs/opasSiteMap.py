@@ -12,7 +12,7 @@ Build a Google sitemap from the document urls
 __author__      = "Neil R. Shapiro"
 __copyright__   = "Copyright 2019-2021, Psychoanalytic Electronic Publishing"
 __license__     = "Apache 2.0"
-__version__     = "2021.0424.1"
+__version__     = "2026.1017.1"
 __status__      = "Development"
 
 import localsecrets
@@ -20,7 +20,11 @@ import localsecrets
 # from xml.sax import SAXParseException
 import sys
 import os.path
+import gzip
 import datetime
+import collections
+import concurrent.futures
+from xml.sax.saxutils import escape
 import logging
 logger = logging.getLogger(__name__)
 
@@ -31,7 +35,35 @@ import s3fs
 
 sys.path.append('./libs/configLib')
 
-from opasPySolrLib import search
+import opasConfig
+from configLib.opasCoreConfig import solr_docs2
+
+BASE_URL = "https://pep-web.org/browse/document/"
+SITEMAP_HEADER = '<?xml version="1.0" encoding="utf-8" ?>\n<!DOCTYPE articles SYSTEM "googlearticles.dtd">\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+SITEMAP_FOOTER = "</urlset>\n"
+SITEMAP_INDEX_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+SITEMAP_INDEX_FOOTER = "\n</sitemapindex>\n"
+DTFORMAT = '%Y-%m-%dT%H:%M:%S%Z'
+
+def sitemap_fs():
+   """
+   Return the filesystem the sitemap is written to: S3, or local (codecs.open) for the Local configuration
+   """
+   if localsecrets.CONFIG != 'Local':
+      ret_val = s3fs.S3FileSystem(anon=False)
+   else:
+      ret_val = codecs
+
+   return ret_val
+
+def sitemap_index_entry(sitemap, mod_time):
+   sitemap_base = os.path.basename(sitemap)
+   return f'''
+   <sitemap>
+      <loc>{localsecrets.SITEMAP_URL}{sitemap_base}</loc>
+      <lastmod>{mod_time}</lastmod>
+   </sitemap>
+            '''
 
 def opas_sitemap_index(output_file=localsecrets.SITEMAP_PATH, sitemap_list=[]):
    """
@@ -40,6 +72,8 @@ def opas_sitemap_index(output_file=localsecrets.SITEMAP_PATH, sitemap_list=[]):
    Create the index of the returned file names
    output file is path but not name of sitemap index, which is set below.
 
+   (metadata_export can also write the index itself, as the sitemap files are written; see index_file)
+
    >>> SITEMAP_OUTPUT_FILE = localsecrets.SITEMAP_PATH + "/sitemap" # don't include xml extension here, it's added
    >>> SITEMAP_INDEX_FILE = localsecrets.SITEMAP_PATH + "/sitemapindex.xml"
    >>> sitemap_list = metadata_export(outputFileName=SITEMAP_OUTPUT_FILE, total_records=1000, records_per_file=200)
@@ -48,32 +82,18 @@ def opas_sitemap_index(output_file=localsecrets.SITEMAP_PATH, sitemap_list=[]):
    True
    
    """
-   dtformat = '%Y-%m-%dT%H:%M:%S%Z'
-   
    try:
       ret_val = ""
-      sm_index_head = '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-
-      if localsecrets.CONFIG != 'Local':
-         fs = s3fs.S3FileSystem(anon=False)
-      else:
-         fs = codecs
-
+      fs = sitemap_fs()
       with fs.open(output_file, 'w') as enf:
-         mod_time = datetime.datetime.now().strftime(dtformat)
-         enf.write(sm_index_head)
+         mod_time = datetime.datetime.now().strftime(DTFORMAT)
+         enf.write(SITEMAP_INDEX_HEADER)
          for sitemap in sitemap_list:
-            sitemap_base = os.path.basename(sitemap)
-            record = f'''
-   <sitemap>
-      <loc>{localsecrets.SITEMAP_URL}{sitemap_base}</loc>
-      <lastmod>{mod_time}</lastmod>
-   </sitemap>
-            '''
+            record = sitemap_index_entry(sitemap, mod_time)
             enf.write(record)
             ret_val += record
       
-         enf.write("\n</sitemapindex>\n")
+         enf.write(SITEMAP_INDEX_FOOTER)
 
    except Exception as err:
       ret_val = f"Error: {err}"
@@ -81,65 +101,126 @@ def opas_sitemap_index(output_file=localsecrets.SITEMAP_PATH, sitemap_list=[]):
       
    return ret_val
      
-     
 #--------------------------------------------------------------------------------
-def metadata_export(outputFileName="../sitemap", total_records=140000, records_per_file=10000):
+def iter_sitemap_records(solr_core=None, max_records=None, rows=opasConfig.SITEMAP_EXPORT_ROWS):
+   """
+   Yield (art_id, file_last_modified) for the articles (art_level:1), paging through Solr with
+     cursorMark (each page costs the same, unlike deep start offsets), up to max_records if given.
+   """
+   if solr_core is None:
+      solr_core = solr_docs2
+
+   count = 0
+   cursor_mark = "*"
+   while max_records is None or count < max_records:
+      results = solr_core.search("art_level:1", fl="art_id, file_last_modified", sort="id asc", rows=rows, cursorMark=cursor_mark)
+      for doc in results.docs:
+         art_id = doc.get("art_id", None)
+         if art_id is not None:
+            yield art_id, doc.get("file_last_modified", None)
+            count += 1
+            if max_records is not None and count >= max_records:
+               break
+      if results.nextCursorMark is None or results.nextCursorMark == cursor_mark:
+         break
+      cursor_mark = results.nextCursorMark
+
+def iter_shards(records, records_per_file):
+   """
+   Group records into lists of exactly records_per_file (the last may be shorter)
+
+   >>> [len(shard) for shard in iter_shards(range(25), 10)]
+   [10, 10, 5]
+   """
+   shard = []
+   for record in records:
+      shard.append(record)
+      if len(shard) == records_per_file:
+         yield shard
+         shard = []
+   if shard:
+      yield shard
+
+def sitemap_content(records):
+   """
+   Return the sitemap XML for a list of (art_id, file_last_modified)
+
+   >>> print (sitemap_content([("IJP.077.0217A", "2021-05-01T10:00:00Z")]))
+   <?xml version="1.0" encoding="utf-8" ?>
+   <!DOCTYPE articles SYSTEM "googlearticles.dtd">
+   <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+   	<url>
+   		<loc>https://pep-web.org/browse/document/IJP.077.0217A</loc>
+   		<lastmod>2021-05-01T10:00:00Z</lastmod>
+   	</url>
+   </urlset>
    """
-   Populate the build table from the articles table.
+   parts = [SITEMAP_HEADER]
+   for art_id, file_last_modified in records:
+      parts.append(f"\t<url>\n\t\t<loc>{BASE_URL}{escape(art_id)}</loc>\n\t\t<lastmod>{file_last_modified}</lastmod>\n\t</url>\n")
+   parts.append(SITEMAP_FOOTER)
+   return "".join(parts)
 
+def write_sitemap_file(fs, filename, records, compress=opasConfig.SITEMAP_COMPRESS):
    """
+   Write one sitemap file (gzip compressed if compress); returns filename
+   """
+   data = sitemap_content(records).encode("utf-8")
+   if compress:
+      data = gzip.compress(data, mtime=0)
+
+   with fs.open(filename, 'wb') as enf:
+      enf.write(data)
+
+   logger.info(f"Wrote {filename} ({len(records)} urls)")
+   return filename
 
-   base_url = "https://pep-web.org/browse/document/"
-   header = '<?xml version="1.0" encoding="utf-8" ?>\n<!DOCTYPE articles SYSTEM "googlearticles.dtd">\n'
+#--------------------------------------------------------------------------------
+def metadata_export(outputFileName="../sitemap", total_records=None, records_per_file=10000, index_file=None,
+                    compress=opasConfig.SITEMAP_COMPRESS, workers=opasConfig.SITEMAP_WRITE_WORKERS, solr_core=None, fs=None):
+   """
+   Write the article URLs to sitemap files of records_per_file URLs each (outputFileName1.xml.gz,
+     outputFileName2.xml.gz, ..., or .xml if not compress), and return the list of file names.
+
+   The art_ids are streamed from Solr (cursorMark) straight into the files, workers files being
+     written at once, so nothing needs to know the total number of articles (total_records is only
+     an optional limit).  If index_file is given, the sitemap index is written too (rather than
+     afterwards with opas_sitemap_index), but only once all the files are done, so a failed export
+     leaves the last good index in place.
+   """
+   if fs is None:
+      fs = sitemap_fs()
+
+   extension = ".xml.gz" if compress else ".xml"
    sitemap_list = []
-   file_count = 0
-   rec_count = 0
+   index_entries = []
+   pending = collections.deque()
+   
+   def finish_oldest():
+      # in order, so the index lists the files in sequence
+      filename = pending.popleft().result()
+      sitemap_list.append(filename)
+      index_entries.append(sitemap_index_entry(filename, datetime.datetime.now().strftime(DTFORMAT)))
+
    try:
-      for rec_group in range(0, total_records, records_per_file):
-         if rec_count > total_records: # don't write more than total_records
-            break
-         try:
-            # search using opasPySolrLib
-            results = search("art_level:1", 
-                              summaryField="art_id, file_last_modified", 
-                              returnStartAt=rec_group, 
-                              returnLimit=records_per_file)
-         except Exception as err:
-            raise HTTPException(404, detail=err)
-            
-         if len(results.docs) == 0: # if there are no more records, stop creating files
-            break
-         else: # write the file
-            if localsecrets.CONFIG != 'Local':
-               fs = s3fs.S3FileSystem(anon=False)
-            else:
-               fs = codecs
-
-            file_count += 1
-            filename = f"{outputFileName}{file_count}.xml"
-            sitemap_list.append(filename)
-            logger.info(f"Writing {filename}")
-
-            try:
-               with fs.open(filename, 'w') as enf:
-                  enf.write(header)
-                  enf.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
-                  for n in results.docs:
-                     rec_count += 1
-                     art_id = n.get("art_id", None)
-                     file_last_modified = n.get("file_last_modified", None)
-                     
-                     if art_id is not None:
-                        enf.write("\t<url>\n")
-                        enf.write(f"\t\t<loc>{base_url}{art_id}</loc>\n")
-                        enf.write(f"\t\t<lastmod>{file_last_modified}</lastmod>\n")
-                        enf.write("\t</url>\n")  
-                  enf.write("</urlset>\n")
-            except Exception as e:
-               logger.error(f"metadata_export error: {e}")
+      with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+         records = iter_sitemap_records(solr_core=solr_core, max_records=total_records)
+         for file_count, shard in enumerate(iter_shards(records, records_per_file), start=1):
+            filename = f"{outputFileName}{file_count}{extension}"
+            pending.append(executor.submit(write_sitemap_file, fs, filename, shard, compress))
+            # bound the shards held in memory
+            while len(pending) > max(workers, 1):
+               finish_oldest()
+         while pending:
+            finish_oldest()
+
+      if index_file is not None:
+         with fs.open(index_file, 'w') as index:
+            index.write(SITEMAP_INDEX_HEADER + "".join(index_entries) + SITEMAP_INDEX_FOOTER)
 
    except Exception as err:
-      raise HTTPException(404, detail=err)
+      logger.error(f"metadata_export error: {err}")
+      raise HTTPException(404, detail=str(err))
       
    return sitemap_list # needed by opas_sitemap_index
 
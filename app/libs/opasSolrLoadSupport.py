@@ -40,6 +40,7 @@ import opasCentralDBLib
 
 import opasGenSupportLib as opasgenlib
 import opasXMLHelper as opasxmllib
+import opasPageIndex
 import loaderConfig
 import opasLocator
 
@@ -105,6 +106,90 @@ def remove_values_from_terms_highlighted_list(the_list, remove_stop_words=True,
         return [strip_tags(value, compiled_tag_pattern = cStripPattern) for value in the_list]
 
 
+def plain_value(value):
+    """
+    Return value with lxml "smart" strings (the results of attribute and text xpaths, which keep
+      a reference to their element) converted to plain str, recursively through lists, tuples
+      and dicts, and any remaining elements serialized to XML, so the value can be pickled
+      and sent between the loader's worker processes.
+
+    >>> plain_value({"lang": [etree.fromstring('<p lang="en"/>').xpath('//@lang')[0]]})
+    {'lang': ['en']}
+    """
+    if isinstance(value, str):
+        ret_val = str(value)
+    elif isinstance(value, dict):
+        ret_val = {key: plain_value(item) for key, item in value.items()}
+    elif isinstance(value, (list, tuple)):
+        ret_val = [plain_value(item) for item in value]
+    elif isinstance(value, etree._Element):
+        ret_val = etree.tostring(value, with_tail=False).decode("utf8")
+    else:
+        ret_val = value
+
+    return ret_val
+
+class SolrAddCollector(object):
+    """
+    Stands in for a pysolr core in the loader's worker processes.  Documents passed to add
+      are kept (in docs) rather than sent, so the writer stage can send them to the real core
+      in batches (see SolrBatchWriter).
+    """
+    def __init__(self):
+        self.docs = []
+
+    def add(self, docs, commit=False, **kwargs):
+        self.docs.extend(plain_value(doc) for doc in docs)
+        # what the callers check for in a Solr response
+        return '{"responseHeader":{"status":0}}'
+
+class SolrBatchWriter(object):
+    """
+    Buffers documents for a Solr core and sends them batch_size at a time in a single add,
+      instead of one update request per article.
+
+    flush sends whatever is pending; commit flushes and then commits the core.  If Solr
+      rejects a batch, its documents are sent again one at a time, so only the documents
+      which really fail are counted (error_count) and left out.
+    """
+    def __init__(self, solrcore, batch_size=opasConfig.LOADER_SOLR_ADD_BATCH_SIZE, name=None):
+        self.solrcore = solrcore
+        self.batch_size = batch_size
+        self.name = name
+        self.pending = []
+        self.sent_count = 0
+        self.error_count = 0
+
+    def add(self, docs):
+        self.pending.extend(docs)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            docs, self.pending = self.pending, []
+            try:
+                self.solrcore.add(docs, commit=False)
+            except Exception as err:
+                # find the bad documents: send the batch again one document at a time
+                logger.warning(f"SolrBatchError: {self.name} add of {len(docs)} documents failed ({err}).  Retrying by document.")
+                for doc in docs:
+                    try:
+                        self.solrcore.add([doc], commit=False)
+                    except Exception as err:
+                        self.error_count += 1
+                        errStr = f"SolrBatchError: {self.name} add of {doc.get('id')} failed: {err}"
+                        logger.error(errStr)
+                        if opasConfig.LOCAL_TRACE: print (errStr)
+                    else:
+                        self.sent_count += 1
+            else:
+                self.sent_count += len(docs)
+
+    def commit(self):
+        self.flush()
+        self.solrcore.commit()
+
 class BiblioEntry(object):
     """
     An entry from a documents bibliography.
@@ -113,6 +198,9 @@ class BiblioEntry(object):
        and the Solr core pepwebrefs for searching in special cases.
     
     """
+    def __getstate__(self):
+        return plain_value(self.__dict__)
+
     def __init__(self, artInfo, ref):
         self.ref_entry_xml = etree.tostring(ref, with_tail=False)
         if self.ref_entry_xml is not None:
@@ -216,6 +304,13 @@ class ArticleInfo(object):
        client searches.
 
     """
+    def __getstate__(self):
+        # the author elements can't be pickled, and are only used while the document tree
+        #  is still at hand (process_info_for_author_core), so they are not sent on.
+        state = self.__dict__.copy()
+        state["author_xml_list"] = []
+        return plain_value(state)
+
     def __init__(self, sourceinfodb_data, pepxml, art_id, logger, verbose=None):
         # let's just double check artid!
         self.art_id = None
@@ -773,6 +868,38 @@ def get_file_dates_solr(solrcore, filename=None, art_id=None):
 
     return ret_val
 #------------------------------------------------------------------------------------------------------
+def get_file_dates_solr_bulk(solrcore, src_codes=None, rows=opasConfig.LOADER_SKIP_CHECK_EXPORT_ROWS):
+    """
+    Fetch art_id -> file_last_modified for all the articles in the core (or only those of the
+      source codes in src_codes) in one cursorMark export, so the loader can decide which files
+      to skip without a query per file.
+
+    Returns None if the export fails, so the caller can fall back to get_file_dates_solr.
+    """
+    ret_val = {}
+    query = "art_level:1"
+    if src_codes:
+        # source codes can include Solr special chars, e.g., ANIJP-FR
+        codes = [code.translate(str.maketrans({"-": r"\-", ":": r"\:"})) for code in sorted(src_codes)]
+        query += " && art_id:(%s)" % " OR ".join([f"{code}.*" for code in codes])
+
+    cursor_mark = "*"
+    try:
+        while True:
+            results = solrcore.search(query, fl="art_id, file_last_modified", sort="id asc", rows=rows, cursorMark=cursor_mark)
+            for doc in results.docs:
+                ret_val[doc["art_id"].upper()] = doc.get("file_last_modified")
+            if results.nextCursorMark is None or results.nextCursorMark == cursor_mark:
+                break
+            cursor_mark = results.nextCursorMark
+    except Exception as e:
+        msg = f"FileDatesError: Solr Export: {e}"
+        logger.error(msg)
+        if opasConfig.LOCAL_TRACE: print (msg)
+        ret_val = None
+
+    return ret_val
+#------------------------------------------------------------------------------------------------------
 def process_article_for_glossary_core(pepxml, artInfo, solr_gloss, fileXMLContents, verbose=None):
     """
     Process the special PEP Glossary documents.  These are linked to terms in the document
@@ -1070,6 +1197,7 @@ def process_article_for_doc_core(pepxml, artInfo, solrcon, file_xml_contents, in
                 "art_excerpt_xml" : excerpt_xml,
                 # very important field for displaying the whole document or extracting parts
                 "text_xml" : file_xml_contents,                                # important
+                "art_pgindex" : opasPageIndex.page_index_json(file_xml_contents), # page break offsets in text_xml, for page extraction without a parse
                 "art_offsite" : offsite_contents, #  true if it's offsite
                 "author_bio_xml" : opasxmllib.xml_xpath_return_xmlstringlist(pepxml, "//nbio", default_return = None),
                 "author_aff_xml" : opasxmllib.xml_xpath_return_xmlstringlist(pepxml, "//autaff", default_return = None),
@@ -1430,6 +1558,118 @@ def add_reference_to_biblioxml_table(ocd, artInfo, bib_entry, verbose=None):
         
     return ret_val  # return True for success
 #------------------------------------------------------------------------------------------------------
+class BiblioxmlBatchWriter(object):
+    """
+    Buffers api_biblioxml rows and writes them with multi-row REPLACE statements, batch_size rows
+      to a statement and one commit per flush, rather than a REPLACE and commit for each
+      reference (add_reference_to_biblioxml_table).
+
+    The loader adds each article's references with add_article (a flush happens once batch_size
+      rows are pending, after a whole article), and calls flush at commit-limit boundaries and
+      at the end of the run.  rows_written / seconds is the insert rate (rows_per_second).
+    """
+    # api_biblioxml column, BiblioEntry attribute
+    columns = (("art_id", "art_id"),
+               ("bib_local_id", "ref_local_id"),
+               ("art_year", "art_year_int"),
+               ("bib_rx", "rx"),
+               ("bib_sourcecode", "rx_sourcecode"),
+               ("bib_rxcf", "rxcf"),
+               ("bib_authors", "author_list_str"),
+               ("bib_authors_xml", "authors_xml"),
+               ("bib_articletitle", "ref_title"),
+               ("bib_sourcetype", "source_type"),
+               ("bib_sourcetitle", "source_title"),
+               ("bib_pgrg", "pgrg"),
+               ("bib_year", "year_of_publication"),
+               ("bib_year_int", "year_of_publication_int"),
+               ("bib_volume", "volume"),
+               ("bib_publisher", "publishers"),
+               ("full_ref_xml", "ref_entry_xml"),
+               ("full_ref_text", "ref_entry_text"),
+               )
+
+    def __init__(self, ocd, batch_size=opasConfig.LOADER_BIBLIO_BATCH_SIZE):
+        self.ocd = ocd
+        self.batch_size = batch_size
+        self.pending = []
+        self.cited_ids = set() # documents cited by the references written, see refresh_cited_summary
+        self.rows_written = 0
+        self.error_count = 0
+        self.seconds = 0.0
+        self.row_sql = "(%s)" % ", ".join(["%s"] * len(self.columns))
+        self.insert_sql = "REPLACE INTO api_biblioxml (%s) VALUES " % ", ".join([column for column, attr in self.columns])
+
+    def add_article(self, bib_entries):
+        for bib_entry in bib_entries:
+            self.pending.append(tuple([getattr(bib_entry, attr, None) for column, attr in self.columns]))
+            cited_id = getattr(bib_entry, "rx", None)
+            if cited_id:
+                self.cited_ids.add(cited_id)
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _execute(self, dbc, rows):
+        dbc.execute(self.insert_sql + ", ".join([self.row_sql] * len(rows)), [value for row in rows for value in row])
+
+    def flush(self):
+        """
+        Write all pending rows.  Returns the number written.
+        """
+        ret_val = 0
+        if not self.pending:
+            return ret_val
+
+        caller_name = "BiblioxmlBatchWriter"
+        start_time = time.time()
+        rows, self.pending = self.pending, []
+        if not self.ocd.open_connection(caller_name=caller_name):
+            self.error_count += len(rows)
+            errStr = f"SQLDatabaseError: Biblio write of {len(rows)} rows failed: no database connection."
+            logger.error(errStr)
+            if opasConfig.LOCAL_TRACE: print (errStr)
+            return ret_val
+
+        try:
+            with closing(self.ocd.db.cursor()) as dbc:
+                try:
+                    for i in range(0, len(rows), self.batch_size):
+                        self._execute(dbc, rows[i:i + self.batch_size])
+                    self.ocd.db.commit()
+                    ret_val = len(rows)
+                except mysql.connector.Error as e:
+                    # find the bad rows: write the batch again one row at a time
+                    logger.warning(f"AddToBiblioDBError: batch of {len(rows)} rows failed ({e}).  Retrying by row.")
+                    self.ocd.db.rollback()
+                    for row in rows:
+                        try:
+                            self._execute(dbc, [row])
+                        except mysql.connector.Error as e:
+                            self.error_count += 1
+                            errStr = f"AddToBiblioDBError: insert error {e} ({row[0]}.{row[1]})"
+                            logger.error(errStr)
+                            if opasConfig.LOCAL_TRACE: print (errStr)
+                        else:
+                            ret_val += 1
+                    self.ocd.db.commit()
+        except mysql.connector.Error as e:
+            self.error_count += len(rows) - ret_val
+            errStr = f"SQLDatabaseError: Biblio commit failed! {e}"
+            logger.error(errStr)
+            if opasConfig.LOCAL_TRACE: print (errStr)
+            ret_val = 0
+        finally:
+            self.ocd.close_connection(caller_name=caller_name)
+
+        self.rows_written += ret_val
+        self.seconds += time.time() - start_time
+        return ret_val
+
+    def rows_per_second(self):
+        return self.rows_written / self.seconds if self.seconds > 0 else 0.0
+
+#------------------------------------------------------------------------------------------------------
 def add_article_to_api_articles_table(ocd, artInfo, verbose=None):
     """
     Adds the article data from a single document to the api_articles table in mysql database opascentral.
@@ -1683,6 +1923,62 @@ def garbage_collect_stat(ocd):
         
     return ret_val
 
+#--------------------------------------------------------------------------------
+# the citation counts of vw_stat_cited_crosstab, for the cited documents listed
+CITED_SUMMARY_RECOUNT_SQL = """
+    INSERT INTO api_stat_cited_summary (cited_document_id, count5, count10, count20, countAll)
+    SELECT api_biblioxml.bib_rx,
+           COALESCE(SUM(citing_article.art_year > YEAR(NOW()) - 5), 0),
+           COALESCE(SUM(citing_article.art_year > YEAR(NOW()) - 10), 0),
+           COALESCE(SUM(citing_article.art_year > YEAR(NOW()) - 20), 0),
+           COUNT(*)
+    FROM api_biblioxml
+    LEFT JOIN api_articles citing_article ON citing_article.art_id = api_biblioxml.art_id
+    WHERE api_biblioxml.bib_rx IN ({})
+    GROUP BY api_biblioxml.bib_rx
+"""
+
+def refresh_cited_summary(ocd, cited_ids, batch_size=opasConfig.STAT_SUMMARY_BATCH_SIZE):
+    """
+    Recount the citations of cited_ids (the documents cited by the references just loaded) and
+      write them to api_stat_cited_summary, so the Most Cited lists include them before the next
+      opasDataUpdateStat run (which refreshes the whole table, including the documents no longer
+      cited by a reloaded article).
+
+    Returns the number of cited documents recounted, or None on error.
+    """
+    ret_val = 0
+    procname = "refresh_cited_summary"
+    cited_ids = sorted([cited_id for cited_id in cited_ids if cited_id != "None" and cited_id[:3] not in ("ZBK", "IPL", "SE.", "GW.")])
+    if not cited_ids:
+        return ret_val
+
+    if not ocd.open_connection(caller_name=procname):
+        errStr = "SQLDatabaseError: api_stat_cited_summary refresh failed: no database connection."
+        logger.error(errStr)
+        if opasConfig.LOCAL_TRACE: print (errStr)
+        return None
+
+    try:
+        with closing(ocd.db.cursor()) as dbc:
+            for i in range(0, len(cited_ids), batch_size):
+                batch = cited_ids[i:i + batch_size]
+                in_list = ", ".join(["%s"] * len(batch))
+                dbc.execute(f"DELETE FROM api_stat_cited_summary WHERE cited_document_id IN ({in_list})", batch)
+                dbc.execute(CITED_SUMMARY_RECOUNT_SQL.format(in_list), batch)
+            ocd.db.commit()
+            ret_val = len(cited_ids)
+    except mysql.connector.Error as e:
+        errStr = f"SQLDatabaseError: api_stat_cited_summary refresh failed! {e}"
+        logger.error(errStr)
+        if opasConfig.LOCAL_TRACE: print (errStr)
+        ocd.db.rollback()
+        ret_val = None
+    finally:
+        ocd.close_connection(caller_name=procname)
+
+    return ret_val
+
 #--------------------------------------------------------------------------------
 def add_to_artstat_table(ocd, artInfo, verbose=None):
     """
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opasTermAutomaton
+
+Multi-pattern matching support for the glossary recognizer (PEPGlossaryRecognitionEngine).
+
+The glossary terms are regular expressions (hand tuned in the database), applied one after
+  another to the whole serialized document.  Most documents contain only a small fraction
+  of the terms, but every regex still has to scan the whole document to find that out.
+
+RegexPrefilter finds, for each regex, a literal string that any match of it must contain
+  (e.g., "ego ideal" for "\\bego\\s*-?\\s*ideals?\\b" has "ego" and "ideal"; the longer is used),
+  compiles all of those literals into one Aho-Corasick automaton, and scans the document
+  once.  Only the regexes whose literal occurs in the document (plus any for which no
+  literal could be found) need to be run; the others can't match, so skipping them
+  leaves the markup unchanged.
+
+Literals are compared case-folded the same way the re module compares characters
+  under re.IGNORECASE (see fold).
+
+>>> automaton = AhoCorasick(["he", "she", "his", "hers"])
+>>> sorted(automaton.find_all("ushers"))
+[0, 1, 3]
+
+>>> required_literals(re.compile(r"\\b(?P<whole>ego\\s*ideals?(?!\\s*=))\\b", re.IGNORECASE|re.VERBOSE))
+['ideal']
+>>> required_literals(re.compile(r"\\b(?P<whole>(?:id|superego)(?!\\s*=))\\b", re.IGNORECASE|re.VERBOSE))
+['id', 'superego']
+>>> required_literals(re.compile(r"\\b(?P<whole>(?:ego)?\\s*[a-z]+(?!\\s*=))\\b", re.IGNORECASE)) is None
+True
+
+>>> regexes = [re.compile(r"\\bego\\s*ideals?\\b", re.IGNORECASE), re.compile(r"\\bsuperego\\b", re.IGNORECASE), re.compile(r"\\b\\w+\\b")]
+>>> prefilter = RegexPrefilter(regexes)
+>>> sorted(prefilter.candidates("<p>The EGO IDEAL...</p>"))
+[0, 2]
+"""
+import re
+
+try:
+    import re._parser as sre_parse # python 3.11+
+    from re._casefix import _EXTRA_CASES
+except ImportError:
+    import sre_parse
+    _EXTRA_CASES = {}
+
+import logging
+logger = logging.getLogger(__name__)
+
+_LITERAL = sre_parse.LITERAL
+_SUBPATTERN = sre_parse.SUBPATTERN
+_BRANCH = sre_parse.BRANCH
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+_POSSESSIVE_REPEAT = getattr(sre_parse, "POSSESSIVE_REPEAT", None)
+_ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+
+# Characters re treats as equal under IGNORECASE beyond simple lowercasing (e.g., the
+#  dotless i and long s), mapped to one representative.  U+0130 is the one character
+#  whose str.lower() is more than one character; re lowercases it to a plain "i".
+_FOLD_TABLE = {char: chr(min((char, ) + others)) for char, others in _EXTRA_CASES.items()}
+_PRE_FOLD_TABLE = {0x130: "i"}
+
+def fold(text):
+    """
+    Case-fold text so that two strings re would match with IGNORECASE fold equal
+
+    >>> fold("Ego IDEAL") == fold("ego ideal")
+    True
+    >>> fold("ſ") == fold("s")
+    True
+    """
+    return text.translate(_PRE_FOLD_TABLE).lower().translate(_FOLD_TABLE)
+
+#------------------------------------------------------------------------------------------------------
+class AhoCorasick(object):
+    """
+    Aho-Corasick automaton over a list of strings.  find_all returns the set of the indexes
+      of the strings found in a text, with one pass over the text.
+    """
+    def __init__(self, strings):
+        self.strings = list(strings)
+        self.goto = [{}]  # state -> {char: next state}
+        self.fail = [0]
+        self.out = [[]]   # state -> indexes of the strings that end there
+        for idx, string in enumerate(self.strings):
+            self._add(string, idx)
+        self._build_failure_links()
+
+    def _add(self, string, idx):
+        state = 0
+        for char in string:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[state][char] = next_state
+            state = next_state
+        self.out[state].append(idx)
+
+    def _build_failure_links(self):
+        queue = list(self.goto[0].values())
+        pos = 0
+        while pos < len(queue):
+            state = queue[pos]
+            pos += 1
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                # a state also outputs everything its failure state outputs
+                self.out[next_state] = self.out[next_state] + self.out[self.fail[next_state]]
+
+    def find_all(self, text):
+        ret_val = set()
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                ret_val.update(out[state])
+
+        return ret_val
+
+#------------------------------------------------------------------------------------------------------
+def _literal_runs(items, exclude_chars):
+    """
+    Return the requirements of a parsed (sub)pattern: a list of alternatives lists,
+      any one of which must occur in the text for the pattern to match.
+    """
+    ret_val = []
+    run = []
+
+    def end_run():
+        if run:
+            ret_val.append(["".join(run)])
+            run.clear()
+
+    for op, arg in items:
+        if op == _LITERAL:
+            char = chr(arg)
+            if char in exclude_chars:
+                end_run()
+            else:
+                run.append(fold(char))
+        elif op == _SUBPATTERN:
+            # a plain group; its contents are in sequence with what's around it
+            sub_items = list(arg[-1])
+            sub_requirements = _literal_runs(sub_items, exclude_chars)
+            if len(sub_items) == 1 and sub_items[0][0] == _LITERAL and sub_requirements:
+                run.append(sub_requirements[0][0])
+            else:
+                end_run()
+                ret_val.extend(sub_requirements)
+        elif op == _ATOMIC_GROUP and op is not None:
+            end_run()
+            ret_val.extend(_literal_runs(list(arg), exclude_chars))
+        elif op == _BRANCH:
+            end_run()
+            alternatives = []
+            for branch in arg[1]:
+                best = _best_requirement(_literal_runs(list(branch), exclude_chars))
+                if best is None: # this branch can match without any literal
+                    alternatives = None
+                    break
+                alternatives.extend(best)
+            if alternatives:
+                ret_val.append(alternatives)
+        elif op in _REPEATS or (op == _POSSESSIVE_REPEAT and op is not None):
+            end_run()
+            min_count, max_count, sub_items = arg
+            if min_count >= 1:
+                ret_val.extend(_literal_runs(list(sub_items), exclude_chars))
+        else:
+            # character sets, anchors, lookarounds, backreferences...no literal required
+            end_run()
+
+    end_run()
+    return ret_val
+
+def _best_requirement(requirements, min_length=1):
+    """
+    Of the alternatives lists, pick the one whose shortest string is longest
+    """
+    ret_val = None
+    best_length = min_length - 1
+    for alternatives in requirements:
+        # a string of only digits may be created by the markers the recognizer inserts
+        if any(alternative.isdigit() for alternative in alternatives):
+            continue
+        shortest = min(len(alternative) for alternative in alternatives)
+        if shortest > best_length:
+            best_length = shortest
+            ret_val = alternatives
+
+    return ret_val
+
+def required_literals(regex, exclude_chars="", min_length=1):
+    """
+    Return a list of (case-folded) strings, at least one of which is in any text regex
+      matches, or None if no such list can be found.
+    """
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception as e:
+        logger.warning(f"Can't parse regex for literals ({e}): {regex.pattern}")
+        return None
+
+    requirements = _literal_runs(list(parsed), exclude_chars)
+    return _best_requirement(requirements, min_length=min_length)
+
+#------------------------------------------------------------------------------------------------------
+class RegexPrefilter(object):
+    """
+    Selects which of a list of compiled regexes could match a text.
+
+    exclude_chars are characters which may be inserted into the text between regex
+      runs (e.g., markers); literals are split at them so the candidates found in the
+      original text remain valid for the marked up text.
+    """
+    def __init__(self, regexes, exclude_chars="", min_length=2):
+        self.always = set()
+        literals = []
+        literal_regexes = []
+        for idx, regex in enumerate(regexes):
+            requirement = None
+            if regex is not None:
+                requirement = required_literals(regex, exclude_chars=exclude_chars, min_length=min_length)
+            if requirement is None:
+                self.always.add(idx)
+            else:
+                for literal in requirement:
+                    literals.append(literal)
+                    literal_regexes.append(idx)
+
+        self.literal_regexes = literal_regexes
+        self.automaton = AhoCorasick(literals)
+        logger.info(f"Prefilter: {len(regexes) - len(self.always)} of {len(regexes)} regexes indexed by {len(literals)} literals ({len(self.automaton.goto)} states).")
+
+    def candidates(self, text):
+        """
+        Return the set of indexes of the regexes which may match text
+        """
+        ret_val = set(self.always)
+        for literal_idx in self.automaton.find_all(fold(text)):
+            ret_val.add(self.literal_regexes[literal_idx])
+
+        return ret_val
+
+if __name__ == "__main__":
+    import doctest
+    print (40*"*", "opasTermAutomaton Tests", 40*"*")
+    doctest.testmod(optionflags=doctest.ELLIPSIS|doctest.NORMALIZE_WHITESPACE)
+    print ("Tests complete.")
@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 # import starlette.status as httpCodes
 
 import opasConfig
+import opasMemoryCache
 from opasConfig import TIME_FORMAT_STR
 
 # import localsecrets
@@ -192,19 +193,27 @@ def load_whats_new(days_back=opasConfig.DEFAULT_DAYS_BACK_FOR_WHATS_NEW,
     return ret_val
 
 class whatsNewDB(object):
+    """
+    What's New lists, cached per (days_back, limit, offset), so clients asking for different
+      pages don't reload each other's.  A list is reloaded in the background once it's older than
+      WHATS_NEW_EXPIRES_DAYS/HOURS/MINUTES (the old one is returned meanwhile, for up to
+      opasConfig.WHATS_NEW_MAX_STALE seconds), and simultaneous requests for a list that isn't
+      cached wait for the same Solr query.
+    """
     def __init__(self,
                  days_back=opasConfig.DEFAULT_DAYS_BACK_FOR_WHATS_NEW,
                  limit=opasConfig.DEFAULT_LIMIT_FOR_WHATS_NEW,
                  req_url="Caching"
                 ):
-        # load message database
-        self.limit = limit
-        self.offset = 0
-        self.days_back = days_back
-        self.expires = datetime.now() + timedelta(days=opasConfig.WHATS_NEW_EXPIRES_DAYS,
-                                                  hours=opasConfig.WHATS_NEW_EXPIRES_HOURS,
-                                                  minutes=opasConfig.WHATS_NEW_EXPIRES_MINUTES)
-        self.whats_new = load_whats_new(days_back=days_back, limit=limit, req_url=req_url)
+        expires = timedelta(days=opasConfig.WHATS_NEW_EXPIRES_DAYS,
+                            hours=opasConfig.WHATS_NEW_EXPIRES_HOURS,
+                            minutes=opasConfig.WHATS_NEW_EXPIRES_MINUTES)
+        self.cache = opasMemoryCache.RefreshingCache(name="whats_new",
+                                                     maxsize=opasConfig.WHATS_NEW_CACHE_SIZE,
+                                                     ttl=expires.total_seconds(),
+                                                     max_stale=opasConfig.WHATS_NEW_MAX_STALE)
+        # load the default list
+        self.get_whats_new(days_back=days_back, limit=limit, req_url=req_url)
 
     def __del__(self):
         pass
@@ -218,21 +227,16 @@ class whatsNewDB(object):
                      ):
         ret_val = {}
         try:
-            # reload when needed later
-            if self.expires < datetime.now() or forced_update or days_back != self.days_back or offset != self.offset or self.limit != limit:
-                self.whats_new = load_whats_new(days_back=days_back, limit=limit, offset=offset, req_url=req_url)            
-                self.expires = datetime.now() + timedelta(days=opasConfig.WHATS_NEW_EXPIRES_DAYS,
-                                                          hours=opasConfig.WHATS_NEW_EXPIRES_HOURS,
-                                                          minutes=opasConfig.WHATS_NEW_EXPIRES_MINUTES)
-                self.limit = limit
-                self.offset = offset
-                self.days_back = days_back
-
-                if opasConfig.DEBUG_TRACE:
-                    ts = time.time()
-                    print(f"{ts}: [WhatsNew] Cache updated. Exp: {self.expires} DaysBack: {days_back} Limit: {limit} Offset: {offset} Forced:{forced_update}")
+            key = (days_back, limit, offset)
+            whats_new = self.cache.get(key,
+                                       lambda: load_whats_new(days_back=days_back, limit=limit, offset=offset, req_url=req_url),
+                                       force=forced_update)
+            if opasConfig.DEBUG_TRACE:
+                ts = time.time()
+                print(f"{ts}: [WhatsNew] DaysBack: {days_back} Limit: {limit} Offset: {offset} Forced:{forced_update} Cache: {self.cache.stats()}")
 
-            ret_val = self.whats_new
+            # a copy, since the caller sets the request in it
+            ret_val = whats_new.copy(deep=True)
             ret_val.whatsNew.responseInfo.limit = limit
             ret_val.whatsNew.responseInfo.offset = offset
 
@@ -259,17 +263,17 @@ if __name__ == "__main__":
     logger.addHandler(ch)
     
     wdb = whatsNewDB()
-    print ("%s: %s" % (wdb.expires, wdb.get_whats_new()))
+    print ("%s: %s" % (wdb.cache.stats(), wdb.get_whats_new()))
     cont = input ("Continue (y/n)?")
-    print ("%s: %s" % (wdb.expires, wdb.get_whats_new()))
+    print ("%s: %s" % (wdb.cache.stats(), wdb.get_whats_new()))
     cont = input ("Continue (y/n)?")
-    print ("%s: %s" % (wdb.expires, wdb.get_whats_new(forced_update=True)))
+    print ("%s: %s" % (wdb.cache.stats(), wdb.get_whats_new(forced_update=True)))
     cont = input ("Continue (y/n)?")
-    print ("%s: %s" % (wdb.expires, wdb.get_whats_new()))
+    print ("%s: %s" % (wdb.cache.stats(), wdb.get_whats_new(offset=15)))
     cont = input ("Continue (y/n)?")
-    print ("%s: %s" % (wdb.expires, wdb.get_whats_new(forced_update=True)))
+    print ("%s: %s" % (wdb.cache.stats(), wdb.get_whats_new(forced_update=True)))
     cont = input ("Continue (y/n)?")
-    print ("%s: %s" % (wdb.expires, wdb.get_whats_new()))
+    print ("%s: %s" % (wdb.cache.stats(), wdb.get_whats_new()))
 
     print ("Fini. Tests complete.")
     
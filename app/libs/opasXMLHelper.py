@@ -83,6 +83,8 @@ import lxml.html as lhtml
 parser = lxml.etree.XMLParser(encoding='utf-8', recover=True, resolve_entities=False)
 
 import opasConfig
+import opasPageIndex
+import opasMetrics
 from localsecrets import APIURL
 
 from ebooklib import epub
@@ -626,10 +628,13 @@ def xml_get_pages_starting_with(xmlstr, start_with, limit=1, inside="body", env=
     return ret_val    
     
     
-def xml_get_pages(xmlstr, offset=0, limit=1, inside="body", env="body", pagebrk="pb", pagenbr="n", remove_tags=[]):
+def xml_get_pages(xmlstr, offset=0, limit=1, inside="body", env="body", pagebrk="pb", pagenbr="n", remove_tags=[], page_index=None):
     """
     Return the xml between the given page breaks (default <pb>).
     
+    If page_index (the art_pgindex the loader stores for xmlstr, see opasPageIndex) is supplied, the pages are
+    sliced from xmlstr using it rather than parsing xmlstr; the second entry of the tuple is then a list of xml strings.
+    
     The pages are returned in the first entry of a tuple: an 'envelope', default <body></body> tag, an 'envelope' of sorts.
     The xml element list is returned as the second entry of the tuple
     if there's an error ("", []) is returned.
@@ -684,7 +689,14 @@ def xml_get_pages(xmlstr, offset=0, limit=1, inside="body", env="body", pagebrk=
     no_page_nbr = "npn"
     ret_val = ("", [], no_page_nbr, no_page_nbr)
 
-    if limit is None: # this should not happen, it should assign the default as specd.  Not sure why it does.
+    indexed_pages = None
+    if page_index is not None and remove_tags == [] and isinstance(xmlstr, str):
+        # slice the pages using the loader's page index, no parse needed (None if the index doesn't apply)
+        indexed_pages = opasPageIndex.get_pages(xmlstr, page_index, offset=offset, limit=limit, inside=inside, env=env, pagebrk=pagebrk, pagenbr=pagenbr)
+
+    if indexed_pages is not None:
+        ret_val = indexed_pages
+    elif limit is None: # this should not happen, it should assign the default as specd.  Not sure why it does.
         ret_val = (xmlstr, [], no_page_nbr, no_page_nbr)
     else:
         try:
@@ -1540,7 +1552,8 @@ def xml_str_to_html(elem_or_xmlstr, transformer_name=opasConfig.TRANSFORMER_XMLT
                         #xslt_doc_transformer = etree.XSLT(xslt_doc_transformer_file)
                         transformer = g_transformer.transformers[transformer_name]
                         # transform the doc or fragment
-                        transformed_data = transformer(sourceFile)
+                        with opasMetrics.timer("xslt", transformer_name):
+                            transformed_data = transformer(sourceFile)
                     except KeyError as e:
                         logger.error(f"Selected Transformer: {transformer_name} not found ({e})")
                         if stop_on_exceptions:
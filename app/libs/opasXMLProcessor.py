@@ -29,6 +29,7 @@ from loggingDebugStream import log_everywhere_if    # log as usual, but if first
 
 # import lxml
 import sys
+import hashlib
 if sys.version_info[0] < 3:
     raise Exception("Must be using Python 3")
 
@@ -52,6 +53,30 @@ import opasDocuments
 
 glossEngine = PEPGlossaryRecognitionEngine.GlossaryRecognitionEngine(gather=False)
 
+#----------------------------------------------------------------------------------------------------------------
+def get_compile_dependency_versions(ocd):
+    """
+    Return a dict of version strings for the lookup data xml_update compiles into its output
+      (glossary terms, split book pages, source info) plus this module's version, so a saved
+      compile can be recognized as stale when any of them change (see opasCompileManifest).
+    """
+    ret_val = {"xml_update": __version__}
+    # the glossary terms as loaded by the recognition engine
+    terms = hashlib.sha256()
+    for rc, term_info in glossEngine.matchList:
+        terms.update(repr((rc.pattern, term_info)).encode("utf8"))
+    ret_val["glossary"] = terms.hexdigest()
+
+    for name, table in (("splitbook", "opasloader_splitbookpages_static"), ("sources", "api_productbase")):
+        try:
+            checksum = ocd.get_select_as_list(f"CHECKSUM TABLE {table}")
+            ret_val[name] = str(checksum[0][1])
+        except Exception as e:
+            logger.warning(f"Could not get the checksum of {table} ({e})")
+            ret_val[name] = None
+
+    return ret_val
+
 #----------------------------------------------------------------------------------------------------------------
 def normalize_local_ids(pepxml, verbose=False):
     
@@ -99,7 +99,6 @@ import time
 import datetime
 from datetime import datetime
 import re
-import wget
 import io
 import urllib.parse
 import random
@@ -107,6 +106,7 @@ import random
 from urllib import parse
 
 import uvicorn
+import anyio.to_thread
 from fastapi import FastAPI, Query, Body, Path, Header, Security, Depends, HTTPException, File #Form, UploadFile, Cookie
 from fastapi.openapi.utils import get_openapi
 from fastapi.openapi.docs import get_swagger_ui_html
@@ -134,7 +134,7 @@ logger = logging.getLogger(__name__)
 
 import localsecrets
 import libs.opasAPISupportLib as opasAPISupportLib
-from configLib.opasCoreConfig import EXTENDED_CORES_DEFAULTS, SOLR_DOCS # , EXTENDED_CORES, SOLR_AUTHORS, SOLR_GLOSSARY, SOLR_DEFAULT_CORE 
+from configLib.opasCoreConfig import EXTENDED_CORES_DEFAULTS, SOLR_DOCS, solr_docs2, solr_gloss2 # , EXTENDED_CORES, SOLR_AUTHORS, SOLR_GLOSSARY, SOLR_DEFAULT_CORE 
 
 from errorMessages import *
 import models
@@ -144,11 +144,18 @@ import opasGenSupportLib
 import opasQueryHelper
 import opasSchemaHelper
 import opasDocPermissions
+import opasHTTPClient
 import opasSolrPyLib
 import opasPySolrLib
 from opasPySolrLib import search_text_qs # , search_text
 import opasPDFStampCpyrght
+import opasRenderQueue
+import opasFileStream
+import opasHTTPCache
 import opasCacheSupport
+import opasMemoryCache
+import opasArtifactCache
+import opasMetrics
 from opasArticleIDSupport import ArticleID
 
 expert_pick_image = ["", ""]
@@ -164,9 +171,9 @@ PARAMS = {'wt':'json'}
 url = f"{localsecrets.SOLRURL}admin/info/system"
 if localsecrets.SOLRUSER is not None:
     # need username and password
-    r = requests.get(url = url, params = PARAMS, auth=HTTPBasicAuth(localsecrets.SOLRUSER, localsecrets.SOLRPW))
+    r = opasHTTPClient.get(url = url, params = PARAMS, auth=HTTPBasicAuth(localsecrets.SOLRUSER, localsecrets.SOLRPW))
 else:
-    r = requests.get(url = url, params = PARAMS)
+    r = opasHTTPClient.get(url = url, params = PARAMS)
 
 if r.status_code == 200:
     ver_json = r.json()
@@ -270,11 +277,73 @@ app.add_middleware(
     allow_headers = ["*"],
 )
 
+@app.exception_handler(opasCentralDBLib.PoolTimeout)
+def db_pool_timeout_handler(request: Request, exc: opasCentralDBLib.PoolTimeout):
+    """
+    All pooled MySQL connections stayed in use for DB_POOL_TIMEOUT secs: answer 503, so the client retries later
+    """
+    return JSONResponse(status_code=httpCodes.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={"detail": "Server busy (no database connection available).  Please retry."},
+                        headers={"Retry-After": str(opasConfig.DB_POOL_TIMEOUT)})
+
+# request latency per route and status, for /v2/Admin/Metrics
+app.add_middleware(opasMetrics.MetricsMiddleware)
+
+# gauges reported by /v2/Admin/Metrics, read when it's called
+opasMetrics.register_stats("db_pool", opasCentralDBLib.get_pool_stats, label="pool")
+opasMetrics.register_stats("usage_log", lambda: opasCentralDBLib.get_usage_log_writer().stats())
+opasMetrics.register_stats("cache", opasMemoryCache.get_cache_stats, label="cache")
+opasMetrics.register_stats("artifact_cache", opasArtifactCache.artifact_cache.stats)
+opasMetrics.register_stats("render_queue", opasRenderQueue.get_render_queue_stats)
+
+def endpoint_thread_stats():
+    # (only available on the event loop's thread)
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {"limit": limiter.total_tokens, "in_use": limiter.borrowed_tokens}
+
+opasMetrics.register_stats("endpoint_threads", endpoint_thread_stats)
+
+@app.on_event("startup")
+def set_endpoint_thread_limit():
+    """
+    Endpoints which call blocking libraries (pysolr, mysql.connector, requests) are
+      declared with def rather than async def, so FastAPI runs them in its worker
+      thread pool instead of on the event loop, where one slow Solr query would stall
+      every other request.  Bound the size of that pool here.
+    """
+    anyio.to_thread.current_default_thread_limiter().total_tokens = opasConfig.API_ENDPOINT_THREAD_LIMIT
+
+@app.on_event("shutdown")
+def flush_usage_log():
+    """
+    Write the endpoint and document view records still queued for the database
+      (see opasCentralDBLib.opasUsageLogWriter) before the process exits.
+    """
+    if not opasCentralDBLib.flush_usage_log():
+        logger.warning(f"Shutdown: usage log not completely written ({opasCentralDBLib.get_usage_log_writer().stats()})")
+
+@app.on_event("shutdown")
+def stop_render_queue():
+    """
+    Stop the download rendering processes (see opasRenderQueue); queued renderings are dropped.
+    """
+    opasRenderQueue.render_queue.shutdown()
+
 from config import whatsnewdb
 from config import mostviewedcache
 from config import mostcitedcache
 from config import msgdb
 
+@app.on_event("startup")
+def preload_most_lists():
+    """
+    Load the Most Viewed and Most Cited lists in the background, so the first requests for them
+      don't wait for Solr.  Done here, rather than when config creates the caches, so the other
+      processes which import config (e.g., the loader, render queue workers) don't run the queries.
+    """
+    mostviewedcache.preload_lists()
+    mostcitedcache.preload_lists()
+
 msg = 'Started at %s' % datetime.today().strftime('%Y-%m-%d %H:%M:%S"')
 logger.info(msg)
 
@@ -513,7 +582,7 @@ def log_endpoint_time(request, ts, level="info", trace=False):
 # ############################################################################
 #-----------------------------------------------------------------------------
 @app.put("/v2/Admin/LogLevel/", tags=["Admin"], summary=opasConfig.ENDPOINT_SUMMARY_LOGLEVEL)
-async def admin_set_loglevel(response: Response, 
+def admin_set_loglevel(response: Response, 
                              request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                              level:str=Query(None, title="Log Level", description="DEBUG, INFO, WARNING, or ERROR"),
                              #sessionid: str=Query(None, title="SessionID", description="Filter by this Session ID"),
@@ -598,7 +667,7 @@ async def admin_set_loglevel(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.get("/v2/Admin/Reports/{report}", response_model=models.Report, tags=["Admin"], summary=opasConfig.ENDPOINT_SUMMARY_REPORTS)
-async def admin_reports(response: Response, 
+def admin_reports(response: Response, 
                         request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                         report: models.ReportTypeEnum=Path(..., title=opasConfig.TITLE_REPORT_REQUESTED, description=opasConfig.DESCRIPTION_REPORT_REQUESTED),
                         sessionid: str=Query(None, title=opasConfig.TITLE_SESSION_ID_FILTER, description=opasConfig.DESCRIPTION_SESSION_ID_FILTER),
@@ -613,6 +682,7 @@ async def admin_reports(response: Response,
                         loggedinrecords:bool=Query(True, title=opasConfig.TITLE_LOGGEDINRECORDS, description=opasConfig.DESCRIPTION_LOGGEDINRECORDS),
                         sortorder: str=Query("ASC", title=opasConfig.TITLE_SORTORDER, description=opasConfig.DESCRIPTION_SORTORDER),
                         download:bool=Query(False, title=opasConfig.TITLE_DOWNLOAD, description=opasConfig.DESCRIPTION_DOWNLOAD), 
+                        downloadformat:str=Query("CSV", title=opasConfig.TITLE_DOWNLOADFORMAT, description=opasConfig.DESCRIPTION_DOWNLOADFORMAT), 
                         client_id:int=Depends(get_client_id), 
                         client_session:str= Depends(get_client_session), 
                         api_key: APIKey = Depends(get_api_key)
@@ -645,6 +715,9 @@ async def admin_reports(response: Response,
        Note as the examples above, you don't need to include special regex wildcards
          (it matches anywhere in the text)
 
+       With download=true, the report is streamed from the database as it's read, as CSV,
+         or with downloadformat=NDJSON, as one JSON object per line (keyed by column name).
+
     ## Potential Errors
        Note document_views_report returns the current RDS database values, not the values
          that are in the Solr database as updated during the latest Solr update. values
@@ -689,6 +762,15 @@ async def admin_reports(response: Response,
             detail=ret_val
         )
 
+    downloadformat = downloadformat.upper()
+    if download and downloadformat not in ["CSV", "NDJSON"]:
+        ret_val = f"Unknown download format supplied: {downloadformat}.  Use CSV or NDJSON."
+        logger.error(ret_val)
+        raise HTTPException(
+            status_code=httpCodes.HTTP_400_BAD_REQUEST, 
+            detail=ret_val
+        )
+
     if sessionid is not None:
         sessionid_condition = f" AND session_id={sessionid}"
 
@@ -857,16 +939,32 @@ async def admin_reports(response: Response,
         select += f"{limit_clause};"
         
         if download:
-            # Download CSV of selected set.  Returns only response with download, not usual documentList
-            #   response to client
-            results = ocd.get_select_as_list(select)
-            df = pd.DataFrame(results)
-            stream = io.StringIO()
-            df.to_csv(stream, header=header, index = False)
-            response = StreamingResponse(iter([stream.getvalue()]),
-                                         media_type="text/csv"
-                                               )
-            response.headers["Content-Disposition"] = f"attachment; filename={report_view}.csv"
+            # Download CSV (or NDJSON) of selected set.  Returns only response with download, not usual documentList
+            #   response to client.  Rows are encoded as they're read from the database (with its own
+            #   connection, held until the download completes), so memory use doesn't grow with the report.
+            # The connection is borrowed and the query run here, before the response (and its 200) is sent,
+            #   so pool exhaustion gets its 503 and a failed query a 500, rather than a truncated download.
+            try:
+                row_chunks = opasCentralDBLib.opasCentralDB().get_select_as_row_chunks(select)
+            except opasCentralDBLib.PoolTimeout:
+                raise # answered 503 by db_pool_timeout_handler
+            except Exception as e:
+                status_message = f"Report {report}: download query failed ({e})"
+                logger.error(status_message)
+                raise HTTPException(
+                    status_code=httpCodes.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=status_message
+                )
+            if downloadformat == "NDJSON":
+                response = StreamingResponse(opasGenSupportLib.ndjson_chunks(row_chunks),
+                                             media_type="application/x-ndjson"
+                                             )
+                response.headers["Content-Disposition"] = f"attachment; filename={report_view}.ndjson"
+            else:
+                response = StreamingResponse(opasGenSupportLib.csv_chunks(row_chunks, header=header),
+                                             media_type="text/csv"
+                                             )
+                response.headers["Content-Disposition"] = f"attachment; filename={report_view}.csv"
             ret_val = response
         else:
             # this comes back as a list of ReportListItems
@@ -917,7 +1015,7 @@ async def admin_reports(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.get("/v2/Admin/Sitemap/", tags=["Admin"], response_model=models.SiteMapInfo, summary=opasConfig.ENDPOINT_SUMMARY_SITEMAP)
-async def admin_sitemap(response: Response, 
+def admin_sitemap(response: Response, 
                         request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                         path: str=Query(localsecrets.SITEMAP_PATH, title=opasConfig.TITLE_SITEMAP_PATH, description=opasConfig.DESCRIPTION_SITEMAP_PATH),
                         size: int=Query(8000, title=opasConfig.TITLE_SITEMAP_RECORDS_PER_FILE, description=opasConfig.DESCRIPTION_SITEMAP_RECORDS_PER_FILE),
@@ -977,8 +1075,8 @@ async def admin_sitemap(response: Response,
         if ocd.verify_admin(session_info):
             try:
                 # returns a list of the sitemap files (since split)
-                sitemap_list = opasSiteMap.metadata_export(SITEMAP_OUTPUT_FILE, total_records=max_records, records_per_file=size)
-                sitemap_index = opasSiteMap.opas_sitemap_index(output_file=SITEMAP_INDEX_FILE, sitemap_list=sitemap_list)
+                # (the index is written as the files are)
+                sitemap_list = opasSiteMap.metadata_export(SITEMAP_OUTPUT_FILE, total_records=max_records, records_per_file=size, index_file=SITEMAP_INDEX_FILE)
                 ret_val = models.SiteMapInfo(siteMapIndex=SITEMAP_INDEX_FILE, siteMapList=sitemap_list)
         
             except Exception as e:
@@ -998,6 +1096,41 @@ async def admin_sitemap(response: Response,
             
     return ret_val
 
+#-----------------------------------------------------------------------------
+@app.get("/v2/Admin/Metrics", tags=["Admin"], summary=opasConfig.ENDPOINT_SUMMARY_METRICS)
+async def admin_metrics(api_key: APIKey = Depends(get_api_key)):
+    """
+    ## Function
+       ### Return this server process's metrics, in the Prometheus text exposition format (0.0.4).
+
+       - opas_http_request_duration_seconds: histogram of response times by method, route (template) and status
+       - opas_dependency_duration_seconds: histogram of the time spent in Solr (core/handler), MySQL (statement type),
+         PaDS (call) and XSLT (transformer) calls, with opas_dependency_errors_total for those which failed
+       - opas_http_requests_in_flight, opas_dependency_calls_in_flight, opas_endpoint_threads_in_use: work in progress
+       - opas_db_pool_*, opas_usage_log_*, opas_cache_*, opas_artifact_cache_*, opas_render_queue_*: gauges from
+         the connection pools, usage log writer, caches and download render queue
+
+    ## Return Type
+       text/plain; version=0.0.4
+
+    ## Status
+       This endpoint is working.
+
+    ## Sample Call
+       /v2/Admin/Metrics
+
+    ## Notes
+       ### Requires API key (e.g., in the scraper's request header)
+
+       Values are per server process, since each keeps its own; with several worker processes,
+       a scrape reaches only one of them.  opasConfig.METRICS_ENABLED turns the timing off.
+       
+    ## Potential Errors
+       N/A
+    
+    """
+    return Response(content=opasMetrics.render(), media_type=opasMetrics.CONTENT_TYPE)
+
 #-----------------------------------------------------------------------------
 @app.get("/v2/Api/LiveDoc", tags=["API documentation"], summary=opasConfig.ENDPOINT_SUMMARY_DOCUMENTATION)
 async def api_live_doc(api_key: APIKey = Depends(get_api_key)):
@@ -1062,7 +1195,7 @@ async def api_openapi_spec(api_key: APIKey = Depends(get_api_key)):
 
 #-----------------------------------------------------------------------------
 @app.get("/v2/Api/Status/", response_model=models.APIStatusItem, response_model_exclude_unset=True, tags=["API documentation"], summary=opasConfig.ENDPOINT_SUMMARY_API_STATUS)
-async def api_status(response: Response, 
+def api_status(response: Response, 
                      request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST)
                     ):
     """
@@ -1103,7 +1236,7 @@ async def api_status(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.post("/v2/Client/Configuration/", response_model=models.ClientConfigList, response_model_exclude_unset=True, tags=["Client"], summary=opasConfig.ENDPOINT_SUMMARY_SAVE_CONFIGURATION, status_code=201)
-async def client_save_configuration(response: Response, 
+def client_save_configuration(response: Response, 
                                     request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                                     configuration:models.ClientConfigList=Body(None, embed=False, title=opasConfig.TITLE_ADMINCONFIG, decription=opasConfig.DESCRIPTION_ADMINCONFIG), # allows full specification
                                     client_id:int=Depends(get_client_id), 
@@ -1216,7 +1349,7 @@ async def client_save_configuration(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.put("/v2/Client/Configuration/", response_model=models.ClientConfigList, response_model_exclude_unset=True, tags=["Client"], summary=opasConfig.ENDPOINT_SUMMARY_SAVEORREPLACE_CONFIGURATION, status_code=201)
-async def client_update_configuration(response: Response, 
+def client_update_configuration(response: Response, 
                                       request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                                       configuration:models.ClientConfigList=Body(None, embed=False, title=opasConfig.TITLE_ADMINCONFIG, decription=opasConfig.DESCRIPTION_ADMINCONFIG), # allows full specification
                                       client_id:int=Depends(get_client_id), 
@@ -1304,7 +1437,7 @@ async def client_update_configuration(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.get("/v2/Client/Configuration/", response_model=models.ClientConfigList, response_model_exclude_unset=True, tags=["Client"], summary=opasConfig.ENDPOINT_SUMMARY_GET_CONFIGURATION)
-async def client_get_configuration(response: Response, 
+def client_get_configuration(response: Response, 
                                    request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                                    configname:str=Query(..., title=opasConfig.TITLE_ADMINCONFIGNAME, description=opasConfig.DESCRIPTION_ADMINCONFIGNAME, min_length=4),
                                    api_key: APIKey = Depends(get_api_key), 
@@ -1380,7 +1513,7 @@ async def client_get_configuration(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.delete("/v2/Client/Configuration/", response_model=models.ClientConfigList, response_model_exclude_unset=True, tags=["Client"], summary=opasConfig.ENDPOINT_SUMMARY_DELETE_CONFIGURATION, status_code=200)
-async def client_del_configuration(response: Response, 
+def client_del_configuration(response: Response, 
                                    request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                                    configname:str=Query(..., title=opasConfig.TITLE_ADMINCONFIGNAME, description=opasConfig.DESCRIPTION_ADMINCONFIGNAME, min_length=4),
                                    client_id:int=Depends(get_client_id), 
@@ -1641,7 +1774,7 @@ def session_logout_user(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.get("/v2/Session/Status/", response_model=models.ServerStatusItem, response_model_exclude_unset=True, tags=["Session"], summary=opasConfig.ENDPOINT_SUMMARY_SERVER_STATUS)
-async def session_status(response: Response, 
+def session_status(response: Response, 
                          request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                          moreinfo: bool=Query(False, title=opasConfig.TITLE_MOREINFO, description=opasConfig.DESCRIPTION_MOREINFO),
                          client_id:int=Depends(get_client_id), 
@@ -1769,7 +1902,7 @@ async def session_status(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.get("/v2/Session/WhoAmI/", response_model=models.SessionInfo, response_model_exclude_unset=False, tags=["Session"], summary=opasConfig.ENDPOINT_SUMMARY_WHO_AM_I)
-async def session_whoami(response: Response,
+def session_whoami(response: Response,
                          request: Request,
                          client_id:int=Depends(get_client_id), 
                          client_session:str= Depends(get_client_session)
@@ -1816,7 +1949,7 @@ async def session_whoami(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.post("/v2/Database/AdvancedSearch/", response_model=Union[models.DocumentList, models.ErrorReturn], response_model_exclude_unset=True, response_model_exclude_none=True, tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_SEARCH_ADVANCED)  #  removed for now: response_model=models.DocumentList, 
-async def database_advanced_search(response: Response, 
+def database_advanced_search(response: Response, 
                                    request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                                    apimode: str=Header(None, title=opasConfig.TITLE_API_MODE, description=opasConfig.DESCRIPTION_API_MODE), 
                                    # Request body parameters - allows full specification of parameters in the body
@@ -2087,7 +2220,7 @@ async def database_advanced_search(response: Response,
 
 #---------------------------------------------------------------------------------------------------------
 @app.post("/v3/Database/ExtendedSearch/", tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_EXTENDED_SEARCH)  #  response_model_exclude_unset=True removed for now: response_model=models.DocumentList, response_model=models.SolrReturnList, 
-async def database_extendedsearch(response: Response,
+def database_extendedsearch(response: Response,
                                   request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                                   solrcore: str=Body("pepwebdocs", embed=True),
                                   solrquery: str=Body(None, embed=True),
@@ -2379,7 +2512,7 @@ async def database_extendedsearch(response: Response,
 #---------------------------------------------------------------------------------------------------------
 @app.post("/v2/Database/Glossary/Search/", response_model=models.DocumentList, response_model_exclude_unset=True, tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_GLOSSARY_SEARCH_POST)
 @app.get("/v2/Database/Glossary/Search/", response_model=models.DocumentList, response_model_exclude_unset=True, tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_GLOSSARY_SEARCH)
-async def database_glossary_search_v2(response: Response, 
+def database_glossary_search_v2(response: Response, 
                                       request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                                       # qtermlist is only for POST
                                       qtermlist: models.SolrQueryTermList=None, # allows full specification
@@ -2452,7 +2585,7 @@ async def database_glossary_search_v2(response: Response,
     log_endpoint(request, client_id=client_id, session_id=client_session, level="debug")
     ocd, session_info = opasDocPermissions.get_session_info(request, response, session_id=client_session, client_id=client_id, caller_name=caller_name)
 
-    ret_val = await database_search(response,
+    ret_val = database_search(response,
                                     request,
                                     qtermlist=qtermlist,
                                     fulltext1=fulltext1,
@@ -2505,7 +2638,7 @@ async def database_glossary_search_v2(response: Response,
 #---------------------------------------------------------------------------------------------------------
 @app.post("/v2/Database/Search/", response_model=Union[models.DocumentList, models.ErrorReturn], response_model_exclude_unset=True, tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_SEARCH_POST)
 @app.get("/v2/Database/Search/", response_model=Union[models.DocumentList, models.ErrorReturn], response_model_exclude_unset=True, tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_SEARCH_V2)
-async def database_search(response: Response, 
+def database_search(response: Response, 
                               request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                               #qtermlist only works with Post
                               qtermlist: models.SolrQueryTermList=Body(None, embed=True, title=opasConfig.TITLE_QTERMLIST, decription=opasConfig.DESCRIPTION_QTERMLIST), # allows full specification
@@ -2863,7 +2996,7 @@ def database_searchanalysis(response: Response,
 
 #---------------------------------------------------------------------------------------------------------
 @app.get("/v2/Database/SmartSearch/", response_model=models.DocumentList, response_model_exclude_unset=True, tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_SEARCH_SMARTSEARCH) 
-async def database_smartsearch(response: Response, 
+def database_smartsearch(response: Response, 
                                request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),  
                                smarttext: str=Query(None, title=opasConfig.TITLE_SMARTSEARCH, description=opasConfig.DESCRIPTION_SMARTSEARCH),
                                facetquery: str=Query(None, title=opasConfig.TITLE_FACETQUERY, description=opasConfig.DESCRIPTION_FACETQUERY),
@@ -2950,7 +3083,7 @@ async def database_smartsearch(response: Response,
     opasDocPermissions.verify_header(request, "SmartSearch") # for debugging client call
     log_endpoint(request, client_id=client_id, session_id=client_session, level="debug")
 
-    ret_val = await database_search(response,
+    ret_val = database_search(response,
                                     request,
                                     fulltext1=None,
                                     paratext=None, 
@@ -2990,7 +3123,7 @@ async def database_smartsearch(response: Response,
 
 #---------------------------------------------------------------------------------------------------------
 @app.get("/v2/Database/MoreLikeThis/", response_model=models.DocumentList, response_model_exclude_unset=True, tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_MORELIKETHIS) 
-async def database_morelikethis(response: Response, 
+def database_morelikethis(response: Response, 
                                 request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),  
                                 morelikethis: str=Query(None, title=opasConfig.TITLE_MORELIKETHIS, description=opasConfig.DESCRIPTION_MORELIKETHIS),
                                 facetquery: str=Query(None, title=opasConfig.TITLE_FACETQUERY, description=opasConfig.DESCRIPTION_FACETQUERY),
@@ -3027,7 +3160,7 @@ async def database_morelikethis(response: Response,
     opasDocPermissions.verify_header(request, "MoreLikeThis") # for debugging client call
     log_endpoint(request, client_id=client_id, session_id=client_session, level="debug")
 
-    ret_val = await database_search(response,
+    ret_val = database_search(response,
                                     request,
                                     fulltext1=None,
                                     paratext=None, 
@@ -3068,7 +3201,7 @@ async def database_morelikethis(response: Response,
 
 #---------------------------------------------------------------------------------------------------------
 @app.get("/v2/Database/RelatedToThis/", response_model=models.DocumentList, response_model_exclude_unset=True, tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_RELATEDTOTHIS) 
-async def database_related_to_this(response: Response, 
+def database_related_to_this(response: Response, 
                                    request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),  
                                    relatedToThis: str=Query(None, title=opasConfig.TITLE_RELATEDTOTHIS, description=opasConfig.DESCRIPTION_RELATEDTOTHIS),
                                    sort: str=Query("score desc", title=opasConfig.TITLE_SORT, description=opasConfig.DESCRIPTION_SORT),
@@ -3305,17 +3438,17 @@ def database_mostviewed(response: Response,
         ret_val = response
 
     else: # go ahead! Search Solr
-        # if no special paramaters, then use the cache. It doesn't make sense otherwise.
-        if cached and all(v is None for v in [pubperiod, viewcount, author, title, sourcename,
-                                               sourcecode, sourcename, sourcetype, abstract,
-                                               stat, similarcount]):
+        # if no special paramaters (the lists without abstracts are the same for all sessions), then use the cache.
+        if cached and not abstract and not stat and not similarcount and all(v is None for v in [viewcount, author, title,
+                                                                                                    sourcename, sourcecode]):
 
             ret_val = mostviewedcache.get_most_viewed(viewperiod=viewperiod,
+                                                      publication_period=pubperiod,
+                                                      source_type=sourcetype,
                                                       limit=limit,
-                                                      offset=0,
-                                                      session_info=session_info,
+                                                      offset=offset,
                                                       forced_update=update_cache)
-        else:
+        if not ret_val: # not cacheable, or the cache couldn't load it
             try:
                 # we want the last year (default, per PEP-Web) of views, for all articles (journal articles)
                 ret_val, ret_status = opasCacheSupport.document_get_most_viewed( publication_period=pubperiod,
@@ -3470,17 +3603,18 @@ def database_mostcited(response: Response,
                                     )
 
     else:
-        # if no special paramaters, then use the cache. It doesn't make sense otherwise.
-        if cached and all(v is None for v in [pubperiod, citecount, author, title, sourcename,
-                                               sourcecode, sourcename, sourcetype, abstract,
-                                               stat, similarcount]):
-
-            ret_val = mostcitedcache.get_most_cited(citeperiod=citeperiod,
-                                                      limit=limit,
-                                                      offset=0,
-                                                      session_info=session_info,
-                                                      forced_update=update_cache)
-        else:
+        ret_val = None
+        # if no special paramaters (the lists without abstracts are the same for all sessions), then use the cache.
+        if cached and not abstract and not stat and not similarcount and all(v is None for v in [citecount, author, title,
+                                                                                                    sourcename, sourcecode]):
+
+            ret_val = mostcitedcache.get_most_cited(cited_in_period=citeperiod,
+                                                    publication_period=pubperiod,
+                                                    source_type=sourcetype,
+                                                    limit=limit,
+                                                    offset=offset,
+                                                    forced_update=update_cache)
+        if not ret_val: # not cacheable, or the cache couldn't load it
             # return documentList, much more limited document list if download==True
             ret_val, ret_status = opasAPISupportLib.database_get_most_cited( cited_in_period=citeperiod,
                                                                              cite_count=citecount,
@@ -3523,7 +3657,7 @@ def database_mostcited(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.get("/v2/Database/OpenURL/", response_model=Union[models.DocumentList, models.ErrorReturn], response_model_exclude_unset=True, tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_OPENURL)
-async def database_open_url(response: Response, 
+def database_open_url(response: Response, 
                             request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),
                             #moreinfo: bool=Query(False, title=opasConfig.TITLE_MOREINFO, description=opasConfig.DESCRIPTION_MOREINFO),
                             client_id:int=Depends(get_client_id), 
@@ -3702,7 +3836,7 @@ async def database_open_url(response: Response,
 
 #-----------------------------------------------------------------------------
 @app.get("/v2/Database/TermCounts/", response_model=Union[models.TermIndex, models.ErrorReturn], response_model_exclude_unset=True, tags=["Database"], summary=opasConfig.ENDPOINT_SUMMARY_TERM_COUNTS)  #  removed for now: response_model=models.DocumentList, 
-async def database_term_counts(response: Response, 
+def database_term_counts(response: Response, 
                                request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),  
                                termlist: str=Query(None, title=opasConfig.TITLE_TERMLIST, description=opasConfig.DESCRIPTION_TERMLIST),
                                termfield: str=Query("text", title=opasConfig.TITLE_TERMFIELD, description=opasConfig.DESCRIPTION_TERMFIELD),
@@ -4830,6 +4964,18 @@ def documents_abstracts(response: Response,
     log_endpoint(request, client_id=client_id, session_id=client_session, level="debug")
     ocd, session_info = opasDocPermissions.get_session_info(request, response, session_id=client_session, client_id=client_id, caller_name=caller_name)
 
+    # conditional GET: 304 if this session already has the current version
+    validator_key = opasHTTPCache.request_key(request, session_info)
+    not_modified = opasHTTPCache.validator_cache.check(request, validator_key, solr_core=solr_docs2)
+    if not_modified is not None:
+        # it's still a view of the abstract
+        view_type = opasHTTPCache.validator_cache.kept_view_type(validator_key)
+        if view_type is not None:
+            ocd.record_document_view(document_id=documentID.upper(),
+                                     session_info=session_info,
+                                     view_type=view_type)
+        return not_modified
+
     try:
         # authenticated = opasAPISupportLib.is_session_authenticated(request, response)
         # make sure it's upper case for consistency (added 2021-10-10)
@@ -4863,6 +5009,7 @@ def documents_abstracts(response: Response,
         )
     else:
         status_message = opasCentralDBLib.API_STATUS_SUCCESS
+        not_modified = None
 
         if ret_val.documents.responseInfo.count > 0:
             response.status_code = httpCodes.HTTP_200_OK
@@ -4881,6 +5028,9 @@ def documents_abstracts(response: Response,
                         document_list_item.pdfOriginalAvailable = True
                     else:
                         document_list_item.pdfOriginalAvailable = False
+
+            etag, last_modified = opasHTTPCache.documents_validators(ret_val, variant=validator_key[:2])
+            not_modified = opasHTTPCache.validator_cache.respond(request, response, validator_key, etag, last_modified, solr_core=solr_docs2, view_type="Abstract")
             
         else:
             # make sure we specify an error in the session log
@@ -4894,6 +5044,10 @@ def documents_abstracts(response: Response,
                                     return_status_code = response.status_code,
                                     status_message=status_message
                                     )
+        if not_modified is not None:
+            # the client already has this version
+            ret_val = not_modified
+
     return ret_val
 
 #-----------------------------------------------------------------------------
@@ -5110,6 +5264,20 @@ def documents_document_fetch(response: Response,
         # doc_info = opasAPISupportLib.document_get_info(documentID,
                                                         #fields="art_id, art_sourcetype, art_year, file_classification, art_sourcecode")
         # file_classification = doc_info.get("file_classification", opasConfig.DOCUMENT_ACCESS_UNDEFINED)
+
+        # conditional GET: 304 if this session already has the current version
+        validator_key = opasHTTPCache.request_key(request, session_info)
+        not_modified = opasHTTPCache.validator_cache.check(request, validator_key, solr_core=solr_docs2)
+        if not_modified is not None:
+            # it's still a view of the document, if the response it stands for was the full-text
+            view_type = opasHTTPCache.validator_cache.kept_view_type(validator_key)
+            if view_type is not None:
+                ocd.record_document_view(document_id=documentID,
+                                         session_info=session_info,
+                                         view_type=view_type)
+            log_endpoint_time(request, ts=ts, level="debug")
+            return not_modified
+
         try:
             # documents_get_document handles the view authorization and returns abstract if not authenticated.
             req_url=urllib.parse.unquote(request.url._url)
@@ -5220,6 +5388,14 @@ def documents_document_fetch(response: Response,
                     else:
                         logger.error("No document available." + request_qualifier_text)
 
+                if ret_val.documents.responseInfo.count > 0:
+                    etag, last_modified = opasHTTPCache.documents_validators(ret_val, variant=validator_key[:2])
+                    not_modified = opasHTTPCache.validator_cache.respond(request, response, validator_key, etag, last_modified, solr_core=solr_docs2,
+                                                                         view_type="Document" if access != False else None)
+                    if not_modified is not None:
+                        # the client already has this version
+                        ret_val = not_modified
+
     log_endpoint_time(request, ts=ts, level="debug")
     return ret_val
 
@@ -5317,6 +5493,12 @@ def documents_downloads(response: Response,
             status_message = status.error_description # status_message = msgdb.get_user_message(opasConfig.ERROR_403_DOWNLOAD_OR_PRINTING_RESTRICTED) + " " + request_qualifier_text
         elif status.httpcode == httpCodes.HTTP_500_INTERNAL_SERVER_ERROR:
             status_message = status.error_description # status_message = msgdb.get_user_message(opasConfig.ERROR_403_DOWNLOAD_OR_PRINTING_RESTRICTED) + " " + request_qualifier_text
+        elif status.httpcode in (httpCodes.HTTP_202_ACCEPTED, httpCodes.HTTP_503_SERVICE_UNAVAILABLE):
+            # large document still rendering (see opasRenderQueue), or too many rendering; the client should retry
+            logger.info(f"{status.error_description} ({status.httpcode}): {request_qualifier_text}")
+            raise HTTPException(status_code=response.status_code,
+                                detail=status.error_description,
+                                headers={"Retry-After": str(opasConfig.RENDER_QUEUE_RETRY_AFTER)})
         
         else:
             if status.error_description is not None and len(status.error_description) > 0:
@@ -5341,16 +5523,15 @@ def documents_downloads(response: Response,
                                     detail=error_status_message)
             else:
                 try:
-                    if flex_fs.key is not None:                    # S3
-                        fileurl = flex_fs.fs.url(filename)
-                        filename = wget.download(fileurl)
-    
-                    stamped_file = opasPDFStampCpyrght.stampcopyright(user_name, input_file=filename, suffix="original")
-                    response.status_code = httpCodes.HTTP_200_OK
-                    ret_val = FileResponse(path=stamped_file,
-                                           status_code=response.status_code,
-                                           filename=os.path.split(stamped_file)[1], 
-                                           media_type=media_type)
+                    # streamed from S3 (or local) as it's read, with the copyright stamp appended (see opasFileStream)
+                    download_name = os.path.splitext(os.path.split(filename)[1])[0] + "-original.pdf"
+                    ret_val = opasFileStream.stamped_pdf_response(flex_fs,
+                                                                  filename,
+                                                                  username=user_name,
+                                                                  download_name=download_name,
+                                                                  media_type=media_type,
+                                                                  range_header=request.headers.get("range"))
+                    response.status_code = ret_val.status_code
     
                 except Exception as e:
                     response.status_code = httpCodes.HTTP_404_NOT_FOUND 
@@ -5520,6 +5701,12 @@ def documents_glossary_term(response: Response,
     log_endpoint(request, client_id=client_id, session_id=client_session, level="debug")
     ocd, session_info = opasDocPermissions.get_session_info(request, response, session_id=client_session, client_id=client_id, caller_name=caller_name)
 
+    # conditional GET: 304 if this session already has the current version
+    validator_key = opasHTTPCache.request_key(request, session_info)
+    not_modified = opasHTTPCache.validator_cache.check(request, validator_key, solr_core=solr_gloss2)
+    if not_modified is not None:
+        return not_modified
+
     try:
         # handle default passthrough, when the value becomes query.
         if not isinstance(termidtype, models.TermTypeIDEnum):
@@ -5590,11 +5777,17 @@ def documents_glossary_term(response: Response,
                                         return_status_code = response.status_code,
                                         status_message=status_message
                                         )
+            etag, last_modified = opasHTTPCache.documents_validators(ret_val, variant=validator_key[:2])
+            not_modified = opasHTTPCache.validator_cache.respond(request, response, validator_key, etag, last_modified, solr_core=solr_gloss2)
+            if not_modified is not None:
+                # the client already has this version
+                ret_val = not_modified
+
     return ret_val
 
 #-----------------------------------------------------------------------------
 @app.get("/v2/Documents/Image/{imageID}/", response_model_exclude_unset=True, tags=["Documents"], summary=opasConfig.ENDPOINT_SUMMARY_IMAGE_DOWNLOAD)
-async def documents_image_fetch(response: Response,
+def documents_image_fetch(response: Response,
                                 request: Request=Query(None, title=opasConfig.TITLE_REQUEST, description=opasConfig.DESCRIPTION_REQUEST),  
                                 imageID: str=Path(..., title=opasConfig.TITLE_IMAGEID, description=opasConfig.DESCRIPTION_IMAGEID),
                                 download: int=Query(0, title="Return or download", description="0 returns the binary image, 1 downloads, 2 returns the article ID"),
@@ -5719,6 +5912,13 @@ async def documents_image_fetch(response: Response,
                 detail=status_message
             )    
 
+    if download == 0 and imageID != "*":
+        # conditional GET: 304 if the client already has this image (images are public)
+        validator_key = opasHTTPCache.request_key(request)
+        not_modified = opasHTTPCache.validator_cache.check(request, validator_key)
+        if not_modified is not None:
+            return not_modified
+
     fs = opasFileSupport.FlexFileSystem(key=localsecrets.S3_KEY, secret=localsecrets.S3_SECRET, root=localsecrets.IMAGE_SOURCE_PATH)
     media_type='image/jpeg'
     if imageID != "*":
@@ -5755,6 +5955,14 @@ async def documents_image_fetch(response: Response,
                 file_content = fs.get_image_binary(filename)
                 try:
                     ret_val = response = Response(file_content, media_type=media_type)
+                    # the expert pick (*) changes daily, so it's revalidated rather than cached
+                    not_modified = opasHTTPCache.validator_cache.respond(request,
+                                                                         response,
+                                                                         opasHTTPCache.request_key(request),
+                                                                         opasHTTPCache.make_etag(file_content),
+                                                                         public=imageID != "*")
+                    if not_modified is not None:
+                        ret_val = not_modified
     
                 except Exception as e:
                     response.status_code = httpCodes.HTTP_400_BAD_REQUEST 
@@ -5799,19 +6007,13 @@ async def documents_image_fetch(response: Response,
         try:
             response.status_code = httpCodes.HTTP_200_OK
             filename = fs.get_image_filename(filename)
-            if fs.key is not None:
-                fileurl = fs.fs.url(filename)
-                fname = wget.download(fileurl)
-                ret_val = FileResponse(path=fname,
-                                       status_code=response.status_code,
-                                       filename=os.path.split(fname)[1], 
-                                       media_type=media_type)
-            else:
-                fileurl = filename
-                ret_val = FileResponse(path=fileurl,
-                                       status_code=response.status_code,
-                                       filename=os.path.split(filename)[1], 
-                                       media_type=media_type)
+            # streamed from S3 (or local) as it's read
+            ret_val = opasFileStream.file_response(fs,
+                                                   filename,
+                                                   media_type=media_type,
+                                                   download_name=os.path.split(filename)[1],
+                                                   range_header=request.headers.get("range"))
+            response.status_code = ret_val.status_code
 
 
         except Exception as e:
@@ -47,6 +47,7 @@ help_text = (
          --nocheck          Don't prompt whether to proceed after showing setting/option choices
          --reverse          Process in reverse
          --halfway          Stop after doing half of the files, so it can be run in both directions
+         --workers          Number of processes to read, parse and compile files in parallel (loading to Solr/MySQL stays in one process)
          --whatsnewdays  Use the days back value supplied to write a new article log, rather than the specific files loaded.
                          Note that 1==today.
          --whatsnewfile  To specify the file in which to write the what's new list.
@@ -58,6 +59,9 @@ help_text = (
          --inputbuildpattern selection by build of what files to include
          --smartload         see if inputbuild file is newer or missing from db,
                              if so then compile and load, otherwise skip
+         --manifest          smartload compile manifest (content hashes of compiled files).  Files are only
+                             recompiled if their content, or the lookup data (e.g., glossary) used to compile them, changed
+         --nomanifest        smartload by file dates only
          --prettyprint       Format generated XML (bEXP_ARCH1) nicely
          --nohelp            Turn off front-matter help (that displays when you run)
          --doctype           Output doctype (defaults to default_doctype setting in loaderConfig.py)
@@ -114,6 +118,8 @@ sys.path.append('../libs/configLib')
 
 import time
 import random
+import collections
+import concurrent.futures
 import pysolr
 import localsecrets
 import re
@@ -135,6 +141,7 @@ import mysql.connector
 import configLib.opasCoreConfig
 from configLib.opasCoreConfig import solr_authors2, solr_gloss2
 import loaderConfig
+import opasConfig
 import opasSolrLoadSupport
 
 import opasXMLHelper as opasxmllib
@@ -151,6 +158,7 @@ else:
 
 # for processxml (build XML or update directly without intermediate file)
 import opasXMLProcessor
+import opasCompileManifest
 
 # Module Globals
 bib_total_reference_count = 0
@@ -268,6 +276,31 @@ def file_is_same_or_newer_in_solr_by_artid(solrcore, art_id, timestamp_str, file
         
     return ret_val
 
+#------------------------------------------------------------------------------------------------------
+def file_is_same_or_newer_in_solr_dates(solr_dates, art_id, timestamp_str, filename=None):
+    """
+    Same check as file_is_same_or_newer_in_solr_by_artid, but against the art_id -> file_last_modified
+      dict fetched up front by opasSolrLoadSupport.get_file_dates_solr_bulk, rather than a Solr query.
+    """
+    ret_val = False
+    if filename is None:
+        filename = art_id
+
+    solrtime = solr_dates.get(art_id, None)
+    if solrtime is not None and solrtime >= timestamp_str:
+        ret_val = True
+        if options.display_verbose:
+            try:
+                filetime = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%SZ")
+                filetime = filetime.strftime("%Y-%m-%d %H:%M:%S")
+                solrtime = datetime.strptime(solrtime, "%Y-%m-%dT%H:%M:%SZ")
+                solrtime = solrtime.strftime("%Y-%m-%d %H:%M:%S")
+                print (f"Skipped - No refresh needed File {filename}: {filetime} vs Solr: {solrtime}")
+            except Exception as e:
+                print (f"Skipped - No refresh needed File {filename}")
+        
+    return ret_val
+
 #------------------------------------------------------------------------------------------------------
 def file_is_same_as_in_solr(solrcore, filename, timestamp_str):
     ret_val = False
@@ -285,6 +318,242 @@ def file_is_same_as_in_solr(solrcore, filename, timestamp_str):
         
     return ret_val
 
+#------------------------------------------------------------------------------------------------------
+class PreparedArticle(object):
+    """
+    Everything the writer stage needs to load one file: the article info, the documents for
+      each Solr core, and the bibliography entries.  Built by prepare_article, in a worker
+      process when --workers is used, so it holds no lxml objects.
+    """
+    def __init__(self, fileinfo, art_id):
+        self.fileinfo = fileinfo
+        self.art_id = art_id
+        self.artInfo = None
+        self.compiled_only = False  # compiletosave: written to the output build, not loaded
+        self.glossary_docs = []
+        self.doc_docs = []
+        self.author_docs = []
+        self.bib_entries = []
+        self.error = None
+        self.seconds = 0
+        self.input_name = None  # --smartload: the input file and its content hash, for the compile manifest
+        self.input_hash = None
+
+#------------------------------------------------------------------------------------------------------
+def prepare_article(job, ocd, fs, source_data):
+    """
+    Read, parse and (if selected) compile one file, write the compiled output if requested,
+      and extract the data for the Solr cores and the references table.  Nothing is written
+      to Solr or MySQL here; that's left to load_prepared_article (the writer stage).
+
+    job is (fileinfo, art_id, file_updated, smart_file_rebuild, file_number, files_found, smart_check)
+
+    With --smartload, the hash of the input file's content is returned (input_hash) for the
+      compile manifest.  If smart_check is set, the input has already been compiled to the
+      output build (smart_check["output"]), and is only compiled again if its content hash
+      differs from the one recorded then (smart_check["hash"]); otherwise the output is loaded.
+    """
+    n, artID, file_updated, smart_file_rebuild, file_number, files_found, smart_check = job
+    fileTimeStart = time.time()
+    ret_val = PreparedArticle(n, artID)
+    try:
+        # Read file    
+        fileXMLContents = fs.get_file_contents(n.filespec)
+        if options.smartload and (smart_file_rebuild or smart_check is not None):
+            ret_val.input_name = n.basename
+            ret_val.input_hash = opasCompileManifest.content_hash(fileXMLContents)
+            if smart_check is not None:
+                if smart_check["hash"] is not None:
+                    smart_file_rebuild = smart_check["hash"] != ret_val.input_hash
+                else: # not in the manifest yet, go by the dates
+                    smart_file_rebuild = smart_check["input_newer"]
+                    
+                if not smart_file_rebuild:
+                    n = smart_check["output"]
+                    fileXMLContents = fs.get_file_contents(n.filespec)
+                    if options.display_verbose:
+                        print (f"SmartLoad: Loading only. No need to rebuild: {n.filespec}.")
+
+        base = n.basename
+        
+        # get file basename without build (which is in paren)
+        #base = n.basename
+        #artID = os.path.splitext(base)[0]
+        # watch out for comments in file name, like:
+        #   JICAP.018.0307A updated but no page breaks (bEXP_ARCH1).XML
+        #   so skip data after a space
+        msg = "Processing file #%s of %s: %s (%s bytes). Art-ID:%s" % (file_number, files_found, n.basename, n.filesize, artID)
+        logger.info(msg)
+        if options.display_verbose:
+            print (80 * "-")
+            print (msg)
+
+        # import into lxml
+        parser = lxml.etree.XMLParser(encoding='utf-8', recover=True, resolve_entities=True, load_dtd=True)
+        parsed_xml = etree.fromstring(opasxmllib.remove_encoding_string(fileXMLContents), parser)
+        #treeroot = pepxml.getroottree()
+        #root = pepxml.getroottree()
+
+        # save common document (article) field values into artInfo instance for both databases
+        artInfo = opasSolrLoadSupport.ArticleInfo(source_data, parsed_xml, artID, logger)
+        artInfo.filedatetime = n.timestamp_str
+        artInfo.filename = base
+        artInfo.file_size = n.filesize
+        artInfo.file_updated = file_updated
+        artInfo.file_create_time = n.create_time
+        ret_val.artInfo = artInfo
+
+        try:
+            artInfo.file_classification = re.search("(?P<class>current|archive|future|free|special|offsite)", str(n.filespec), re.IGNORECASE).group("class")
+            # set it to lowercase for ease of matching later
+            if artInfo.file_classification is not None:
+                artInfo.file_classification = artInfo.file_classification.lower()
+        except Exception as e:
+            logger.warning("Could not determine file classification for %s (%s)" % (n.filespec, e))
+        
+        if options.compiletosave or options.compiletorebuild or options.compiletoload or smart_file_rebuild:
+            # make changes to the XML
+            parsed_xml, ret_status = opasXMLProcessor.xml_update(parsed_xml, artInfo, ocd, pretty_print=options.pretty_printed, verbose=options.display_verbose)
+            # impx_count = int(pepxml.xpath('count(//impx[@type="TERM2"])'))
+            # print (impx_count, fileXMLContents[500:2500])
+            if not options.compiletoload: # save it
+                # write output file
+                fname = str(n.filespec)
+                fname = re.sub("\(b.*\)", options.output_build, fname)
+                
+                msg = f"\t...Exporting! Writing compiled file to {fname}"
+                if options.display_verbose:
+                    print (msg)
+
+                root = parsed_xml.getroottree()
+                root.write(fname, encoding="utf-8", method="xml", pretty_print=True, xml_declaration=True, doctype=options.output_doctype)
+
+            if options.compiletosave:
+                ret_val.compiled_only = True
+                return ret_val # no need to do anything else for this doc
+
+        # input to the glossary
+        if 1: # options.glossary_core_update:
+            # load the glossary core if this is a glossary item
+            glossary_file_pattern=r"ZBK.069(.*)\(bEXP_ARCH1\)\.(xml|XML)$"
+            if re.match(glossary_file_pattern, n.basename):
+                collector = opasSolrLoadSupport.SolrAddCollector()
+                opasSolrLoadSupport.process_article_for_glossary_core(parsed_xml, artInfo, collector, fileXMLContents, verbose=options.display_verbose)
+                ret_val.glossary_docs = collector.docs
+        
+        # input to the full-text and authors cores
+        if not options.glossary_only: # options.fulltext_core_update:
+            # the docs (pepwebdocs) core
+            collector = opasSolrLoadSupport.SolrAddCollector()
+            opasSolrLoadSupport.process_article_for_doc_core(parsed_xml, artInfo, collector, fileXMLContents, include_paras=options.include_paras, verbose=options.display_verbose)
+            ret_val.doc_docs = collector.docs
+            # the authors (pepwebauthors) core.
+            collector = opasSolrLoadSupport.SolrAddCollector()
+            opasSolrLoadSupport.process_info_for_author_core(parsed_xml, artInfo, collector, verbose=options.display_verbose)
+            ret_val.author_docs = collector.docs
+
+        # references for the references table
+        if 1: # options.biblio_update:
+            if artInfo.ref_count > 0:
+                bibReferences = parsed_xml.xpath("/pepkbd3//be")  # this is the second time we do this (also in artinfo, but not sure or which is better per space vs time considerations)
+                ret_val.bib_entries = [opasSolrLoadSupport.BiblioEntry(artInfo, ref) for ref in bibReferences]
+
+    except Exception as e:
+        ret_val.error = f"{type(e).__name__}: {e}"
+        logger.error(f"LoadError: {n.basename} could not be processed ({ret_val.error})")
+
+    ret_val.seconds = time.time() - fileTimeStart
+    return ret_val
+
+#------------------------------------------------------------------------------------------------------
+def load_prepared_article(prepared, ocd, solr_writers, biblio_writer):
+    """
+    Writer stage: load a prepared article into MySQL and (through the batching
+      solr_writers, keyed "docs", "authors" and "glossary") into Solr.  The references
+      are queued on biblio_writer, which writes them to api_biblioxml in batches.
+      
+    Returns the number of references queued for the references table.
+    """
+    artInfo = prepared.artInfo
+    ret_val = 0
+    if prepared.glossary_docs:
+        solr_writers["glossary"].add(prepared.glossary_docs)
+
+    if not options.glossary_only: # options.fulltext_core_update:
+        # load the database
+        opasSolrLoadSupport.add_article_to_api_articles_table(ocd, artInfo, verbose=options.display_verbose)
+        opasSolrLoadSupport.add_to_artstat_table(ocd, artInfo, verbose=options.display_verbose)
+
+        # -----
+        # 2022-04-22 New Section Name Workaround - This works but it means at least for new data, you can't run the load backwards as we currently do
+        #  on a full build.  Should be put into the client instead, really, during table gen.
+        # -----
+        # Uses new views: vw_article_firstsectnames which is based on the new view vw_article_sectnames
+        #  if an article id is found in that view, it's the first in the section, otherwise it isn't
+        # check database to see if this is the first in the section
+        if not opasSolrLoadSupport.check_if_start_of_section(ocd, artInfo.art_id):
+            # print (f"\t\t...NewSec Workaround: Clearing newsecnm for {artInfo.art_id}")
+            artInfo.start_sectname = None # clear it so it's not written to solr, this is not the first article
+            for doc in prepared.doc_docs:
+                doc["art_newsecnm"] = None
+        else:
+            if options.display_verbose:
+                print (f"\t\t...NewSec {artInfo.start_sectname} found in {artInfo.art_id}")
+        # -----
+
+        # load the docs (pepwebdocs) core
+        solr_writers["docs"].add(prepared.doc_docs)
+        # load the authors (pepwebauthors) core.
+        solr_writers["authors"].add(prepared.author_docs)
+
+    # Add to the references table
+    if prepared.bib_entries:
+        if options.display_verbose:
+            print(("\t...Processing %s references for the references database." % (artInfo.ref_count)))
+
+        biblio_writer.add_article(prepared.bib_entries)
+        ret_val = len(prepared.bib_entries)
+
+    return ret_val
+
+#------------------------------------------------------------------------------------------------------
+# --workers: each worker process sets these up once (_init_load_worker) and reuses them for every file
+_worker_ocd = None
+_worker_fs = None
+_worker_source_data = None
+
+def _init_load_worker(worker_options, source_data):
+    global options, _worker_ocd, _worker_fs, _worker_source_data
+    options = worker_options
+    _worker_ocd = opasCentralDBLib.opasCentralDB()
+    _worker_fs = opasFileSupport.FlexFileSystem(key=localsecrets.S3_KEY, secret=localsecrets.S3_SECRET, root="pep-web-xml")
+    _worker_source_data = source_data
+
+def _prepare_article_in_worker(job):
+    return prepare_article(job, _worker_ocd, _worker_fs, _worker_source_data)
+
+def prepare_articles_in_parallel(jobs, workers, source_data):
+    """
+    Run prepare_article over jobs in a pool of worker processes, yielding the results
+      in the order of jobs, so the writer sees the files in the same order as a serial run.
+
+    Only workers * LOADER_WORKER_QUEUE_FACTOR files are in progress (or waiting for the writer)
+      at a time, so a slow writer holds back the readers rather than letting the parsed
+      documents pile up in memory.
+    """
+    window = workers * opasConfig.LOADER_WORKER_QUEUE_FACTOR
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                initializer=_init_load_worker,
+                                                initargs=(options, source_data)) as executor:
+        pending = collections.deque()
+        for job in jobs:
+            pending.append(executor.submit(_prepare_article_in_worker, job))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
 #------------------------------------------------------------------------------------------------------
 def main():
     
@@ -541,6 +810,7 @@ def main():
         print((80*"-"))
         precommit_file_count = 0
         skipped_files = 0
+        failed_files = 0
         stop_after = 0
         cumulative_file_time_start = time.time()
         issue_updates = {}
@@ -555,93 +825,132 @@ def main():
             # Now walk through all the filenames selected
             # ----------------------------------------------------------------------
             print (f"{pre_action_verb} started ({time.ctime()}).  Examining files.")
+
+            # for more than a few files, get the dates of everything already loaded in one export,
+            #  rather than asking Solr about each file
+            solr_dates = None
+            if not options.forceRebuildAllFiles and files_found >= opasConfig.LOADER_SKIP_CHECK_BULK_MIN_FILES:
+                src_codes = {n.basename.split(".")[0].upper() for n in filenames}
+                if len(src_codes) > opasConfig.LOADER_SKIP_CHECK_MAX_SRC_CODES:
+                    src_codes = None
+                skip_check_start = time.time()
+                solr_dates = opasSolrLoadSupport.get_file_dates_solr_bulk(solr_docs2, src_codes=src_codes)
+                if solr_dates is None:
+                    print ("Could not export the loaded file dates from Solr.  Checking each file instead.")
+                else:
+                    print (f"Fetched the dates of {len(solr_dates)} loaded articles for the skip check in {time.time() - skip_check_start:.2f} secs.")
             
-            for n in filenames:
-                fileTimeStart = time.time()
-                file_updated = False
-                smart_file_rebuild = False
-                base = n.basename
-                artID = os.path.splitext(base)[0]
-                m = re.match(r"([^ ]*).*\(.*\)", artID)
-                artID = m.group(1)
-                artID = artID.upper()
-                
-                if not options.forceRebuildAllFiles:  # always force processed for single file                  
-                    if not options.display_verbose and processed_files_count % 100 == 0 and processed_files_count != 0:
-                        print (f"Processed Files ...loaded {processed_files_count} out of {files_found} possible.")
-    
-                    if not options.display_verbose and skipped_files % 100 == 0 and skipped_files != 0:
-                        print (f"Skipped {skipped_files} so far...loaded {processed_files_count} out of {files_found} possible." )
+            def selected_files():
+                """
+                Generate the jobs for prepare_article: the files that need loading,
+                  after the skip and smartload checks
+                """
+                nonlocal processed_files_count, skipped_files
+                for n in filenames:
+                    file_updated = False
+                    smart_file_rebuild = False
+                    base = n.basename
+                    artID = os.path.splitext(base)[0]
+                    m = re.match(r"([^ ]*).*\(.*\)", artID)
+                    artID = m.group(1)
+                    artID = artID.upper()
+
+                    # compiled with lookup data (e.g., glossary terms) that has since changed, so it needs compiling even if unchanged itself
+                    deps_changed = manifest is not None and manifest.dependencies_changed(n.basename)
                     
-                    if file_is_same_or_newer_in_solr_by_artid(solr_docs2, art_id=artID, timestamp_str=n.timestamp_str, filename=n.basename):
-                        skipped_files += 1
-                        # moved to file_is_same_or_newer_in_solr_by_artid
-                        #if options.display_verbose:
-                            #print (f"Skipped - No refresh needed for {n.basename}")
-                        continue
-                    else:
-                        file_updated = True
-                
-                # get mod date/time, filesize, etc. for mysql database insert/update
-                processed_files_count += 1
-                if stop_after > 0:
-                    if processed_files_count > stop_after:
-                        print (f"Halfway mark reached on file list ({stop_after})...file processing stopped per halfway option")
-                        break
-
-                if options.smartload:
-                    if options.forceRebuildAllFiles:
-                        smart_file_rebuild = True
-                    else:
-                        # see if the output file exists and is older than the input file
-                        outputfname = str(n.filespec)
-                        outputfname = outputfname.replace(selected_input_build, options.output_build)
-                        fileinfoinp = FileInfo()
-                        try:
-                            fileinfoinp.mapLocalFS(outputfname)
-                            if fileinfoinp.date_modified <  n.date_modified:
-                                # need to rebuild
-                                smart_file_rebuild = True
-                            else:
-                                smart_file_rebuild = False
-                                n = fileinfoinp
-                        except Exception as e:
-                            #print (e)
+                    if not options.forceRebuildAllFiles and not deps_changed:  # always force processed for single file                  
+                        if not options.display_verbose and processed_files_count % 100 == 0 and processed_files_count != 0:
+                            print (f"Processed Files ...loaded {processed_files_count} out of {files_found} possible.")
+        
+                        if not options.display_verbose and skipped_files % 100 == 0 and skipped_files != 0:
+                            print (f"Skipped {skipped_files} so far...loaded {processed_files_count} out of {files_found} possible." )
+                        
+                        if solr_dates is not None:
+                            already_loaded = file_is_same_or_newer_in_solr_dates(solr_dates, art_id=artID, timestamp_str=n.timestamp_str, filename=n.basename)
+                        else:
+                            already_loaded = file_is_same_or_newer_in_solr_by_artid(solr_docs2, art_id=artID, timestamp_str=n.timestamp_str, filename=n.basename)
+
+                        if already_loaded:
+                            skipped_files += 1
+                            # moved to file_is_same_or_newer_in_solr_by_artid
+                            #if options.display_verbose:
+                                #print (f"Skipped - No refresh needed for {n.basename}")
+                            continue
+                        else:
+                            file_updated = True
+                    
+                    # get mod date/time, filesize, etc. for mysql database insert/update
+                    processed_files_count += 1
+                    if stop_after > 0:
+                        if processed_files_count > stop_after:
+                            print (f"Halfway mark reached on file list ({stop_after})...file processing stopped per halfway option")
+                            return
+    
+                    smart_check = None
+                    if options.smartload:
+                        if options.forceRebuildAllFiles or deps_changed:
                             smart_file_rebuild = True
                         else:
-                            smart_file_rebuild = False
-                            if options.display_verbose:
-                                print (f"SmartLoad: Loading only. No need to rebuild: {outputfname}.")
-                
-                # Read file    
-                fileXMLContents = fs.get_file_contents(n.filespec)
-                
-                # get file basename without build (which is in paren)
-                #base = n.basename
-                #artID = os.path.splitext(base)[0]
-                # watch out for comments in file name, like:
-                #   JICAP.018.0307A updated but no page breaks (bEXP_ARCH1).XML
-                #   so skip data after a space
-                msg = "Processing file #%s of %s: %s (%s bytes). Art-ID:%s" % (processed_files_count, files_found, n.basename, n.filesize, artID)
-                logger.info(msg)
-                if options.display_verbose:
-                    print (80 * "-")
-                    print (msg)
-        
-                # import into lxml
-                parser = lxml.etree.XMLParser(encoding='utf-8', recover=True, resolve_entities=True, load_dtd=True)
-                parsed_xml = etree.fromstring(opasxmllib.remove_encoding_string(fileXMLContents), parser)
-                #treeroot = pepxml.getroottree()
-                #root = pepxml.getroottree()
-        
-                # save common document (article) field values into artInfo instance for both databases
-                artInfo = opasSolrLoadSupport.ArticleInfo(sourceDB.sourceData, parsed_xml, artID, logger)
-                artInfo.filedatetime = n.timestamp_str
-                artInfo.filename = base
-                artInfo.file_size = n.filesize
-                artInfo.file_updated = file_updated
-                artInfo.file_create_time = n.create_time
+                            # see if the output file exists and is older than the input file
+                            outputfname = str(n.filespec)
+                            outputfname = outputfname.replace(selected_input_build, options.output_build)
+                            fileinfoout = FileInfo()
+                            try:
+                                fileinfoout.mapLocalFS(outputfname)
+                            except Exception as e:
+                                #print (e)
+                                smart_file_rebuild = True # no output file yet
+                            else:
+                                input_newer = fileinfoout.date_modified < n.date_modified
+                                if manifest is not None:
+                                    # prepare_article reads the input and compares its hash to the one recorded
+                                    #  when the output was compiled (dates decide only for files not yet in the manifest)
+                                    manifest_entry = manifest.get(n.basename)
+                                    smart_check = {"output": fileinfoout,
+                                                   "hash": manifest_entry["hash"] if manifest_entry is not None else None,
+                                                   "input_newer": input_newer}
+                                elif input_newer:
+                                    # need to rebuild
+                                    smart_file_rebuild = True
+                                else:
+                                    smart_file_rebuild = False
+                                    n = fileinfoout
+                                    if options.display_verbose:
+                                        print (f"SmartLoad: Loading only. No need to rebuild: {outputfname}.")
+
+                    yield (n, artID, file_updated, smart_file_rebuild, processed_files_count, files_found, smart_check)
+
+            # --smartload: the content hashes of compiled files, and the lookup data they were compiled with
+            manifest = None
+            if options.smartload and not options.no_manifest:
+                manifest = opasCompileManifest.CompileManifest(options.manifest_file,
+                                                               dependency_versions=opasXMLProcessor.get_compile_dependency_versions(ocd))
+                print (f"SmartLoad: Using compile manifest {options.manifest_file} ({len(manifest.entries)} files recorded).")
+
+            if options.workers > 1:
+                print (f"Reading, parsing and compiling with {options.workers} worker processes.")
+                prepared_articles = prepare_articles_in_parallel(selected_files(), options.workers, sourceDB.sourceData)
+            else:
+                prepared_articles = (prepare_article(job, ocd, fs, sourceDB.sourceData) for job in selected_files())
+
+            # the writer stage: everything sent to Solr and MySQL goes through here, in file order
+            solr_writers = {"docs": opasSolrLoadSupport.SolrBatchWriter(solr_docs2, name="docs"),
+                            "authors": opasSolrLoadSupport.SolrBatchWriter(solr_authors2, name="authors"),
+                            "glossary": opasSolrLoadSupport.SolrBatchWriter(solr_gloss2, name="glossary")
+                            }
+            biblio_writer = opasSolrLoadSupport.BiblioxmlBatchWriter(ocd)
+            fileTimeStart = time.time()
+            for prepared in prepared_articles:
+                fileTimeStart = time.time()
+                if prepared.error is not None:
+                    failed_files += 1
+                    print (f"Error: {prepared.fileinfo.basename} not loaded ({prepared.error})")
+                    continue
                 
+                artInfo = prepared.artInfo
+                if manifest is not None and prepared.input_hash is not None:
+                    manifest.record(prepared.input_name, prepared.input_hash)
+
                 # not a new journal, see if it's a new article.
                 if opasSolrLoadSupport.add_to_tracker_table(ocd, artInfo.art_id): # if true, added successfully, so new!
                     # don't log to issue updates for journals that are new sources added during the annual update
@@ -652,123 +961,55 @@ def main():
                         except Exception as e:
                             issue_updates[artInfo.issue_id_str] = [art]
     
-                try:
-                    artInfo.file_classification = re.search("(?P<class>current|archive|future|free|special|offsite)", str(n.filespec), re.IGNORECASE).group("class")
-                    # set it to lowercase for ease of matching later
-                    if artInfo.file_classification is not None:
-                        artInfo.file_classification = artInfo.file_classification.lower()
-                except Exception as e:
-                    logger.warning("Could not determine file classification for %s (%s)" % (n.filespec, e))
-                
-                if options.compiletosave or options.compiletorebuild or options.compiletoload or smart_file_rebuild:
-                    # make changes to the XML
-                    parsed_xml, ret_status = opasXMLProcessor.xml_update(parsed_xml, artInfo, ocd, pretty_print=options.pretty_printed, verbose=options.display_verbose)
-                    # impx_count = int(pepxml.xpath('count(//impx[@type="TERM2"])'))
-                    # print (impx_count, fileXMLContents[500:2500])
-                    if not options.compiletoload: # save it
-                        # write output file
-                        fname = str(n.filespec)
-                        fname = re.sub("\(b.*\)", options.output_build, fname)
-                        
-                        msg = f"\t...Exporting! Writing compiled file to {fname}"
-                        if options.display_verbose:
-                            print (msg)
-
-                        root = parsed_xml.getroottree()
-                        root.write(fname, encoding="utf-8", method="xml", pretty_print=True, xml_declaration=True, doctype=options.output_doctype)
-                    
-                        # xml_text version, not reconverted to tree
-                        #file_text = lxml.etree.tostring(parsed_xml, pretty_print=options.pretty_printed, encoding="utf8").decode("utf-8")
-                        #fname = fname.replace(options.output_build, "(bXML_TEXT)")
-                        #with open(fname, 'w', encoding="utf8") as fo:
-                            #fo.write( f'<?xml version="1.0" encoding="UTF-8"?>\n')
-                            #fo.write(file_text)
-
-                    if options.compiletosave:
-                        continue # next document -- no need to do anything else for this doc
+                if prepared.compiled_only:
+                    continue # next document -- no need to do anything else for this doc
 
-                # walk through bib section and add to refs core database
                 precommit_file_count += 1
                 if precommit_file_count > configLib.opasCoreConfig.COMMITLIMIT:
                     print(f"Committing info for {configLib.opasCoreConfig.COMMITLIMIT} documents/articles")
-    
-                # input to the glossary
-                if 1: # options.glossary_core_update:
-                    # load the glossary core if this is a glossary item
-                    glossary_file_pattern=r"ZBK.069(.*)\(bEXP_ARCH1\)\.(xml|XML)$"
-                    if re.match(glossary_file_pattern, n.basename):
-                        opasSolrLoadSupport.process_article_for_glossary_core(parsed_xml, artInfo, solr_gloss2, fileXMLContents, verbose=options.display_verbose)
-                
-                # input to the full-text and authors cores
+
+                bib_total_reference_count += load_prepared_article(prepared, ocd, solr_writers, biblio_writer)
+
+                if precommit_file_count > configLib.opasCoreConfig.COMMITLIMIT:
+                    biblio_writer.flush()
+                    if manifest is not None:
+                        manifest.save()
+
                 if not options.glossary_only: # options.fulltext_core_update:
-                    # load the database
-                    opasSolrLoadSupport.add_article_to_api_articles_table(ocd, artInfo, verbose=options.display_verbose)
-                    opasSolrLoadSupport.add_to_artstat_table(ocd, artInfo, verbose=options.display_verbose)
-
-                    # -----
-                    # 2022-04-22 New Section Name Workaround - This works but it means at least for new data, you can't run the load backwards as we currently do
-                    #  on a full build.  Should be put into the client instead, really, during table gen.
-                    # -----
-                    # Uses new views: vw_article_firstsectnames which is based on the new view vw_article_sectnames
-                    #  if an article id is found in that view, it's the first in the section, otherwise it isn't
-                    # check database to see if this is the first in the section
-                    if not opasSolrLoadSupport.check_if_start_of_section(ocd, artInfo.art_id):
-                        # print (f"\t\t...NewSec Workaround: Clearing newsecnm for {artInfo.art_id}")
-                        artInfo.start_sectname = None # clear it so it's not written to solr, this is not the first article
-                    else:
-                        if options.display_verbose:
-                            print (f"\t\t...NewSec {artInfo.start_sectname} found in {artInfo.art_id}")
-                    # -----
-
-                    # load the docs (pepwebdocs) core
-                    opasSolrLoadSupport.process_article_for_doc_core(parsed_xml, artInfo, solr_docs2, fileXMLContents, include_paras=options.include_paras, verbose=options.display_verbose)
-                    # load the authors (pepwebauthors) core.
-                    opasSolrLoadSupport.process_info_for_author_core(parsed_xml, artInfo, solr_authors2, verbose=options.display_verbose)
-                    # load the database (Moved to above new section name workaround)
-                    #opasSolrLoadSupport.add_article_to_api_articles_table(ocd, artInfo, verbose=options.display_verbose)
-                    #opasSolrLoadSupport.add_to_artstat_table(ocd, artInfo, verbose=options.display_verbose)
-                    
                     if precommit_file_count > configLib.opasCoreConfig.COMMITLIMIT:
                         precommit_file_count = 0
-                        solr_docs2.commit()
-                        solr_authors2.commit()
-                    
-                # Add to the references table
-                if 1: # options.biblio_update:
-                    if artInfo.ref_count > 0:
-                        bibReferences = parsed_xml.xpath("/pepkbd3//be")  # this is the second time we do this (also in artinfo, but not sure or which is better per space vs time considerations)
-                        if options.display_verbose:
-                            print(("\t...Processing %s references for the references database." % (artInfo.ref_count)))
-    
-                        #processedFilesCount += 1
-                        bib_total_reference_count = 0
-                        ocd.open_connection(caller_name="processBibliographies")
-                        for ref in bibReferences:
-                            bib_total_reference_count += 1
-                            bib_entry = opasSolrLoadSupport.BiblioEntry(artInfo, ref)
-                            opasSolrLoadSupport.add_reference_to_biblioxml_table(ocd, artInfo, bib_entry)
-    
-                        try:
-                            ocd.db.commit()
-                        except mysql.connector.Error as e:
-                            print("SQL Database -- Biblio Commit failed!", e)
-                            
-                        ocd.close_connection(caller_name="processBibliographies")
+                        solr_writers["docs"].commit()
+                        solr_writers["authors"].commit()
     
                 # close the file, and do the next
                 if options.display_verbose:
-                    print(("\t...Time: %s seconds." % (time.time() - fileTimeStart)))
+                    print(("\t...Time: %s seconds." % (prepared.seconds + time.time() - fileTimeStart)))
         
             print (f"{pre_action_verb} process complete ({time.ctime()} ). Time: {time.time() - fileTimeStart} seconds.")
+            if manifest is not None:
+                manifest.save()
+            if not options.forceRebuildAllFiles:
+                print (f"Skip check: {skipped_files} files skipped (already loaded and unchanged), {processed_files_count} queued for loading.")
+            if failed_files > 0:
+                print (f"{failed_files} files could not be processed and were not loaded (see the log for details).")
             if processed_files_count > 0 and not options.compiletosave:
+                biblio_writer.flush()
+                if biblio_writer.rows_written > 0:
+                    print (f"References table: {biblio_writer.rows_written} rows written in {biblio_writer.seconds:.2f} secs ({biblio_writer.rows_per_second():.1f} rows/sec).")
+                if biblio_writer.error_count > 0:
+                    print (f"References table: {biblio_writer.error_count} rows could not be written (see the log for details).")
+                if biblio_writer.cited_ids:
+                    recounted = opasSolrLoadSupport.refresh_cited_summary(ocd, biblio_writer.cited_ids)
+                    if recounted:
+                        print (f"Most cited summary: citation counts of {recounted} cited documents updated.")
                 try:
                     print ("Performing final commit.")
                     if not options.glossary_only: # options.fulltext_core_update:
-                        solr_docs2.commit()
-                        solr_authors2.commit()
+                        solr_writers["docs"].commit()
+                        solr_writers["authors"].commit()
                         # fileTracker.commit()
                     if 1: # options.glossary_core_update:
-                        solr_gloss2.commit()
+                        solr_writers["glossary"].commit()
                 except Exception as e:
                     print(("Exception: ", e))
                 else:
@@ -942,6 +1183,8 @@ if __name__ == "__main__":
                       help="Don't load any files (use with whatsnewdays to only generate a whats new list).")
     parser.add_option("--whatsnewdays", dest="daysback", default=None,
                       help="Generate a log of files added in the last n days (1==today), rather than for files added during this run.")
+    parser.add_option("--workers", dest="workers", type="int", default=1,
+                      help="Number of worker processes to read, parse and compile files in parallel (default 1, no worker processes).  Loading into Solr and MySQL stays in the main process.")
     parser.add_option("--whatsnewfile", dest="whatsnewfile", default=None,
                       help="File name to force the file and path rather than a generated name for the log of files added in the last n days.")
     # New OpasLoader2 Options
@@ -970,6 +1213,12 @@ if __name__ == "__main__":
     parser.add_option("--compiletorebuild", "--compilerebuild", action="store_true", dest="compiletorebuild", default=False,
                       help="Compile input XML (e.g., (bKBD3) to a processed build of XML, Save, AND load into database.")
 
+    parser.add_option("--manifest", dest="manifest_file", default=loaderConfig.default_compile_manifest,
+                      help=f"For --smartload, the file recording the content hash of each compiled input file and the lookup data versions it was compiled with, default='{loaderConfig.default_compile_manifest}'.")
+
+    parser.add_option("--nomanifest", action="store_true", dest="no_manifest", default=False,
+                      help="For --smartload, decide what to compile by file dates only, without the compile manifest.")
+
     parser.add_option("--prettyprint", action="store_true", dest="pretty_printed", default=True,
                       help="Pretty format the compiled XML.")
 
@@ -5,7 +5,7 @@
 __author__      = "Neil R. Shapiro"
 __copyright__   = "Copyright 2019-2021, Psychoanalytic Electronic Publishing"
 __license__     = "Apache 2.0"
-__version__     = "2022.0618/v1.1.8"
+__version__     = "2026.1017/v1.2.0"
 __status__      = "Beta"
 
 programNameShort = "opasDataUpdateStat"
@@ -23,6 +23,10 @@ print(
          - The first update after a load should be with option --all
          - Then, omit --all to update views daily
          - Citations (include --all) only need be updated after data updates
+
+      Use option --bulk to fetch the current stat values of all the articles in one export and
+        send the changes as batches of atomic updates (--batchsize, --workers at once), with one
+        commit at the end, rather than a search and update per article.
          
          For complete details, see:
           https://github.com/Psychoanalytic-Electronic-Publishing/OpenPubArchive-Content-Server/wiki/Loading-Data-into-OpenPubArchive
@@ -30,7 +34,13 @@ print(
       The records added are controlled by the database views:
          vw_stat_docviews_crosstab
          vw_stat_cited_crosstab
+
+      The same data is written to the summary tables api_stat_docviews_summary and
+        api_stat_cited_summary (only the rows which changed), which the Most Viewed and Most
+        Cited downloads read rather than the (slow) views.  Use --nosummary to skip them.
          
+      2026-10-17 Added --bulk mode, and the summary tables.
+
       2020-11-21 Added library numbers display to main startup to monitor what it's running under.
       
       2020-10-29 Important update - Since it is used at database build/rebuild time, it now updates all records
@@ -44,9 +54,15 @@ sys.path.append('../config')
 sys.path.append('../libs/configLib')
 
 UPDATE_AFTER = 2500
+BULK_FETCH_ROWS = 10000      # rows per cursorMark page when fetching the current stat values (--bulk)
+BULK_UPDATE_BATCH = 5000     # atomic updates per request to Solr (--bulk)
+BULK_UPDATE_WORKERS = 4      # update requests sent at once (--bulk)
+SUMMARY_UPDATE_BATCH = 1000  # rows per statement when refreshing the api_stat_*_summary tables
 
 import logging
 import time
+import fnmatch
+import concurrent.futures
 import pymysql
 import pysolr
 import localsecrets
@@ -64,6 +80,16 @@ print (start_notice)
 
 unified_article_stat = {}
 
+STAT_FIELDS = ("art_cited_5",
+               "art_cited_10",
+               "art_cited_20",
+               "art_cited_all",
+               "art_views_lastcalyear",
+               "art_views_last12mos",
+               "art_views_last6mos",
+               "art_views_last1mos",
+               "art_views_lastweek")
+
 class ArticleStat(BaseModel):
     document_id: str = None
     art_views_update: bool = False
@@ -267,11 +293,108 @@ class opasCentralDBMini(object):
         
         return citation_table
 
+    def get_summary_table(self, table, key_column, columns) -> dict:
+        """
+         Return the rows of a summary table as a dict, key_column value -> tuple of the columns
+        """
+        ret_val = {}
+        self.open_connection(caller_name="get_summary_table") # make sure connection is open
+        if self.db is not None:
+            cursor = self.db.cursor()
+            cursor.execute(f"SELECT {key_column}, {', '.join(columns)} FROM {table}")
+            for row in cursor.fetchall():
+                ret_val[row[0]] = tuple(row[1:])
+            cursor.close()
+        else:
+            logger.fatal("Connection not available to database.")
+
+        self.close_connection(caller_name="get_summary_table") # make sure connection is closed
+        return ret_val
+
+    def refresh_summary_table(self, table, key_column, columns, rows, batch_size=SUMMARY_UPDATE_BATCH):
+        """
+         Bring a summary table (a crosstab view, materialized) up to date with rows fetched from
+           the view: only the rows which changed are written, and those no longer in the view are
+           removed.
+
+         Returns (rows written, rows removed)
+        """
+        changed, removed = summary_changes(self.get_summary_table(table, key_column, columns), rows, key_column, columns)
+        self.open_connection(caller_name="refresh_summary_table") # make sure connection is open
+        if self.db is not None:
+            cursor = self.db.cursor()
+            row_sql = "(%s)" % ", ".join(["%s"] * (len(columns) + 1))
+            insert_sql = f"INSERT INTO {table} ({key_column}, {', '.join(columns)}) VALUES "
+            update_sql = " ON DUPLICATE KEY UPDATE " + ", ".join([f"{column} = VALUES({column})" for column in columns])
+            for i in range(0, len(changed), batch_size):
+                batch = changed[i:i + batch_size]
+                cursor.execute(insert_sql + ", ".join([row_sql] * len(batch)) + update_sql, [value for row in batch for value in row])
+            for i in range(0, len(removed), batch_size):
+                batch = removed[i:i + batch_size]
+                cursor.execute(f"DELETE FROM {table} WHERE {key_column} IN ({', '.join(['%s'] * len(batch))})", batch)
+            self.db.commit()
+            cursor.close()
+        else:
+            logger.fatal("Connection not available to database.")
+
+        self.close_connection(caller_name="refresh_summary_table") # make sure connection is closed
+        return len(changed), len(removed)
+
 
 #----------------------------------------------------------------------------------------
 #  End OpasCentralDBMini
 #----------------------------------------------------------------------------------------
+CITED_SUMMARY_COLUMNS = ("count5", "count10", "count20", "countAll")
+VIEWS_SUMMARY_COLUMNS = ("last_viewed", "lastweek", "lastmonth", "last6months", "last12months", "lastcalyear")
+
+def summary_changes(existing, rows, key_column, columns):
+    """
+    Compare the rows of a summary table (existing, as returned by get_summary_table) with the
+      rows from its view.  Returns (the rows to write, as tuples starting with the key, the keys
+      to remove).
+
+    >>> existing = {"IJP.001.0001A": (3, 5), "IJP.001.0002A": (1, 1), "IJP.001.0003A": (2, 2)}
+    >>> rows = [{"id": "IJP.001.0001A", "count5": 3, "countAll": 5}, {"id": "IJP.001.0002A", "count5": 1, "countAll": 2}, {"id": "IJP.001.0004A", "count5": 0, "countAll": 1}]
+    >>> summary_changes(existing, rows, "id", ("count5", "countAll"))
+    ([('IJP.001.0002A', 1, 2), ('IJP.001.0004A', 0, 1)], ['IJP.001.0003A'])
+    """
+    changed = []
+    current = set()
+    for row in rows:
+        key = row.get(key_column, None)
+        if key is None or key in current:
+            continue
+        current.add(key)
+        values = tuple([row.get(column, None) for column in columns])
+        if existing.get(key) != values:
+            changed.append((key,) + values)
+
+    removed = [key for key in existing if key not in current]
+    return changed, removed
+
+def refresh_stat_summaries(citation_table, most_viewed):
+    """
+    Write the citation and view counts (as fetched from the crosstab views for the Solr
+      update) to the summary tables
+    """
+    ocd = opasCentralDBMini()
+    for table, key_column, columns, rows in (("api_stat_cited_summary", "cited_document_id", CITED_SUMMARY_COLUMNS, citation_table),
+                                             ("api_stat_docviews_summary", "document_id", VIEWS_SUMMARY_COLUMNS, most_viewed)):
+        if not rows: # (the fetch failed) don't empty the table
+            logger.warning(f"opasDataUpdateStat: no rows fetched for {table}; not refreshed.")
+            continue
+        try:
+            written, removed = ocd.refresh_summary_table(table, key_column, columns, rows)
+        except Exception as e:
+            logger.error(f"opasDataUpdateStatDBError: {table} could not be refreshed ({e})")
+        else:
+            print (f"{table}: {written} rows written, {removed} removed.")
+
 def load_unified_article_stat():
+    """
+    Load the view and citation data (into unified_article_stat).  Returns the rows of the two
+      crosstabs, (most_viewed, citation_table).
+    """
     ocd =  opasCentralDBMini()
     # load most viewed data
     count, most_viewed = ocd.get_most_viewed_crosstab()
@@ -310,6 +433,8 @@ def load_unified_article_stat():
                 unified_article_stat[doc_id].art_views_last6mos = n.get("last6months", None) 
                 unified_article_stat[doc_id].art_views_last1mos = n.get("lastmonth", None)
                 unified_article_stat[doc_id].art_views_lastweek = n.get("lastweek", None)
+
+    return most_viewed, citation_table
                 
 def update_solr_stat_data(solrcon, all_records:bool=False):
     """
@@ -441,6 +566,196 @@ def update_solr_stat_data(solrcon, all_records:bool=False):
     print (f"Finished updating Solr stat with {update_count} article records updated; records skipped: {skipped_as_update_error }.")
     return update_count
 
+#----------------------------------------------------------------------------------------
+#  Bulk mode
+#----------------------------------------------------------------------------------------
+def get_solr_stat_values(solrcon, rows=BULK_FETCH_ROWS):
+    """
+    Fetch art_id -> current stat field values for all the articles in the core, in one cursorMark export
+    """
+    ret_val = {}
+    cursor_mark = "*"
+    while True:
+        results = solrcon.search("art_level:1", fl="art_id, " + ", ".join(STAT_FIELDS), sort="id asc", rows=rows, cursorMark=cursor_mark)
+        for doc in results.docs:
+            ret_val[doc["art_id"]] = doc
+        if results.nextCursorMark is None or results.nextCursorMark == cursor_mark:
+            break
+        cursor_mark = results.nextCursorMark
+
+    return ret_val
+
+class AlternateIDResolver(object):
+    """
+    In memory version of the alternate ID search in update_solr_stat_data: a cited ID which isn't
+      in Solr is replaced by the one article matching its ArticleID altStandard (a wildcard
+      pattern, e.g., MPSA.043?.0117A), if there's only one.
+
+    Article IDs are grouped by source code and volume number, so only a volume's worth are
+      matched against each pattern.
+
+    >>> resolver = AlternateIDResolver(["MPSA.043A.0117A", "IJP.077A.0217A", "IJP.077B.0217A", "IJP.078.0217A"])
+    >>> AlternateIDResolver.group_key("MPSA.043?.0117A")
+    'MPSA.043'
+    >>> resolver.resolve("MPSA.043.0117A")
+    'MPSA.043A.0117A'
+    >>> resolver.resolve("IJP.077.0217A") is None # two matches, so it's not known which
+    True
+    >>> resolver.resolve("IJP.079.0217A") is None
+    True
+    """
+    def __init__(self, art_ids):
+        self.art_ids = art_ids
+        self.groups = {}
+        for art_id in art_ids:
+            self.groups.setdefault(self.group_key(art_id), []).append(art_id)
+
+    @staticmethod
+    def group_key(art_id):
+        parts = art_id.split(".")
+        if len(parts) > 1:
+            ret_val = f"{parts[0]}.{parts[1][:3]}"
+        else:
+            ret_val = parts[0]
+        return ret_val
+
+    def resolve(self, doc_id):
+        ret_val = None
+        try:
+            pattern = ArticleID(articleID=doc_id).altStandard
+        except Exception as e:
+            pattern = None
+
+        if pattern:
+            group = self.group_key(pattern)
+            if "?" in group or "*" in group:
+                candidates = self.art_ids
+            else:
+                candidates = self.groups.get(group, ())
+            matches = [art_id for art_id in candidates if fnmatch.fnmatchcase(art_id, pattern)]
+            if len(matches) == 1:  # only accept alternative if there's only one match (otherwise, not known which)
+                ret_val = matches[0]
+
+        return ret_val
+
+def stat_changed(current, art_stat):
+    """
+    True if any of the stat fields of art_stat differ from current, the values in Solr (a field
+      not there counts as 0)
+
+    >>> art_stat = ArticleStat(document_id="IJP.077.0217A", art_cited_all=10, art_views_lastweek=2)
+    >>> stat_changed({"art_id": "IJP.077.0217A", "art_cited_all": 10, "art_views_lastweek": 2}, art_stat)
+    False
+    >>> stat_changed({"art_id": "IJP.077.0217A", "art_cited_all": 10, "art_views_lastweek": 1}, art_stat)
+    True
+    """
+    return any(current.get(field, 0) != getattr(art_stat, field) for field in STAT_FIELDS)
+
+def stat_update_record(doc_id, art_stat):
+    ret_val = {"id": doc_id}
+    for field in STAT_FIELDS:
+        ret_val[field] = getattr(art_stat, field)
+    return ret_val
+
+def send_stat_updates(solrcon, update_recs, batch_size=BULK_UPDATE_BATCH, workers=BULK_UPDATE_WORKERS):
+    """
+    Send update_recs as atomic ("set") updates, batch_size per request, workers requests at once.
+      No commit.  Returns (records updated, records skipped as update errors).
+    """
+    field_updates = {field: "set" for field in STAT_FIELDS}
+    batches = [update_recs[i:i + batch_size] for i in range(0, len(update_recs), batch_size)]
+    update_count = 0
+    skipped_as_update_error = 0
+    start_time = time.time()
+
+    def send(batch):
+        solrcon.add(batch, fieldUpdates=field_updates, commit=False)
+        return len(batch)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {executor.submit(send, batch): batch for batch in batches}
+        for future in concurrent.futures.as_completed(futures):
+            batch = futures[future]
+            try:
+                update_count += future.result()
+            except Exception as err:
+                errStr = f"opasDataUpdateStatUpdateError: Solr call exception for update of {len(batch)} records ({batch[0]['id']}...): {err}"
+                print (errStr)
+                skipped_as_update_error += len(batch)
+                logger.error(errStr)
+            else:
+                elapsed = time.time() - start_time
+                print (f"...Updated {update_count} of {len(update_recs)} records ({update_count / elapsed if elapsed else 0:.0f} records/sec)")
+
+    return update_count, skipped_as_update_error
+
+def update_solr_stat_data_bulk(solrcon, all_records:bool=False, batch_size=BULK_UPDATE_BATCH, workers=BULK_UPDATE_WORKERS):
+    """
+    Bulk version of update_solr_stat_data: fetch the current stat values of all the articles in
+      one export, resolve alternate IDs in memory, send the changed records as batches of atomic
+      updates, and commit once.
+
+    Falls back to update_solr_stat_data if the export fails.
+    """
+    start_time = time.time()
+    try:
+        solr_stat_values = get_solr_stat_values(solrcon)
+    except Exception as e:
+        msg = f"opasDataUpdateStatUpdateError: Solr export of stat values failed ({e}).  Updating record by record."
+        print (msg)
+        logger.error(msg)
+        return update_solr_stat_data(solrcon, all_records)
+
+    fetch_time = time.time() - start_time
+    print (f"Fetched current stat values for {len(solr_stat_values)} articles in {fetch_time:.1f} secs ({len(solr_stat_values) / fetch_time if fetch_time else 0:.0f} records/sec).")
+
+    resolver = None
+    update_recs = {}
+    skipped_as_missing = 0
+    unchanged_count = 0
+    for key, art_stat in unified_article_stat.items():
+        if all_records==False:
+            if not art_stat.art_views_update:
+                continue
+
+        doc_id = key
+        current = solr_stat_values.get(doc_id)
+        if current is None: # TryAlternateID:
+            if resolver is None:
+                resolver = AlternateIDResolver(list(solr_stat_values.keys()))
+            alt_id = resolver.resolve(doc_id)
+            if alt_id is not None:
+                logger.info(f"Document ID {doc_id} not in Solr.  The correct ID seems to be {alt_id}. Using that instead!")
+                doc_id = alt_id
+                current = solr_stat_values[alt_id]
+            else:
+                logger.warning(f"Document {doc_id} not in Solr...skipping")
+                skipped_as_missing += 1
+                continue
+
+        if stat_changed(current, art_stat):
+            update_recs[doc_id] = stat_update_record(doc_id, art_stat)
+        else:
+            unchanged_count += 1
+
+    print (f"{len(update_recs)} article records to update ({unchanged_count} unchanged; {skipped_as_missing} not in Solr).")
+    update_start_time = time.time()
+    update_count, skipped_as_update_error = send_stat_updates(solrcon, list(update_recs.values()), batch_size=batch_size, workers=workers)
+
+    #  final (only) commit
+    try:
+        solrcon.commit()
+    except Exception as e:
+        msg = f"opasDataUpdateStatUpdateError: Final commit error {e}"
+        print(msg)
+        logger.error(msg)
+
+    update_time = time.time() - update_start_time
+    total_time = time.time() - start_time
+    print (f"Finished updating Solr stat with {update_count} article records updated in {update_time:.1f} secs ({update_count / update_time if update_time else 0:.0f} records/sec); records skipped: {skipped_as_update_error}.")
+    print (f"Bulk stat update total {total_time:.1f} secs for {len(unified_article_stat)} stat records ({len(unified_article_stat) / total_time if total_time else 0:.0f} records/sec).")
+    return update_count
+
 if __name__ == "__main__":
     import argparse
     import pymysql
@@ -452,6 +767,14 @@ if __name__ == "__main__":
                         help="Level at which events should be logged (DEBUG, INFO, WARNING, ERROR")
     parser.add_argument("-a", "--all", dest="all_records", default=False, action="store_true",
                         help="Update records with views and any citation data (takes significantly longer)")
+    parser.add_argument("-b", "--bulk", dest="bulk", default=False, action="store_true",
+                        help="Fetch the current values in one export and send batches of atomic updates, with one commit")
+    parser.add_argument("--batchsize", dest="batch_size", type=int, default=BULK_UPDATE_BATCH,
+                        help=f"Records per update request to Solr in bulk mode (default {BULK_UPDATE_BATCH})")
+    parser.add_argument("--workers", dest="workers", type=int, default=BULK_UPDATE_WORKERS,
+                        help=f"Update requests sent to Solr at once in bulk mode (default {BULK_UPDATE_WORKERS})")
+    parser.add_argument("--nosummary", dest="no_summary", default=False, action="store_true",
+                        help="Don't refresh the api_stat_cited_summary and api_stat_docviews_summary tables")
     
     args = parser.parse_args()
     logger = logging.getLogger(programNameShort)
@@ -475,8 +798,13 @@ if __name__ == "__main__":
                         "pysolr": pysolr.__version__,
                        }
     print (f"Key Library Versions: {library_versions}")
-    load_unified_article_stat()
-    updates = update_solr_stat_data(solr_docs2, args.all_records)
+    most_viewed, citation_table = load_unified_article_stat()
+    if not args.no_summary:
+        refresh_stat_summaries(citation_table, most_viewed)
+    if args.bulk:
+        updates = update_solr_stat_data_bulk(solr_docs2, args.all_records, batch_size=args.batch_size, workers=args.workers)
+    else:
+        updates = update_solr_stat_data(solr_docs2, args.all_records)
     total_time = time.time() - start_time
     final_stat = f"{time.ctime()} Updated {updates} Solr records in {total_time} secs ({total_time/60} minutes))."
     print (final_stat)
@@ -112,8 +112,8 @@ def sitemapper( path: str=localsecrets.SITEMAP_PATH, # local path or bucket for
         
     try:
         # returns a list of the sitemap files (since split)
-        sitemap_list = opasSiteMap.metadata_export(SITEMAP_OUTPUT_FILE, total_records=max_records, records_per_file=size)
-        opasSiteMap.opas_sitemap_index(output_file=SITEMAP_INDEX_FILE, sitemap_list=sitemap_list)
+        # (the index is written as the files are)
+        sitemap_list = opasSiteMap.metadata_export(SITEMAP_OUTPUT_FILE, total_records=max_records, records_per_file=size, index_file=SITEMAP_INDEX_FILE)
         ret_val["siteMapIndexFile"] = SITEMAP_INDEX_FILE
         ret_val["siteMapList"] = sitemap_list
 
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A minimal local stand-in for the PaDS auth server, for tests which need to count or time the
+  calls the OPAS server makes to PaDS without depending on the real one.
+
+Only the endpoints the tests use are implemented:
+    /v1/Permits           - grants archive access to every document after delay seconds
+                            (401 for the session ids in unauthenticated, or the document ids in denied)
+    /v1/Users             - returns a fixed logged in user
+    /v1/Users/Logout/     - ok
+    /v1/Authenticate/     - (POST) logs in any user/password (and sets a cookie)
+    /v1/Authenticate/IP/  - returns an unauthenticated session
+
+Usage:
+    stub = StubPaDSServer(delay=0.2)
+    stub.start()
+    opasDocPermissions.base = stub.base_url
+    ...
+    stub.stop()
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+class StubPaDSServer(object):
+    def __init__(self, delay=0.0, has_archive_access=True):
+        self.delay = delay
+        self.has_archive_access = has_archive_access
+        self.unauthenticated = set()
+        self.denied = set()
+        self.calls = []
+        self.cookies_received = [] # Cookie header of each call (None if there was none)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def call_count(self, path_prefix=""):
+        with self.lock:
+            return len([call for call in self.calls if call.startswith(path_prefix)])
+
+    def _handler_class(self):
+        stub = self
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass # quiet
+
+            def _reply(self, body, status=200, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self):
+                url = urlparse(self.path)
+                query = {key.lower(): val[0] for key, val in parse_qs(url.query).items()}
+                with stub.lock:
+                    stub.calls.append(url.path)
+                    stub.cookies_received.append(self.headers.get("Cookie"))
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    if stub.delay:
+                        time.sleep(stub.delay)
+                    session_id = query.get("sessionid", "stub-session-id")
+                    if url.path.startswith("/v1/Permits") and (session_id in stub.unauthenticated or query.get("docid") in stub.denied):
+                        self._reply("Session has not been authenticated", status=401)
+                    elif url.path.startswith("/v1/Permits"):
+                        self._reply({"SessionId": session_id,
+                                     "DocId": query.get("docid"),
+                                     "HasArchiveAccess": stub.has_archive_access,
+                                     "HasCurrentAccess": False,
+                                     "Permit": stub.has_archive_access,
+                                     "ReasonId": 200,
+                                     "StatusCode": 200,
+                                     "ReasonStr": "Stub PaDS"})
+                    elif url.path.startswith("/v1/Users/Logout"):
+                        self._reply({})
+                    elif url.path.startswith("/v1/Users"):
+                        self._reply({"UserId": 1, "UserName": "stubuser", "UserType": "Individual"})
+                    elif url.path.startswith("/v1/Authenticate/IP"):
+                        self._reply({"SessionId": session_id, "IsValidLogon": False})
+                    elif url.path.startswith("/v1/Authenticate"):
+                        self._reply({"SessionId": session_id, "IsValidLogon": True, "IsValidUserName": True,
+                                     "HasSubscription": True, "ReasonId": 200},
+                                    headers={"Set-Cookie": f"PaDSSession={session_id}; Path=/"})
+                    else:
+                        self._reply("Not found", status=404)
+                finally:
+                    with stub.lock:
+                        stub.in_flight -= 1
+
+            do_GET = _handle
+            do_POST = _handle
+
+        return Handler
@@ -72,6 +72,16 @@ class TestReports(unittest.TestCase):
         # these don't get affected by the level.
         assert (response.headers["content-disposition"] == 'attachment; filename=vw_reports_session_activity.csv')
 
+    def test01c_session_log_report_download_ndjson(self):
+        import json
+        full_URL = base_plus_endpoint_encoded(f'/v2/Admin/Reports/Session-Log?limit=10&matchstr=/v2/Documents/Abstract&download=true&downloadformat=ndjson')
+        response = requests.get(full_URL, headers=headers, stream=True)
+        assert(response.ok == True)
+        assert (response.headers["content-disposition"] == 'attachment; filename=vw_reports_session_activity.ndjson')
+        rows = [json.loads(line) for line in response.iter_lines() if line]
+        assert(1 <= len(rows) <= 10)
+        assert(rows[0]["return_status_code"] == 200)
+
     def test02_document_view__log_report(self):
         # note api_key is required, but already in headers
         full_URL = base_plus_endpoint_encoded(f'/v2/Admin/Reports/Document-View-Log?limit=10&offset=5')
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import tempfile
+import unittest
+
+import unitTestConfig # sets up paths
+import opasArtifactCache
+
+class TestArtifactCache(unittest.TestCase):
+    """
+    Check the cache of generated PDF/EPUB download files
+    """
+    def test_0_key(self):
+        key = opasArtifactCache.artifact_key("IJP.077.0217A", "2021-05-01T00:00:00Z", "pdf")
+        assert(key.endswith(".pdf"))
+        # a reloaded document has a new key
+        assert(key != opasArtifactCache.artifact_key("IJP.077.0217A", "2022-05-01T00:00:00Z", "pdf"))
+        assert(key != opasArtifactCache.artifact_key("IJP.077.0217A", "2021-05-01T00:00:00Z", "epub.html"))
+
+    def test_1_size_bound(self):
+        cache = opasArtifactCache.ArtifactCache(tempfile.mkdtemp(), max_bytes=2500)
+        keys = [opasArtifactCache.artifact_key(f"IJP.077.021{n}A", "2021-05-01T00:00:00Z", "pdf") for n in range(3)]
+        for key in keys:
+            source = tempfile.mktemp()
+            with open(source, "wb") as f:
+                f.write(b"%PDF" + 996 * b" ")
+            assert(cache.put_file(key, source) is not None)
+            assert(not os.path.exists(source)) # moved into the cache
+            time.sleep(0.01)
+        # only the two most recent fit
+        assert(cache.get(keys[0]) is None)
+        assert(cache.get(keys[2]) is not None)
+        assert(cache.stats()["evictions"] == 1)
+
+    def test_2_clean_temp_files(self):
+        temp_dir = tempfile.mkdtemp()
+        old_files = ["IJP.077.0217A-pepweb.pdf", "IJP.077.0217A.PDF", "IJP.077.0217A.epub"]
+        other_files = ["notes.pdf", "IJP.077.0217A.xml"]
+        for name in old_files + other_files:
+            path = os.path.join(temp_dir, name)
+            with open(path, "w") as f:
+                f.write("x")
+            os.utime(path, (time.time() - 7200, time.time() - 7200))
+        with open(os.path.join(temp_dir, "IJP.077.0218A-pepweb.pdf"), "w") as f:
+            f.write("recent")
+        assert(opasArtifactCache.clean_temp_files(temp_dir, max_age=3600) == len(old_files))
+        assert(sorted(os.listdir(temp_dir)) == sorted(other_files + ["IJP.077.0218A-pepweb.pdf"]))
+
+if __name__ == '__main__':
+    unittest.main()
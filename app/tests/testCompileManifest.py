@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import os
+import tempfile
+
+import unitTestConfig # sets up paths
+import opasCompileManifest
+from opasCompileManifest import CompileManifest, content_hash
+
+class TestCompileManifest(unittest.TestCase):
+    """
+    Check the smartload compile manifest decides on content and lookup data, not file dates
+    """
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "manifest.json")
+        self.fname = "IJP.001.0001A(bKBD3).xml"
+        self.deps = {"glossary": "g1", "splitbook": "s1", "sources": "p1", "xml_update": "2022.0613"}
+
+    def test_0_new_file_needs_compile(self):
+        manifest = CompileManifest(self.path, dependency_versions=self.deps)
+        assert(manifest.needs_compile(self.fname, content_hash("<pepkbd3/>")))
+        assert(not manifest.dependencies_changed(self.fname)) # nothing recorded, nothing to compare
+
+    def test_1_unchanged_content_skips_compile(self):
+        manifest = CompileManifest(self.path, dependency_versions=self.deps)
+        manifest.record(self.fname, content_hash("<pepkbd3/>"))
+        manifest.save()
+        # a touched but unchanged file has the same hash
+        manifest = CompileManifest(self.path, dependency_versions=dict(self.deps))
+        assert(not manifest.needs_compile(self.fname, content_hash(b"<pepkbd3/>")))
+        assert(manifest.needs_compile(self.fname, content_hash("<pepkbd3>new</pepkbd3>")))
+
+    def test_2_changed_lookup_data_needs_compile(self):
+        manifest = CompileManifest(self.path, dependency_versions=self.deps)
+        manifest.record(self.fname, content_hash("<pepkbd3/>"))
+        manifest.save()
+        self.deps["glossary"] = "g2"
+        manifest = CompileManifest(self.path, dependency_versions=self.deps)
+        assert(manifest.dependencies_changed(self.fname))
+        assert(manifest.needs_compile(self.fname, content_hash("<pepkbd3/>")))
+        manifest.record(self.fname, content_hash("<pepkbd3/>"))
+        assert(not manifest.dependencies_changed(self.fname))
+
+    def test_3_bad_manifest_starts_over(self):
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        manifest = CompileManifest(self.path, dependency_versions=self.deps)
+        assert(manifest.entries == {})
+        manifest.save() # nothing recorded, file left alone
+        with open(self.path) as f:
+            assert(f.read() == "{not json")
+
+if __name__ == '__main__':
+    unittest.main()
+    print ("Tests Complete.")
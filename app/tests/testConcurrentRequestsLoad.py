@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from unitTestConfig import base_plus_endpoint_encoded, headers
+
+CONCURRENT_REQUESTS = 8
+SEARCH_ENDPOINTS = [
+    '/v2/Database/Search/?fulltext1=dream%20interpretation&synonyms=false&limit=15',
+    '/v2/Database/Search/?author=tuckett&limit=15',
+    '/v2/Database/SmartSearch/?smarttext=transference&limit=15',
+    '/v2/Database/MoreLikeThis/?morelikethis=IJP.056.0303A&similarcount=4',
+]
+
+def timed_get(endpoint):
+    start = time.time()
+    response = requests.get(base_plus_endpoint_encoded(endpoint), headers=headers)
+    return response.ok, time.time() - start
+
+class TestConcurrentRequestsLoad(unittest.TestCase):
+    """
+    Load test: requests sent at the same time to one server worker should be served
+      concurrently, not one after the other.  Before the search endpoints were moved off
+      the event loop, the total time for N concurrent searches was about N times a single search.
+    """
+    def test_concurrent_searches_do_not_serialize(self):
+        for endpoint in SEARCH_ENDPOINTS:
+            # warm up, and time a single request
+            timed_get(endpoint)
+            ok, single = timed_get(endpoint)
+            assert(ok)
+            start = time.time()
+            with ThreadPoolExecutor(max_workers=CONCURRENT_REQUESTS) as executor:
+                results = list(executor.map(timed_get, [endpoint] * CONCURRENT_REQUESTS))
+            total = time.time() - start
+            assert(all([ok for ok, elapsed in results]))
+            print (f"{endpoint}: single {single:.3f}s; {CONCURRENT_REQUESTS} concurrent {total:.3f}s (serialized would be ~{single * CONCURRENT_REQUESTS:.3f}s)")
+            assert(total < single * CONCURRENT_REQUESTS * 0.75)
+
+if __name__ == '__main__':
+    unittest.main()
+    print ("Tests Complete.")
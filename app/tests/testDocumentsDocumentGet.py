@@ -90,6 +90,24 @@ class TestDocumentsDocumentGet(unittest.TestCase):
         docitem = response_set[0]
         assert(docitem["termCount"] >= 25)
 
+    def test_002C_get_document_cached_rendering_with_hits(self):
+        # the second fetch of the same document is served from the rendered HTML cache; hits are marked on either
+        full_URL = base_plus_endpoint_encoded(f'/v2/Documents/Document/PCT.011.0171A/?return_format=HTML')
+        response = requests.get(full_URL, headers=headers)
+        assert(response.ok == True)
+        document_plain = response.json()["documents"]["responseSet"][0]["document"]
+        assert("searchhit" not in document_plain)
+
+        search = 'search=&fulltext1=%22Evenly%20Suspended%20Attention%22~25&formatrequested=HTML&highlightlimit=5'
+        full_URL = base_plus_endpoint_encoded(f'/v2/Documents/Document/PCT.011.0171A?{search}')
+        response = requests.get(full_URL, headers=headers)
+        assert(response.ok == True)
+        docitem = response.json()["documents"]["responseSet"][0]
+        assert(docitem["termCount"] >= 25)
+        assert("searchhit" in docitem["document"])
+        # same document apart from the hit markup
+        assert(len(docitem["document"]) > len(document_plain))
+
     def test_1_get_document(self):
         full_URL = base_plus_endpoint_encoded(f'/v2/Documents/Document/PCT.011.0171A/')
         # local, this works...but fails in the response.py code trying to convert self.status to int.
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import ast
+import os.path
+import unittest
+
+import unitTestConfig # sets up paths
+
+MAIN_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main.py")
+
+# endpoints which do no blocking I/O, and so may stay on the event loop
+ASYNC_ENDPOINTS = ["admin_metrics", "api_live_doc", "api_openapi_spec"]
+
+def app_functions():
+    with open(MAIN_PY, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            decorators = [ast.unparse(dec) for dec in node.decorator_list]
+            yield node, decorators
+
+class TestEndpointsThreadPool(unittest.TestCase):
+    """
+    Endpoints which call pysolr, mysql.connector or requests must be declared with def, not
+      async def, so FastAPI runs them in its worker thread pool rather than on the event loop,
+      where one slow Solr query stalls every other request.
+    """
+    def test_0_blocking_endpoints_are_sync(self):
+        endpoints = 0
+        for node, decorators in app_functions():
+            if not any([dec.startswith(("app.get(", "app.put(", "app.post(", "app.delete(")) for dec in decorators]):
+                continue
+            endpoints += 1
+            if node.name not in ASYNC_ENDPOINTS:
+                assert isinstance(node, ast.FunctionDef), f"{node.name} is async def but may block"
+        assert(endpoints > 40)
+
+    def test_1_thread_limit_set_at_startup(self):
+        startup = [node for node, decorators in app_functions() if 'app.on_event("startup")' in decorators or "app.on_event('startup')" in decorators]
+        source = " ".join([ast.unparse(node) for node in startup])
+        assert("current_default_thread_limiter().total_tokens = opasConfig.API_ENDPOINT_THREAD_LIMIT" in source)
+
+if __name__ == '__main__':
+    unittest.main()
+    print ("Tests Complete.")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import asyncio
+import unittest
+
+import fsspec
+from fpdf import FPDF
+from pdfrw import PdfReader
+
+import unitTestConfig # sets up paths
+import opasFileSupport
+import opasFileStream
+
+def read_body(response):
+    async def read():
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    return asyncio.run(read())
+
+class TestFileStream(unittest.TestCase):
+    """
+    Check the streamed (and stamped) downloads of originals and images.
+
+    An in memory fsspec filesystem stands in for S3.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.flex_fs = opasFileSupport.FlexFileSystem(key="test", secret="test")
+        cls.flex_fs.fs = fsspec.filesystem("memory")
+        pdf = FPDF()
+        for page in range(3):
+            pdf.add_page()
+            pdf.set_font("Helvetica", size=12)
+            pdf.cell(0, 10, f"Original page {page + 1}")
+        cls.pdf_data = bytes(pdf.output())
+        cls.filename = "/pep-web-originals/IJP/077/IJP.077.0217A.pdf"
+        with cls.flex_fs.fs.open(cls.filename, "wb") as f:
+            f.write(cls.pdf_data)
+
+    def test_0_file_response(self):
+        response = opasFileStream.file_response(self.flex_fs, self.filename, media_type="application/pdf", download_name="IJP.077.0217A.pdf")
+        assert(response.status_code == 200)
+        assert(response.headers["content-length"] == str(len(self.pdf_data)))
+        assert(read_body(response) == self.pdf_data)
+        response = opasFileStream.file_response(self.flex_fs, self.filename, media_type="application/pdf", download_name="IJP.077.0217A.pdf", range_header="bytes=10-19")
+        assert(response.status_code == 206)
+        assert(read_body(response) == self.pdf_data[10:20])
+        response = opasFileStream.file_response(self.flex_fs, self.filename, media_type="application/pdf", download_name="IJP.077.0217A.pdf", range_header=f"bytes={len(self.pdf_data)}-")
+        assert(response.status_code == 416)
+
+    def test_1_stamped_pdf(self):
+        opasFileStream.stamp_cache.clear()
+        opasFileStream.structure_cache.clear()
+        response = opasFileStream.stamped_pdf_response(self.flex_fs, self.filename, username="TestUser", download_name="IJP.077.0217A-original.pdf")
+        assert(response.status_code == 200)
+        assert("content-length" not in response.headers) # the stamp isn't known yet
+        stamped = read_body(response)
+        # the original, unchanged, then the stamp
+        assert(stamped.startswith(self.pdf_data) and len(stamped) > len(self.pdf_data))
+        pages = PdfReader(fdata=stamped).pages
+        assert(len(pages) == 3)
+        assert("/PEPStamp" in pages[0].Resources.XObject)
+        # now the stamp is kept, so the length is known, and ranges can be served
+        response = opasFileStream.stamped_pdf_response(self.flex_fs, self.filename, username="TestUser", download_name="IJP.077.0217A-original.pdf")
+        assert(response.headers["content-length"] == str(len(stamped)))
+        start = len(self.pdf_data) - 100
+        response = opasFileStream.stamped_pdf_response(self.flex_fs, self.filename, username="TestUser", download_name="IJP.077.0217A-original.pdf", range_header=f"bytes={start}-")
+        assert(response.status_code == 206)
+        assert(read_body(response) == stamped[start:])
+
+    def test_2_stamped_pdf_other_user(self):
+        # once an original's stamp structure is kept, another user's stamp is made from it (and the
+        #  username), so only the bytes asked for are read from the original
+        import opasPDFStampCpyrght
+        opasFileStream.stamp_cache.clear()
+        opasFileStream.structure_cache.clear()
+        read_body(opasFileStream.stamped_pdf_response(self.flex_fs, self.filename, username="TestUser", download_name="IJP.077.0217A-original.pdf"))
+        expected = self.pdf_data + opasPDFStampCpyrght.copyright_stamp_update("OtherUser", self.pdf_data)
+        reads = []
+        def read_chunks(filename, start=0, end=None):
+            reads.append((start, end))
+            return opasFileSupport.FlexFileSystem.read_chunks(self.flex_fs, filename, start=start, end=end)
+
+        self.flex_fs.read_chunks = read_chunks
+        try:
+            start = len(self.pdf_data) - 100
+            response = opasFileStream.stamped_pdf_response(self.flex_fs, self.filename, username="OtherUser", download_name="IJP.077.0217A-original.pdf", range_header=f"bytes={start}-")
+            assert(response.status_code == 206)
+            assert(read_body(response) == expected[start:])
+            assert(reads == [(start, len(self.pdf_data))])
+            response = opasFileStream.stamped_pdf_response(self.flex_fs, self.filename, username="OtherUser", download_name="IJP.077.0217A-original.pdf")
+            assert(response.headers["content-length"] == str(len(expected)))
+            assert(read_body(response) == expected)
+        finally:
+            del self.flex_fs.read_chunks
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from types import SimpleNamespace
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+import unitTestConfig # sets up paths
+import opasArtifactCache
+import opasHTTPCache
+
+def make_request(path="/v2/Documents/Document/IJP.077.0217A/", query=b"return_format=HTML", headers=()):
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query,
+                    "headers": [(name.lower().encode(), value.encode()) for name, value in headers]})
+
+def make_documents(updated="2021-05-01T10:00:00Z", access_limited=False):
+    item = SimpleNamespace(documentID="IJP.077.0217A", termID=None, updated=updated, accessChecked=True,
+                           accessLimited=access_limited, document="<p>text</p>", abstract=None)
+    return SimpleNamespace(documents=SimpleNamespace(responseSet=[item]))
+
+class TestHTTPCache(unittest.TestCase):
+    """
+    Check the ETag/Last-Modified validators and 304 responses for documents and images
+    """
+    def test_0_document_etag(self):
+        etag, last_modified = opasHTTPCache.documents_validators(make_documents(), variant="IJP.077.0217A")
+        assert(last_modified.isoformat() == "2021-05-01T10:00:00+00:00")
+        # a reloaded document, or the abstract only (access limited), has another ETag
+        assert(etag != opasHTTPCache.documents_validators(make_documents(updated="2022-05-01T10:00:00Z"), variant="IJP.077.0217A")[0])
+        assert(etag != opasHTTPCache.documents_validators(make_documents(access_limited=True), variant="IJP.077.0217A")[0])
+        # so does the same document rendered with a changed stylesheet
+        stylesheet_version = opasArtifactCache._stylesheet_version
+        try:
+            opasArtifactCache._stylesheet_version = "changed"
+            assert(etag != opasHTTPCache.documents_validators(make_documents(), variant="IJP.077.0217A")[0])
+        finally:
+            opasArtifactCache._stylesheet_version = stylesheet_version
+
+    def test_1_not_modified(self):
+        index_version = [1]
+        cache = opasHTTPCache.ValidatorCache(name="http_validators_test", get_index_version=lambda solr_core: index_version[0])
+        session_info = SimpleNamespace(session_id="test-session", user_id=101, authenticated=True, authorized_peparchive=True, authorized_pepcurrent=False)
+        key = opasHTTPCache.request_key(make_request(), session_info)
+        etag, last_modified = opasHTTPCache.documents_validators(make_documents(), variant=key[:2])
+        response = Response()
+        assert(cache.respond(make_request(), response, key, etag, last_modified, solr_core="docs", view_type="Document") is None)
+        assert(response.headers["cache-control"] == "private, no-cache")
+        assert(response.headers["last-modified"] == "Sat, 01 May 2021 10:00:00 GMT")
+        # the same version: 304 without generating it
+        not_modified = cache.check(make_request(headers=[("If-None-Match", etag)]), key, solr_core="docs")
+        assert(not_modified.status_code == 304)
+        # ...and it's recorded as a view of the document, as the response was
+        assert(cache.kept_view_type(key) == "Document")
+        not_modified = cache.check(make_request(headers=[("If-Modified-Since", "Sat, 01 May 2021 10:00:00 GMT")]), key, solr_core="docs")
+        assert(not_modified.status_code == 304)
+        assert(cache.check(make_request(headers=[("If-Modified-Since", "Fri, 30 Apr 2021 10:00:00 GMT")]), key, solr_core="docs") is None)
+        # another session doesn't share them
+        other_key = opasHTTPCache.request_key(make_request(), SimpleNamespace(session_id="other-session", user_id=101, authenticated=True, authorized_peparchive=True, authorized_pepcurrent=False))
+        assert(cache.check(make_request(headers=[("If-None-Match", etag)]), other_key, solr_core="docs") is None)
+        # ...nor does the same session once its access has changed (e.g., the subscription lapsed, or another user logged in)
+        for changed in ({"authorized_peparchive": False}, {"authorized_pepcurrent": True}, {"user_id": 102}, {"authenticated": False}):
+            changed_key = opasHTTPCache.request_key(make_request(), SimpleNamespace(**{**vars(session_info), **changed}))
+            assert(cache.check(make_request(headers=[("If-None-Match", etag)]), changed_key, solr_core="docs") is None)
+        # after a reload (new index version), the response must be generated again
+        index_version[0] = 2
+        assert(cache.check(make_request(headers=[("If-None-Match", etag)]), key, solr_core="docs") is None)
+        # ...but it's still a 304 if it's unchanged
+        not_modified = cache.respond(make_request(headers=[("If-None-Match", etag)]), Response(), key, etag, last_modified, solr_core="docs")
+        assert(not_modified.status_code == 304)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import time
+
+import unitTestConfig # sets up paths
+import requests
+import opasHTTPClient
+from stubPaDSServer import StubPaDSServer
+
+class TestHTTPClient(unittest.TestCase):
+    """
+    Check the pooled outbound HTTP client against a local stub server
+    """
+    def test_0_shared_session(self):
+        assert(opasHTTPClient.get_session() is opasHTTPClient.get_session())
+
+    def test_1_get_and_post(self):
+        stub = StubPaDSServer().start()
+        try:
+            response = opasHTTPClient.get(stub.base_url + "/v1/Permits?SessionId=abc&DocId=IJP.001.0001A")
+            assert(response.status_code == 200)
+            assert(response.json()["DocId"] == "IJP.001.0001A")
+            response = opasHTTPClient.post(stub.base_url + "/v1/Authenticate/", json={"UserName": "x", "Password": "y"})
+            assert(response.ok)
+        finally:
+            stub.stop()
+
+    def test_2_read_timeout(self):
+        # a slow server no longer pins the caller indefinitely
+        stub = StubPaDSServer(delay=2).start()
+        try:
+            start = time.time()
+            with self.assertRaises(requests.exceptions.RequestException):
+                opasHTTPClient.request("POST", stub.base_url + "/v1/Users/Logout/", timeout=(1, 0.2))
+            assert(time.time() - start < 2)
+        finally:
+            stub.stop()
+
+    def test_3_no_cookies_kept(self):
+        # the session is shared by every user's PaDS calls, so a cookie set for one mustn't be sent for the next
+        stub = StubPaDSServer().start()
+        try:
+            response = opasHTTPClient.post(stub.base_url + "/v1/Authenticate/?SessionId=user1", json={"UserName": "x", "Password": "y"})
+            assert("PaDSSession" in response.headers.get("Set-Cookie", ""))
+            opasHTTPClient.get(stub.base_url + "/v1/Permits?SessionId=user2&DocId=IJP.001.0001A")
+            assert(stub.cookies_received[-1] is None)
+            assert(len(opasHTTPClient.get_session().cookies) == 0)
+        finally:
+            stub.stop()
+
+if __name__ == '__main__':
+    unittest.main()
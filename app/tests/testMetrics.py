@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import sqlite3
+import unittest
+from contextlib import closing
+from types import SimpleNamespace
+
+import unitTestConfig # sets up paths
+import opasMetrics
+
+class TestMetrics(unittest.TestCase):
+    """
+    Check the latency histograms, dependency timers and text exposition format behind /v2/Admin/Metrics
+    """
+    def test_0_histogram_buckets(self):
+        hist = opasMetrics.Histogram("test_metrics_duration_seconds", "Test timings", ("route", ), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            hist.observe(value, route="/v2/Documents/Document/{documentID}/")
+        lines = hist.collect()
+        assert('test_metrics_duration_seconds_bucket{route="/v2/Documents/Document/{documentID}/",le="0.1"} 1' in lines)
+        assert('test_metrics_duration_seconds_bucket{route="/v2/Documents/Document/{documentID}/",le="1"} 2' in lines)
+        assert('test_metrics_duration_seconds_bucket{route="/v2/Documents/Document/{documentID}/",le="+Inf"} 3' in lines)
+        assert('test_metrics_duration_seconds_count{route="/v2/Documents/Document/{documentID}/"} 3' in lines)
+
+    def test_1_timer_errors(self):
+        count = opasMetrics.DEPENDENCY_DURATION.count(dependency="solr", operation="test/select")
+        errors = opasMetrics.DEPENDENCY_ERRORS.value(dependency="solr", operation="test/select")
+        with opasMetrics.timer("solr", "test/select"):
+            pass
+        try:
+            with opasMetrics.timer("solr", "test/select"):
+                raise ValueError("Solr down")
+        except ValueError:
+            pass
+        assert(opasMetrics.DEPENDENCY_DURATION.count(dependency="solr", operation="test/select") == count + 2)
+        assert(opasMetrics.DEPENDENCY_ERRORS.value(dependency="solr", operation="test/select") == errors + 1)
+        assert(opasMetrics.DEPENDENCY_IN_FLIGHT.value(dependency="solr") == 0)
+
+    def test_2_timed_connection(self):
+        count = opasMetrics.DEPENDENCY_DURATION.count(dependency="test_db", operation="select")
+        conn = opasMetrics.TimedConnection(sqlite3.connect(":memory:"), dependency="test_db")
+        with closing(conn.cursor()) as cursor:
+            cursor.execute("create table api_docviews (document_id text)")
+            cursor.executemany("insert into api_docviews values (?)", [("IJP.001.0001A", ), ("IJP.001.0002A", )])
+            conn.commit()
+            cursor.execute("select document_id from api_docviews")
+            assert(len(list(cursor)) == 2)
+        assert(opasMetrics.DEPENDENCY_DURATION.count(dependency="test_db", operation="select") == count + 1)
+        assert(opasMetrics.DEPENDENCY_DURATION.count(dependency="test_db", operation="insert") >= 1)
+
+    def test_3_middleware_route_template(self):
+        async def app(scope, receive, send):
+            scope["route"] = SimpleNamespace(path="/v2/Test/{item}/")
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def send(message):
+            pass
+
+        middleware = opasMetrics.MetricsMiddleware(app)
+        for item in range(3):
+            asyncio.run(middleware({"type": "http", "method": "GET", "path": f"/v2/Test/{item}/"}, None, send))
+        assert(opasMetrics.HTTP_REQUEST_DURATION.count(method="GET", route="/v2/Test/{item}/", status=404) == 3)
+        assert(opasMetrics.HTTP_REQUESTS_IN_FLIGHT.value() == 0)
+
+    def test_4_render_stats(self):
+        opasMetrics.register_stats("test_pool", lambda: {"opasuser@localhost/opascentral": {"size": 10, "in_use": 2}}, label="pool")
+        opasMetrics.register_stats("test_broken", lambda: 1 / 0)
+        text = opasMetrics.render()
+        assert("# TYPE opas_test_pool_in_use gauge" in text)
+        assert('opas_test_pool_in_use{pool="opasuser@localhost/opascentral"} 2' in text)
+        assert("# TYPE opas_http_request_duration_seconds histogram" in text)
+
+if __name__ == '__main__':
+    unittest.main()
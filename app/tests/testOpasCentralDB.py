@@ -21,6 +21,7 @@ import unittest
 #import urllib
 
 from unitTestConfig import base_api, base_plus_endpoint_encoded
+import opasCentralDBLib
 from opasCentralDBLib import opasCentralDB
 
 class TestDatabase(unittest.TestCase):
@@ -87,7 +88,142 @@ class TestDatabase(unittest.TestCase):
         #assert(ocd.unpaired_connection_count == 0) # open
         #ocd.open_connection(caller_name=fname)  
         #assert(ocd.unpaired_connection_count == 1) # unpaired open
-          
-        
+
+    def test_opasdb_pooled_connections(self):
+        fname = "test_pool"
+        ocd = opasCentralDB()
+        pool = ocd.pool
+        created_before = pool.stats()["created"]
+        # repeated open/close reuses the pooled connection rather than connecting again
+        for n in range(5):
+            assert(ocd.open_connection(caller_name=fname) == True)
+            ocd.close_connection(caller_name=fname)
+        assert(pool.stats()["created"] <= created_before + 1)
+        # nested opens share the connection; only the outer close returns it
+        ocd.open_connection(caller_name=fname)
+        in_use = pool.stats()["in_use"]
+        ocd.open_connection(caller_name=fname)
+        assert(pool.stats()["in_use"] == in_use)
+        ocd.close_connection(caller_name=fname)
+        assert(ocd.connected == True)
+        ocd.close_connection(caller_name=fname)
+        assert(ocd.connected == False)
+        assert(pool.stats()["in_use"] == in_use - 1)
+
+    def test_opasdb_pool_exhausted(self):
+        fname = "test_pool_exhausted"
+        ocd = opasCentralDB()
+        pool = opasCentralDBLib.opasConnectionPool(host=ocd.host, port=ocd.port, user=ocd.user, password=ocd.password,
+                                                   database=ocd.database, size=1, timeout=0.1)
+        ocd.pool = pool
+        ocd2 = opasCentralDB()
+        ocd2.pool = pool
+        assert(ocd.open_connection(caller_name=fname) == True)
+        # the only connection is in use: the second borrower fails, rather than carrying on without a connection
+        with self.assertRaises(opasCentralDBLib.PoolTimeout):
+            ocd2.open_connection(caller_name=fname)
+        assert(ocd2.db is None)
+        ocd.close_connection(caller_name=fname)
+        assert(ocd2.open_connection(caller_name=fname) == True)
+        ocd2.close_connection(caller_name=fname)
+        pool.close_all()
+
+    def test_opasdb_row_chunks_errors_and_threads(self):
+        # report downloads stream these chunks: the query runs (and fails) before the first chunk
+        #  is asked for, and the connection is released whichever thread reads the last chunk
+        import threading
+        ocd = opasCentralDB()
+        in_use = ocd.pool.stats()["in_use"]
+        with self.assertRaises(Exception):
+            ocd.get_select_as_row_chunks(sqlSelect="SELECT * from no_such_table_or_view;")
+        assert(ocd.pool.stats()["in_use"] == in_use)
+
+        chunks = ocd.get_select_as_row_chunks(sqlSelect="SELECT * from vw_reports_session_activity LIMIT 5;", chunk_size=2)
+        assert(ocd.pool.stats()["in_use"] == in_use + 1)
+        counts = []
+        for n in range(4): # one chunk per thread, as StreamingResponse reads them
+            reader = threading.Thread(target=lambda: counts.extend(len(rows) for column_names, rows in [next(chunks, (None, []))]))
+            reader.start()
+            reader.join()
+        assert(counts == [2, 2, 1, 0])
+        assert(ocd.pool.stats()["in_use"] == in_use)
+        assert(ocd.db is None)
+
+    def test_opasdb_shared_instance_threads(self):
+        # module level instances (e.g., opasDocPermissions.ocd) are used by concurrent endpoints:
+        #  each thread must get its own connection, and release only its own
+        import models
+        import opasConfig
+        from concurrent.futures import ThreadPoolExecutor
+        session_id = "test-shared-instance-0001"
+        ocd = opasCentralDB()
+        ocd.save_session(session_id, models.SessionInfo(session_id=session_id))
+        session_info = models.SessionInfo(session_id=session_id, user_id=0)
+        usage_log_async = opasConfig.USAGE_LOG_ASYNC
+        opasConfig.USAGE_LOG_ASYNC = False # write the views in the calling threads
+        in_use = ocd.pool.stats()["in_use"]
+
+        def use_shared(n):
+            ocd.open_connection(caller_name="test_shared")
+            try:
+                connection = id(ocd.db)
+                session = ocd.get_session_from_db(session_id)
+                viewed = ocd.record_document_view(document_id="IJP.001.0001A", session_info=session_info, view_type="Document")
+                assert(ocd.connected == True and id(ocd.db) == connection) # not released by another thread's close
+            finally:
+                ocd.close_connection(caller_name="test_shared")
+            return session is not None and session.session_id == session_id, viewed
+
+        try:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(use_shared, range(40)))
+            assert(all(session_ok and viewed for session_ok, viewed in results))
+            assert(ocd.pool.stats()["in_use"] == in_use)
+        finally:
+            opasConfig.USAGE_LOG_ASYNC = usage_log_async
+            ocd.do_action_query(querytxt="DELETE from api_docviews where session_id=%(session_id)s", queryparams={"session_id": session_id})
+            ocd.delete_session(session_id)
+
+    def test_opasdb_session_cache(self):
+        import models
+        import opasCentralDBLib
+        session_id = "test-session-cache-0001"
+        ocd = opasCentralDB()
+        ocd.save_session(session_id, models.SessionInfo(session_id=session_id))
+        try:
+            session_info = ocd.get_session_from_db(session_id, use_cache=True)
+            assert(session_info is not None)
+            # the second lookup is answered from the cache, as a copy the caller may change
+            hits_before = opasCentralDBLib.session_cache.stats()["hits"]
+            session_info.username = "changed"
+            cached_session_info = ocd.get_session_from_db(session_id, use_cache=True)
+            assert(opasCentralDBLib.session_cache.stats()["hits"] == hits_before + 1)
+            assert(cached_session_info.username != "changed")
+            # writing the record drops it from the cache
+            ocd.end_session(session_id)
+            assert(session_id not in opasCentralDBLib.session_cache)
+            assert(ocd.get_session_from_db(session_id, use_cache=True).session_end is not None)
+        finally:
+            ocd.delete_session(session_id)
+        assert(ocd.get_session_from_db(session_id, use_cache=True) is None)
+
+    def test_opasdb_usage_log_writer(self):
+        import models
+        import opasConfig
+        import opasCentralDBLib
+        ocd = opasCentralDB()
+        session_info = models.SessionInfo(session_id="test-usage-log-0001", authenticated=False)
+        writer = opasCentralDBLib.get_usage_log_writer()
+        written_before = writer.stats()["written"]
+        for n in range(5):
+            assert(ocd.record_session_endpoint(session_info=session_info, api_endpoint_id=opasCentralDBLib.API_DOCUMENTS_ABSTRACTS, item_of_interest="IJP.001.0001A") == 1)
+        if opasConfig.USAGE_LOG_ASYNC:
+            # queued, then written together by the background writer
+            assert(opasCentralDBLib.flush_usage_log() == True)
+            stats = writer.stats()
+            assert(stats["written"] - written_before == 5)
+            assert(stats["queue_size"] == 0)
+
+
 if __name__ == '__main__':
     unittest.main()    
\ No newline at end of file
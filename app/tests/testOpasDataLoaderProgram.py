@@ -58,6 +58,18 @@ class TestOpasLoaderProgram(unittest.TestCase):
         print (err[-400:])
         self.assertIn(b'Load process complete', result.stdout)
 
+    def test_process_sub_workers(self):
+        result = subprocess.run([sys.executable, '../opasDataLoader/opasDataLoader.py', '--sub=_PEPFree', '--nocheck', '--load', '--rebuild', '--workers=4'], capture_output=True)
+        out = result.stdout.decode("UTF-8")
+        err = result.stderr.decode("UTF-8")
+        print ("Stdout:")
+        print (out[-240:])
+        print ("Stderr:")
+        print (err[-400:])
+        self.assertIn(b'with 4 worker processes', result.stdout)
+        self.assertIn(b'Load process complete', result.stdout)
+        self.assertNotIn(b'could not be processed', result.stdout)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import time
+
+import unitTestConfig # sets up paths
+import models
+import opasConfig
+import opasDocPermissions
+from stubPaDSServer import StubPaDSServer
+
+PADS_DELAY = 0.2
+PAGE_SIZE = 20
+
+class TestPaDSBulkPermissions(unittest.TestCase):
+    """
+    Check opasDocPermissions.get_access_limitations_for_list against a local stub PaDS server
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubPaDSServer(delay=PADS_DELAY).start()
+        cls.saved_base = opasDocPermissions.base
+        opasDocPermissions.base = cls.stub.base_url
+
+    @classmethod
+    def tearDownClass(cls):
+        opasDocPermissions.base = cls.saved_base
+        cls.stub.stop()
+
+    def page_of_items(self, count=PAGE_SIZE):
+        return [models.DocumentListItem(documentID=f"IJP.0{n:02}.0001A",
+                                        accessClassification=opasConfig.DOCUMENT_ACCESS_ARCHIVE,
+                                        year="1990") for n in range(count)]
+
+    def test_0_fulltext_page_checked_concurrently(self):
+        session_info = models.SessionInfo(session_id="stub-session-1", authenticated=True)
+        items = self.page_of_items()
+        calls_before = self.stub.call_count("/v1/Permits")
+        start = time.time()
+        access = opasDocPermissions.get_access_limitations_for_list(items, session_info=session_info, fulltext_request=True)
+        elapsed = time.time() - start
+        assert(len(access) == PAGE_SIZE)
+        for item in items:
+            assert(access[item.documentID].accessLimited == False)
+        assert(self.stub.call_count("/v1/Permits") - calls_before == PAGE_SIZE)
+        assert(self.stub.max_in_flight > 1)
+        assert(self.stub.max_in_flight <= opasConfig.PADS_PERMISSION_CHECK_MAX_WORKERS)
+        # serially this would take PAGE_SIZE * PADS_DELAY
+        print (f"{PAGE_SIZE} permission checks took {elapsed:.2f} secs (serial would be {PAGE_SIZE * PADS_DELAY:.2f})")
+        assert(elapsed < PAGE_SIZE * PADS_DELAY / 2)
+
+    def test_1_abstract_page_uses_first_answer(self):
+        # not full-text: once PaDS grants archive access, the rest of the page needs no PaDS call
+        session_info = models.SessionInfo(session_id="stub-session-2", authenticated=True)
+        items = self.page_of_items()
+        calls_before = self.stub.call_count("/v1/Permits")
+        access = opasDocPermissions.get_access_limitations_for_list(items, session_info=session_info, fulltext_request=False)
+        assert(len(access) == PAGE_SIZE)
+        assert(session_info.authorized_peparchive == True)
+        assert(self.stub.call_count("/v1/Permits") - calls_before == 1)
+
+    def test_2_permit_cache(self):
+        # the same session asking about the same documents again is answered from the permit cache
+        session_info = models.SessionInfo(session_id="stub-session-3", authenticated=True)
+        items = self.page_of_items(count=5)
+        saved_fulltext = opasConfig.PADS_PERMIT_CACHE_FULLTEXT
+        opasConfig.PADS_PERMIT_CACHE_FULLTEXT = True
+        try:
+            calls_before = self.stub.call_count("/v1/Permits")
+            hits_before = opasDocPermissions.permit_cache.stats()["hits"]
+            opasDocPermissions.get_access_limitations_for_list(items, session_info=session_info, fulltext_request=True)
+            opasDocPermissions.get_access_limitations_for_list(items, session_info=session_info, fulltext_request=True)
+            assert(self.stub.call_count("/v1/Permits") - calls_before == 5)
+            assert(opasDocPermissions.permit_cache.stats()["hits"] - hits_before == 5)
+            # logout forgets them
+            opasDocPermissions.authserver_logout(session_id=session_info.session_id)
+            assert(opasDocPermissions.invalidate_session_permits(session_info.session_id) == 0)
+            opasDocPermissions.get_access_limitations_for_list(items, session_info=session_info, fulltext_request=True)
+            assert(self.stub.call_count("/v1/Permits") - calls_before == 10)
+        finally:
+            opasConfig.PADS_PERMIT_CACHE_FULLTEXT = saved_fulltext
+
+        # by default, every full-text check goes to PaDS, so it sees each view
+        if not opasConfig.PADS_PERMIT_CACHE_FULLTEXT:
+            calls_before = self.stub.call_count("/v1/Permits")
+            opasDocPermissions.get_access_limitations_for_list(items, session_info=session_info, fulltext_request=True)
+            assert(self.stub.call_count("/v1/Permits") - calls_before == 5)
+
+    def test_3_fulltext_user_info_collected_once(self):
+        # a session PaDS permits but whose user isn't known yet: PaDS is asked who it is once, not per document
+        session_info = models.SessionInfo(session_id="stub-session-4", authenticated=True)
+        session_info.user_id = opasConfig.USER_NOT_LOGGED_IN_NAME
+        updates = []
+        saved_update_session = opasDocPermissions.ocd.update_session
+        opasDocPermissions.ocd.update_session = lambda session_id, **kwargs: updates.append(session_id)
+        try:
+            calls_before = self.stub.call_count("/v1/Users")
+            access = opasDocPermissions.get_access_limitations_for_list(self.page_of_items(), session_info=session_info, fulltext_request=True)
+        finally:
+            opasDocPermissions.ocd.update_session = saved_update_session
+        assert(len(access) == PAGE_SIZE)
+        assert(self.stub.call_count("/v1/Users") - calls_before == 1)
+        assert(updates == ["stub-session-4"])
+        assert(session_info.username == "stubuser")
+
+    def test_4_denied_answer_expires_quickly(self):
+        # a 401 (not logged in) is reused only briefly: the user may log in through another server process
+        session_id = "stub-session-5"
+        item = self.page_of_items(count=1)[0]
+        saved_ttl = opasConfig.PADS_PERMIT_CACHE_DENIED_TTL
+        opasConfig.PADS_PERMIT_CACHE_DENIED_TTL = 0.2
+        self.stub.unauthenticated.add(session_id)
+        try:
+            session_info = models.SessionInfo(session_id=session_id)
+            access = opasDocPermissions.get_access_limitations_for_list([item], session_info=session_info, fulltext_request=False)
+            assert(access[item.documentID].accessLimited == True)
+            # logged in elsewhere
+            self.stub.unauthenticated.discard(session_id)
+            time.sleep(0.3)
+            session_info = models.SessionInfo(session_id=session_id)
+            access = opasDocPermissions.get_access_limitations_for_list([item], session_info=session_info, fulltext_request=False)
+            assert(access[item.documentID].accessLimited == False)
+        finally:
+            opasConfig.PADS_PERMIT_CACHE_DENIED_TTL = saved_ttl
+            self.stub.unauthenticated.discard(session_id)
+
+    def test_5_session_changes_merged_in_order(self):
+        # the concurrent checks each get a copy of session_info; one document's 401 doesn't
+        #  change it under the others, but is applied to it once they're done
+        session_info = models.SessionInfo(session_id="stub-session-6", authenticated=True)
+        items = self.page_of_items()
+        denied_id = items[3].documentID
+        seen = []
+        saved_get_access_limitations = opasDocPermissions.get_access_limitations
+        def recording_get_access_limitations(*args, **kwargs):
+            seen.append(kwargs["session_info"] is session_info)
+            return saved_get_access_limitations(*args, **kwargs)
+
+        opasDocPermissions.get_access_limitations = recording_get_access_limitations
+        self.stub.denied.add(denied_id)
+        try:
+            access = opasDocPermissions.get_access_limitations_for_list(items, session_info=session_info, fulltext_request=True)
+        finally:
+            opasDocPermissions.get_access_limitations = saved_get_access_limitations
+            self.stub.denied.discard(denied_id)
+        assert(seen[0] == True and not any(seen[1:])) # only the first (serial) check uses it directly
+        assert(access[denied_id].accessLimited == True)
+        assert(all(access[item.documentID].accessLimited == False for item in items if item.documentID != denied_id))
+        assert(session_info.authenticated == False)
+
+if __name__ == '__main__':
+    unittest.main()
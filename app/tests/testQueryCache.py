@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import unitTestConfig # sets up paths
+import opasQueryCache
+from configLib.opasCoreConfig import solr_docs2
+
+class TestQueryCache(unittest.TestCase):
+    """
+    Check the Solr search response cache used by search_text_qs
+    """
+    def test_0_index_version(self):
+        assert(opasQueryCache.solr_index_version(solr_docs2) is not None)
+
+    def test_1_repeated_search(self):
+        cache = opasQueryCache.QueryResultCache(name="solr_query_results_test")
+        params = {"fq": "art_sourcecode:IJP", "fl": "art_id, art_title", "rows": 5, "sort": "art_id asc", "facet.field": ["art_lang"]}
+        first = cache.search(solr_docs2, "art_vol:10", **params)
+        first.docs[0]["art_title"] = None # callers change their copy
+        # same search, parameters in another order
+        second = cache.search(solr_docs2, "art_vol:10", **dict(reversed(list(params.items()))))
+        assert(cache.stats()["hits"] == 1)
+        assert(second.hits == first.hits)
+        assert(second.docs[0]["art_id"] == first.docs[0]["art_id"])
+        assert(second.docs[0]["art_title"] is not None)
+        # a different page is a different search
+        cache.search(solr_docs2, "art_vol:10", **dict(params, start=5))
+        assert(cache.stats()["misses"] == 2)
+
+if __name__ == '__main__':
+    unittest.main()
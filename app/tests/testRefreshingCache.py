@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import unittest
+
+import unitTestConfig # sets up paths
+import opasMemoryCache
+
+class TestRefreshingCache(unittest.TestCase):
+    """
+    Check the keyed, stale while revalidate cache used for What's New
+    """
+    def test_0_keyed(self):
+        cache = opasMemoryCache.RefreshingCache(name="refreshing_test_keyed", maxsize=2, ttl=60)
+        assert(cache.get((30, 15, 0), lambda: "page 1") == "page 1")
+        # another page doesn't replace the first
+        assert(cache.get((30, 15, 15), lambda: "page 2") == "page 2")
+        assert(cache.get((30, 15, 0), lambda: "reloaded") == "page 1")
+        assert(cache.stats()["loads"] == 2)
+
+    def test_1_coalesced_misses(self):
+        cache = opasMemoryCache.RefreshingCache(name="refreshing_test_coalesced", ttl=60)
+        release = threading.Event()
+        loads = []
+        def load():
+            loads.append(1)
+            release.wait(5)
+            return "whats new"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get("key", load))) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        while cache.stats()["coalesced"] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert(len(loads) == 1)
+        assert(results == ["whats new"] * 4)
+
+    def test_2_stale_while_revalidate(self):
+        cache = opasMemoryCache.RefreshingCache(name="refreshing_test_stale", ttl=0.05, max_stale=60)
+        assert(cache.get("key", lambda: "old") == "old")
+        time.sleep(0.1)
+        refreshed = threading.Event()
+        def load():
+            refreshed.set()
+            return "new"
+        # stale: returned at once, and reloaded in the background
+        assert(cache.get("key", load) == "old")
+        assert(refreshed.wait(5))
+        for n in range(100):
+            if cache.get("key", load) == "new":
+                break
+            time.sleep(0.01)
+        assert(cache.get("key", load) == "new")
+        assert(cache.stats()["refreshes"] >= 1)
+
+    def test_3_prefetch(self):
+        cache = opasMemoryCache.RefreshingCache(name="refreshing_test_prefetch", ttl=60)
+        release = threading.Event()
+        def load():
+            release.wait(5)
+            return "most cited"
+        # returns at once; a get meanwhile waits for the same load
+        cache.prefetch(("5", None, None, 15, 0), load)
+        cache.prefetch(("5", None, None, 15, 0), load)
+        release.set()
+        assert(cache.get(("5", None, None, 15, 0), lambda: "reloaded") == "most cited")
+        assert(cache.stats()["loads"] == 1)
+
+if __name__ == '__main__':
+    unittest.main()
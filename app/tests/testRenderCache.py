@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import unittest
+
+import unitTestConfig # sets up paths
+import opasConfig
+import opasRenderCache
+
+rcx_tags = re.compile(r"<[^>]*>")
+rcx_hit = re.compile(f"{re.escape(opasConfig.HITMARKERSTART)}(.*?){re.escape(opasConfig.HITMARKEREND)}", re.DOTALL)
+
+def marked_hits(text):
+    # the text of each hit, in document order, without the markup around or inside it
+    return [rcx_tags.sub("", hit) for hit in rcx_hit.findall(text)]
+
+def render(xml_text):
+    # stands in for the XSLT: the tags change, the text (and hit markers) don't
+    return xml_text.replace("<p>", "<p class='para'>").replace("<i>", "<em>").replace("</i>", "</em>")
+
+class TestRenderCache(unittest.TestCase):
+    """
+    The hits marked in a rendered document must be the ones Solr marked: the numbered anchors
+      made from them are matched up with the hitList and termCount computed from the XML.
+    """
+    # a positional phrase hit, an unmarked occurrence of a hit term (e.g., past highlightlimit),
+    #   and a hit which spans an inline tag
+    plain_xml = "<p>Evenly suspended attention, attention to the ego.</p><p>The <i>evenly</i> suspended attention again.</p>"
+    marked_xml = f"<p>{opasConfig.HITMARKERSTART}Evenly suspended attention{opasConfig.HITMARKEREND}, attention to the ego.</p>" \
+                 f"<p>The {opasConfig.HITMARKERSTART}<i>evenly</i> suspended attention{opasConfig.HITMARKEREND} again.</p>"
+
+    def test_0_hits_match_solr_markers(self):
+        cache = opasRenderCache.RenderCache(name="rendered_html_test_0", maxsize=10)
+        key = opasRenderCache.render_key("PCT.011.0171A", "2022-01-01T00:00:00Z", opasConfig.TRANSFORMER_XMLTOHTML, glossary=True)
+        # cache the plain rendering first, as a view of the document without a search would
+        html = cache.get_html(key, self.plain_xml, render)
+        assert(opasConfig.HITMARKERSTART not in html)
+        html = cache.get_html(key, self.marked_xml, render)
+        assert(marked_hits(html) == marked_hits(self.marked_xml) == ["Evenly suspended attention", "evenly suspended attention"])
+        # one anchor per hit Solr marked, so they line up with termCount
+        assert(html.count(opasConfig.HITMARKERSTART) == self.marked_xml.count(opasConfig.HITMARKERSTART) == 2)
+        assert(cache.stats()["hits"] == 0)
+
+    def test_1_marked_rendering_not_cached(self):
+        cache = opasRenderCache.RenderCache(name="rendered_html_test_1", maxsize=10)
+        key = opasRenderCache.render_key("PCT.011.0171A", "2022-01-01T00:00:00Z", opasConfig.TRANSFORMER_XMLTOHTML, glossary=True)
+        cache.get_html(key, self.marked_xml, render)
+        html = cache.get_html(key, self.plain_xml, render)
+        assert(opasConfig.HITMARKERSTART not in html)
+        assert(cache.get_html(key, self.plain_xml, lambda xml_text: "not called") == html)
+
+if __name__ == '__main__':
+    unittest.main()
+    print ("Tests Complete.")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+import unitTestConfig # sets up paths
+import opasRenderQueue
+
+class TestRenderQueue(unittest.TestCase):
+    """
+    Check the process pool used for large PDF/EPUB download renderings
+    """
+    def test_0_small_renders_inline(self):
+        queue = opasRenderQueue.RenderQueue(max_workers=1, sync_max_bytes=1000)
+        assert(queue.render("IJP.077.0217A.pdf", max, 1, 2, size=999) == 2)
+        assert(queue.stats()["sync"] == 1)
+        assert(queue.stats()["submitted"] == 0)
+
+    def test_1_coalesce_and_timeout(self):
+        queue = opasRenderQueue.RenderQueue(max_workers=1, max_pending=1, sync_max_bytes=0, wait_timeout=0.1)
+        future = queue.submit("IJP.077.0217A.pdf", time.sleep, 2)
+        # a second request for the same document waits for the same job
+        with self.assertRaises(opasRenderQueue.RenderPending):
+            queue.render("IJP.077.0217A.pdf", time.sleep, 2, size=10**6)
+        assert(queue.stats()["coalesced"] == 1)
+        assert(queue.poll("IJP.077.0217A.pdf") in ("queued", "running"))
+        # a different document doesn't fit in the queue
+        with self.assertRaises(opasRenderQueue.RenderQueueFull):
+            queue.submit("IJP.077.0218A.pdf", time.sleep, 2)
+        future.result()
+        queue.shutdown()
+
+    def test_2_retry_gets_finished_result(self):
+        # a rendering the artifact cache can't keep is picked up by the retry, not rendered again
+        queue = opasRenderQueue.RenderQueue(max_workers=1, sync_max_bytes=0, wait_timeout=0.1, result_ttl=60)
+        with self.assertRaises(opasRenderQueue.RenderPending):
+            queue.render("IJP.077.0217A.pdf", time.sleep, 1, size=10**6)
+        time.sleep(2)
+        assert(queue.render("IJP.077.0217A.pdf", time.sleep, 1, size=10**6) is None)
+        assert(queue.stats()["submitted"] == 1)
+        assert(queue.stats()["reused"] == 1)
+        # once it expires, it's rendered again
+        queue.result_ttl = 0.1
+        time.sleep(0.2)
+        with self.assertRaises(opasRenderQueue.RenderPending):
+            queue.render("IJP.077.0217A.pdf", time.sleep, 1, size=10**6)
+        assert(queue.stats()["submitted"] == 2)
+        queue.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
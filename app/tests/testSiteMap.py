@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import gzip
+import codecs
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import unitTestConfig # sets up paths
+import opasSiteMap
+
+class FakeSolrCore(object):
+    """
+    Returns art_level:1 records a page at a time, with cursorMark
+    """
+    def __init__(self, count):
+        self.docs = [{"art_id": f"IJP.{vol:03}.{page:04}A", "file_last_modified": "2021-05-01T10:00:00Z"} for vol in range(1, 4) for page in range(1, count // 3 + 1)]
+        self.searches = 0
+
+    def search(self, query, rows=10, cursorMark="*", **kwargs):
+        self.searches += 1
+        start = 0 if cursorMark == "*" else int(cursorMark)
+        next_mark = str(min(start + rows, len(self.docs)))
+        return SimpleNamespace(docs=self.docs[start:start + rows], nextCursorMark=next_mark)
+
+class TestSiteMap(unittest.TestCase):
+    """
+    Check the streamed (cursorMark), sharded and compressed sitemap export
+    """
+    def test_0_shards_and_index(self):
+        path = tempfile.mkdtemp()
+        solr_core = FakeSolrCore(90)
+        index_file = os.path.join(path, "sitemapindex.xml")
+        sitemap_list = opasSiteMap.metadata_export(os.path.join(path, "sitemap"), records_per_file=25, index_file=index_file,
+                                                   compress=True, workers=2, solr_core=solr_core, fs=codecs)
+        assert(sitemap_list == [os.path.join(path, f"sitemap{n}.xml.gz") for n in range(1, 5)])
+        with gzip.open(sitemap_list[0], "rt", encoding="utf-8") as f:
+            assert(f.read().count("<url>") == 25)
+        with gzip.open(sitemap_list[-1], "rt", encoding="utf-8") as f:
+            assert(f.read().count("<url>") == 15)
+        with open(index_file, encoding="utf-8") as f:
+            index = f.read()
+        assert(index.count("<sitemap>") == 4 and index.rstrip().endswith("</sitemapindex>"))
+
+        # a failed export leaves the last index as it was
+        class FailingSolrCore(FakeSolrCore):
+            def search(self, query, rows=10, cursorMark="*", **kwargs):
+                if cursorMark != "*":
+                    raise Exception("Solr unavailable")
+                return super().search(query, rows=rows, cursorMark=cursorMark, **kwargs)
+
+        with self.assertRaises(Exception):
+            opasSiteMap.metadata_export(os.path.join(path, "sitemap"), records_per_file=25, index_file=index_file,
+                                        compress=True, workers=2, solr_core=FailingSolrCore(90), fs=codecs)
+        with open(index_file, encoding="utf-8") as f:
+            assert(f.read() == index)
+
+    def test_1_max_records(self):
+        path = tempfile.mkdtemp()
+        sitemap_list = opasSiteMap.metadata_export(os.path.join(path, "sitemap"), total_records=50, records_per_file=20,
+                                                   compress=False, solr_core=FakeSolrCore(90), fs=codecs)
+        assert(len(sitemap_list) == 3)
+        with open(sitemap_list[-1], encoding="utf-8") as f:
+            assert(f.read().count("<url>") == 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+import pickle
 import opasCentralDBLib
+import opasSolrLoadSupport
 
 ocd = opasCentralDBLib.opasCentralDB()
 
@@ -24,6 +26,92 @@ class TestStandaloneDataLoaderFunctions(unittest.TestCase):
             count += 1
             if count > 10:
                 break
+
+    def test_solr_batch_writer(self):
+        class RecordingCore(object):
+            def __init__(self):
+                self.adds = []
+                self.commits = 0
+            def add(self, docs, commit=False):
+                self.adds.append(list(docs))
+            def commit(self):
+                self.commits += 1
+
+        # what a worker process collects must survive the trip back to the writer
+        collector = opasSolrLoadSupport.SolrAddCollector()
+        collector.add([{"id": "IJP.001.0001A", "art_lang": ["en"]}])
+        collector.add([{"id": "IJP.001.0002A", "art_lang": ["en"]}])
+        docs = pickle.loads(pickle.dumps(collector.docs))
+        assert(docs == collector.docs)
+
+        core = RecordingCore()
+        writer = opasSolrLoadSupport.SolrBatchWriter(core, batch_size=3, name="test")
+        writer.add(docs)
+        assert(core.adds == []) # under the batch size, nothing sent yet
+        writer.add(docs)
+        assert(len(core.adds) == 1 and len(core.adds[0]) == 4)
+        writer.add(docs[:1])
+        writer.commit() # flushes what's pending before committing
+        assert(len(core.adds) == 2 and len(core.adds[1]) == 1)
+        assert(core.commits == 1)
+        assert(writer.sent_count == 5)
+
+        # one bad document in a batch doesn't lose the rest
+        class RejectingCore(RecordingCore):
+            def add(self, docs, commit=False):
+                if any(doc["id"] == "IJP.001.0002A" for doc in docs):
+                    raise Exception("Solr rejected document")
+                super().add(docs, commit=commit)
+
+        core = RejectingCore()
+        writer = opasSolrLoadSupport.SolrBatchWriter(core, batch_size=3, name="test")
+        writer.add(docs + [{"id": "IJP.001.0003A", "art_lang": ["en"]}])
+        assert([doc["id"] for add in core.adds for doc in add] == ["IJP.001.0001A", "IJP.001.0003A"])
+        assert(writer.sent_count == 2 and writer.error_count == 1)
+
+    def test_get_file_dates_solr_bulk(self):
+        from configLib.opasCoreConfig import solr_docs2
+        # one export gives the same dates as the per-article query the loader used to run
+        solr_dates = opasSolrLoadSupport.get_file_dates_solr_bulk(solr_docs2, src_codes=["FD", "ANIJP-FR"])
+        assert(solr_dates is not None)
+        assert(len(solr_dates) > 0)
+        result = opasSolrLoadSupport.get_file_dates_solr(solr_docs2, art_id="FD.026.0007A")
+        assert(solr_dates["FD.026.0007A"] == result[0]["file_last_modified"])
+        assert(all(art_id.startswith(("FD.", "ANIJP-FR.")) for art_id in solr_dates))
+
+    def test_biblioxml_batch_writer(self):
+        class BibEntry(object):
+            def __init__(self, n):
+                self.art_id = "ZZZTEST.001.0001A"
+                self.ref_local_id = f"B{n:03d}"
+                self.art_year_int = 2022
+                self.ref_entry_xml = f"<be id='B{n:03d}'>Test reference {n}</be>"
+                self.ref_entry_text = f"Test reference {n}"
+                self.year_of_publication = "2020"
+                self.year_of_publication_int = 2020
+
+        writer = opasSolrLoadSupport.BiblioxmlBatchWriter(ocd, batch_size=2)
+        writer.add_article([BibEntry(n) for n in range(3)]) # over the batch size, so written in two statements
+        assert(writer.pending == [])
+        writer.add_article([BibEntry(3)])
+        assert(len(writer.pending) == 1)
+        assert(writer.flush() == 1)
+        assert(writer.rows_written == 4 and writer.error_count == 0)
+        assert(writer.rows_per_second() > 0)
+        rows = ocd.get_select_as_list_of_dicts("SELECT bib_local_id from api_biblioxml where art_id='ZZZTEST.001.0001A'")
+        assert(len(rows) == 4)
+        ocd.do_action_query(querytxt="DELETE from api_biblioxml where art_id=%(art_id)s", queryparams={"art_id": "ZZZTEST.001.0001A"})
+
+        # no database connection: the rows are counted as errors, not raised
+        class UnreachableDB(object):
+            db = None
+            def open_connection(self, caller_name=""):
+                return False
+
+        writer = opasSolrLoadSupport.BiblioxmlBatchWriter(UnreachableDB(), batch_size=2)
+        writer.add_article([BibEntry(n) for n in range(3)])
+        assert(writer.rows_written == 0 and writer.error_count == 3)
+        assert(opasSolrLoadSupport.refresh_cited_summary(UnreachableDB(), ["IJP.001.0001A"]) is None)
     
         
 if __name__ == '__main__':
@@ -47,6 +47,36 @@ class TestStandalonePageExtractFunctions(unittest.TestCase):
         print ("Extract size smaller: {extract_size < orig_size}, extract size: {extract_size}, {orig_size}")
         print ("warning: test development incomplete. TODO")
         # assert (xmlpages == "")
+
+    def test_2_page_index_vs_parse(self):
+        """
+        Extract page ranges from a large SE volume with the loader's page index and by parsing (the old way);
+        the results must be the same XML.  Prints the time for each.
+        """
+        import time
+        import opasPageIndex
+        from lxml import etree
+        
+        xmlstr = opasXMLHelper.xml_file_to_xmlstr(r"../libs/tstfiles/DoNotRedistribute/SE.006.R0007A(bKBD3).xml", dtd_validations=False)
+        page_index = opasPageIndex.page_index_json(xmlstr)
+        assert page_index is not None
+        canonical = lambda xml: etree.tostring(etree.fromstring(xml), method="c14n")
+        page_requests = [(offset, limit) for offset in range(0, 40, 3) for limit in (1, 2, 5)]
+
+        start = time.time()
+        parsed_pages = [opasXMLHelper.xml_get_pages(xmlstr, offset, limit) for offset, limit in page_requests]
+        parse_time = time.time() - start
+
+        start = time.time()
+        indexed_pages = [opasXMLHelper.xml_get_pages(xmlstr, offset, limit, page_index=page_index) for offset, limit in page_requests]
+        index_time = time.time() - start
+
+        for parsed, indexed in zip(parsed_pages, indexed_pages):
+            assert canonical(parsed[0]) == canonical(indexed[0])
+            assert parsed[2:] == indexed[2:]
+
+        print (f"{len(page_requests)} page extracts from {len(xmlstr)} chars: parse {parse_time:.3f} secs; page index {index_time:.3f} secs")
+        assert index_time < parse_time
         
         
 if __name__ == '__main__':
@@ -85,6 +85,40 @@ class TestXMLProcessing(unittest.TestCase):
         print (output_list[1])
         assert output_list[1] == """+ f the <impx type="TERM2" rx="YP0001423271790" grpname="ID">id</impx>,"""
         
+    def test_2_glossary_automaton_vs_regex_markup(self):
+        """
+        The automaton prefiltered recognizer must produce the same markup as running every term regex.
+        
+        Also a benchmark: prints the time each method takes over a sample of the _PEPFree KBD3 files.
+        """
+        import time
+        import localsecrets
+        import opasFileSupport
+        
+        sample_size = 25
+        regex_engine = PEPGlossaryRecognitionEngine.GlossaryRecognitionEngine(gather=False, use_automaton=False)
+        automaton_engine = PEPGlossaryRecognitionEngine.GlossaryRecognitionEngine(gather=False, use_automaton=True)
+        fs = opasFileSupport.FlexFileSystem(key=localsecrets.S3_KEY, secret=localsecrets.S3_SECRET, root=localsecrets.XML_ORIGINALS_PATH)
+        sample_path = localsecrets.XML_ORIGINALS_PATH + localsecrets.PATH_SEPARATOR + "_PEPFree"
+        filelist = fs.get_matching_filelist(path=sample_path, filespec_regex=r".*\(bKBD3\)\.xml$", max_items=sample_size)
+        assert len(filelist) > 0
+        
+        times = {"regex": 0.0, "automaton": 0.0}
+        for fileinfo in filelist:
+            xml_text = fs.get_file_contents(fileinfo.filespec)
+            results = {}
+            for method, engine in (("regex", regex_engine), ("automaton", automaton_engine)):
+                parser = etree.XMLParser(encoding='utf-8', recover=True, resolve_entities=True, load_dtd=True)
+                root = etree.fromstring(xml_text.encode("utf-8"), parser).getroottree()
+                start = time.time()
+                result_tree, markup_status = engine.doGlossaryMarkup(root, pretty_print=False)
+                times[method] += time.time() - start
+                results[method] = lxml.etree.tostring(result_tree, pretty_print=False, encoding="utf8").decode("utf-8")
+            
+            assert results["automaton"] == results["regex"], fileinfo.basename
+        
+        print (f"Glossary markup of {len(filelist)} files: regex method {times['regex']:.2f} secs; automaton method {times['automaton']:.2f} secs")
+        
     def test_3_bld_from_kbd3(self):
         """
         Tests:
@@ -248,6 +248,45 @@ CREATE TABLE `api_sessions`  (
   INDEX `session_user`(`user_id`) USING BTREE
 ) ENGINE = InnoDB CHARACTER SET = utf8 COLLATE = utf8_general_ci COMMENT = 'Each API session with a unique ID creates a session record. ' ROW_FORMAT = Dynamic;
 
+-- ----------------------------
+-- Table structure for api_stat_cited_summary
+-- ----------------------------
+DROP TABLE IF EXISTS `api_stat_cited_summary`;
+CREATE TABLE `api_stat_cited_summary`  (
+  `cited_document_id` varchar(30) CHARACTER SET latin1 COLLATE latin1_swedish_ci NOT NULL COMMENT 'document (article id) cited',
+  `count5` int(11) NOT NULL DEFAULT 0 COMMENT 'times cited by articles published in the last 5 years',
+  `count10` int(11) NOT NULL DEFAULT 0 COMMENT 'times cited by articles published in the last 10 years',
+  `count20` int(11) NOT NULL DEFAULT 0 COMMENT 'times cited by articles published in the last 20 years',
+  `countAll` int(11) NOT NULL DEFAULT 0 COMMENT 'times cited by any article',
+  `last_update` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'time record was added or updated',
+  PRIMARY KEY (`cited_document_id`) USING BTREE,
+  INDEX `count5`(`count5`) USING BTREE,
+  INDEX `count10`(`count10`) USING BTREE,
+  INDEX `count20`(`count20`) USING BTREE,
+  INDEX `countAll`(`countAll`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8 COLLATE = utf8_general_ci COMMENT = 'vw_stat_cited_crosstab materialized.  Refreshed (changed rows only) by opasDataUpdateStat, and for the documents cited by the references loaded, by opasDataLoader.' ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Table structure for api_stat_docviews_summary
+-- ----------------------------
+DROP TABLE IF EXISTS `api_stat_docviews_summary`;
+CREATE TABLE `api_stat_docviews_summary`  (
+  `document_id` varchar(255) CHARACTER SET latin1 COLLATE latin1_swedish_ci NOT NULL COMMENT 'document (article id) viewed',
+  `last_viewed` timestamp NULL DEFAULT NULL COMMENT 'time of the latest view',
+  `lastweek` int(11) NOT NULL DEFAULT 0 COMMENT 'views in the last 7 days',
+  `lastmonth` int(11) NOT NULL DEFAULT 0 COMMENT 'views in the last month',
+  `last6months` int(11) NOT NULL DEFAULT 0 COMMENT 'views in the last 6 months',
+  `last12months` int(11) NOT NULL DEFAULT 0 COMMENT 'views in the last 12 months',
+  `lastcalyear` int(11) NOT NULL DEFAULT 0 COMMENT 'views in the last calendar year',
+  `last_update` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'time record was added or updated',
+  PRIMARY KEY (`document_id`) USING BTREE,
+  INDEX `lastweek`(`lastweek`) USING BTREE,
+  INDEX `lastmonth`(`lastmonth`) USING BTREE,
+  INDEX `last6months`(`last6months`) USING BTREE,
+  INDEX `last12months`(`last12months`) USING BTREE,
+  INDEX `lastcalyear`(`lastcalyear`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8 COLLATE = utf8_general_ci COMMENT = 'vw_stat_docviews_crosstab materialized.  Refreshed (changed rows only) by opasDataUpdateStat.' ROW_FORMAT = Dynamic;
+
 -- ----------------------------
 -- Table structure for article_tracker
 -- ----------------------------
@@ -407,7 +446,7 @@ CREATE ALGORITHM = UNDEFINED SQL SECURITY DEFINER VIEW `vw_stat_cited_crosstab`
 -- View structure for vw_stat_cited_crosstab_with_details
 -- ----------------------------
 DROP VIEW IF EXISTS `vw_stat_cited_crosstab_with_details`;
-CREATE ALGORITHM = UNDEFINED SQL SECURITY DEFINER VIEW `vw_stat_cited_crosstab_with_details` AS select `vw_stat_cited_crosstab`.`cited_document_id` AS `cited_document_id`,`vw_stat_cited_crosstab`.`count5` AS `count5`,`vw_stat_cited_crosstab`.`count10` AS `count10`,`vw_stat_cited_crosstab`.`count20` AS `count20`,`vw_stat_cited_crosstab`.`countAll` AS `countAll`,`api_articles`.`art_auth_citation` AS `hdgauthor`,`api_articles`.`art_title` AS `hdgtitle`,`api_articles`.`src_title_abbr` AS `srctitleseries`,`api_articles`.`src_code` AS `source_code`,`api_articles`.`art_year` AS `year`,`api_articles`.`art_vol` AS `vol`,`api_articles`.`art_pgrg` AS `pgrg`,`api_articles`.`art_id` AS `art_id`,`api_articles`.`art_citeas_text` AS `art_citeas_text` from (`vw_stat_cited_crosstab` join `api_articles` on((`vw_stat_cited_crosstab`.`cited_document_id` = `api_articles`.`art_id`))) order by `vw_stat_cited_crosstab`.`countAll` desc;
+CREATE ALGORITHM = UNDEFINED SQL SECURITY DEFINER VIEW `vw_stat_cited_crosstab_with_details` AS select `api_stat_cited_summary`.`cited_document_id` AS `cited_document_id`,`api_stat_cited_summary`.`count5` AS `count5`,`api_stat_cited_summary`.`count10` AS `count10`,`api_stat_cited_summary`.`count20` AS `count20`,`api_stat_cited_summary`.`countAll` AS `countAll`,`api_articles`.`art_auth_citation` AS `hdgauthor`,`api_articles`.`art_title` AS `hdgtitle`,`api_articles`.`src_title_abbr` AS `srctitleseries`,`api_articles`.`src_code` AS `source_code`,`api_articles`.`art_year` AS `year`,`api_articles`.`art_vol` AS `vol`,`api_articles`.`art_pgrg` AS `pgrg`,`api_articles`.`art_id` AS `art_id`,`api_articles`.`art_citeas_text` AS `art_citeas_text` from (`api_stat_cited_summary` join `api_articles` on((`api_stat_cited_summary`.`cited_document_id` = `api_articles`.`art_id`))) order by `api_stat_cited_summary`.`countAll` desc;
 
 -- ----------------------------
 -- View structure for vw_stat_docviews_crosstab
@@ -419,7 +458,7 @@ CREATE ALGORITHM = UNDEFINED SQL SECURITY DEFINER VIEW `vw_stat_docviews_crossta
 -- View structure for vw_stat_most_viewed
 -- ----------------------------
 DROP VIEW IF EXISTS `vw_stat_most_viewed`;
-CREATE ALGORITHM = UNDEFINED SQL SECURITY DEFINER VIEW `vw_stat_most_viewed` AS select `vw_stat_docviews_crosstab`.`document_id` AS `document_id`,`vw_stat_docviews_crosstab`.`last_viewed` AS `last_viewed`,coalesce(`vw_stat_docviews_crosstab`.`lastweek`,0) AS `lastweek`,coalesce(`vw_stat_docviews_crosstab`.`lastmonth`,0) AS `lastmonth`,coalesce(`vw_stat_docviews_crosstab`.`last6months`,0) AS `last6months`,coalesce(`vw_stat_docviews_crosstab`.`last12months`,0) AS `last12months`,coalesce(`vw_stat_docviews_crosstab`.`lastcalyear`,0) AS `lastcalyear`,`api_articles`.`art_auth_citation` AS `hdgauthor`,`api_articles`.`art_title` AS `hdgtitle`,`api_articles`.`src_title_abbr` AS `srctitleseries`,`api_articles`.`bk_publisher` AS `publisher`,`api_articles`.`src_code` AS `source_code`,`api_articles`.`art_year` AS `pubyear`,`api_articles`.`art_vol` AS `vol`,`api_articles`.`art_pgrg` AS `pgrg`,`api_productbase`.`pep_class` AS `source_type`,`api_articles`.`preserve` AS `preserve`,`api_articles`.`filename` AS `filename`,`api_articles`.`bk_title` AS `bktitle`,`api_articles`.`bk_info_xml` AS `bk_info_xml`,`api_articles`.`art_citeas_xml` AS `xmlref`,`api_articles`.`art_citeas_text` AS `textref`,`api_articles`.`art_auth_mast` AS `authorMast`,`api_articles`.`art_issue` AS `issue`,`api_articles`.`last_update` AS `last_update` from ((`vw_stat_docviews_crosstab` join `api_articles` on((`api_articles`.`art_id` = `vw_stat_docviews_crosstab`.`document_id`))) left join `api_productbase` on((`api_articles`.`src_code` = `api_productbase`.`pepcode`)));
+CREATE ALGORITHM = UNDEFINED SQL SECURITY DEFINER VIEW `vw_stat_most_viewed` AS select `api_stat_docviews_summary`.`document_id` AS `document_id`,`api_stat_docviews_summary`.`last_viewed` AS `last_viewed`,coalesce(`api_stat_docviews_summary`.`lastweek`,0) AS `lastweek`,coalesce(`api_stat_docviews_summary`.`lastmonth`,0) AS `lastmonth`,coalesce(`api_stat_docviews_summary`.`last6months`,0) AS `last6months`,coalesce(`api_stat_docviews_summary`.`last12months`,0) AS `last12months`,coalesce(`api_stat_docviews_summary`.`lastcalyear`,0) AS `lastcalyear`,`api_articles`.`art_auth_citation` AS `hdgauthor`,`api_articles`.`art_title` AS `hdgtitle`,`api_articles`.`src_title_abbr` AS `srctitleseries`,`api_articles`.`bk_publisher` AS `publisher`,`api_articles`.`src_code` AS `source_code`,`api_articles`.`art_year` AS `pubyear`,`api_articles`.`art_vol` AS `vol`,`api_articles`.`art_pgrg` AS `pgrg`,`api_productbase`.`pep_class` AS `source_type`,`api_articles`.`preserve` AS `preserve`,`api_articles`.`filename` AS `filename`,`api_articles`.`bk_title` AS `bktitle`,`api_articles`.`bk_info_xml` AS `bk_info_xml`,`api_articles`.`art_citeas_xml` AS `xmlref`,`api_articles`.`art_citeas_text` AS `textref`,`api_articles`.`art_auth_mast` AS `authorMast`,`api_articles`.`art_issue` AS `issue`,`api_articles`.`last_update` AS `last_update` from ((`api_stat_docviews_summary` join `api_articles` on((`api_articles`.`art_id` = `api_stat_docviews_summary`.`document_id`))) left join `api_productbase` on((`api_articles`.`src_code` = `api_productbase`.`pepcode`)));
 
 -- ----------------------------
 -- View structure for vw_stat_to_update_solr_docviews